@@ -15,53 +15,47 @@ import shlex
 from functools import partial
 
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
-from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
+from pr_agent.algo.checkpoints import run_once
 from pr_agent.algo.cli_args import CliArgs
-from pr_agent.algo.utils import update_settings_from_args
+from pr_agent.algo.utils import LazyClassMap, update_settings_from_args
 from pr_agent.config_loader import get_settings
 from pr_agent.git_providers.utils import apply_repo_settings
 from pr_agent.log import get_logger
-from pr_agent.tools.pr_add_docs import PRAddDocs
-from pr_agent.tools.pr_code_suggestions import PRCodeSuggestions
-from pr_agent.tools.pr_config import PRConfig
-from pr_agent.tools.pr_description import PRDescription
-from pr_agent.tools.pr_generate_labels import PRGenerateLabels
-from pr_agent.tools.pr_help_docs import PRHelpDocs
-from pr_agent.tools.pr_help_message import PRHelpMessage
-from pr_agent.tools.pr_line_questions import PR_LineQuestions
-from pr_agent.tools.pr_questions import PRQuestions
-from pr_agent.tools.pr_reviewer import PRReviewer
-from pr_agent.tools.pr_similar_issue import PRSimilarIssue
-from pr_agent.tools.pr_update_changelog import PRUpdateChangelog
-
-command2class = {
-    "auto_review": PRReviewer,
-    "answer": PRReviewer,
-    "review": PRReviewer,
-    "review_pr": PRReviewer,
-    "describe": PRDescription,
-    "describe_pr": PRDescription,
-    "improve": PRCodeSuggestions,
-    "improve_code": PRCodeSuggestions,
-    "ask": PRQuestions,
-    "ask_question": PRQuestions,
-    "ask_line": PR_LineQuestions,
-    "update_changelog": PRUpdateChangelog,
-    "config": PRConfig,
-    "settings": PRConfig,
-    "help": PRHelpMessage,
-    "similar_issue": PRSimilarIssue,
-    "add_docs": PRAddDocs,
-    "generate_labels": PRGenerateLabels,
-    "help_docs": PRHelpDocs,
-}
+
+# the tool of a command (and what it imports, e.g. litellm) is only imported when the command is first run
+command2class = LazyClassMap({
+    "auto_review": "pr_agent.tools.pr_reviewer:PRReviewer",
+    "answer": "pr_agent.tools.pr_reviewer:PRReviewer",
+    "review": "pr_agent.tools.pr_reviewer:PRReviewer",
+    "review_pr": "pr_agent.tools.pr_reviewer:PRReviewer",
+    "describe": "pr_agent.tools.pr_description:PRDescription",
+    "describe_pr": "pr_agent.tools.pr_description:PRDescription",
+    "improve": "pr_agent.tools.pr_code_suggestions:PRCodeSuggestions",
+    "improve_code": "pr_agent.tools.pr_code_suggestions:PRCodeSuggestions",
+    "ask": "pr_agent.tools.pr_questions:PRQuestions",
+    "ask_question": "pr_agent.tools.pr_questions:PRQuestions",
+    "ask_line": "pr_agent.tools.pr_line_questions:PR_LineQuestions",
+    "update_changelog": "pr_agent.tools.pr_update_changelog:PRUpdateChangelog",
+    "config": "pr_agent.tools.pr_config:PRConfig",
+    "settings": "pr_agent.tools.pr_config:PRConfig",
+    "help": "pr_agent.tools.pr_help_message:PRHelpMessage",
+    "similar_issue": "pr_agent.tools.pr_similar_issue:PRSimilarIssue",
+    "add_docs": "pr_agent.tools.pr_add_docs:PRAddDocs",
+    "generate_labels": "pr_agent.tools.pr_generate_labels:PRGenerateLabels",
+    "help_docs": "pr_agent.tools.pr_help_docs:PRHelpDocs",
+})
 
 commands = list(command2class.keys())
 
 
+def default_ai_handler() -> BaseAiHandler:
+    # litellm is only imported when a tool first needs an AI handler
+    from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
+    return LiteLLMAIHandler()
+
 
 class PRAgent:
-    def __init__(self, ai_handler: partial[BaseAiHandler,] = LiteLLMAIHandler):
+    def __init__(self, ai_handler: partial[BaseAiHandler,] = default_ai_handler):
         self.ai_handler = ai_handler  # will be initialized in run_action
 
     async def handle_request(self, pr_url, request, notify=None) -> bool:
@@ -119,14 +113,18 @@ class PRAgent:
             if action == "answer":
                 if notify:
                     notify()
-                await PRReviewer(pr_url, is_answer=True, args=args, ai_handler=self.ai_handler).run()
+                create_tool = partial(command2class[action], pr_url, is_answer=True, args=args,
+                                      ai_handler=self.ai_handler)
             elif action == "auto_review":
-                await PRReviewer(pr_url, is_auto=True, args=args, ai_handler=self.ai_handler).run()
+                create_tool = partial(command2class[action], pr_url, is_auto=True, args=args, ai_handler=self.ai_handler)
             elif action in command2class:
                 if notify:
                     notify()
 
-                await command2class[action](pr_url, ai_handler=self.ai_handler, args=args).run()
+                create_tool = partial(command2class[action], pr_url, ai_handler=self.ai_handler, args=args)
             else:
                 return False
+            # a tool publishes its results: within a resumed webhook event, the tools that completed are not run again
+            if not await run_once("tool", [action, pr_url, args], lambda: create_tool().run()):
+                get_logger().info(f"Skipping the {action} tool, which completed before the event was interrupted")
             return True
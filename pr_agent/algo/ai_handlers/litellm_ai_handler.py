@@ -26,6 +26,7 @@ from pr_agent.algo import (CLAUDE_EXTENDED_THINKING_MODELS,
                            SUPPORT_REASONING_EFFORT_MODELS,
                            USER_MESSAGE_ONLY_MODELS)
 from pr_agent.algo.ai_handlers.base_ai_handler import BaseAiHandler
+from pr_agent.algo.checkpoints import checkpointed
 from pr_agent.algo.utils import ReasoningEffort, get_version
 from pr_agent.config_loader import get_settings
 from pr_agent.log import get_logger
@@ -295,11 +296,22 @@ class LiteLLMAIHandler(BaseAiHandler):
         """
         return get_settings().get("OPENAI.DEPLOYMENT_ID", None)
 
+    async def chat_completion(self, model: str, system: str, user: str, temperature: float = 0.2, img_path: str = None):
+        """
+        Performs chat completion using either PRRagEngine (if available) or standard LLM completion.
+        Within a checkpointed background task, the response is recorded, and replayed if the task is resumed.
+        """
+        resp, finish_reason = await checkpointed(
+            "chat_completion", [model, system, user, temperature, img_path],
+            lambda: self._chat_completion(model, system, user, temperature=temperature, img_path=img_path))
+        return resp, finish_reason
+
     @retry(
         retry=retry_if_exception_type(openai.APIError) & retry_if_not_exception_type(openai.RateLimitError),
         stop=stop_after_attempt(OPENAI_RETRIES),
     )
-    async def chat_completion(self, model: str, system: str, user: str, temperature: float = 0.2, img_path: str = None):
+    async def _chat_completion(self, model: str, system: str, user: str, temperature: float = 0.2,
+                               img_path: str = None):
         """
         Performs chat completion using either PRRagEngine (if available) or standard LLM completion.
         
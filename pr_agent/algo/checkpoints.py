@@ -0,0 +1,189 @@
+# Copyright (c) 2023 PR-Agent Authors
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import uuid
+from collections import Counter
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Optional
+
+from pr_agent.log import get_logger
+
+# tasks that are accepted, but not finished
+_ACCEPTED = "accepted"
+# tasks interrupted by the shutdown of their process, to be resumed by another one
+_INTERRUPTED = "interrupted"
+
+
+@dataclass
+class CheckpointedTask:
+    id: str
+    name: str
+    payload: dict
+
+
+class CheckpointStore:
+    """
+    Persists the background tasks of the webhook servers until they are finished, with the results of their expensive
+    steps (e.g. the AI responses), in a local SQLite file shared by the processes of a host.
+    A task interrupted by a shutdown is resumed by another process from its payload: its steps that completed before
+    the interruption are not run again.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        connection = self._connection()
+        connection.execute("CREATE TABLE IF NOT EXISTS tasks (id TEXT PRIMARY KEY, name TEXT NOT NULL, "
+                           "payload TEXT NOT NULL, owner TEXT, state TEXT NOT NULL, updated_at REAL NOT NULL)")
+        connection.execute("CREATE TABLE IF NOT EXISTS steps (task_id TEXT NOT NULL, key TEXT NOT NULL, "
+                           "value TEXT NOT NULL, PRIMARY KEY (task_id, key))")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # autocommit mode: transactions are explicit, 'BEGIN IMMEDIATE' takes the write lock of the database upfront
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self, func: Callable[[sqlite3.Connection], Any]) -> Any:
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(connection)
+            connection.execute("COMMIT")
+            return result
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def create(self, name: str, payload: dict, owner: str, interrupted: bool = False) -> CheckpointedTask:
+        task = CheckpointedTask(uuid.uuid4().hex, name, payload)
+        self._connection().execute(
+            "INSERT INTO tasks (id, name, payload, owner, state, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
+            (task.id, name, json.dumps(payload), None if interrupted else owner,
+             _INTERRUPTED if interrupted else _ACCEPTED, time.time()))
+        return task
+
+    def delete(self, task_id: str):
+        def delete(connection: sqlite3.Connection):
+            connection.execute("DELETE FROM steps WHERE task_id = ?", (task_id,))
+            connection.execute("DELETE FROM tasks WHERE id = ?", (task_id,))
+
+        self._transaction(delete)
+
+    def interrupt(self, owner: str) -> int:
+        """Marks the unfinished tasks of `owner` as interrupted, and returns their number."""
+        cursor = self._connection().execute(
+            "UPDATE tasks SET owner = NULL, state = ?, updated_at = ? WHERE owner = ? AND state = ?",
+            (_INTERRUPTED, time.time(), owner, _ACCEPTED))
+        return cursor.rowcount
+
+    def claim_interrupted(self, owner: str, max_age_seconds: float) -> list[CheckpointedTask]:
+        """
+        Claims the interrupted tasks for `owner`. Tasks last updated more than `max_age_seconds` ago are dropped,
+        including the unfinished tasks of processes that were killed without draining.
+        """
+        now = time.time()
+
+        def claim(connection: sqlite3.Connection) -> list[CheckpointedTask]:
+            expired = (now - max_age_seconds,)
+            connection.execute("DELETE FROM steps WHERE task_id IN (SELECT id FROM tasks WHERE updated_at < ?)",
+                               expired)
+            connection.execute("DELETE FROM tasks WHERE updated_at < ?", expired)
+            rows = connection.execute("SELECT id, name, payload FROM tasks WHERE state = ? ORDER BY updated_at",
+                                      (_INTERRUPTED,)).fetchall()
+            connection.execute("UPDATE tasks SET owner = ?, state = ?, updated_at = ? WHERE state = ?",
+                               (owner, _ACCEPTED, now, _INTERRUPTED))
+            return [CheckpointedTask(task_id, name, json.loads(payload)) for task_id, name, payload in rows]
+
+        return self._transaction(claim)
+
+    def get_step(self, task_id: str, key: str) -> Optional[Any]:
+        row = self._connection().execute("SELECT value FROM steps WHERE task_id = ? AND key = ?",
+                                         (task_id, key)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_step(self, task_id: str, key: str, value: Any):
+        self._connection().execute("INSERT OR REPLACE INTO steps (task_id, key, value) VALUES (?, ?, ?)",
+                                   (task_id, key, json.dumps(value, default=str)))
+
+
+@dataclass
+class _Checkpoint:
+    store: CheckpointStore
+    task_id: str
+    # number of times each step was run by the task, so that repeated identical steps are told apart
+    occurrences: Counter = field(default_factory=Counter)
+
+
+_current_checkpoint: ContextVar[Optional[_Checkpoint]] = ContextVar("pr_agent_checkpoint", default=None)
+
+
+def set_current_checkpoint(store: CheckpointStore, task_id: str):
+    """Records the steps run in the current context (e.g. a background task) in the checkpoint of `task_id`."""
+    return _current_checkpoint.set(_Checkpoint(store, task_id))
+
+
+async def checkpointed(step: str, inputs: list, func: Callable[[], Awaitable[Any]]) -> Any:
+    """
+    Runs a step of the current task, e.g. an AI call, and records its (JSON serializable) result in the checkpoint of
+    the task. When the task is resumed after an interruption, the recorded result of a step with the same inputs is
+    returned instead of running it again. Outside a checkpointed task, `func` is simply run.
+    """
+    checkpoint = _current_checkpoint.get()
+    if checkpoint is None:
+        return await func()
+    key = f"{step}:{hashlib.sha256(json.dumps(inputs, default=str).encode()).hexdigest()}"
+    checkpoint.occurrences[key] += 1
+    key = f"{key}:{checkpoint.occurrences[key]}"
+    try:
+        result = await asyncio.to_thread(checkpoint.store.get_step, checkpoint.task_id, key)
+    except Exception as e:
+        get_logger().warning(f"Failed to read the checkpoint of step {step}: {e}")
+        result = None
+    if result is not None:
+        get_logger().info(f"Resuming from the checkpoint of step {step}")
+        return result
+    result = await func()
+    try:
+        await asyncio.to_thread(checkpoint.store.put_step, checkpoint.task_id, key, result)
+    except Exception as e:
+        get_logger().warning(f"Failed to checkpoint step {step}: {e}")
+    return result
+
+
+async def run_once(step: str, inputs: list, func: Callable[[], Awaitable[Any]]) -> bool:
+    """
+    Runs a step with side effects that must not be repeated, e.g. a tool publishing its results, and records its
+    completion in the checkpoint of the current task. When the task is resumed after an interruption, the step is
+    skipped if it completed before. Returns whether the step was run.
+    """
+    ran = False
+
+    async def run():
+        nonlocal ran
+        await func()
+        ran = True
+        return True
+
+    await checkpointed(step, inputs, run)
+    return ran
@@ -238,6 +238,23 @@ def extract_hunk_headers(match):
     return section_header, size1, size2, start1, start2
 
 
+def get_hunk_line_ranges(patch: str) -> list[tuple[range, range]]:
+    """
+    Return, for each hunk of a patch, the ranges of old-file (LEFT side) and new-file (RIGHT side) line numbers it covers.
+    """
+    RE_HUNK_HEADER = re.compile(
+        r"^@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@[ ]?(.*)")
+    hunk_ranges = []
+    for line in patch.splitlines():
+        if line.startswith('@@'):
+            match = RE_HUNK_HEADER.match(line)
+            if match:
+                # an omitted hunk size means a single line
+                start1, size1, start2, size2 = (int(group) if group is not None else 1 for group in match.groups()[:4])
+                hunk_ranges.append((range(start1, start1 + size1), range(start2, start2 + size2)))
+    return hunk_ranges
+
+
 def omit_deletion_hunks(patch_lines) -> str:
     """
     Omit deletion hunks from the patch and return the modified patch.
@@ -0,0 +1,244 @@
+# Copyright (c) 2023 PR-Agent Authors
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Cache of the data fetched by the tools (e.g. the PR files and diff), so that the tools handling the same request share
+it instead of fetching it again.
+
+Values are stored under typed keys, which define their lifetime:
+- REQUEST: the current request, i.e. a webhook event, or the command of a single-command entry point (CLI, GitHub
+  Action). In the webhook servers, the request is the starlette_context of the event.
+- PR_HEAD: a PR at a given head commit, across requests. The scope of the value must identify the head commit.
+- PROCESS: the process.
+PR_HEAD and PROCESS values are kept in a process-wide LRU, within CONFIG.REQUEST_CACHE_MAX_SIZE_MB.
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, fields, is_dataclass
+from enum import Enum
+from typing import Any, Callable, Generic, Hashable, Optional, TypeVar
+
+from starlette_context import context
+
+from pr_agent.algo.types import FilePatchInfo
+from pr_agent.config_loader import get_settings
+
+T = TypeVar("T")
+
+
+class CacheLifetime(str, Enum):
+    REQUEST = "request"
+    PR_HEAD = "pr_head"
+    PROCESS = "process"
+
+
+@dataclass(frozen=True)
+class CacheKey(Generic[T]):
+    """
+    Typed key of the request cache, e.g. `CacheKey[list[FilePatchInfo]]("diff_files", CacheLifetime.REQUEST)`.
+    Its values are told apart by the scope given on each access, e.g. the PR url.
+    `sizeof` estimates the size in bytes of a value, by default with `estimate_size`.
+    """
+    name: str
+    lifetime: CacheLifetime
+    sizeof: Optional[Callable[[T], int]] = None
+
+    def size_of(self, value: T) -> int:
+        return self.sizeof(value) if self.sizeof else estimate_size(value)
+
+
+def estimate_size(value, max_depth: int = 8) -> int:
+    """
+    Estimates the size in bytes of a value, including the strings and containers it holds. Other objects are only
+    counted shallowly, so that shared objects (e.g. API clients) are not counted with each value that refers to them.
+    """
+    size = sys.getsizeof(value)
+    if max_depth <= 0 or isinstance(value, (str, bytes, bytearray)):
+        return size
+    if isinstance(value, dict):
+        return size + sum(estimate_size(k, max_depth - 1) + estimate_size(v, max_depth - 1) for k, v in value.items())
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return size + sum(estimate_size(item, max_depth - 1) for item in value)
+    if is_dataclass(value) and not isinstance(value, type):
+        return size + sum(estimate_size(getattr(value, f.name, None), max_depth - 1) for f in fields(value))
+    return size
+
+
+class _Entries:
+    """Cached values of a request, keyed by (key name, scope), with their total size."""
+
+    def __init__(self):
+        self.values: dict[tuple[str, Hashable], tuple[object, int]] = {}
+        self.size_bytes = 0
+
+
+@dataclass
+class _KeyStats:
+    lifetime: CacheLifetime
+    hits: int = 0
+    misses: int = 0
+    puts: int = 0
+
+
+# keys shared by the git providers and the tools, scoped by PR (url)
+GIT_PROVIDER: CacheKey[Any] = CacheKey("git_provider", CacheLifetime.REQUEST, sizeof=sys.getsizeof)
+GIT_FILES: CacheKey[list] = CacheKey("git_files", CacheLifetime.REQUEST)
+DIFF_FILES: CacheKey[list[FilePatchInfo]] = CacheKey("diff_files", CacheLifetime.REQUEST)
+REPO_SETTINGS: CacheKey[Any] = CacheKey("repo_settings", CacheLifetime.REQUEST)
+
+_request_entries: ContextVar[Optional[_Entries]] = ContextVar("pr_agent_request_cache", default=None)
+# key of the request entries in the starlette_context of a webhook event
+_CONTEXT_KEY = "request_cache"
+
+
+@contextmanager
+def request_scope():
+    """Runs the enclosed code as a request of its own, with fresh REQUEST values (e.g. a polled notification)."""
+    token = _request_entries.set(_Entries())
+    try:
+        yield
+    finally:
+        _request_entries.reset(token)
+
+
+class RequestCache:
+    """
+    Registry of the cached values, by lifetime. Thread safe: the tools share the values with the threads running
+    their blocking git provider calls.
+    """
+
+    def __init__(self, max_size_bytes: int):
+        self.max_size_bytes = max_size_bytes
+        self._lock = threading.Lock()
+        self._process_values: OrderedDict[tuple[str, Hashable], tuple[object, int]] = OrderedDict()
+        self._process_size_bytes = 0
+        self._evictions = 0
+        # REQUEST values outside a webhook event: single-command entry points run a single request per process
+        self._default_request_entries = _Entries()
+        self._stats: dict[str, _KeyStats] = {}
+
+    def _request_entries(self) -> _Entries:
+        entries = _request_entries.get()
+        if entries is not None:
+            return entries
+        if not context.exists():
+            return self._default_request_entries
+        entries = context.get(_CONTEXT_KEY)
+        if entries is None:
+            with self._lock:
+                entries = context.get(_CONTEXT_KEY)
+                if entries is None:
+                    entries = context[_CONTEXT_KEY] = _Entries()
+        return entries
+
+    def _key_stats(self, key: CacheKey) -> _KeyStats:
+        stats = self._stats.get(key.name)
+        if stats is None:
+            stats = self._stats[key.name] = _KeyStats(key.lifetime)
+        return stats
+
+    def get(self, key: CacheKey[T], scope: Hashable = None) -> Optional[T]:
+        """Returns the value of `key` for `scope`, or None if it is not cached."""
+        entries = self._request_entries() if key.lifetime == CacheLifetime.REQUEST else None
+        with self._lock:
+            if entries is not None:
+                entry = entries.values.get((key.name, scope))
+            else:
+                entry = self._process_values.get((key.name, scope))
+                if entry is not None:
+                    self._process_values.move_to_end((key.name, scope))
+            stats = self._key_stats(key)
+            if entry is None:
+                stats.misses += 1
+                return None
+            stats.hits += 1
+            return entry[0]
+
+    def put(self, key: CacheKey[T], value: T, scope: Hashable = None):
+        """Caches the value of `key` for `scope`. None values are not cached."""
+        if value is None:
+            return
+        size = key.size_of(value)
+        entries = self._request_entries() if key.lifetime == CacheLifetime.REQUEST else None
+        with self._lock:
+            self._key_stats(key).puts += 1
+            if entries is not None:
+                previous = entries.values.pop((key.name, scope), None)
+                entries.size_bytes += size - (previous[1] if previous else 0)
+                entries.values[(key.name, scope)] = (value, size)
+                return
+            previous = self._process_values.pop((key.name, scope), None)
+            if previous:
+                self._process_size_bytes -= previous[1]
+            if size > self.max_size_bytes:
+                return
+            self._process_values[(key.name, scope)] = (value, size)
+            self._process_size_bytes += size
+            while self._process_size_bytes > self.max_size_bytes:
+                _, (_, evicted_size) = self._process_values.popitem(last=False)
+                self._process_size_bytes -= evicted_size
+                self._evictions += 1
+
+    def get_or_compute(self, key: CacheKey[T], compute: Callable[[], T], scope: Hashable = None) -> T:
+        """Returns the cached value of `key` for `scope`, or computes and caches it."""
+        value = self.get(key, scope)
+        if value is None:
+            value = compute()
+            self.put(key, value, scope)
+        return value
+
+    def invalidate(self, key: CacheKey, scope: Hashable = None):
+        entries = self._request_entries() if key.lifetime == CacheLifetime.REQUEST else None
+        with self._lock:
+            if entries is not None:
+                previous = entries.values.pop((key.name, scope), None)
+                if previous:
+                    entries.size_bytes -= previous[1]
+            else:
+                previous = self._process_values.pop((key.name, scope), None)
+                if previous:
+                    self._process_size_bytes -= previous[1]
+
+    def request_size(self) -> tuple[int, int]:
+        """Returns the number of REQUEST values of the current request, and their size in bytes."""
+        entries = self._request_entries()
+        with self._lock:
+            return len(entries.values), entries.size_bytes
+
+    def stats(self) -> dict:
+        """Hit/miss counts by key, and the size of the PR_HEAD and PROCESS values."""
+        with self._lock:
+            return {
+                "keys": {name: {"lifetime": stats.lifetime.value, "hits": stats.hits, "misses": stats.misses,
+                                "puts": stats.puts} for name, stats in self._stats.items()},
+                "process": {"entries": len(self._process_values), "size_bytes": self._process_size_bytes,
+                            "max_size_bytes": self.max_size_bytes, "evictions": self._evictions},
+            }
+
+
+_request_cache: Optional[RequestCache] = None
+_request_cache_lock = threading.Lock()
+
+
+def get_request_cache() -> RequestCache:
+    global _request_cache
+    if _request_cache is None:
+        with _request_cache_lock:
+            if _request_cache is None:
+                _request_cache = RequestCache(
+                    int(get_settings().get("CONFIG.REQUEST_CACHE_MAX_SIZE_MB", 128) * 1024 * 1024))
+    return _request_cache
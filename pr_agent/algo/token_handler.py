@@ -14,7 +14,6 @@
 from threading import Lock
 
 from jinja2 import Environment, StrictUndefined
-from tiktoken import encoding_for_model, get_encoding
 
 from pr_agent.config_loader import get_settings
 from pr_agent.log import get_logger
@@ -31,6 +30,8 @@ class TokenEncoder:
         if cls._encoder_instance is None or model != cls._model:  # Check without acquiring the lock for performance
             with cls._lock:  # Lock acquisition to ensure thread safety
                 if cls._encoder_instance is None or model != cls._model:
+                    # tiktoken is imported (and its encodings loaded) on first use
+                    from tiktoken import encoding_for_model, get_encoding
                     cls._model = model
                     try:
                         cls._encoder_instance = encoding_for_model(cls._model) if "gpt" in cls._model else get_encoding(
@@ -15,19 +15,25 @@ from __future__ import annotations
 
 import copy
 import difflib
+import functools
 import hashlib
 import html
+import importlib
 import json
 import os
 import re
+import shutil
+import subprocess
 import sys
+import tempfile
 import textwrap
 import time
 import traceback
+from collections.abc import Mapping
 from datetime import datetime
 from enum import Enum
 from importlib.metadata import PackageNotFoundError, version
-from typing import Any, List, Tuple
+from typing import Any, List, Optional, Tuple
 
 import html2text
 import requests
@@ -75,6 +81,40 @@ class PRDescriptionHeader(str, Enum):
     CHANGES_WALKTHROUGH = "### **Changes walkthrough** 📝"
 
 
+class LazyClassMap(Mapping):
+    """
+    Maps names to classes given as 'module:Class' paths, each imported on its first access. A process then only
+    imports the classes it uses, e.g. the tools of the commands it runs or its git provider, and their dependencies.
+    """
+
+    def __init__(self, paths: dict[str, str]):
+        self._paths = paths
+        self._classes = {}
+
+    def __getitem__(self, name: str) -> type:
+        cls = self._classes.get(name)
+        if cls is None:
+            module, _, class_name = self._paths[name].partition(":")
+            cls = self._classes[name] = getattr(importlib.import_module(module), class_name)
+        return cls
+
+    def __contains__(self, name) -> bool:
+        return name in self._paths
+
+    def __iter__(self):
+        return iter(self._paths)
+
+    def __len__(self) -> int:
+        return len(self._paths)
+
+    def find(self, class_name: str) -> Optional[type]:
+        """Return the class named `class_name`, or None if it is not in the map."""
+        for name, path in self._paths.items():
+            if path.rpartition(":")[2] == class_name:
+                return self[name]
+        return None
+
+
 def get_setting(key: str) -> Any:
     try:
         key = key.upper()
@@ -654,6 +694,9 @@ def load_large_diff(filename, new_file_content_str: str, original_file_content_s
     """
     Generate a patch for a modified file by comparing the original content of the file with the new content provided as
     input.
+    Small files are diffed in-process with difflib. Files with at least config.large_diff_git_min_lines lines are diffed
+    with 'git diff --no-index', which is much faster on large, heavily edited files; if that does not finish within
+    config.large_diff_timeout seconds, no patch is returned (an empty string), as for a file that failed to diff.
     """
     if not original_file_content_str and not new_file_content_str:
         return ""
@@ -661,10 +704,22 @@ def load_large_diff(filename, new_file_content_str: str, original_file_content_s
     try:
         original_file_content_str = (original_file_content_str or "").rstrip() + "\n"
         new_file_content_str = (new_file_content_str or "").rstrip() + "\n"
-        diff = difflib.unified_diff(original_file_content_str.splitlines(keepends=True),
-                                    new_file_content_str.splitlines(keepends=True))
         if get_settings().config.verbosity_level >= 2 and show_warning:
             get_logger().info(f"File was modified, but no patch was found. Manually creating patch: {filename}.")
+        original_lines = original_file_content_str.splitlines(keepends=True)
+        new_lines = new_file_content_str.splitlines(keepends=True)
+        git_min_lines = get_settings().get("CONFIG.LARGE_DIFF_GIT_MIN_LINES", 1000)
+        if git_min_lines >= 0 and max(len(original_lines), len(new_lines)) >= git_min_lines and _get_git_executable():
+            timeout = get_settings().get("CONFIG.LARGE_DIFF_TIMEOUT", 10)
+            try:
+                return _git_diff_no_index(original_file_content_str, new_file_content_str, timeout)
+            except subprocess.TimeoutExpired:
+                get_logger().warning(f"Generating the patch for file {filename} timed out after {timeout} seconds, "
+                                     f"skipping its patch")
+                return ""
+            except Exception as e:
+                get_logger().warning(f"Failed to generate patch with git for file: {filename}, falling back to difflib: {e}")
+        diff = difflib.unified_diff(original_lines, new_lines)
         patch = ''.join(diff)
         return patch
     except Exception as e:
@@ -672,6 +727,37 @@ def load_large_diff(filename, new_file_content_str: str, original_file_content_s
         return ""
 
 
+@functools.lru_cache(maxsize=1)
+def _get_git_executable() -> str | None:
+    return shutil.which("git")
+
+
+def _git_diff_no_index(original_file_content_str: str, new_file_content_str: str, timeout: float) -> str:
+    """
+    Diff two in-memory file versions with 'git diff --no-index' (histogram algorithm).
+    The output is normalized to the difflib format: an empty '--- '/'+++ ' header followed by the hunks.
+    """
+    with tempfile.TemporaryDirectory(prefix="pr_agent_diff_") as tmp_dir:
+        original_path = os.path.join(tmp_dir, "original")
+        new_path = os.path.join(tmp_dir, "new")
+        with open(original_path, "wb") as f:
+            f.write(original_file_content_str.encode("utf-8", errors="surrogateescape"))
+        with open(new_path, "wb") as f:
+            f.write(new_file_content_str.encode("utf-8", errors="surrogateescape"))
+        result = subprocess.run(
+            [_get_git_executable(), "-c", "core.autocrlf=false", "diff", "--no-index", "--no-color", "--no-ext-diff",
+             "--text", "--unified=3", "--diff-algorithm=histogram", "--", original_path, new_path],
+            cwd=tmp_dir, capture_output=True, timeout=timeout)
+    # 'git diff' exits with 1 when the files differ, and with 0 when they are identical
+    if result.returncode not in (0, 1):
+        raise RuntimeError(result.stderr.decode("utf-8", errors="replace").strip())
+    output = result.stdout.decode("utf-8", errors="replace")
+    first_hunk = output.find("\n@@ ")
+    if first_hunk == -1:
+        return ""
+    return "--- \n+++ \n" + output[first_hunk + 1:]
+
+
 def update_settings_from_args(args: List[str]) -> List[str]:
     """
     Update the settings of the Dynaconf object based on the arguments passed to the function.
@@ -11,45 +11,217 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import copy
 from os.path import abspath, dirname, join
 from pathlib import Path
-from typing import Optional
+from typing import Any, Optional
 
 from dynaconf import Dynaconf
+from dynaconf.utils import object_merge
+from dynaconf.utils.boxing import DynaBox
 from starlette_context import context
 
+from pr_agent.settings_snapshot import get_settings_snapshot
+
 PR_AGENT_TOML_KEY = 'pr-agent'
 
 current_dir = dirname(abspath(__file__))
+DEFAULT_SETTINGS_FILES = [join(current_dir, f) for f in [
+    "settings/configuration.toml",
+    "settings/ignore.toml",
+    "settings/language_extensions.toml",
+    "settings/pr_reviewer_prompts.toml",
+    "settings/pr_questions_prompts.toml",
+    "settings/pr_line_questions_prompts.toml",
+    "settings/pr_description_prompts.toml",
+    "settings/code_suggestions/pr_code_suggestions_prompts.toml",
+    "settings/code_suggestions/pr_code_suggestions_prompts_not_decoupled.toml",
+    "settings/code_suggestions/pr_code_suggestions_reflect_prompts.toml",
+    "settings/pr_information_from_user_prompts.toml",
+    "settings/pr_update_changelog_prompts.toml",
+    "settings/pr_custom_labels.toml",
+    "settings/pr_add_docs.toml",
+    "settings/custom_labels.toml",
+    "settings/pr_help_prompts.toml",
+    "settings/pr_help_docs_prompts.toml",
+    "settings/pr_help_docs_headings_prompts.toml",
+]]
+# deployment specific files, which are never part of the settings snapshot
+SECRETS_SETTINGS_FILES = [join(current_dir, f) for f in [
+    "settings/.secrets.toml",
+    "settings_prod/.secrets.toml",
+    "settings_prod/allowed_repos.toml",
+]]
+# a snapshot generated at build time (see settings_snapshot.py) replaces the default settings files while they match it
+_settings_snapshot = get_settings_snapshot(DEFAULT_SETTINGS_FILES)
 global_settings = Dynaconf(
     envvar_prefix=False,
     merge_enabled=True,
-    settings_files=[join(current_dir, f) for f in [
-        "settings/configuration.toml",
-        "settings/ignore.toml",
-        "settings/language_extensions.toml",
-        "settings/pr_reviewer_prompts.toml",
-        "settings/pr_questions_prompts.toml",
-        "settings/pr_line_questions_prompts.toml",
-        "settings/pr_description_prompts.toml",
-        "settings/code_suggestions/pr_code_suggestions_prompts.toml",
-        "settings/code_suggestions/pr_code_suggestions_prompts_not_decoupled.toml",
-        "settings/code_suggestions/pr_code_suggestions_reflect_prompts.toml",
-        "settings/pr_information_from_user_prompts.toml",
-        "settings/pr_update_changelog_prompts.toml",
-        "settings/pr_custom_labels.toml",
-        "settings/pr_add_docs.toml",
-        "settings/custom_labels.toml",
-        "settings/pr_help_prompts.toml",
-        "settings/pr_help_docs_prompts.toml",
-        "settings/pr_help_docs_headings_prompts.toml",
-        "settings/.secrets.toml",
-        "settings_prod/.secrets.toml",
-        "settings_prod/allowed_repos.toml",
-    ]]
+    settings_files=([_settings_snapshot] if _settings_snapshot else DEFAULT_SETTINGS_FILES) + SECRETS_SETTINGS_FILES,
 )
 
 
+_MISSING = object()
+_IMMUTABLE_TYPES = (str, int, float, bool, bytes, type(None))
+
+
+def _find_key(box: dict, key: str) -> str:
+    """Return the key of `box` matching `key` case-insensitively, like dynaconf does, or `key` itself if none does."""
+    if key in box:
+        return key
+    return next((existing for existing in box if existing.lower() == key.lower()), key)
+
+
+def _to_box(value: Any) -> Any:
+    return DynaBox(value) if isinstance(value, dict) and not isinstance(value, DynaBox) else value
+
+
+def _to_plain(value: Any) -> Any:
+    return value.to_dict() if isinstance(value, DynaBox) else value
+
+
+def _lookup(value: Any, path: list[str]) -> Any:
+    """Return the value at the (case-insensitive) key path of nested dicts, or _MISSING."""
+    for part in path:
+        if not isinstance(value, dict):
+            return _MISSING
+        value = value.get(_find_key(value, part), _MISSING)
+        if value is _MISSING:
+            return _MISSING
+    return value
+
+
+class SettingsOverlay:
+    """
+    A per-request, copy-on-write view of a shared Dynaconf settings object.
+    Reads go to the shared base settings, and writes to the overlay only - so a request (e.g. applying repo settings or
+    command line arguments) never changes the settings seen by other requests.
+    A top-level section is copied into the overlay the first time it is written, or read as a mutable object (e.g.
+    `settings.config`, which callers may modify in place). Reading immutable values, such as
+    `settings.get("config.model")`, copies nothing. This makes a new overlay nearly free, unlike a deep copy of the whole
+    settings tree with all the prompts.
+    Supports the subset of the Dynaconf API used on get_settings(): get/set/unset, attribute and item access,
+    as_dict/to_dict. Other attributes (e.g. find_file) are read from the base settings.
+    """
+
+    def __init__(self, base: Dynaconf):
+        object.__setattr__(self, "_base", base)
+        object.__setattr__(self, "_sections", {})  # upper-case top-level key -> private copy, or _MISSING if unset
+        object.__setattr__(self, "_shared", {})  # upper-case top-level key -> read-only section shared between overlays
+
+    @property
+    def base(self) -> Dynaconf:
+        return self._base
+
+    def share_sections(self, sections: dict[str, Any]) -> list[str]:
+        """
+        Use read-only sections, shared with other overlays, in place of the base sections - e.g. base sections
+        pre-merged with a repo settings file. Like the base sections, they are copied only when written, or read as
+        mutable objects. Sections that already have a private copy are not replaced: their names are returned.
+        """
+        not_shared = []
+        for name, value in sections.items():
+            name = name.upper()
+            if name in self._sections:
+                not_shared.append(name)
+            else:
+                self._shared[name] = value
+        return not_shared
+
+    def _has_section(self, name: str) -> bool:
+        if name in self._sections:
+            return self._sections[name] is not _MISSING
+        return name in self._shared or self._base.get(name, _MISSING) is not _MISSING
+
+    def _section(self, name: str, default: Any = _MISSING) -> Any:
+        """Return the private copy of a top-level section, copying it from the base settings on first use."""
+        if name not in self._sections:
+            value = self._shared[name] if name in self._shared else self._base.get(name, _MISSING)
+            self._sections[name] = value if value is _MISSING else copy.deepcopy(value)
+        value = self._sections[name]
+        return default if value is _MISSING else value
+
+    def get(self, key: str, default: Any = None, **kwargs) -> Any:
+        name, *path = key.split(".")
+        name = name.upper()
+        if name not in self._sections:
+            if name in self._shared:
+                value = _lookup(self._shared[name], path)
+            else:
+                value = self._base.get(key, _MISSING, **kwargs)
+            if value is _MISSING:
+                return default
+            if isinstance(value, _IMMUTABLE_TYPES):
+                return value
+        # a mutable value may be modified in place by the caller, so it must come from the private copy
+        value = _lookup(self._section(name), path)
+        return default if value is _MISSING else value
+
+    def set(self, key: str, value: Any, merge: Any = _MISSING, **kwargs):
+        """Same semantics as Dynaconf.set: dotted keys replace the leaf value, top-level keys are merged by default."""
+        name, *path = key.split(".")
+        name = name.upper()
+        if path:
+            value = _to_box(value)
+            section = self._section(name, None)
+            if not isinstance(section, dict):
+                section = self._sections[name] = DynaBox()
+            parent = section
+            for part in path[:-1]:
+                part = _find_key(parent, part)
+                if not isinstance(parent.get(part), dict):
+                    parent[part] = DynaBox()
+                parent = parent[part]
+            parent[_find_key(parent, path[-1])] = value
+            return
+        if merge is _MISSING:
+            merge = self._base.get("MERGE_ENABLED_FOR_DYNACONF", False)
+        existing = self._section(name, None)
+        value = _to_plain(value)
+        if merge and existing is not None:
+            # like dynaconf: nested dicts are merged, and the items of existing lists are kept before the new ones
+            value = object_merge(existing, value)
+        self._sections[name] = _to_box(value)
+
+    def unset(self, key: str, **kwargs):
+        self._sections[key.upper()] = _MISSING
+
+    def as_dict(self, **kwargs) -> dict:
+        data = self._base.as_dict(**kwargs)
+        for name, value in (self._shared | self._sections).items():
+            if value is _MISSING:
+                data.pop(name, None)
+            else:
+                data[name] = value.to_dict() if isinstance(value, DynaBox) else copy.deepcopy(value)
+        return data
+
+    to_dict = as_dict
+
+    def __getitem__(self, key: str) -> Any:
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            raise KeyError(key)
+        return value
+
+    def __contains__(self, key: str) -> bool:
+        return self.get(key, _MISSING) is not _MISSING
+
+    def __getattr__(self, name: str) -> Any:
+        # only called for names that are not attributes of the overlay itself
+        if not name.startswith("_") and self._has_section(name.upper()):
+            return self._section(name.upper())
+        return getattr(self._base, name)
+
+    def __setattr__(self, name: str, value: Any):
+        self.set(name, value, merge=False)
+
+    def __deepcopy__(self, memo) -> "SettingsOverlay":
+        overlay = SettingsOverlay(self._base)
+        overlay._shared.update(self._shared)  # read-only, so not copied
+        overlay._sections.update(copy.deepcopy(self._sections, memo))
+        return overlay
+
+
 def get_settings(use_context=False):
     """
     Retrieves the current settings.
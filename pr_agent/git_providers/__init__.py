@@ -11,32 +11,39 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from starlette_context import context
-
+from pr_agent.algo.request_cache import GIT_PROVIDER, get_request_cache
+from pr_agent.algo.utils import LazyClassMap
 from pr_agent.config_loader import get_settings
-from pr_agent.git_providers.azuredevops_provider import AzureDevopsProvider
-from pr_agent.git_providers.bitbucket_provider import BitbucketProvider
-from pr_agent.git_providers.bitbucket_server_provider import \
-    BitbucketServerProvider
-from pr_agent.git_providers.codecommit_provider import CodeCommitProvider
-from pr_agent.git_providers.gerrit_provider import GerritProvider
+from pr_agent.git_providers.async_git_provider import (AsyncGitProvider,
+                                                       ThreadedGitProvider)
 from pr_agent.git_providers.git_provider import GitProvider
-from pr_agent.git_providers.gitea_provider import GiteaProvider
-from pr_agent.git_providers.github_provider import GithubProvider
-from pr_agent.git_providers.gitlab_provider import GitLabProvider
-from pr_agent.git_providers.local_git_provider import LocalGitProvider
 
-_GIT_PROVIDERS = {
-    'github': GithubProvider,
-    'gitlab': GitLabProvider,
-    'bitbucket': BitbucketProvider,
-    'bitbucket_server': BitbucketServerProvider,
-    'azure': AzureDevopsProvider,
-    'codecommit': CodeCommitProvider,
-    'local': LocalGitProvider,
-    'gerrit': GerritProvider,
-    'gitea': GiteaProvider,
-}
+
+# the providers (and their SDKs) are only imported when they are first used
+_GIT_PROVIDERS = LazyClassMap({
+    'github': 'pr_agent.git_providers.github_provider:GithubProvider',
+    'gitlab': 'pr_agent.git_providers.gitlab_provider:GitLabProvider',
+    'bitbucket': 'pr_agent.git_providers.bitbucket_provider:BitbucketProvider',
+    'bitbucket_server': 'pr_agent.git_providers.bitbucket_server_provider:BitbucketServerProvider',
+    'azure': 'pr_agent.git_providers.azuredevops_provider:AzureDevopsProvider',
+    'codecommit': 'pr_agent.git_providers.codecommit_provider:CodeCommitProvider',
+    'local': 'pr_agent.git_providers.local_git_provider:LocalGitProvider',
+    'gerrit': 'pr_agent.git_providers.gerrit_provider:GerritProvider',
+    'gitea': 'pr_agent.git_providers.gitea_provider:GiteaProvider',
+})
+
+_ASYNC_GIT_PROVIDERS = LazyClassMap({
+    'github': 'pr_agent.git_providers.async_github_provider:AsyncGithubProvider',
+    'gitlab': 'pr_agent.git_providers.async_gitlab_provider:AsyncGitLabProvider',
+})
+
+
+def __getattr__(name: str):
+    # the provider classes are still importable from this package, e.g. `from pr_agent.git_providers import GithubProvider`
+    cls = _GIT_PROVIDERS.find(name) or _ASYNC_GIT_PROVIDERS.find(name)
+    if cls is None:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    return cls
 
 
 def get_git_provider():
@@ -51,29 +58,35 @@ def get_git_provider():
 
 def get_git_provider_with_context(pr_url) -> GitProvider:
     """
-    Get a GitProvider instance for the given PR URL. If the GitProvider instance is already in the context, return it.
+    Get a GitProvider instance for the given PR URL. The instance is shared by the tools handling the current request.
     """
-
-    is_context_env = None
+    request_cache = get_request_cache()
+    git_provider = request_cache.get(GIT_PROVIDER, pr_url)
+    if git_provider is not None:
+        return git_provider
     try:
-        is_context_env = context.get("settings", None)
-    except Exception:
-        pass  # we are not in a context environment (CLI)
-
-    # check if context["git_provider"]["pr_url"] exists
-    if is_context_env and context.get("git_provider", {}).get("pr_url", {}):
-        git_provider = context["git_provider"]["pr_url"]
-        # possibly check if the git_provider is still valid, or if some reset is needed
-        # ...
+        provider_id = get_settings().config.git_provider
+        if provider_id not in _GIT_PROVIDERS:
+            raise ValueError(f"Unknown git provider: {provider_id}")
+        git_provider = _GIT_PROVIDERS[provider_id](pr_url)
+        request_cache.put(GIT_PROVIDER, git_provider, pr_url)
         return git_provider
-    else:
-        try:
-            provider_id = get_settings().config.git_provider
-            if provider_id not in _GIT_PROVIDERS:
-                raise ValueError(f"Unknown git provider: {provider_id}")
-            git_provider = _GIT_PROVIDERS[provider_id](pr_url)
-            if is_context_env:
-                context["git_provider"] = {pr_url: git_provider}
-            return git_provider
-        except Exception as e:
-            raise ValueError(f"Failed to get git provider for {pr_url}") from e
+    except Exception as e:
+        raise ValueError(f"Failed to get git provider for {pr_url}") from e
+
+
+async def get_async_git_provider(pr_url) -> AsyncGitProvider:
+    """
+    Get an AsyncGitProvider instance for the given PR URL.
+    Providers with a native async implementation are used directly. Any other provider is wrapped
+    in a ThreadedGitProvider, which runs its blocking calls in a thread pool.
+    """
+    provider_id = get_settings().config.git_provider
+    if provider_id not in _GIT_PROVIDERS:
+        raise ValueError(f"Unknown git provider: {provider_id}")
+    try:
+        if provider_id in _ASYNC_GIT_PROVIDERS and get_settings().get("CONFIG.USE_NATIVE_ASYNC_GIT_PROVIDER", True):
+            return _ASYNC_GIT_PROVIDERS[provider_id](pr_url)
+        return await ThreadedGitProvider.create(_GIT_PROVIDERS[provider_id], pr_url)
+    except Exception as e:
+        raise ValueError(f"Failed to get async git provider for {pr_url}") from e
@@ -0,0 +1,309 @@
+# Copyright (c) 2023 PR-Agent Authors
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import contextvars
+import functools
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+import aiohttp
+
+from pr_agent.algo.types import FilePatchInfo
+from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.git_provider import GitProvider
+from pr_agent.log import get_logger
+
+_executor: Optional[ThreadPoolExecutor] = None
+_executor_lock = threading.Lock()
+_http_sessions: dict[asyncio.AbstractEventLoop, aiohttp.ClientSession] = {}
+_http_sessions_lock = threading.Lock()
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                max_workers = get_settings().get("CONFIG.GIT_PROVIDER_THREAD_POOL_SIZE", 32)
+                _executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="git_provider")
+    return _executor
+
+
+async def run_in_thread(func: Callable, *args, **kwargs) -> Any:
+    """
+    Run a blocking function in the shared git provider thread pool.
+    The current context is copied into the worker thread, so request-scoped settings (starlette_context)
+    remain visible to the sync provider code.
+    """
+    loop = asyncio.get_running_loop()
+    ctx = contextvars.copy_context()
+    return await loop.run_in_executor(_get_executor(), functools.partial(ctx.run, func, *args, **kwargs))
+
+
+async def gather_bounded(coros: Iterable[Awaitable], limit: int) -> list:
+    """Await the given coroutines concurrently, with at most `limit` of them in flight. Order is preserved."""
+    semaphore = asyncio.Semaphore(max(1, limit))
+
+    async def _bounded(coro):
+        async with semaphore:
+            return await coro
+
+    return await asyncio.gather(*[_bounded(coro) for coro in coros])
+
+
+def _evict_closed_loop_sessions():
+    """Drops the sessions of the event loops that were closed without closing their session (e.g. asyncio.run)."""
+    for loop in [loop for loop in _http_sessions if loop.is_closed()]:
+        session = _http_sessions.pop(loop)
+        connector = session.connector
+        session.detach()
+        if connector is not None and not connector.closed:
+            try:
+                # the connections of a closed loop can only be dropped: close() would wait for them on the loop
+                connector._close()
+            except Exception as e:
+                get_logger().debug(f"Failed to close the connections of a closed event loop: {e}")
+
+
+def get_async_http_session() -> aiohttp.ClientSession:
+    """
+    Return the aiohttp session shared by all async git providers running on the current event loop.
+    A session is bound to the loop it was created on, so one session is kept per loop. The sessions of closed loops
+    are dropped.
+    """
+    loop = asyncio.get_running_loop()
+    with _http_sessions_lock:
+        _evict_closed_loop_sessions()
+        session = _http_sessions.get(loop)
+        if session is None or session.closed:
+            limit = get_settings().get("CONFIG.GIT_PROVIDER_HTTP_CONNECTIONS", 100)
+            timeout = get_settings().get("CONFIG.GIT_PROVIDER_HTTP_TIMEOUT", 60)
+            session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=limit),
+                                            timeout=aiohttp.ClientTimeout(total=timeout))
+            _http_sessions[loop] = session
+    return session
+
+
+async def close_async_http_session():
+    """Close the shared aiohttp session of the current event loop (e.g. on server shutdown)."""
+    with _http_sessions_lock:
+        session = _http_sessions.pop(asyncio.get_running_loop(), None)
+    if session is not None and not session.closed:
+        await session.close()
+
+
+class AsyncGitProviderError(Exception):
+    """Raised when an async git provider receives an unexpected response from the git server."""
+
+    def __init__(self, message: str, status: int = None):
+        super().__init__(message)
+        self.status = status
+
+
+class AsyncGitProvider(ABC):
+    """
+    The async counterpart of GitProvider, for code that runs on the event loop.
+    Only the calls tools make on every run are part of this interface; see ThreadedGitProvider for
+    awaiting any other method of a sync provider.
+    """
+
+    @abstractmethod
+    async def get_files(self) -> list:
+        pass
+
+    @abstractmethod
+    async def get_diff_files(self) -> list[FilePatchInfo]:
+        pass
+
+    @abstractmethod
+    async def get_pr_file_content(self, file_path: str, branch: str) -> str:
+        pass
+
+    @abstractmethod
+    async def get_title(self) -> str:
+        pass
+
+    @abstractmethod
+    async def get_pr_branch(self) -> str:
+        pass
+
+    @abstractmethod
+    async def get_pr_description_full(self) -> str:
+        pass
+
+    @abstractmethod
+    async def publish_description(self, pr_title: str, pr_body: str):
+        pass
+
+    @abstractmethod
+    async def publish_comment(self, pr_comment: str, is_temporary: bool = False):
+        pass
+
+    async def edit_comment(self, comment, body: str):
+        pass
+
+    async def remove_comment(self, comment):
+        pass
+
+    async def get_issue_comments(self) -> list:
+        raise NotImplementedError("The async git provider does not support getting issue comments")
+
+    async def publish_labels(self, labels: list[str]):
+        pass
+
+    async def get_pr_labels(self, update: bool = False) -> list[str]:
+        pass
+
+    async def get_commit_messages(self) -> str:
+        pass
+
+    async def close(self):
+        pass
+
+    def limit_output_characters(self, output: str, max_chars: int):
+        return output[:max_chars] + '...' if len(output) > max_chars else output
+
+
+class ThreadedGitProvider(AsyncGitProvider):
+    """
+    Adapts a sync GitProvider to the async interface by running each call in the shared thread pool,
+    so that blocking HTTP calls do not stall the event loop.
+    Methods that are not part of AsyncGitProvider are exposed as awaitables as well, e.g.
+    `await provider.get_repo_settings()`. The wrapped provider is available as `git_provider`.
+    """
+
+    def __init__(self, git_provider: GitProvider):
+        self.git_provider = git_provider
+
+    @classmethod
+    async def create(cls, provider_cls: type[GitProvider], pr_url: str) -> "ThreadedGitProvider":
+        # provider constructors already talk to the git server, so they run in the thread pool as well
+        return cls(await run_in_thread(provider_cls, pr_url))
+
+    def __getattr__(self, name: str):
+        if name == "git_provider":
+            raise AttributeError(name)
+        attr = getattr(self.git_provider, name)
+        if not callable(attr):
+            return attr
+
+        async def _call(*args, **kwargs):
+            return await run_in_thread(attr, *args, **kwargs)
+
+        return _call
+
+    async def get_files(self) -> list:
+        return await run_in_thread(self.git_provider.get_files)
+
+    async def get_diff_files(self) -> list[FilePatchInfo]:
+        return await run_in_thread(self.git_provider.get_diff_files)
+
+    async def get_pr_file_content(self, file_path: str, branch: str) -> str:
+        return await run_in_thread(self.git_provider.get_pr_file_content, file_path, branch)
+
+    async def get_title(self) -> str:
+        return await run_in_thread(self.git_provider.get_title)
+
+    async def get_pr_branch(self) -> str:
+        return await run_in_thread(self.git_provider.get_pr_branch)
+
+    async def get_pr_description_full(self) -> str:
+        return await run_in_thread(self.git_provider.get_pr_description_full)
+
+    async def publish_description(self, pr_title: str, pr_body: str):
+        return await run_in_thread(self.git_provider.publish_description, pr_title, pr_body)
+
+    async def publish_comment(self, pr_comment: str, is_temporary: bool = False):
+        return await run_in_thread(self.git_provider.publish_comment, pr_comment, is_temporary)
+
+    async def edit_comment(self, comment, body: str):
+        return await run_in_thread(self.git_provider.edit_comment, comment, body)
+
+    async def remove_comment(self, comment):
+        return await run_in_thread(self.git_provider.remove_comment, comment)
+
+    async def get_issue_comments(self) -> list:
+        return await run_in_thread(lambda: list(self.git_provider.get_issue_comments()))
+
+    async def publish_labels(self, labels: list[str]):
+        return await run_in_thread(self.git_provider.publish_labels, labels)
+
+    async def get_pr_labels(self, update: bool = False) -> list[str]:
+        return await run_in_thread(self.git_provider.get_pr_labels, update=update)
+
+    async def get_commit_messages(self) -> str:
+        return await run_in_thread(self.git_provider.get_commit_messages)
+
+
+class AsyncRestGitProvider(AsyncGitProvider):
+    """Base class for async providers that talk to a REST API through the shared aiohttp session."""
+
+    async def _get_auth_headers(self) -> dict:
+        return {}
+
+    async def _request(self, method: str, url: str, *, params: dict = None, json: Any = None,
+                       headers: dict = None, raw: bool = False, allowed_statuses: tuple = ()) -> Any:
+        request_headers = await self._get_auth_headers()
+        if headers:
+            request_headers.update(headers)
+        session = get_async_http_session()
+        async with session.request(method, url, params=params, json=json, headers=request_headers) as response:
+            if response.status in allowed_statuses:
+                return None
+            if response.status >= 400:
+                text = await response.text()
+                raise AsyncGitProviderError(f"{method} {url} failed with status {response.status}: {text[:500]}",
+                                            status=response.status)
+            if raw:
+                return await response.read()
+            if response.status == 204 or response.content_length == 0:
+                return None
+            return await response.json(content_type=None)
+
+    async def _paginate(self, url: str, params: dict = None, per_page: int = 100) -> list:
+        """Follow `Link: rel="next"` headers (used by both GitHub and GitLab) and collect all items."""
+        items = []
+        params = dict(params or {})
+        params.setdefault("per_page", per_page)
+        session = get_async_http_session()
+        next_url = url
+        while next_url:
+            async with session.get(next_url, params=params, headers=await self._get_auth_headers()) as response:
+                if response.status >= 400:
+                    text = await response.text()
+                    raise AsyncGitProviderError(f"GET {next_url} failed with status {response.status}: {text[:500]}",
+                                                status=response.status)
+                page = await response.json(content_type=None)
+                items.extend(page)
+                next_link = response.links.get("next")
+                next_url = str(next_link["url"]) if next_link else None
+                params = None  # the next link already carries the query string
+        return items
+
+    async def _fetch_contents(self, file_refs: list[tuple[str, str]]) -> list[str]:
+        """Fetch (file_path, ref) pairs concurrently, bounded by config.git_provider_concurrency."""
+        limit = get_settings().get("CONFIG.GIT_PROVIDER_CONCURRENCY", 8)
+        return await gather_bounded([self.get_pr_file_content(path, ref) for path, ref in file_refs], limit)
+
+    @staticmethod
+    def _decode(content: Optional[bytes], file_path: str) -> str:
+        if not content:
+            return ""
+        try:
+            return content.decode("utf-8")
+        except UnicodeDecodeError:
+            get_logger().warning(f"Cannot decode file {file_path}")
+            return ""
@@ -0,0 +1,207 @@
+# Copyright (c) 2023 PR-Agent Authors
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from types import SimpleNamespace
+from typing import Optional
+from urllib.parse import quote
+
+from github import Auth
+
+from ..algo.file_filter import filter_ignored
+from ..algo.language_handler import is_valid_file
+from ..algo.types import EDIT_TYPE, FilePatchInfo
+from ..algo.utils import clip_tokens, load_large_diff
+from ..config_loader import get_settings
+from ..log import get_logger
+from .async_git_provider import (AsyncGitProviderError, AsyncRestGitProvider,
+                                 run_in_thread)
+from .git_provider import MAX_FILES_ALLOWED_FULL
+from .github_provider import GithubProvider
+
+_GITHUB_EDIT_TYPES = {
+    'added': EDIT_TYPE.ADDED,
+    'removed': EDIT_TYPE.DELETED,
+    'renamed': EDIT_TYPE.RENAMED,
+    'modified': EDIT_TYPE.MODIFIED,
+}
+
+
+class AsyncGithubProvider(AsyncRestGitProvider):
+    """
+    Async GitHub provider talking to the REST API through the shared aiohttp session.
+    Authentication (user token or pooled app installation token) is shared with GithubProvider.
+    """
+
+    def __init__(self, pr_url: str):
+        # without a PR url, GithubProvider only builds the (pooled) authenticated client - no API calls are made
+        github_provider = GithubProvider()
+        self.base_url = github_provider.base_url
+        self._auth = github_provider.auth
+        self.max_comment_chars = 65000
+        self.repo, self.pr_num = github_provider._parse_pr_url(pr_url)
+        self.pr_url = pr_url
+        self._pr: Optional[dict] = None
+        self.git_files = None
+        self.diff_files = None
+
+    @property
+    def _repo_url(self) -> str:
+        return f"{self.base_url}/repos/{self.repo}"
+
+    async def _get_auth_headers(self) -> dict:
+        if isinstance(self._auth, Auth.Token):
+            token = self._auth.token
+        else:
+            # installation tokens may need to be minted (a blocking call); afterwards they are cached on the auth
+            token = await run_in_thread(lambda: self._auth.token)
+        return {"Authorization": f"token {token}", "Accept": "application/vnd.github+json"}
+
+    async def get_pr(self, update: bool = False) -> dict:
+        if self._pr is None or update:
+            self._pr = await self._request("GET", f"{self._repo_url}/pulls/{self.pr_num}")
+        return self._pr
+
+    async def get_files(self) -> list:
+        if self.git_files is None:
+            files = await self._paginate(f"{self._repo_url}/pulls/{self.pr_num}/files")
+            self.git_files = [SimpleNamespace(**file) for file in files]
+        return self.git_files
+
+    async def get_pr_file_content(self, file_path: str, branch: str) -> str:
+        content = await self._request("GET", f"{self._repo_url}/contents/{quote(file_path)}",
+                                      params={"ref": branch},
+                                      headers={"Accept": "application/vnd.github.raw"},
+                                      raw=True, allowed_statuses=(404,))
+        return self._decode(content, file_path)
+
+    async def _get_merge_base_sha(self, pr: dict) -> str:
+        try:
+            compare = await self._request("GET", f"{self._repo_url}/compare/{pr['base']['sha']}...{pr['head']['sha']}")
+            return compare["merge_base_commit"]["sha"]
+        except Exception as e:
+            get_logger().error(f"Failed to get merge base commit: {e}")
+            return pr['base']['sha']
+
+    async def get_diff_files(self) -> list[FilePatchInfo]:
+        if self.diff_files:
+            return self.diff_files
+
+        pr = await self.get_pr()
+        files = filter_ignored(await self.get_files())
+        merge_base_sha = await self._get_merge_base_sha(pr)
+
+        valid_files = []
+        invalid_files_names = []
+        for file in files:
+            if is_valid_file(file.filename):
+                valid_files.append(file)
+            else:
+                invalid_files_names.append(file.filename)
+
+        # allow only a limited number of files to be fully loaded. We can manage the rest with diffs only
+        file_refs = []
+        for index, file in enumerate(valid_files):
+            if index + 1 < MAX_FILES_ALLOWED_FULL or not getattr(file, 'patch', None):
+                file_refs.append((file.filename, pr['head']['sha']))
+                file_refs.append((getattr(file, 'previous_filename', None) or file.filename, merge_base_sha))
+        contents = iter(await self._fetch_contents(file_refs))
+
+        diff_files = []
+        for index, file in enumerate(valid_files):
+            patch = getattr(file, 'patch', None)
+            if index + 1 < MAX_FILES_ALLOWED_FULL or not patch:
+                new_file_content_str = next(contents)
+                original_file_content_str = next(contents)
+            else:
+                new_file_content_str = original_file_content_str = ""
+            if not patch:
+                patch = load_large_diff(file.filename, new_file_content_str, original_file_content_str)
+
+            edit_type = _GITHUB_EDIT_TYPES.get(file.status, EDIT_TYPE.UNKNOWN)
+            if edit_type == EDIT_TYPE.UNKNOWN:
+                get_logger().error(f"Unknown edit type: {file.status}")
+            diff_files.append(FilePatchInfo(original_file_content_str, new_file_content_str, patch, file.filename,
+                                            edit_type=edit_type,
+                                            num_plus_lines=file.additions,
+                                            num_minus_lines=file.deletions,
+                                            old_filename=getattr(file, 'previous_filename', None)))
+        if invalid_files_names:
+            get_logger().info(f"Filtered out files with invalid extensions: {invalid_files_names}")
+
+        self.diff_files = diff_files
+        return diff_files
+
+    async def get_title(self) -> str:
+        return (await self.get_pr())["title"]
+
+    async def get_pr_branch(self) -> str:
+        return (await self.get_pr())["head"]["ref"]
+
+    async def get_pr_description_full(self) -> str:
+        return (await self.get_pr())["body"] or ""
+
+    async def publish_description(self, pr_title: str, pr_body: str):
+        self._pr = await self._request("PATCH", f"{self._repo_url}/pulls/{self.pr_num}",
+                                       json={"title": pr_title, "body": pr_body})
+
+    async def publish_comment(self, pr_comment: str, is_temporary: bool = False):
+        if is_temporary and not get_settings().config.publish_output_progress:
+            get_logger().debug(f"Skipping publish_comment for temporary comment: {pr_comment}")
+            return None
+        pr_comment = self.limit_output_characters(pr_comment, self.max_comment_chars)
+        comment = await self._request("POST", f"{self._repo_url}/issues/{self.pr_num}/comments",
+                                      json={"body": pr_comment})
+        comment["is_temporary"] = is_temporary
+        return comment
+
+    async def edit_comment(self, comment: dict, body: str):
+        body = self.limit_output_characters(body, self.max_comment_chars)
+        return await self._request("PATCH", f"{self._repo_url}/issues/comments/{comment['id']}", json={"body": body})
+
+    async def remove_comment(self, comment: dict):
+        try:
+            await self._request("DELETE", f"{self._repo_url}/issues/comments/{comment['id']}")
+        except AsyncGitProviderError as e:
+            get_logger().exception(f"Failed to remove comment, error: {e}")
+
+    async def get_issue_comments(self) -> list:
+        return await self._paginate(f"{self._repo_url}/issues/{self.pr_num}/comments")
+
+    async def publish_labels(self, labels: list[str]):
+        try:
+            await self._request("PUT", f"{self._repo_url}/issues/{self.pr_num}/labels", json={"labels": labels})
+        except AsyncGitProviderError as e:
+            get_logger().warning(f"Failed to publish labels, error: {e}")
+
+    async def get_pr_labels(self, update: bool = False) -> list[str]:
+        try:
+            if update:
+                labels = await self._paginate(f"{self._repo_url}/issues/{self.pr_num}/labels")
+            else:
+                labels = (await self.get_pr())["labels"]
+            return [label["name"] for label in labels]
+        except Exception as e:
+            get_logger().exception(f"Failed to get labels, error: {e}")
+            return []
+
+    async def get_commit_messages(self) -> str:
+        max_tokens = get_settings().get("CONFIG.MAX_COMMITS_TOKENS", None)
+        try:
+            commits = await self._paginate(f"{self._repo_url}/pulls/{self.pr_num}/commits")
+            commit_messages = [commit["commit"]["message"] for commit in commits]
+            commit_messages_str = "\n".join([f"{i + 1}. {message}" for i, message in enumerate(commit_messages)])
+        except Exception:
+            commit_messages_str = ""
+        if max_tokens:
+            commit_messages_str = clip_tokens(commit_messages_str, max_tokens)
+        return commit_messages_str
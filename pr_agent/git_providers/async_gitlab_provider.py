@@ -0,0 +1,192 @@
+# Copyright (c) 2023 PR-Agent Authors
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from typing import Optional
+from urllib.parse import quote
+
+from ..algo.file_filter import filter_ignored
+from ..algo.language_handler import is_valid_file
+from ..algo.types import EDIT_TYPE, FilePatchInfo
+from ..algo.utils import clip_tokens, load_large_diff
+from ..config_loader import get_settings
+from ..log import get_logger
+from .async_git_provider import AsyncGitProviderError, AsyncRestGitProvider
+from .git_provider import MAX_FILES_ALLOWED_FULL
+from .gitlab_provider import GitLabProvider
+
+
+class AsyncGitLabProvider(AsyncRestGitProvider):
+    """Async GitLab provider talking to the v4 REST API through the shared aiohttp session."""
+
+    def __init__(self, merge_request_url: str):
+        gitlab_url = get_settings().get("GITLAB.URL", None)
+        if not gitlab_url:
+            raise ValueError("GitLab URL is not set in the config file")
+        self.gitlab_url = gitlab_url.rstrip("/")
+        self._access_token = get_settings().get("GITLAB.PERSONAL_ACCESS_TOKEN", None)
+        if not self._access_token:
+            raise ValueError("GitLab personal access token is not set in the config file")
+        self.max_comment_chars = 65000
+        self.pr_url = merge_request_url
+        self.id_project, self.id_mr = GitLabProvider._parse_merge_request_url(merge_request_url)
+        self._mr: Optional[dict] = None
+        self._changes: Optional[list] = None
+        self.git_files = None
+        self.diff_files = None
+
+    @property
+    def _project_url(self) -> str:
+        return f"{self.gitlab_url}/api/v4/projects/{quote(self.id_project, safe='')}"
+
+    @property
+    def _mr_url(self) -> str:
+        return f"{self._project_url}/merge_requests/{self.id_mr}"
+
+    async def _get_auth_headers(self) -> dict:
+        return {"Authorization": f"Bearer {self._access_token}"}
+
+    async def get_mr(self, update: bool = False) -> dict:
+        if self._mr is None or update:
+            self._mr = await self._request("GET", self._mr_url)
+        return self._mr
+
+    async def _get_changes(self) -> list:
+        if self._changes is None:
+            self._changes = (await self._request("GET", f"{self._mr_url}/changes"))["changes"]
+        return self._changes
+
+    async def get_files(self) -> list:
+        if not self.git_files:
+            self.git_files = [change['new_path'] for change in await self._get_changes()]
+        return self.git_files
+
+    async def get_pr_file_content(self, file_path: str, branch: str) -> str:
+        content = await self._request("GET", f"{self._project_url}/repository/files/{quote(file_path, safe='')}/raw",
+                                      params={"ref": branch}, raw=True, allowed_statuses=(404,))
+        return self._decode(content, file_path)
+
+    async def get_diff_files(self) -> list[FilePatchInfo]:
+        if self.diff_files:
+            return self.diff_files
+
+        mr = await self.get_mr()
+        diffs = filter_ignored(await self._get_changes(), 'gitlab')
+
+        valid_diffs = []
+        invalid_files_names = []
+        for diff in diffs:
+            if is_valid_file(diff['new_path']):
+                valid_diffs.append(diff)
+            else:
+                invalid_files_names.append(diff['new_path'])
+
+        # allow only a limited number of files to be fully loaded. We can manage the rest with diffs only
+        file_refs = []
+        for index, diff in enumerate(valid_diffs):
+            if index + 1 < MAX_FILES_ALLOWED_FULL or not diff['diff']:
+                file_refs.append((diff['old_path'], mr['diff_refs']['base_sha']))
+                file_refs.append((diff['new_path'], mr['diff_refs']['head_sha']))
+        contents = iter(await self._fetch_contents(file_refs))
+
+        diff_files = []
+        for index, diff in enumerate(valid_diffs):
+            if index + 1 < MAX_FILES_ALLOWED_FULL or not diff['diff']:
+                original_file_content_str = next(contents)
+                new_file_content_str = next(contents)
+            else:
+                original_file_content_str = new_file_content_str = ''
+
+            edit_type = EDIT_TYPE.MODIFIED
+            if diff['new_file']:
+                edit_type = EDIT_TYPE.ADDED
+            elif diff['deleted_file']:
+                edit_type = EDIT_TYPE.DELETED
+            elif diff['renamed_file']:
+                edit_type = EDIT_TYPE.RENAMED
+
+            filename = diff['new_path']
+            patch = diff['diff']
+            if not patch:
+                patch = load_large_diff(filename, new_file_content_str, original_file_content_str)
+
+            patch_lines = patch.splitlines(keepends=True)
+            diff_files.append(
+                FilePatchInfo(original_file_content_str, new_file_content_str,
+                              patch=patch,
+                              filename=filename,
+                              edit_type=edit_type,
+                              old_filename=None if diff['old_path'] == diff['new_path'] else diff['old_path'],
+                              num_plus_lines=len([line for line in patch_lines if line.startswith('+')]),
+                              num_minus_lines=len([line for line in patch_lines if line.startswith('-')])))
+        if invalid_files_names:
+            get_logger().info(f"Filtered out files with invalid extensions: {invalid_files_names}")
+
+        self.diff_files = diff_files
+        return diff_files
+
+    async def get_title(self) -> str:
+        return (await self.get_mr())["title"]
+
+    async def get_pr_branch(self) -> str:
+        return (await self.get_mr())["source_branch"]
+
+    async def get_pr_description_full(self) -> str:
+        return (await self.get_mr())["description"] or ""
+
+    async def publish_description(self, pr_title: str, pr_body: str):
+        try:
+            self._mr = await self._request("PUT", self._mr_url, json={"title": pr_title, "description": pr_body})
+        except AsyncGitProviderError as e:
+            get_logger().exception(f"Could not update merge request {self.id_mr} description: {e}")
+
+    async def publish_comment(self, mr_comment: str, is_temporary: bool = False):
+        if is_temporary and not get_settings().config.publish_output_progress:
+            get_logger().debug(f"Skipping publish_comment for temporary comment: {mr_comment}")
+            return None
+        mr_comment = self.limit_output_characters(mr_comment, self.max_comment_chars)
+        comment = await self._request("POST", f"{self._mr_url}/notes", json={"body": mr_comment})
+        comment["is_temporary"] = is_temporary
+        return comment
+
+    async def edit_comment(self, comment: dict, body: str):
+        body = self.limit_output_characters(body, self.max_comment_chars)
+        return await self._request("PUT", f"{self._mr_url}/notes/{comment['id']}", json={"body": body})
+
+    async def remove_comment(self, comment: dict):
+        try:
+            await self._request("DELETE", f"{self._mr_url}/notes/{comment['id']}")
+        except AsyncGitProviderError as e:
+            get_logger().exception(f"Failed to remove comment, error: {e}")
+
+    async def get_issue_comments(self) -> list:
+        return (await self._paginate(f"{self._mr_url}/notes"))[::-1]
+
+    async def publish_labels(self, labels: list[str]):
+        try:
+            self._mr = await self._request("PUT", self._mr_url, json={"labels": ",".join(set(labels))})
+        except AsyncGitProviderError as e:
+            get_logger().warning(f"Failed to publish labels, error: {e}")
+
+    async def get_pr_labels(self, update: bool = False) -> list[str]:
+        return (await self.get_mr(update=update))["labels"]
+
+    async def get_commit_messages(self) -> str:
+        max_tokens = get_settings().get("CONFIG.MAX_COMMITS_TOKENS", None)
+        try:
+            commits = await self._paginate(f"{self._mr_url}/commits")
+            commit_messages_str = "\n".join([f"{i + 1}. {commit['message']}" for i, commit in enumerate(commits)])
+        except Exception:
+            commit_messages_str = ""
+        if max_tokens:
+            commit_messages_str = clip_tokens(commit_messages_str, max_tokens)
+        return commit_messages_str
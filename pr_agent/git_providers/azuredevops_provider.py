@@ -11,10 +11,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import hashlib
+import io
 import os
+import threading
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Tuple
 from urllib.parse import urlparse
 
+from pr_agent.algo.git_patch_processing import decode_if_bytes
 from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
 
 from ..algo.file_filter import filter_ignored
@@ -27,6 +33,7 @@ from ..log import get_logger
 from .git_provider import GitProvider
 
 AZURE_DEVOPS_AVAILABLE = True
+ITEMS_BATCH_SIZE = 200
 ADO_APP_CLIENT_DEFAULT_ID = "499b84ac-1321-427f-aa17-267ca6975798/.default"
 MAX_PR_DESCRIPTION_AZURE_LENGTH = 4000-1
 
@@ -36,7 +43,8 @@ try:
     # noinspection PyUnresolvedReferences
     from azure.devops.released.git import (Comment, CommentPosition,
                                            CommentThread, CommentThreadContext,
-                                           GitClient, GitPullRequest,
+                                           GitClient, GitItemDescriptor,
+                                           GitItemRequestData, GitPullRequest,
                                            GitVersionDescriptor)
     # noinspection PyUnresolvedReferences
     from azure.identity import DefaultAzureCredential
@@ -44,6 +52,15 @@ try:
 except ImportError:
     AZURE_DEVOPS_AVAILABLE = False
 
+# the sdk connection (and the resource areas it looks up on first use) is reused across PRs: org -> (token, client)
+_azure_devops_clients: dict[str, tuple[str, "GitClient"]] = {}
+_azure_devops_clients_lock = threading.Lock()
+_default_azure_credential = None
+
+
+def _git_blob_id(content: bytes) -> str:
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
 
 class AzureDevopsProvider(GitProvider):
 
@@ -276,35 +293,16 @@ class AzureDevopsProvider(GitProvider):
                     pass
 
             invalid_files_names = []
+            valid_files = []
             for file in diffs:
                 if not is_valid_file(file):
                     invalid_files_names.append(file)
                     continue
+                valid_files.append(file)
 
-                version = GitVersionDescriptor(
-                    version=head_sha.commit_id, version_type="commit"
-                )
-                try:
-                    new_file_content_str = self.azure_devops_client.get_item(
-                        repository_id=self.repo_slug,
-                        path=file,
-                        project=self.workspace_slug,
-                        version_descriptor=version,
-                        download=False,
-                        include_content=True,
-                    )
-
-                    new_file_content_str = new_file_content_str.content
-                except Exception as error:
-                    get_logger().error(f"Failed to retrieve new file content of {file} at version {version}", error=error)
-                    # get_logger().error(
-                    #     "Failed to retrieve new file content of %s at version %s. Error: %s",
-                    #     file,
-                    #     version,
-                    #     str(error),
-                    # )
-                    new_file_content_str = ""
-
+            edit_types = {}
+            items = []  # (file, commit id)
+            for file in valid_files:
                 edit_type = EDIT_TYPE.MODIFIED
                 if diff_types[file] == "add":
                     edit_type = EDIT_TYPE.ADDED
@@ -312,26 +310,17 @@ class AzureDevopsProvider(GitProvider):
                     edit_type = EDIT_TYPE.DELETED
                 elif "rename" in diff_types[file]: # diff_type can be `rename` | `edit, rename`
                     edit_type = EDIT_TYPE.RENAMED
-
-                version = GitVersionDescriptor(
-                    version=base_sha.commit_id, version_type="commit"
-                )
-                if edit_type == EDIT_TYPE.ADDED or edit_type == EDIT_TYPE.RENAMED:
-                    original_file_content_str = ""
-                else:
-                    try:
-                        original_file_content_str = self.azure_devops_client.get_item(
-                            repository_id=self.repo_slug,
-                            path=file,
-                            project=self.workspace_slug,
-                            version_descriptor=version,
-                            download=False,
-                            include_content=True,
-                        )
-                        original_file_content_str = original_file_content_str.content
-                    except Exception as error:
-                        get_logger().error(f"Failed to retrieve original file content of {file} at version {version}", error=error)
-                        original_file_content_str = ""
+                edit_types[file] = edit_type
+                if edit_type != EDIT_TYPE.DELETED:
+                    items.append((file, head_sha.commit_id))
+                if edit_type != EDIT_TYPE.ADDED and edit_type != EDIT_TYPE.RENAMED:
+                    items.append((file, base_sha.commit_id))
+            contents = self._get_items_contents(items)
+
+            for file in valid_files:
+                edit_type = edit_types[file]
+                new_file_content_str = contents.get((file, head_sha.commit_id), "")
+                original_file_content_str = contents.get((file, base_sha.commit_id), "")
 
                 patch = load_large_diff(
                     file, new_file_content_str, original_file_content_str, show_warning=False
@@ -361,6 +350,83 @@ class AzureDevopsProvider(GitProvider):
             get_logger().exception(f"Failed to get diff files, error: {e}")
             return []
 
+    def _get_items_contents(self, items: list[tuple[str, str]]) -> dict[tuple[str, str], str]:
+        """
+        Get the contents of (path, commit id) items with a few batch requests: the blob ids of the items are resolved
+        with the items-batch endpoint, and the blobs are downloaded together from the blobs (zip) endpoint.
+        Items that could not be fetched this way are requested one by one, concurrently (at most
+        azure_devops.max_concurrent_requests at a time).
+        """
+        object_ids = self._get_items_object_ids(items)
+        blobs = self._get_blobs(set(object_ids.values()))
+        contents = {key: decode_if_bytes(blobs[object_id]) for key, object_id in object_ids.items() if object_id in blobs}
+        missing = [key for key in items if key not in contents]
+        if missing:
+            max_workers = min(get_settings().get("AZURE_DEVOPS.MAX_CONCURRENT_REQUESTS", 8), len(missing))
+            with ThreadPoolExecutor(max_workers=max(max_workers, 1)) as executor:
+                for key, content in zip(missing, executor.map(lambda key: self._get_item_content(*key), missing)):
+                    contents[key] = content
+        return contents
+
+    def _get_items_object_ids(self, items: list[tuple[str, str]]) -> dict[tuple[str, str], str]:
+        object_ids = {}
+        for i in range(0, len(items), ITEMS_BATCH_SIZE):
+            batch = items[i:i + ITEMS_BATCH_SIZE]
+            try:
+                request_data = GitItemRequestData(item_descriptors=[
+                    GitItemDescriptor(path=file, version=commit_id, version_type="commit") for file, commit_id in batch
+                ])
+                results = self.azure_devops_client.get_items_batch(
+                    request_data=request_data,
+                    repository_id=self.repo_slug,
+                    project=self.workspace_slug,
+                )
+                # one list of items per descriptor, in the same order
+                for key, result in zip(batch, results):
+                    if result and result[0].object_id and result[0].git_object_type in (None, "blob"):
+                        object_ids[key] = result[0].object_id
+            except Exception as e:
+                get_logger().warning(f"Failed to get a batch of {len(batch)} items, error: {e}")
+        return object_ids
+
+    def _get_blobs(self, object_ids: set[str]) -> dict[str, bytes]:
+        if not object_ids:
+            return {}
+        try:
+            response = self.azure_devops_client.get_blobs_zip(
+                blob_ids=sorted(object_ids),
+                repository_id=self.repo_slug,
+                project=self.workspace_slug,
+            )
+            archive = zipfile.ZipFile(io.BytesIO(b"".join(response)))
+            blobs = {}
+            for name in archive.namelist():
+                content = archive.read(name)
+                # blobs are identified by their content, so that an unexpected archive layout is never misattributed
+                object_id = _git_blob_id(content)
+                if object_id in object_ids:
+                    blobs[object_id] = content
+            return blobs
+        except Exception as e:
+            get_logger().warning(f"Failed to download blobs in a batch, falling back to single items, error: {e}")
+            return {}
+
+    def _get_item_content(self, file: str, commit_id: str) -> str:
+        version = GitVersionDescriptor(version=commit_id, version_type="commit")
+        try:
+            item = self.azure_devops_client.get_item(
+                repository_id=self.repo_slug,
+                path=file,
+                project=self.workspace_slug,
+                version_descriptor=version,
+                download=False,
+                include_content=True,
+            )
+            return item.content
+        except Exception as error:
+            get_logger().error(f"Failed to retrieve file content of {file} at version {version}", error=error)
+            return ""
+
     def publish_comment(self, pr_comment: str, is_temporary: bool = False, thread_context=None) -> Comment:
         if is_temporary and not get_settings().config.publish_output_progress:
             get_logger().debug(f"Skipping publish_comment for temporary comment: {pr_comment}")
@@ -583,6 +649,7 @@ class AzureDevopsProvider(GitProvider):
 
     @staticmethod
     def _get_azure_devops_client() -> GitClient:
+        global _default_azure_credential
         org = get_settings().azure_devops.get("org", None)
         pat = get_settings().azure_devops.get("pat", None)
 
@@ -597,18 +664,22 @@ class AzureDevopsProvider(GitProvider):
                 # see https://learn.microsoft.com/en-us/python/api/overview/azure/identity-readme?view=azure-python
                 # for usage and env var configuration of user-assigned managed identity, local machine auth etc.
                 get_logger().info("No PAT found in settings, trying to use Azure Default Credentials.")
-                credentials = DefaultAzureCredential()
-                accessToken = credentials.get_token(ADO_APP_CLIENT_DEFAULT_ID)
+                if _default_azure_credential is None:
+                    # a single credential object caches its token until it expires
+                    _default_azure_credential = DefaultAzureCredential()
+                accessToken = _default_azure_credential.get_token(ADO_APP_CLIENT_DEFAULT_ID)
                 auth_token = accessToken.token
             except Exception as e:
                 get_logger().error(f"No PAT found in settings, and Azure Default Authentication failed, error: {e}")
                 raise
 
-        credentials = BasicAuthentication("", auth_token)
-
-        credentials = BasicAuthentication("", auth_token)
-        azure_devops_connection = Connection(base_url=org, creds=credentials)
-        azure_devops_client = azure_devops_connection.clients.get_git_client()
+        with _azure_devops_clients_lock:
+            cached_token, azure_devops_client = _azure_devops_clients.get(org, (None, None))
+            if cached_token != auth_token:
+                credentials = BasicAuthentication("", auth_token)
+                azure_devops_connection = Connection(base_url=org, creds=credentials)
+                azure_devops_client = azure_devops_connection.clients.get_git_client()
+                _azure_devops_clients[org] = (auth_token, azure_devops_client)
 
         return azure_devops_client
 
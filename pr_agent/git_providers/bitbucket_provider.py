@@ -14,7 +14,8 @@
 import difflib
 import json
 import re
-from typing import Optional, Tuple
+from collections import deque
+from typing import Iterable, Iterator, Optional, Tuple
 from urllib.parse import urlparse
 
 import requests
@@ -25,6 +26,7 @@ from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
 
 from ..algo.file_filter import filter_ignored
 from ..algo.language_handler import is_valid_file
+from ..algo.request_cache import GIT_FILES, get_request_cache
 from ..algo.utils import find_line_number_of_relevant_line_in_file
 from ..config_loader import get_settings
 from ..log import get_logger
@@ -37,6 +39,67 @@ def _gef_filename(diff):
     return diff.old.path
 
 
+def _split_diff_per_file(chunks: Iterable[bytes]) -> Iterator[bytes]:
+    """
+    Incrementally split a raw git diff, received as a stream of byte chunks, into per-file patches.
+    A new file patch starts at each line beginning with 'diff --git'. Only the current file patch is held in memory.
+    """
+    current = bytearray()
+    pending = b""
+    for chunk in chunks:
+        if not chunk:
+            continue
+        lines = (pending + chunk).split(b"\n")
+        pending = lines.pop()  # the last element is an incomplete line (or b"" if the chunk ended with a newline)
+        for line in lines:
+            if line.startswith(b"diff --git") and current:
+                yield bytes(current)
+                current.clear()
+            current += line + b"\n"
+    if pending:
+        if pending.startswith(b"diff --git") and current:
+            yield bytes(current)
+            current.clear()
+        current += pending
+    if current:
+        yield bytes(current)
+
+
+def _decode_patch(patch: bytes) -> str:
+    """Decode a single file patch, falling back to latin-1 (which decodes any bytes) if it is not valid UTF-8."""
+    try:
+        return patch.decode("utf-8")
+    except UnicodeDecodeError:
+        return patch.decode("latin-1")
+
+
+def _strip_patch_header(patch: str, diff) -> str:
+    """Remove the header bitbucket puts before the hunks of each file patch, e.g.:
+    "diff --git filename
+    new file mode 100644 (optional)
+     index caa56f0..61528d7 100644
+      --- a/pr_agent/cli_pip.py
+     +++ b/pr_agent/cli_pip.py
+      @@ -... @@"
+    """
+    patch_lines = patch.splitlines()
+    if (len(patch_lines) >= 6) and \
+            ((patch_lines[2].startswith("---") and
+              patch_lines[3].startswith("+++") and
+              patch_lines[4].startswith("@@")) or
+             (patch_lines[3].startswith("---") and  # new or deleted file
+              patch_lines[4].startswith("+++") and
+              patch_lines[5].startswith("@@"))):
+        return "\n".join(patch_lines[4:])
+    if diff.data.get('lines_added', 0) == 0 and diff.data.get('lines_removed', 0) == 0:
+        return ""
+    if len(patch_lines) <= 3:
+        get_logger().info(f"Disregarding empty diff for file {_gef_filename(diff)}")
+    else:
+        get_logger().warning(f"Bitbucket failed to get diff for file {_gef_filename(diff)}")
+    return ""
+
+
 class BitbucketProvider(GitProvider):
     def __init__(
         self, pr_url: Optional[str] = None, incremental: Optional[bool] = False
@@ -90,6 +153,10 @@ class BitbucketProvider(GitProvider):
         self.bitbucket_comment_api_url = self.pr._BitbucketBase__data["links"]["comments"]["href"]
         self.bitbucket_pull_request_api_url = self.pr._BitbucketBase__data["links"]['self']['href']
 
+    def get_repo_settings_cache_key(self) -> Optional[str]:
+        # the settings file is read from the destination branch of the PR
+        return f"https://bitbucket.org/{self.workspace_slug}/{self.repo_slug}@{self.pr.destination_branch}"
+
     def get_repo_settings(self):
         try:
             url = (f"https://api.bitbucket.org/2.0/repositories/{self.workspace_slug}/{self.repo_slug}/src/"
@@ -212,17 +279,11 @@ class BitbucketProvider(GitProvider):
         self.pr = self._get_pr()
 
     def get_files(self):
-        try:
-            git_files = context.get("git_files", None)
-            if git_files:
-                return git_files
-            self.git_files = [_gef_filename(diff) for diff in self.pr.diffstat()]
-            context["git_files"] = self.git_files
-            return self.git_files
-        except Exception:
-            if not self.git_files:
-                self.git_files = [_gef_filename(diff) for diff in self.pr.diffstat()]
-            return self.git_files
+        if self.git_files is None:
+            scope = (self.workspace_slug, self.repo_slug, self.pr_num)
+            self.git_files = get_request_cache().get_or_compute(
+                GIT_FILES, lambda: [_gef_filename(diff) for diff in self.pr.diffstat()], scope)
+        return self.git_files
 
     def get_diff_files(self) -> list[FilePatchInfo]:
         if self.diff_files:
@@ -244,71 +305,44 @@ class BitbucketProvider(GitProvider):
             except Exception as e:
                 pass
 
-        # get the pr patches
-        try:
-            pr_patches = self.pr.diff()
-        except Exception as e:
-            # Try different encodings if UTF-8 fails
-            get_logger().warning(f"Failed to decode PR patch with utf-8, error: {e}")
-            encodings_to_try = ['iso-8859-1', 'latin-1', 'ascii', 'utf-16']
-            pr_patches = None
-            for encoding in encodings_to_try:
-                try:
-                    pr_patches = self.pr.diff(encoding=encoding)
-                    get_logger().info(f"Successfully decoded PR patch with encoding {encoding}")
-                    break
-                except UnicodeDecodeError:
-                    continue
-
-            if pr_patches is None:
-                raise ValueError(f"Failed to decode PR patch with encodings {encodings_to_try}")
-
-        diff_split = ["diff --git" + x for x in pr_patches.split("diff --git") if x.strip()]
-        # filter all elements of 'diff_split' that are of indices in 'diffs_original' that are not in 'diffs'
-        if len(diff_split) > len(diffs) and len(diffs_original) == len(diff_split):
-            diff_split = [diff_split[i] for i in range(len(diff_split)) if diffs_original[i] in diffs]
-        if len(diff_split) != len(diffs):
-            get_logger().error(f"Error - failed to split the diff into {len(diffs)} parts")
-            return []
-        # bitbucket diff has a header for each file, we need to remove it:
-        # "diff --git filename
-        # new file mode 100644 (optional)
-        #  index caa56f0..61528d7 100644
-        #   --- a/pr_agent/cli_pip.py
-        #  +++ b/pr_agent/cli_pip.py
-        #   @@ -... @@"
-        for i, _ in enumerate(diff_split):
-            diff_split_lines = diff_split[i].splitlines()
-            if (len(diff_split_lines) >= 6) and \
-                    ((diff_split_lines[2].startswith("---") and
-                      diff_split_lines[3].startswith("+++") and
-                      diff_split_lines[4].startswith("@@")) or
-                     (diff_split_lines[3].startswith("---") and  # new or deleted file
-                      diff_split_lines[4].startswith("+++") and
-                      diff_split_lines[5].startswith("@@"))):
-                diff_split[i] = "\n".join(diff_split_lines[4:])
-            else:
-                if diffs[i].data.get('lines_added', 0) == 0 and diffs[i].data.get('lines_removed', 0) == 0:
-                    diff_split[i] = ""
-                elif len(diff_split_lines) <= 3:
-                    diff_split[i] = ""
-                    get_logger().info(f"Disregarding empty diff for file {_gef_filename(diffs[i])}")
-                else:
-                    get_logger().warning(f"Bitbucket failed to get diff for file {_gef_filename(diffs[i])}")
-                    diff_split[i] = ""
-
+        # get the pr patches, streamed and split per file. They come in the order of the diffstat entries, so each
+        # patch is matched to its entry as it arrives and only the entries not matched yet are kept, instead of the
+        # whole diff. The patches of ignored or invalid files are dropped right away
+        kept_diffs = {id(diff) for diff in diffs}
+        unmatched_diffs = deque(diffs_original)
+        matched_diffs = []
         invalid_files_names = []
         diff_files = []
-        counter_valid = 0
-        # get full files
-        for index, diff in enumerate(diffs):
+        num_patches = 0
+        for patch in self._iter_pr_file_patches():
+            num_patches += 1
+            if not unmatched_diffs:
+                continue  # more patches than diffstat entries, reported below
+            diff = unmatched_diffs.popleft()
+            if id(diff) not in kept_diffs:
+                continue
             file_path = _gef_filename(diff)
             if not is_valid_file(file_path):
                 invalid_files_names.append(file_path)
                 continue
+            file_patch_canonic_structure = FilePatchInfo("", "", _strip_patch_header(patch, diff), file_path)
+            if diff.data['status'] == 'added':
+                file_patch_canonic_structure.edit_type = EDIT_TYPE.ADDED
+            elif diff.data['status'] == 'removed':
+                file_patch_canonic_structure.edit_type = EDIT_TYPE.DELETED
+            elif diff.data['status'] == 'modified':
+                file_patch_canonic_structure.edit_type = EDIT_TYPE.MODIFIED
+            elif diff.data['status'] == 'renamed':
+                file_patch_canonic_structure.edit_type = EDIT_TYPE.RENAMED
+            matched_diffs.append(diff)
+            diff_files.append(file_patch_canonic_structure)
+        if num_patches != len(diffs_original):
+            get_logger().error(f"Error - failed to split the diff into {len(diffs_original)} parts")
+            return []
 
+        # get full files, once the diff stream is closed
+        for counter_valid, (diff, file_patch_canonic_structure) in enumerate(zip(matched_diffs, diff_files), 1):
             try:
-                counter_valid += 1
                 if get_settings().get("bitbucket_app.avoid_full_files", False):
                     original_file_content_str = ""
                     new_file_content_str = ""
@@ -332,23 +366,8 @@ class BitbucketProvider(GitProvider):
                 get_logger().exception(f"Error - bitbucket failed to get file content, error: {e}")
                 original_file_content_str = ""
                 new_file_content_str = ""
-
-            file_patch_canonic_structure = FilePatchInfo(
-                original_file_content_str,
-                new_file_content_str,
-                diff_split[index],
-                file_path,
-            )
-
-            if diff.data['status'] == 'added':
-                file_patch_canonic_structure.edit_type = EDIT_TYPE.ADDED
-            elif diff.data['status'] == 'removed':
-                file_patch_canonic_structure.edit_type = EDIT_TYPE.DELETED
-            elif diff.data['status'] == 'modified':
-                file_patch_canonic_structure.edit_type = EDIT_TYPE.MODIFIED
-            elif diff.data['status'] == 'renamed':
-                file_patch_canonic_structure.edit_type = EDIT_TYPE.RENAMED
-            diff_files.append(file_patch_canonic_structure)
+            file_patch_canonic_structure.base_file = original_file_content_str
+            file_patch_canonic_structure.head_file = new_file_content_str
 
         if invalid_files_names:
             get_logger().info(f"Disregarding files with invalid extensions:\n{invalid_files_names}")
@@ -599,6 +618,27 @@ class BitbucketProvider(GitProvider):
         except Exception:
             get_logger().exception(f"Failed to create empty file {file_path} in branch {branch}")
 
+    def _iter_pr_file_patches(self) -> Iterator[str]:
+        """
+        Download the raw PR diff once, as a stream, and yield it split per file.
+        Each file patch is decoded on its own (with an encoding fallback), so a single badly-encoded file does not
+        force re-downloading the whole diff. Patches above bitbucket.max_file_patch_bytes are dropped.
+        """
+        max_patch_bytes = get_settings().get("BITBUCKET.MAX_FILE_PATCH_BYTES", 5 * 1024 * 1024)
+        # the read timeout applies between received bytes, so that a stalled download fails instead of hanging
+        timeout = get_settings().get("BITBUCKET.DIFF_REQUEST_TIMEOUT_SECONDS", 60)
+        diff_url = f"{self.pr.url}/diff"
+        with requests.get(diff_url, headers=self.headers, stream=True, timeout=timeout) as response:
+            response.raise_for_status()
+            for patch in _split_diff_per_file(response.iter_content(chunk_size=64 * 1024)):
+                if not patch.strip():
+                    continue
+                if max_patch_bytes and len(patch) > max_patch_bytes:
+                    header = patch[:patch.find(b"\n")].decode("utf-8", errors="replace")
+                    get_logger().info(f"Disregarding too large patch ({len(patch)} bytes): {header}")
+                    patch = patch[:patch.find(b"\n") + 1]  # keep only the 'diff --git' header line
+                yield _decode_patch(patch)
+
     def _get_pr_file_content(self, remote_link: str):
         try:
             response = requests.request("GET", remote_link, headers=self.headers)
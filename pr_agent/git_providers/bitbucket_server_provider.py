@@ -555,3 +555,6 @@ class BitbucketServerProvider(GitProvider):
 
         subprocess.run(cli_args, check=True,  # check=True will raise an exception if the command fails
             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=operation_timeout_in_seconds)
+
+    def _get_clone_git_options(self) -> list[str]:
+        return ["-c", f"http.extraHeader=Authorization: Bearer {self.bearer_token}"]
@@ -11,8 +11,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import threading
+from collections import OrderedDict
+from typing import Iterator, Optional
+
 import boto3
 import botocore
+from botocore.config import Config
+
+from pr_agent.config_loader import get_settings
 
 
 class CodeCommitDifferencesResponse:
@@ -59,6 +66,67 @@ class CodeCommitPullRequestResponse:
             self.destination_branch = json.get("destinationReference", "")
 
 
+class CodeCommitBlobCache:
+    """
+    CodeCommitBlobCache is a process-wide LRU cache of blob contents, keyed by repository name and blob id.
+    Blob ids are hashes of the contents, so cached blobs never go stale - they are only evicted to stay within the size limit.
+    """
+
+    def __init__(self, max_size_bytes: int):
+        self.max_size_bytes = max_size_bytes
+        self.size_bytes = 0
+        self._blobs: OrderedDict[tuple[str, str], bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, repo_name: str, blob_id: str) -> Optional[bytes]:
+        with self._lock:
+            content = self._blobs.get((repo_name, blob_id))
+            if content is not None:
+                self._blobs.move_to_end((repo_name, blob_id))
+            return content
+
+    def put(self, repo_name: str, blob_id: str, content: bytes):
+        if len(content) > self.max_size_bytes:
+            return
+        with self._lock:
+            if (repo_name, blob_id) in self._blobs:
+                return
+            self._blobs[(repo_name, blob_id)] = content
+            self.size_bytes += len(content)
+            while self.size_bytes > self.max_size_bytes:
+                _, evicted = self._blobs.popitem(last=False)
+                self.size_bytes -= len(evicted)
+
+
+_shared_boto_client = None
+_shared_boto_client_lock = threading.Lock()
+_blob_cache: Optional[CodeCommitBlobCache] = None
+_blob_cache_lock = threading.Lock()
+
+
+def get_shared_boto_client():
+    """
+    Return the process-wide boto3 CodeCommit client. boto3 clients can be shared between threads, but creating one is slow (and not thread safe).
+    Its connection pool is sized for codecommit.max_concurrent_requests concurrent requests.
+    """
+    global _shared_boto_client
+    if _shared_boto_client is None:
+        with _shared_boto_client_lock:
+            if _shared_boto_client is None:
+                max_pool_connections = max(get_settings().get("CODECOMMIT.MAX_CONCURRENT_REQUESTS", 8), 10)
+                _shared_boto_client = boto3.client("codecommit", config=Config(max_pool_connections=max_pool_connections))
+    return _shared_boto_client
+
+
+def get_blob_cache() -> CodeCommitBlobCache:
+    global _blob_cache
+    if _blob_cache is None:
+        with _blob_cache_lock:
+            if _blob_cache is None:
+                _blob_cache = CodeCommitBlobCache(get_settings().get("CODECOMMIT.BLOB_CACHE_SIZE_MB", 64) * 1024 * 1024)
+    return _blob_cache
+
+
 class CodeCommitClient:
     """
     CodeCommitClient is a wrapper around the AWS boto3 SDK for the CodeCommit client
@@ -74,7 +142,7 @@ class CodeCommitClient:
 
     def _connect_boto_client(self):
         try:
-            self.boto_client = boto3.client("codecommit")
+            self.boto_client = get_shared_boto_client()
         except Exception as e:
             raise ValueError(f"Failed to connect to AWS CodeCommit: {e}") from e
 
@@ -94,11 +162,17 @@ class CodeCommitClient:
         - aws codecommit get-differences
         - https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/codecommit/client/get_differences.html
         """
+        return list(self.iter_differences(repo_name, destination_commit, source_commit))
+
+    def iter_differences(self, repo_name: str, destination_commit: str,
+                         source_commit: str) -> Iterator[CodeCommitDifferencesResponse]:
+        """
+        Same as get_differences(), but yields the differences page by page, as they are received.
+        """
         if self.boto_client is None:
             self._connect_boto_client()
 
         # The differences response from AWS is paginated, so we need to iterate through the pages to get all the differences.
-        differences = []
         try:
             paginator = self.boto_client.get_paginator("get_differences")
             for page in paginator.paginate(
@@ -106,7 +180,8 @@ class CodeCommitClient:
                 beforeCommitSpecifier=destination_commit,
                 afterCommitSpecifier=source_commit,
             ):
-                differences.extend(page.get("differences", []))
+                for json in page.get("differences", []):
+                    yield CodeCommitDifferencesResponse(json)
         except botocore.exceptions.ClientError as e:
             if e.response["Error"]["Code"] == 'RepositoryDoesNotExistException':
                 raise ValueError(f"CodeCommit cannot retrieve differences: Repository does not exist: {repo_name}") from e
@@ -114,10 +189,43 @@ class CodeCommitClient:
         except Exception as e:
             raise ValueError(f"CodeCommit cannot retrieve differences for {source_commit}..{destination_commit}") from e
 
-        output = []
-        for json in differences:
-            output.append(CodeCommitDifferencesResponse(json))
-        return output
+    def get_blob(self, repo_name: str, blob_id: str) -> bytes:
+        """
+        Retrieve the contents of a blob from CodeCommit. The contents are cached by blob id.
+
+        Args:
+        - repo_name: Name of the repository
+        - blob_id: ID of the blob, as returned by get_differences
+
+        Returns:
+        - Blob contents (bytes)
+
+        Boto3 Documentation:
+        - aws codecommit get_blob
+        - https://boto3.amazonaws.com/v1/documentation/api/latest/reference/services/codecommit/client/get_blob.html
+        """
+        blob_cache = get_blob_cache()
+        content = blob_cache.get(repo_name, blob_id)
+        if content is not None:
+            return content
+
+        if self.boto_client is None:
+            self._connect_boto_client()
+
+        try:
+            response = self.boto_client.get_blob(repositoryName=repo_name, blobId=blob_id)
+        except botocore.exceptions.ClientError as e:
+            if e.response["Error"]["Code"] == 'RepositoryDoesNotExistException':
+                raise ValueError(f"CodeCommit cannot retrieve blob: Repository does not exist: {repo_name}") from e
+            raise ValueError(f"CodeCommit cannot retrieve blob '{blob_id}' from repository '{repo_name}'") from e
+        except Exception as e:
+            raise ValueError(f"CodeCommit cannot retrieve blob '{blob_id}' from repository '{repo_name}'") from e
+        if "content" not in response:
+            raise ValueError(f"Blob content is empty for blob: {blob_id}")
+
+        content = response["content"]
+        blob_cache.put(repo_name, blob_id, content)
+        return content
 
     def get_file(self, repo_name: str, file_path: str, sha_hash: str, optional: bool = False):
         """
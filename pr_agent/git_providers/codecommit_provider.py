@@ -14,9 +14,11 @@
 import os
 import re
 from collections import Counter
-from typing import List, Optional, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple
 from urllib.parse import urlparse
 
+from pr_agent.algo.git_patch_processing import decode_if_bytes
 from pr_agent.algo.language_handler import is_valid_file
 from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
 from pr_agent.git_providers.codecommit_client import CodeCommitClient
@@ -103,20 +105,32 @@ class CodeCommitProvider(GitProvider):
         if self.git_files:
             return self.git_files
 
-        self.git_files = []
-        differences = self.codecommit_client.get_differences(self.repo_name, self.pr.destination_commit, self.pr.source_commit)
-        for item in differences:
-            self.git_files.append(CodeCommitFile(item.before_blob_path,
-                                                 item.before_blob_id,
-                                                 item.after_blob_path,
-                                                 item.after_blob_id,
-                                                 CodeCommitProvider._get_edit_type(item.change_type)))
+        for _ in self._iter_files():
+            pass
         return self.git_files
 
+    def _iter_files(self) -> Iterator[CodeCommitFile]:
+        """
+        Yields the files of the pull request as the pages of differences are received, and stores them in self.git_files.
+        """
+        git_files = []
+        differences = self.codecommit_client.iter_differences(self.repo_name, self.pr.destination_commit, self.pr.source_commit)
+        for item in differences:
+            git_file = CodeCommitFile(item.before_blob_path,
+                                      item.before_blob_id,
+                                      item.after_blob_path,
+                                      item.after_blob_id,
+                                      CodeCommitProvider._get_edit_type(item.change_type))
+            git_files.append(git_file)
+            yield git_file
+        self.git_files = git_files
+
     def get_diff_files(self) -> list[FilePatchInfo]:
         """
         Retrieves the list of files that have been modified, added, deleted, or renamed in a pull request in CodeCommit,
         along with their content and patch information.
+        File contents are downloaded concurrently (up to codecommit.max_concurrent_requests at a time), starting while
+        the next pages of differences are still being received.
 
         Returns:
             diff_files (List[FilePatchInfo]): List of FilePatchInfo objects representing the modified, added, deleted,
@@ -128,47 +142,55 @@ class CodeCommitProvider(GitProvider):
 
         self.diff_files = []
 
-        files = self.get_files()
-        for diff_item in files:
-            patch_filename = ""
-            if diff_item.a_blob_id is not None:
-                patch_filename = diff_item.a_path
-                original_file_content_str = self.codecommit_client.get_file(
-                    self.repo_name, diff_item.a_path, self.pr.destination_commit)
-                if isinstance(original_file_content_str, (bytes, bytearray)):
-                    original_file_content_str = original_file_content_str.decode("utf-8")
-            else:
-                original_file_content_str = ""
-
-            if diff_item.b_blob_id is not None:
-                patch_filename = diff_item.b_path
-                new_file_content_str = self.codecommit_client.get_file(self.repo_name, diff_item.b_path, self.pr.source_commit)
-                if isinstance(new_file_content_str, (bytes, bytearray)):
-                    new_file_content_str = new_file_content_str.decode("utf-8")
-            else:
-                new_file_content_str = ""
-
-            patch = load_large_diff(patch_filename, new_file_content_str, original_file_content_str)
-
-            # Store the diffs as a list of FilePatchInfo objects
-            info = FilePatchInfo(
-                original_file_content_str,
-                new_file_content_str,
-                patch,
-                diff_item.b_path,
-                edit_type=diff_item.edit_type,
-                old_filename=None
-                if diff_item.a_path == diff_item.b_path
-                else diff_item.a_path,
-            )
-            # Only add valid files to the diff list
-            # "bad extensions" are set in the language_extensions.toml file
-            # a "valid file" is one that is not in the "bad extensions" list
-            if is_valid_file(info.filename):
+        files = []
+        contents = {}  # blob id -> future of the file content
+        max_workers = get_settings().get("CODECOMMIT.MAX_CONCURRENT_REQUESTS", 8)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            for diff_item in self.git_files or self._iter_files():
+                # Only add valid files to the diff list
+                # "bad extensions" are set in the language_extensions.toml file
+                # a "valid file" is one that is not in the "bad extensions" list
+                if not is_valid_file(diff_item.b_path):
+                    continue
+                files.append(diff_item)
+                if diff_item.a_blob_id and diff_item.a_blob_id not in contents:
+                    contents[diff_item.a_blob_id] = executor.submit(
+                        self._get_file_content, diff_item.a_blob_id, diff_item.a_path, self.pr.destination_commit)
+                if diff_item.b_blob_id and diff_item.b_blob_id not in contents:
+                    contents[diff_item.b_blob_id] = executor.submit(
+                        self._get_file_content, diff_item.b_blob_id, diff_item.b_path, self.pr.source_commit)
+
+            for diff_item in files:
+                original_file_content_str = contents[diff_item.a_blob_id].result() if diff_item.a_blob_id else ""
+                new_file_content_str = contents[diff_item.b_blob_id].result() if diff_item.b_blob_id else ""
+                patch_filename = diff_item.b_path or diff_item.a_path
+
+                patch = load_large_diff(patch_filename, new_file_content_str, original_file_content_str)
+
+                # Store the diffs as a list of FilePatchInfo objects
+                info = FilePatchInfo(
+                    original_file_content_str,
+                    new_file_content_str,
+                    patch,
+                    diff_item.b_path,
+                    edit_type=diff_item.edit_type,
+                    old_filename=None
+                    if diff_item.a_path == diff_item.b_path
+                    else diff_item.a_path,
+                )
                 self.diff_files.append(info)
 
         return self.diff_files
 
+    def _get_file_content(self, blob_id: str, file_path: str, sha_hash: str) -> str:
+        try:
+            content = self.codecommit_client.get_blob(self.repo_name, blob_id)
+        except ValueError as e:
+            # e.g. the credentials may allow codecommit:GetFile, but not codecommit:GetBlob
+            get_logger().debug(f"Failed to get blob {blob_id}, getting file '{file_path}' instead: {e}")
+            content = self.codecommit_client.get_file(self.repo_name, file_path, sha_hash)
+        return decode_if_bytes(content)
+
     def publish_description(self, pr_title: str, pr_body: str):
         try:
             self.codecommit_client.publish_description(
@@ -11,15 +11,21 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import codecs
 import json
 import os
 import pathlib
+import re
 import shutil
 import subprocess
+import threading
+import time
 import uuid
+import weakref
 from collections import Counter, namedtuple
 from pathlib import Path
 from tempfile import NamedTemporaryFile, mkdtemp
+from typing import Callable, Optional
 
 import requests
 import urllib3.util
@@ -27,8 +33,12 @@ from git import Repo
 
 from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
 from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.git_blob_reader import GitBlobReader
+from pr_agent.git_providers.git_mirror_cache import (GitMirrorCache,
+                                                     get_git_mirror_cache)
 from pr_agent.git_providers.git_provider import GitProvider
-from pr_agent.git_providers.local_git_provider import PullRequestMimic
+from pr_agent.git_providers.local_git_provider import (LazyFilePatchInfo,
+                                                       PullRequestMimic)
 from pr_agent.log import get_logger
 
 
@@ -112,14 +122,184 @@ def list_comments(url: urllib3.util.Url, refspec):
     return json.loads(change_set)["currentPatchSet"]["comments"]
 
 
-def prepare_repo(url: urllib3.util.Url, project, refspec):
+class GerritWorkspacePool:
+    """
+    Reusable working trees of gerrit projects, so that reviewing a patchset does not clone the project.
+    Each workspace is a worktree of the project's mirror in the git mirror cache: acquiring one fetches only the change
+    refspec (and its parent commit) into the mirror, and checks it out in an idle workspace of the same project.
+    Released workspaces are kept for reuse - at most `max_idle_per_project` per project, and for `idle_ttl_seconds` -
+    and the others are removed on the next acquire or release, so the cleanup is spread over the requests.
+    """
+
+    def __init__(self, mirror_cache: GitMirrorCache, max_idle_per_project: int, idle_ttl_seconds: float):
+        self.mirror_cache = mirror_cache
+        self.max_idle_per_project = max_idle_per_project
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self._idle: dict[str, list[tuple[float, str]]] = {}  # repo url -> [(release time, workspace path)]
+        self._lock = threading.Lock()
+
+    def acquire(self, repo_url: str, refspec: str) -> pathlib.Path:
+        self.cleanup()
+        refspecs = [f"+{refspec}:{refspec}"]
+        while True:
+            with self._lock:
+                idle = self._idle.get(repo_url)
+                if not idle:
+                    break
+                _, directory = idle.pop()  # the most recently used workspace has the warmest checkout
+            try:
+                with self.mirror_cache.mirror(repo_url, repo_url, refspecs=refspecs, depth=2):
+                    _call('git', 'checkout', '--force', '--detach', refspec, cwd=directory)
+                    _call('git', 'clean', '-ffdxq', cwd=directory)
+                get_logger().info(f"Reusing workspace {directory} for {refspec}")
+                return pathlib.Path(directory)
+            except Exception as e:
+                get_logger().warning(f"Failed to reuse workspace {directory}, removing it: {e}")
+                shutil.rmtree(directory, ignore_errors=True)
+
+        directory = mkdtemp(prefix="pr_agent_gerrit_")
+        try:
+            self.mirror_cache.checkout(repo_url, repo_url, directory, ref=refspec, refspecs=refspecs, depth=2)
+        except Exception:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+        return pathlib.Path(directory)
+
+    def release(self, repo_url: str, refspec: str, directory):
+        # the change ref is no longer needed in the mirror. the workspace itself keeps its commit alive until reused
+        try:
+            with self.mirror_cache.mirror(repo_url, repo_url, sync=False) as mirror_path:
+                _call('git', 'update-ref', '-d', refspec, cwd=mirror_path)
+        except Exception as e:
+            get_logger().warning(f"Failed to delete {refspec} from the git mirror: {e}")
+        with self._lock:
+            self._idle.setdefault(repo_url, []).append((time.monotonic(), str(directory)))
+        self.cleanup()
+
+    def cleanup(self):
+        """Remove the workspaces idle for longer than idle_ttl_seconds, and those above max_idle_per_project."""
+        now = time.monotonic()
+        expired = []
+        with self._lock:
+            for repo_url, idle in list(self._idle.items()):
+                fresh = [(released, path) for released, path in idle if now - released < self.idle_ttl_seconds]
+                kept = fresh[-self.max_idle_per_project:] if self.max_idle_per_project > 0 else []
+                expired += [path for released, path in idle if (released, path) not in kept]
+                if kept:
+                    self._idle[repo_url] = kept
+                else:
+                    del self._idle[repo_url]
+        # the worktree metadata in the mirror is pruned by the mirror cache on its next checkout or eviction
+        for path in expired:
+            get_logger().info(f"Removing idle workspace {path}")
+            shutil.rmtree(path, ignore_errors=True)
+
+
+_gerrit_workspace_pool: Optional[GerritWorkspacePool] = None
+_gerrit_workspace_pool_lock = threading.Lock()
+
+
+def get_gerrit_workspace_pool() -> Optional[GerritWorkspacePool]:
+    """Return the process-wide gerrit workspace pool, or None if the git mirror cache is disabled."""
+    global _gerrit_workspace_pool
+    mirror_cache = get_git_mirror_cache()
+    if mirror_cache is None:
+        return None
+    if _gerrit_workspace_pool is None:
+        with _gerrit_workspace_pool_lock:
+            if _gerrit_workspace_pool is None:
+                _gerrit_workspace_pool = GerritWorkspacePool(
+                    mirror_cache,
+                    max_idle_per_project=get_settings().get('gerrit.max_idle_workspaces_per_project', 2),
+                    idle_ttl_seconds=get_settings().get('gerrit.workspace_idle_ttl_seconds', 1800),
+                )
+    return _gerrit_workspace_pool
+
+
+def prepare_repo(url: urllib3.util.Url, project, refspec) -> tuple[pathlib.Path, Callable[[], None]]:
+    """Check out `refspec` of `project`, and return the directory together with the function that releases it."""
     repo_url = (f"{url.scheme}://{url.auth}@{url.host}:{url.port}/{project}")
 
+    pool = get_gerrit_workspace_pool()
+    if pool:
+        try:
+            directory = pool.acquire(repo_url, refspec)
+            return directory, lambda: pool.release(repo_url, refspec, directory)
+        except Exception as e:
+            get_logger().warning(f"Failed to check out {refspec} in a pooled workspace, cloning instead: {e}")
     directory = pathlib.Path(mkdtemp())
     clone(repo_url, directory),
     fetch(repo_url, refspec, cwd=directory)
     checkout(cwd=directory)
-    return directory
+    return directory, lambda: shutil.rmtree(directory, ignore_errors=True)
+
+
+_NULL_OBJECT_ID = "0" * 40
+_DIFF_HEADER_RE = re.compile(rb"^diff --git ", re.MULTILINE)
+
+
+def _unquote_path(path: str) -> str:
+    # git quotes paths with special characters C-style, e.g. "tab\there"
+    if len(path) >= 2 and path[0] == path[-1] == '"':
+        return codecs.escape_decode(path[1:-1].encode())[0].decode('utf-8', errors='replace')
+    return path
+
+
+def load_diff_files(cwd, base: str = "HEAD^", head: str = "HEAD",
+                    max_file_size: Optional[int] = None) -> list[FilePatchInfo]:
+    """
+    Compute the per-file patches between `base` and `head` with a single 'git diff', and read the contents of all the
+    changed files with a single 'git cat-file --batch'. Binary files and files over `max_file_size` bytes are read as
+    empty.
+    """
+    output = subprocess.run(
+        ['git', '-c', 'core.quotePath=false', 'diff', '--patch-with-raw', '--full-index', '-M', '--no-color',
+         '--no-ext-diff', base, head],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True, cwd=cwd,
+    ).stdout
+
+    # the raw section lists the files (':<old mode> <new mode> <old id> <new id> <status>\t<path>[\t<new path>]'),
+    # followed by the patches of the same files, in the same order
+    raw_section, _, patch_section = output.partition(b"\n\n")
+    raw_entries = []
+    for line in raw_section.decode('utf-8', errors='replace').splitlines():
+        if not line.startswith(':'):
+            continue
+        info, *paths = line.split('\t')
+        _, _, old_id, new_id, status = info.split(' ')
+        raw_entries.append((old_id, new_id, status, [_unquote_path(path) for path in paths]))
+    patches = [patch for patch in _DIFF_HEADER_RE.split(patch_section) if patch]
+    if len(patches) != len(raw_entries):
+        raise ValueError(f"git diff listed {len(raw_entries)} files, but produced {len(patches)} patches")
+
+    object_ids = [object_id for old_id, new_id, _, _ in raw_entries for object_id in (old_id, new_id)
+                  if object_id != _NULL_OBJECT_ID]
+    with GitBlobReader(cwd, max_blob_size=max_file_size) as blob_reader:
+        blobs = blob_reader.read_many(object_ids)
+
+    diff_files = []
+    for (old_id, new_id, status, paths), patch in zip(raw_entries, patches):
+        # the hunks start at the first '@@' line; binary and mode-only changes have none
+        hunks_start = patch.find(b"\n@@")
+        hunks = patch[hunks_start + 1:].decode('utf-8', errors='replace') if hunks_start != -1 else ""
+        edit_type = EDIT_TYPE.MODIFIED
+        if status == 'A':
+            edit_type = EDIT_TYPE.ADDED
+        elif status == 'D':
+            edit_type = EDIT_TYPE.DELETED
+        elif status.startswith('R'):
+            edit_type = EDIT_TYPE.RENAMED
+        diff_files.append(
+            LazyFilePatchInfo(
+                blobs.get(old_id),
+                blobs.get(new_id),
+                hunks,
+                paths[-1],
+                edit_type=edit_type,
+                old_filename=paths[0] if len(paths) > 1 else None
+            )
+        )
+    return diff_files
 
 
 def adopt_to_gerrit_message(message):
@@ -201,9 +381,11 @@ class GerritProvider(GitProvider):
             f"{parsed.scheme}://{user}@{parsed.host}:{parsed.port}"
         )
 
-        self.repo_path = prepare_repo(
+        self.repo_path, release_repo = prepare_repo(
             self.parsed_url, self.project, self.refspec
         )
+        # the workspace goes back to the pool (or is removed) once the provider is no longer used
+        self._release_repo = weakref.finalize(self, release_repo)
         self.repo = Repo(self.repo_path)
         assert self.repo
         self.pr_url = base_url
@@ -245,44 +427,10 @@ class GerritProvider(GitProvider):
             return b""
 
     def get_diff_files(self) -> list[FilePatchInfo]:
-        diffs = self.repo.head.commit.diff(
-            self.repo.head.commit.parents[0],  # previous commit
-            create_patch=True,
-            R=True
+        diff_files = load_diff_files(
+            self.repo_path,
+            max_file_size=get_settings().get('gerrit.max_file_size_bytes', 2 * 1024 * 1024)
         )
-
-        diff_files = []
-        for diff_item in diffs:
-            if diff_item.a_blob is not None:
-                original_file_content_str = (
-                    diff_item.a_blob.data_stream.read().decode('utf-8')
-                )
-            else:
-                original_file_content_str = ""  # empty file
-            if diff_item.b_blob is not None:
-                new_file_content_str = diff_item.b_blob.data_stream.read(). \
-                    decode('utf-8')
-            else:
-                new_file_content_str = ""  # empty file
-            edit_type = EDIT_TYPE.MODIFIED
-            if diff_item.new_file:
-                edit_type = EDIT_TYPE.ADDED
-            elif diff_item.deleted_file:
-                edit_type = EDIT_TYPE.DELETED
-            elif diff_item.renamed_file:
-                edit_type = EDIT_TYPE.RENAMED
-            diff_files.append(
-                FilePatchInfo(
-                    original_file_content_str,
-                    new_file_content_str,
-                    diff_item.diff.decode('utf-8'),
-                    diff_item.b_path,
-                    edit_type=edit_type,
-                    old_filename=None
-                    if diff_item.a_path == diff_item.b_path
-                    else diff_item.a_path
-                )
-            )
         self.diff_files = diff_files
         return diff_files
 
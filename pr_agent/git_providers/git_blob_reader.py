@@ -0,0 +1,86 @@
+# Copyright (c) 2023 PR-Agent Authors
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import subprocess
+from typing import Iterable, Optional
+
+from pr_agent.log import get_logger
+
+# same heuristic as git: a file is binary if it has a NUL byte within its first 8000 bytes
+_BINARY_DETECTION_BYTES = 8000
+_DISCARD_CHUNK_SIZE = 1024 * 1024
+
+
+def is_binary(content: bytes) -> bool:
+    return b"\0" in content[:_BINARY_DETECTION_BYTES]
+
+
+class GitBlobReader:
+    """
+    Reads blobs of a local repository through a single, persistent 'git cat-file --batch' process,
+    instead of one git call (or one GitPython stream) per object.
+    Blobs larger than `max_blob_size` bytes and binary blobs are skipped: they are read as None.
+    Use as a context manager, or call close() when done.
+    """
+
+    def __init__(self, repo_path, max_blob_size: Optional[int] = None):
+        self.max_blob_size = max_blob_size
+        self._process = subprocess.Popen(["git", "cat-file", "--batch"], cwd=repo_path,
+                                         stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL)
+
+    def __enter__(self) -> "GitBlobReader":
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def close(self):
+        if self._process.poll() is None:
+            self._process.stdin.close()
+            self._process.wait()
+        self._process.stdout.close()
+
+    def read(self, object_id: str) -> Optional[bytes]:
+        self._process.stdin.write(object_id.encode() + b"\n")
+        self._process.stdin.flush()
+        header = self._process.stdout.readline()
+        if not header:
+            raise RuntimeError(f"git cat-file exited unexpectedly while reading {object_id}")
+        fields = header.split()
+        if len(fields) < 3 or fields[1] == b"missing":
+            get_logger().warning(f"Blob {object_id} is missing from the repository")
+            return None
+        size = int(fields[2])
+        if self.max_blob_size is not None and size > self.max_blob_size:
+            get_logger().info(f"Skipping blob {object_id}: its size ({size} bytes) exceeds {self.max_blob_size} bytes")
+            self._discard(size + 1)
+            return None
+        content = self._process.stdout.read(size)
+        self._process.stdout.read(1)  # the content is followed by a newline
+        if is_binary(content):
+            return None
+        return content
+
+    def read_many(self, object_ids: Iterable[str]) -> dict[str, Optional[bytes]]:
+        blobs = {}
+        for object_id in object_ids:
+            if object_id not in blobs:
+                blobs[object_id] = self.read(object_id)
+        return blobs
+
+    def _discard(self, size: int):
+        while size > 0:
+            chunk = self._process.stdout.read(min(size, _DISCARD_CHUNK_SIZE))
+            if not chunk:
+                raise RuntimeError("git cat-file exited unexpectedly")
+            size -= len(chunk)
@@ -0,0 +1,329 @@
+# Copyright (c) 2023 PR-Agent Authors
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Optional
+from urllib.parse import urlsplit, urlunsplit
+
+try:
+    import fcntl
+except ImportError:  # not available on Windows - only in-process locking is used there
+    fcntl = None
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+_LAST_USED_MARKER = "pr_agent_last_used"
+_CREDENTIALS_IN_URL = re.compile(r"(\w+://)[^/@\s]+@")
+
+
+def strip_credentials(repo_url: str) -> str:
+    parts = urlsplit(repo_url)
+    if not parts.netloc or "@" not in parts.netloc:
+        return repo_url
+    return urlunsplit(parts._replace(netloc=parts.netloc.rsplit("@", 1)[1]))
+
+
+def redact_git_error(error: BaseException) -> str:
+    """
+    Describe an error of a git operation for logging, without the credentials it may contain: a failed subprocess is
+    described without its command line (which may hold credentials), and credentials are removed from urls.
+    """
+    if isinstance(error, subprocess.CalledProcessError):
+        return f"git command failed with exit code {error.returncode}"
+    if isinstance(error, subprocess.TimeoutExpired):
+        return f"git command timed out after {error.timeout} seconds"
+    return _CREDENTIALS_IN_URL.sub(r"\1", str(error))
+
+
+def _credential_config(clone_url: Optional[str], git_options: Optional[list[str]] = None) -> list[tuple[str, str]]:
+    """
+    The git config entries that authenticate a command: the '-c key=value' options of `git_options`, and the
+    credentials embedded in `clone_url`, by rewriting the url of the mirror's remote (the url without credentials) to
+    `clone_url`. They are passed to git in its environment (see GitMirrorCache._git_raw) rather than on the command
+    line, where they would be visible to other processes and in the errors of failed commands.
+    """
+    config = []
+    options = list(git_options or [])
+    if len(options) % 2 or any(option != "-c" for option in options[::2]):
+        raise ValueError("Only '-c key=value' git options are supported")
+    for option in options[1::2]:
+        key, _, value = option.partition("=")
+        config.append((key, value))
+    if clone_url:
+        remote_url = strip_credentials(clone_url)
+        if remote_url != clone_url:
+            config.append((f"url.{clone_url}.insteadOf", remote_url))
+    return config
+
+
+def _dir_size(path: str) -> int:
+    total = 0
+    for root, _, files in os.walk(path):
+        for file in files:
+            try:
+                total += os.lstat(os.path.join(root, file)).st_size
+            except OSError:
+                pass
+    return total
+
+
+class GitMirrorCache:
+    """
+    A persistent, size-capped cache of bare repository mirrors.
+    Instead of cloning a repository for every operation, the mirror is fetched on use (only the needed refs, shallow),
+    and the caller gets a cheap `git worktree` of it, optionally restricted to some paths with a cone-mode sparse checkout.
+    Operations on the same mirror are serialized with a lock (a file lock as well, so that several worker processes can
+    share the cache directory). Least recently used mirrors are evicted once the cache exceeds its size limit.
+    """
+
+    def __init__(self, cache_dir: str, max_size_bytes: int):
+        self.cache_dir = cache_dir
+        self.max_size_bytes = max_size_bytes
+        self._locks: dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+        os.makedirs(cache_dir, mode=0o700, exist_ok=True)
+
+    def mirror_path(self, repo_url: str, blob_filter: Optional[str] = None) -> str:
+        key = f"{strip_credentials(repo_url)}|{blob_filter or ''}"
+        return os.path.join(self.cache_dir, hashlib.sha256(key.encode()).hexdigest()[:32] + ".git")
+
+    @contextmanager
+    def _lock(self, mirror_path: str, blocking: bool = True):
+        with self._locks_lock:
+            thread_lock = self._locks.setdefault(mirror_path, threading.Lock())
+        if not thread_lock.acquire(blocking=blocking):
+            yield False
+            return
+        try:
+            if fcntl is None:
+                yield True
+                return
+            with open(mirror_path + ".lock", "a") as lock_file:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB))
+                except BlockingIOError:
+                    yield False
+                    return
+                try:
+                    yield True
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+        finally:
+            thread_lock.release()
+
+    @staticmethod
+    def _git_raw(*args, cwd: str = None, timeout: Optional[float] = None, input: bytes = None,
+                 config: Optional[list[tuple[str, str]]] = None) -> bytes:
+        """
+        Run a git command. `config` entries are passed in the environment (GIT_CONFIG_KEY_<n>/GIT_CONFIG_VALUE_<n>),
+        and a failure is raised without the command line, so that neither exposes the credentials they may hold.
+        """
+        env = None
+        if config:
+            env = dict(os.environ)
+            count = int(env.get("GIT_CONFIG_COUNT") or 0)
+            for index, (key, value) in enumerate(config, count):
+                env[f"GIT_CONFIG_KEY_{index}"] = key
+                env[f"GIT_CONFIG_VALUE_{index}"] = value
+            env["GIT_CONFIG_COUNT"] = str(count + len(config))
+        try:
+            result = subprocess.run(["git", *args], cwd=cwd, check=True, timeout=timeout, input=input, env=env,
+                                    stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        except subprocess.CalledProcessError as e:
+            stderr = _CREDENTIALS_IN_URL.sub(r"\1", e.stderr.decode("utf-8", errors="replace").strip())
+            raise RuntimeError(f"git {args[0]} failed with exit code {e.returncode}: {stderr}") from None
+        except subprocess.TimeoutExpired as e:
+            raise RuntimeError(f"git {args[0]} timed out after {e.timeout} seconds") from None
+        return result.stdout
+
+    @classmethod
+    def _git(cls, *args, cwd: str = None, timeout: Optional[float] = None,
+             config: Optional[list[tuple[str, str]]] = None) -> str:
+        return cls._git_raw(*args, cwd=cwd, timeout=timeout, config=config).decode("utf-8", errors="replace").strip()
+
+    def _sync_mirror(self, mirror_path: str, clone_url: str, refspecs: list[str], depth: Optional[int],
+                     blob_filter: Optional[str], timeout: Optional[float], git_options: list[str]):
+        filter_args = [f"--filter={blob_filter}"] if blob_filter else []
+        depth_args = ["--depth", str(depth)] if depth else []
+        remote_url = strip_credentials(clone_url)
+        config = _credential_config(clone_url, git_options)
+        if not os.path.exists(mirror_path):
+            # clone into a temporary directory first, so that a failed or timed out clone never leaves a broken mirror
+            tmp_path = tempfile.mkdtemp(dir=self.cache_dir, prefix=".cloning_")
+            try:
+                self._git("clone", "--bare", "--no-tags", *depth_args, *filter_args, remote_url, tmp_path,
+                          timeout=timeout, config=config)
+                os.rename(tmp_path, mirror_path)
+            finally:
+                shutil.rmtree(tmp_path, ignore_errors=True)
+        else:
+            # mirrors created by earlier versions stored the url with its credentials
+            self._git("remote", "set-url", "origin", remote_url, cwd=mirror_path)
+            default_branch = self._git("symbolic-ref", "HEAD", cwd=mirror_path)
+            refspecs = [f"+HEAD:{default_branch}"] + list(refspecs)
+        if refspecs:
+            self._git("fetch", "--no-tags", *depth_args, *filter_args, "origin", *refspecs,
+                      cwd=mirror_path, timeout=timeout, config=config)
+
+    @contextmanager
+    def mirror(self, repo_url: str, clone_url: str, refspecs: Optional[list[str]] = None, depth: Optional[int] = 1,
+               blob_filter: Optional[str] = None, timeout: Optional[float] = None,
+               git_options: Optional[list[str]] = None, sync: bool = True) -> Iterator[str]:
+        """
+        Fetch `refspecs` (and the default branch) into the mirror of `repo_url`, and yield the path of the mirror.
+        The mirror is locked until the block exits. The credentials embedded in `clone_url` and `git_options` (only
+        '-c key=value' options, e.g. ['-c', 'http.extraHeader=...']) are passed in the environment of every command that
+        talks to the remote, and are never stored in the mirror: its remote is `clone_url` without credentials.
+        With sync=False, an existing mirror is used as is (missing blobs can still be fetched with read_blobs).
+        """
+        mirror_path = self.mirror_path(repo_url, blob_filter)
+        with self._lock(mirror_path):
+            if sync:
+                self._sync_mirror(mirror_path, clone_url, refspecs or [], depth, blob_filter, timeout, git_options or [])
+            elif not os.path.exists(mirror_path):
+                raise FileNotFoundError(f"No cached mirror for {strip_credentials(repo_url)}")
+            else:
+                self._git("remote", "set-url", "origin", strip_credentials(clone_url), cwd=mirror_path)
+            yield mirror_path
+            with open(os.path.join(mirror_path, _LAST_USED_MARKER), "w"):
+                pass
+        self.evict(keep=mirror_path)
+
+    def checkout(self, repo_url: str, clone_url: str, dest_folder: str, ref: str = "HEAD",
+                 refspecs: Optional[list[str]] = None, depth: Optional[int] = 1, blob_filter: Optional[str] = None,
+                 sparse_paths: Optional[list[str]] = None, timeout: Optional[float] = None,
+                 git_options: Optional[list[str]] = None) -> str:
+        """
+        Sync the mirror of `repo_url` (see mirror()), then add a detached worktree of `ref` at `dest_folder`.
+        If `sparse_paths` is given, only these directories (and the files at the repository root) are checked out.
+        Returns the path of the mirror.
+        """
+        with self.mirror(repo_url, clone_url, refspecs, depth, blob_filter, timeout, git_options) as mirror_path:
+            self._git("worktree", "prune", cwd=mirror_path)
+            self._git("worktree", "add", "--detach", "--no-checkout", os.path.abspath(dest_folder), ref,
+                      cwd=mirror_path)
+            if sparse_paths is not None:
+                self._git("sparse-checkout", "set", "--cone", *sparse_paths, cwd=dest_folder)
+            # with a partial clone, checking out lazily fetches the missing blobs - only those of the sparse paths
+            self._git("checkout", "--detach", cwd=dest_folder, timeout=timeout,
+                      config=_credential_config(clone_url, git_options))
+        return mirror_path
+
+    def list_files(self, mirror_path: str, path: str = "", ref: str = "HEAD",
+                   recursive: bool = True) -> list[tuple[str, str]]:
+        """List the (path, blob id) of the files under `path` at `ref`, without a working tree or fetching blobs."""
+        args = ["ls-tree", "-z", "--full-tree"] + (["-r"] if recursive else []) + [ref]
+        if path and path not in (".", "/"):
+            args += ["--", path.strip("/")]
+        files = []
+        for entry in self._git_raw(*args, cwd=mirror_path).split(b"\0"):
+            if not entry:
+                continue
+            info, file_path = entry.split(b"\t", 1)
+            _, object_type, object_id = info.split(b" ")
+            if object_type == b"blob":  # skips submodules (commits) and, when not recursive, directories (trees)
+                files.append((file_path.decode("utf-8", errors="replace"), object_id.decode()))
+        return files
+
+    def read_blobs(self, mirror_path: str, object_ids: list[str], ref: str = "HEAD", pathspecs: list[str] = None,
+                   timeout: Optional[float] = None, git_options: Optional[list[str]] = None,
+                   clone_url: Optional[str] = None) -> dict[str, bytes]:
+        """
+        Read blobs with a single 'git cat-file --batch'. In a partial clone, the blobs missing among those under
+        `pathspecs` at `ref` are first fetched with a single request (authenticated as in mirror()), instead of lazily
+        one by one.
+        """
+        if not object_ids:
+            return {}
+        if pathspecs:
+            # the pathspecs are passed on stdin, as there may be too many of them for the command line
+            listing = self._git_raw("rev-list", "--objects", "--missing=print", "--no-walk", "--stdin", cwd=mirror_path,
+                                    input="\n".join([ref, "--", *pathspecs]).encode() + b"\n")
+            missing = {line[1:].strip() for line in listing.decode().splitlines() if line.startswith("?")}
+            missing &= set(object_ids)
+            if missing:
+                config = _credential_config(clone_url, git_options) + [("fetch.negotiationAlgorithm", "noop")]
+                self._git_raw("fetch", "--no-tags", "--no-write-fetch-head", "--recurse-submodules=no",
+                              "--filter=blob:none", "--stdin", "origin", cwd=mirror_path, timeout=timeout,
+                              input="\n".join(missing).encode(), config=config)
+        output = self._git_raw("cat-file", "--batch", cwd=mirror_path, timeout=timeout,
+                               input="\n".join(object_ids).encode() + b"\n")
+        blobs = {}
+        position = 0
+        while position < len(output):
+            header_end = output.index(b"\n", position)
+            header = output[position:header_end].split(b" ")
+            position = header_end + 1
+            if len(header) < 3 or header[1] == b"missing":
+                continue
+            size = int(header[2])
+            blobs[header[0].decode()] = output[position:position + size]
+            position += size + 1  # the content is followed by a newline
+        return blobs
+
+    def evict(self, keep: Optional[str] = None):
+        """Remove the least recently used mirrors until the cache fits its size limit. Mirrors in use are skipped."""
+        try:
+            mirrors = []
+            for name in os.listdir(self.cache_dir):
+                path = os.path.join(self.cache_dir, name)
+                if name.endswith(".git") and os.path.isdir(path):
+                    marker = os.path.join(path, _LAST_USED_MARKER)
+                    last_used = os.path.getmtime(marker) if os.path.exists(marker) else 0
+                    mirrors.append((last_used, path, _dir_size(path)))
+            total_size = sum(size for _, _, size in mirrors)
+            for _, path, size in sorted(mirrors):
+                if total_size <= self.max_size_bytes:
+                    break
+                if path == keep:
+                    continue
+                with self._lock(path, blocking=False) as acquired:
+                    if not acquired:
+                        continue
+                    # a mirror backing a live worktree must not be removed from under it
+                    self._git("worktree", "prune", cwd=path)
+                    worktrees_dir = os.path.join(path, "worktrees")
+                    if os.path.isdir(worktrees_dir) and os.listdir(worktrees_dir):
+                        continue
+                    get_logger().info(f"Evicting git mirror {path} ({size} bytes) from the cache")
+                    shutil.rmtree(path, ignore_errors=True)
+                    total_size -= size
+        except Exception as e:
+            get_logger().warning(f"Failed to evict git mirrors: {e}")
+
+
+_git_mirror_cache: Optional[GitMirrorCache] = None
+_git_mirror_cache_lock = threading.Lock()
+
+
+def get_git_mirror_cache() -> Optional[GitMirrorCache]:
+    """Return the process-wide git mirror cache, or None if it is disabled (config.git_mirror_cache)."""
+    global _git_mirror_cache
+    if not get_settings().get("CONFIG.GIT_MIRROR_CACHE", True):
+        return None
+    if _git_mirror_cache is None:
+        with _git_mirror_cache_lock:
+            if _git_mirror_cache is None:
+                cache_dir = (get_settings().get("CONFIG.GIT_MIRROR_CACHE_DIR", "")
+                             or os.path.join(tempfile.gettempdir(), "pr_agent_git_mirrors"))
+                max_size_mb = get_settings().get("CONFIG.GIT_MIRROR_CACHE_MAX_SIZE_MB", 2048)
+                _git_mirror_cache = GitMirrorCache(cache_dir, max_size_mb * 1024 * 1024)
+    return _git_mirror_cache
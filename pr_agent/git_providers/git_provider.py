@@ -16,11 +16,14 @@ import os
 import shutil
 import subprocess
 from abc import ABC, abstractmethod
-from typing import Optional, Tuple
+from typing import Callable, Optional, Tuple
 
 from pr_agent.algo.types import FilePatchInfo
 from pr_agent.algo.utils import Range, process_description
 from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.git_mirror_cache import (get_git_mirror_cache,
+                                                     redact_git_error,
+                                                     strip_credentials)
 from pr_agent.log import get_logger
 
 MAX_FILES_ALLOWED_FULL = 50
@@ -78,11 +81,99 @@ class GitProvider(ABC):
         ], check=True,  # check=True will raise an exception if the command fails
             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, timeout=operation_timeout_in_seconds)
 
+    # Extra git options (such as authentication headers) for commands that talk to the remote. Providers that override
+    # _clone_inner in order to authenticate differently should return the equivalent options here.
+    def _get_clone_git_options(self) -> list[str]:
+        return []
+
+    # Checks out the repo from the git mirror cache. Returns False if the cache is disabled or could not be used, in which
+    # case dest_folder is left empty for a regular clone.
+    def _clone_from_mirror_cache(self, repo_url_to_clone: str, clone_url: str, dest_folder: str,
+                                 operation_timeout_in_seconds: int=None, sparse_paths: list[str] = None) -> bool:
+        mirror_cache = get_git_mirror_cache()
+        if not mirror_cache:
+            return False
+        try:
+            mirror_cache.checkout(repo_url_to_clone, clone_url, dest_folder, blob_filter="blob:none",
+                                  sparse_paths=sparse_paths, timeout=operation_timeout_in_seconds,
+                                  git_options=self._get_clone_git_options())
+            return True
+        except Exception as e:
+            get_logger().warning(f"Failed to check out the repo from the git mirror cache, cloning it instead: "
+                                 f"{redact_git_error(e)}")
+            if os.path.isdir(dest_folder):
+                for entry in os.listdir(dest_folder):
+                    entry_path = os.path.join(dest_folder, entry)
+                    if os.path.isdir(entry_path):
+                        shutil.rmtree(entry_path, ignore_errors=True)
+                    else:
+                        os.remove(entry_path)
+            return False
+
     CLONE_TIMEOUT_SEC = 20
+    # Lists files of the default branch of a repo straight from the git mirror cache, without a working tree (with
+    # 'git ls-tree', so no file contents are downloaded). As in a cone-mode sparse checkout, the files under each of
+    # dir_paths and the files at the root of the repo are considered. Returns a dict of file path -> blob id for the
+    # files accepted by file_filter (in listing order, at most max_files), or None if the mirror cache is disabled or
+    # could not be used. Blob ids identify file versions, so they can serve as cache keys for the file contents.
+    def list_repo_files(self, repo_url_to_clone: str, dir_paths: list[str], file_filter: Callable[[str], bool],
+                        max_files: int = 5000, operation_timeout_in_seconds: int=CLONE_TIMEOUT_SEC) -> dict[str, str] | None:
+        mirror_cache = get_git_mirror_cache()
+        if not mirror_cache:
+            return None
+        clone_url = self._prepare_clone_url_with_token(repo_url_to_clone)
+        if not clone_url:
+            get_logger().error("Listing repo files failed: Unable to obtain url to clone.")
+            return None
+        try:
+            with mirror_cache.mirror(repo_url_to_clone, clone_url, blob_filter="blob:none",
+                                     timeout=operation_timeout_in_seconds,
+                                     git_options=self._get_clone_git_options()) as mirror_path:
+                files = mirror_cache.list_files(mirror_path, recursive=False)
+                for dir_path in dir_paths:
+                    files += mirror_cache.list_files(mirror_path, dir_path)
+            selected_files = {}
+            for file_path, object_id in files:
+                if file_path not in selected_files and file_filter(file_path):
+                    selected_files[file_path] = object_id
+                    if len(selected_files) >= max_files:
+                        get_logger().warning(f"Found at least {max_files} files in {repo_url_to_clone}, skipping the rest.")
+                        break
+            return selected_files
+        except Exception as e:
+            get_logger().warning(f"Failed to list files of {repo_url_to_clone} from the git mirror cache: "
+                                 f"{redact_git_error(e)}")
+            return None
+
+    # Reads files previously listed with list_repo_files (file path -> blob id) with a single 'git cat-file --batch'.
+    # Only the blobs of these files are downloaded, in one request. Returns a dict of file path -> contents, or None if
+    # the files could not be read.
+    def read_repo_files(self, repo_url_to_clone: str, files: dict[str, str],
+                        operation_timeout_in_seconds: int=CLONE_TIMEOUT_SEC) -> dict[str, bytes] | None:
+        mirror_cache = get_git_mirror_cache()
+        clone_url = self._prepare_clone_url_with_token(repo_url_to_clone)
+        if not mirror_cache or not clone_url:
+            return None
+        git_options = self._get_clone_git_options()
+        try:
+            with mirror_cache.mirror(repo_url_to_clone, clone_url, blob_filter="blob:none", sync=False,
+                                     timeout=operation_timeout_in_seconds, git_options=git_options) as mirror_path:
+                blobs = mirror_cache.read_blobs(mirror_path, list(files.values()), pathspecs=list(files.keys()),
+                                                timeout=operation_timeout_in_seconds, git_options=git_options,
+                                                clone_url=clone_url)
+            return {file_path: blobs[object_id] for file_path, object_id in files.items() if object_id in blobs}
+        except Exception as e:
+            get_logger().warning(f"Failed to read files of {repo_url_to_clone} from the git mirror cache: "
+                                 f"{redact_git_error(e)}")
+            return None
+
     # Clone a given url to a destination folder. If successful, returns an object that wraps the destination folder,
     # deleting it once it is garbage collected. See: GitProvider.ScopedClonedRepo for more details.
+    # When the git mirror cache is enabled (config.git_mirror_cache), the destination folder is a worktree of a cached
+    # mirror of the repo, which is only fetched incrementally. If sparse_paths is given, only these directories (and the
+    # files at the root of the repo) are checked out.
     def clone(self, repo_url_to_clone: str, dest_folder: str, remove_dest_folder: bool = True,
-              operation_timeout_in_seconds: int=CLONE_TIMEOUT_SEC) -> ScopedClonedRepo|None:
+              operation_timeout_in_seconds: int=CLONE_TIMEOUT_SEC, sparse_paths: list[str] = None) -> ScopedClonedRepo|None:
         returned_obj = None
         clone_url = self._prepare_clone_url_with_token(repo_url_to_clone)
         if not clone_url:
@@ -91,11 +182,15 @@ class GitProvider(ABC):
         try:
             if remove_dest_folder and os.path.exists(dest_folder) and os.path.isdir(dest_folder):
                 shutil.rmtree(dest_folder)
-            self._clone_inner(clone_url, dest_folder, operation_timeout_in_seconds)
+            if not self._clone_from_mirror_cache(repo_url_to_clone, clone_url, dest_folder,
+                                                 operation_timeout_in_seconds, sparse_paths):
+                self._clone_inner(clone_url, dest_folder, operation_timeout_in_seconds)
             returned_obj = GitProvider.ScopedClonedRepo(dest_folder)
         except Exception as e:
-            get_logger().exception(f"Clone failed: Could not clone url.",
-                artifact={"error": str(e), "url": clone_url, "dest_folder": dest_folder})
+            # not logged with the traceback, as the error of a failed git command holds its command line (credentials)
+            get_logger().error(f"Clone failed: Could not clone url.",
+                artifact={"error": redact_git_error(e), "url": strip_credentials(clone_url),
+                          "dest_folder": dest_folder})
         finally:
             return returned_obj
 
@@ -219,6 +314,13 @@ class GitProvider(ABC):
     def get_repo_settings(self):
         pass
 
+    def get_repo_settings_cache_key(self) -> Optional[str]:
+        """
+        A key identifying the repo settings file returned by get_repo_settings(), used to reuse it across events of the
+        same repo for a short while. None disables the caching for this provider.
+        """
+        return None
+
     def get_workspace_name(self):
         return ""
 
@@ -0,0 +1,126 @@
+# Copyright (c) 2023 PR-Agent Authors
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Tuple
+
+from github import AppAuthentication, Auth, Github
+from requests.adapters import HTTPAdapter
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+from .github_conditional_requests import (ConditionalRequestAdapter,
+                                          get_conditional_request_cache,
+                                          mount_adapter)
+
+
+class PooledAppAuthentication(AppAuthentication):
+    """
+    GitHub App installation authentication that is shared by all providers of the same installation.
+    PyGithub already caches the installation token on the auth object; this subclass only widens the refresh
+    margin, so that a token is not handed to a long-running tool run seconds before it expires.
+    """
+
+    def __init__(self, app_id, private_key: str, installation_id: int, refresh_margin_seconds: int = 300):
+        super().__init__(app_id=app_id, private_key=private_key, installation_id=installation_id)
+        self._refresh_margin = timedelta(seconds=refresh_margin_seconds)
+        self._token_lock = threading.Lock()
+
+    @property
+    def token(self) -> str:
+        # avoid minting several tokens when multiple threads find the token expired at the same time
+        with self._token_lock:
+            return super().token
+
+    @property
+    def _is_expired(self) -> bool:
+        expires_at = self._AppInstallationAuth__installation_authorization.expires_at
+        now = datetime.now(timezone.utc)
+        if expires_at.tzinfo is None:
+            now = now.replace(tzinfo=None)
+        return expires_at - self._refresh_margin < now
+
+
+class GithubClientPool:
+    """
+    A process-level LRU pool of authenticated Github clients.
+    Clients are keyed by installation (or by user token), so constructing a GithubProvider reuses the client,
+    its installation access token and its HTTP session instead of authenticating from scratch.
+    """
+
+    def __init__(self, max_clients: int = 100):
+        self.max_clients = max_clients
+        self._clients: OrderedDict[tuple, Tuple[Github, Auth.Auth]] = OrderedDict()
+        self._lock = threading.Lock()
+        self._shared_adapters: dict[str, HTTPAdapter] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get_client(self, key: tuple, auth_factory: Callable[[], Auth.Auth], base_url: str) -> Tuple[Github, Auth.Auth]:
+        with self._lock:
+            pooled = self._clients.get(key)
+            if pooled is not None:
+                self._clients.move_to_end(key)
+                self.hits += 1
+                return pooled
+            self.misses += 1
+            auth = auth_factory()
+            client = Github(auth=auth, base_url=base_url)
+            mount_adapter(client, self._get_shared_adapter(base_url))
+            self._clients[key] = (client, auth)
+            while len(self._clients) > self.max_clients:
+                self._clients.popitem(last=False)
+            return client, auth
+
+    def _get_shared_adapter(self, base_url: str) -> HTTPAdapter:
+        # A single adapter (and therefore a single urllib3 connection pool) is shared by all pooled clients
+        # of the same GitHub host, so TCP/TLS connections are reused across installations.
+        adapter = self._shared_adapters.get(base_url)
+        if adapter is None:
+            pool_size = get_settings().get("GITHUB.CLIENT_POOL_CONNECTIONS", 20)
+            if get_settings().get("GITHUB.CONDITIONAL_REQUESTS", True):
+                adapter = ConditionalRequestAdapter(get_conditional_request_cache(),
+                                                    pool_connections=pool_size, pool_maxsize=pool_size)
+            else:
+                adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+            self._shared_adapters[base_url] = adapter
+        return adapter
+
+    def clear(self):
+        with self._lock:
+            self._clients.clear()
+
+    def __len__(self):
+        return len(self._clients)
+
+    def get_stats(self) -> dict:
+        return {"clients": len(self._clients), "hits": self.hits, "misses": self.misses}
+
+
+_github_client_pool: GithubClientPool | None = None
+_github_client_pool_lock = threading.Lock()
+
+
+def get_github_client_pool() -> GithubClientPool:
+    """Return the process-wide Github client pool, creating it on first use."""
+    global _github_client_pool
+    if _github_client_pool is None:
+        with _github_client_pool_lock:
+            if _github_client_pool is None:
+                max_clients = get_settings().get("GITHUB.CLIENT_POOL_MAX_SIZE", 100)
+                _github_client_pool = GithubClientPool(max_clients=max_clients)
+                get_logger().debug(f"Created GitHub client pool with max size {max_clients}")
+    return _github_client_pool
@@ -0,0 +1,199 @@
+# Copyright (c) 2023 PR-Agent Authors
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+
+import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+# Headers of a 304 response that should override the ones stored with the cached body
+_REFRESHED_HEADERS = ("date", "x-ratelimit-limit", "x-ratelimit-remaining", "x-ratelimit-reset",
+                      "x-ratelimit-used", "x-ratelimit-resource", "etag", "last-modified")
+
+
+@dataclass
+class CachedResponse:
+    etag: str | None
+    last_modified: str | None
+    headers: dict
+    content: bytes
+    encoding: str | None
+
+
+class ConditionalRequestCache:
+    """
+    A bounded, thread-safe LRU store of GET response bodies together with their validators (ETag/Last-Modified).
+    GitHub does not count 304 (Not Modified) responses against the rate limit, so every revalidated hit is
+    a saved request.
+    """
+
+    def __init__(self, max_entries: int = 1000):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, CachedResponse] = OrderedDict()
+        self._lock = threading.Lock()
+        self.not_modified = 0  # 304 responses served from the cache
+        self.modified = 0  # conditional requests that returned a new body
+        self.uncached = 0  # GET requests that had nothing cached yet
+
+    def get(self, key: tuple) -> CachedResponse | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put(self, key: tuple, entry: CachedResponse):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record(self, outcome: str):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_stats(self) -> dict:
+        conditional = self.not_modified + self.modified
+        return {
+            "entries": len(self._entries),
+            "saved_requests": self.not_modified,
+            "conditional_requests": conditional,
+            "uncached_requests": self.uncached,
+            "hit_rate": self.not_modified / conditional if conditional else 0.0,
+        }
+
+
+class ConditionalRequestAdapter(HTTPAdapter):
+    """
+    A requests transport adapter that turns repeated GET requests into conditional requests
+    (If-None-Match / If-Modified-Since) and transparently serves the cached body when the server answers 304.
+    """
+
+    def __init__(self, cache: ConditionalRequestCache, **kwargs):
+        self.cache = cache
+        super().__init__(**kwargs)
+
+    @staticmethod
+    def _cache_key(request: requests.PreparedRequest) -> tuple:
+        # The Accept header changes the representation (e.g. raw vs. json), so it is part of the key.
+        # The Authorization header is intentionally not: a 304 is only returned to an authorized caller.
+        return request.url, request.headers.get("Accept", "")
+
+    def send(self, request: requests.PreparedRequest, **kwargs) -> requests.Response:
+        if request.method != "GET":
+            return super().send(request, **kwargs)
+
+        key = self._cache_key(request)
+        cached = self.cache.get(key)
+        if cached:
+            if cached.etag and "If-None-Match" not in request.headers:
+                request.headers["If-None-Match"] = cached.etag
+            if cached.last_modified and "If-Modified-Since" not in request.headers:
+                request.headers["If-Modified-Since"] = cached.last_modified
+
+        response = super().send(request, **kwargs)
+
+        if response.status_code == 304 and cached:
+            self.cache.record("not_modified")
+            return self._build_cached_response(request, response, cached)
+
+        self.cache.record("modified" if cached else "uncached")
+
+        if response.status_code == 200:
+            etag = response.headers.get("ETag")
+            last_modified = response.headers.get("Last-Modified")
+            if etag or last_modified:
+                self.cache.put(key, CachedResponse(etag=etag,
+                                                   last_modified=last_modified,
+                                                   headers=dict(response.headers),
+                                                   content=response.content,
+                                                   encoding=response.encoding))
+        return response
+
+    @staticmethod
+    def _build_cached_response(request: requests.PreparedRequest, not_modified: requests.Response,
+                               cached: CachedResponse) -> requests.Response:
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.url = request.url
+        response.request = request
+        response.connection = getattr(not_modified, "connection", None)
+        response.encoding = cached.encoding
+        response._content = cached.content
+        headers = CaseInsensitiveDict(cached.headers)
+        for header in _REFRESHED_HEADERS:
+            if header in not_modified.headers:
+                headers[header] = not_modified.headers[header]
+        response.headers = headers
+        response.elapsed = not_modified.elapsed
+        return response
+
+
+_conditional_request_cache: ConditionalRequestCache | None = None
+_conditional_request_cache_lock = threading.Lock()
+
+
+def get_conditional_request_cache() -> ConditionalRequestCache:
+    """Return the process-wide conditional request cache, creating it on first use."""
+    global _conditional_request_cache
+    if _conditional_request_cache is None:
+        with _conditional_request_cache_lock:
+            if _conditional_request_cache is None:
+                max_entries = get_settings().get("GITHUB.CONDITIONAL_REQUESTS_CACHE_SIZE", 1000)
+                _conditional_request_cache = ConditionalRequestCache(max_entries=max_entries)
+    return _conditional_request_cache
+
+
+def mount_adapter(github_client, adapter: HTTPAdapter) -> bool:
+    """
+    Mount a transport adapter on the HTTP session that PyGithub uses for the given client.
+    Returns True if the adapter was mounted.
+    """
+    try:
+        requester = github_client._Github__requester
+        # PyGithub creates a single persistent connection object (wrapping a requests.Session) per requester
+        connection = requester._Requester__createConnection()
+        session = getattr(connection, "session", None)
+        if session is None:
+            return False
+        session.mount(f"{connection.protocol}://", adapter)
+        connection.adapter = adapter
+        return True
+    except Exception as e:
+        get_logger().warning(f"Failed to mount HTTP adapter on GitHub client, error: {e}")
+        return False
+
+
+def install_conditional_requests(github_client, cache: ConditionalRequestCache = None, **adapter_kwargs) -> bool:
+    """
+    Mount a ConditionalRequestAdapter on the HTTP session that PyGithub uses for the given client.
+    Returns True if the adapter was installed.
+    """
+    if cache is None:
+        cache = get_conditional_request_cache()
+    return mount_adapter(github_client, ConditionalRequestAdapter(cache, **adapter_kwargs))
@@ -24,13 +24,17 @@ from typing import Optional, Tuple
 from urllib.parse import urlparse
 
 from github import AppAuthentication, Auth, Github, GithubException
+from github.Commit import Commit
 from github.Issue import Issue
 from retry import retry
 from starlette_context import context
 
 from ..algo.file_filter import filter_ignored
-from ..algo.git_patch_processing import extract_hunk_headers
+from ..algo.git_patch_processing import (extract_hunk_headers,
+                                         get_hunk_line_ranges)
 from ..algo.language_handler import is_valid_file
+from ..algo.request_cache import (DIFF_FILES, CacheKey, CacheLifetime,
+                                  get_request_cache)
 from ..algo.types import EDIT_TYPE
 from ..algo.utils import (PRReviewHeader, Range, clip_tokens,
                           find_line_number_of_relevant_line_in_file,
@@ -40,6 +44,13 @@ from ..log import get_logger
 from ..servers.utils import RateLimitExceeded
 from .git_provider import (MAX_FILES_ALLOWED_FULL, FilePatchInfo, GitProvider,
                            IncrementalPR)
+from .github_client_pool import PooledAppAuthentication, get_github_client_pool
+from .github_conditional_requests import (get_conditional_request_cache,
+                                          install_conditional_requests)
+
+# the files of a PR, which only change with its head commit (or its base branch)
+_PR_FILES: CacheKey[list] = CacheKey("github.pr_files", CacheLifetime.PR_HEAD,
+                                     sizeof=lambda files: sum(1024 + len(file.patch or "") for file in files))
 
 
 class GithubProvider(GitProvider):
@@ -61,15 +72,47 @@ class GithubProvider(GitProvider):
         self.diff_files = None
         self.git_files = None
         self.incremental = IncrementalPR(False)
+        # commits are loaded lazily: listing them paginates through the whole PR history (see pr_commits)
+        self._pr_commits = None
+        self._last_commit_id = None
         if pr_url and 'pull' in pr_url:
             self.set_pr(pr_url)
-            self.pr_commits = list(self.pr.get_commits())
-            self.last_commit_id = self.pr_commits[-1]
             self.pr_url = self.get_pr_url() # pr_url for github actions can be as api.github.com, so we need to get the url from the pr object
         elif pr_url and 'issue' in pr_url: #url is an issue
             self.issue_main = self._get_issue_handle(pr_url)
-        else: #Instantiated the provider without a PR / Issue
-            self.pr_commits = None
+
+    @property
+    def pr_commits(self) -> Optional[list[Commit]]:
+        """The full list of PR commits. Fetched on first access only, since it requires paginating all commits."""
+        if self._pr_commits is None and self.pr is not None:
+            self._pr_commits = list(self.pr.get_commits())
+        return self._pr_commits
+
+    @pr_commits.setter
+    def pr_commits(self, commits: Optional[list[Commit]]):
+        self._pr_commits = commits
+
+    @property
+    def last_commit_id(self) -> Optional[Commit]:
+        """The PR head commit, built from pr.head.sha without listing the PR commits."""
+        if self._last_commit_id is None and self.pr is not None:
+            if self._pr_commits:
+                self._last_commit_id = self._pr_commits[-1]
+            else:
+                self._last_commit_id = self._get_head_commit()
+        return self._last_commit_id
+
+    @last_commit_id.setter
+    def last_commit_id(self, commit: Optional[Commit]):
+        self._last_commit_id = commit
+
+    def _get_head_commit(self) -> Commit:
+        sha = self.pr.head.sha
+        repo = self._get_repo()
+        # a non-completed Commit object: attributes that are set here are served without any API call
+        return Commit(self.pr._requester, {}, {"sha": sha,
+                                               "url": f"{repo.url}/commits/{sha}",
+                                               "html_url": f"{repo.html_url}/commit/{sha}"}, completed=False)
 
     def _get_issue_handle(self, issue_url) -> Optional[Issue]:
         repo_name, issue_number = self._parse_issue_url(issue_url)
@@ -163,9 +206,6 @@ class GithubProvider(GitProvider):
         self.pr = self._get_pr()
 
     def _get_incremental_commits(self):
-        if not self.pr_commits:
-            self.pr_commits = list(self.pr.get_commits())
-
         self.previous_review = self.get_previous_review(full=True, incremental=True)
         if self.previous_review:
             self.incremental.commits_range = self.get_commit_range()
@@ -209,17 +249,11 @@ class GithubProvider(GitProvider):
     def get_files(self):
         if self.incremental.is_incremental and self.unreviewed_files_set:
             return self.unreviewed_files_set.values()
-        try:
-            git_files = context.get("git_files", None)
-            if git_files:
-                return git_files
-            self.git_files = list(self.pr.get_files()) # 'list' to handle pagination
-            context["git_files"] = self.git_files
-            return self.git_files
-        except Exception:
-            if not self.git_files:
-                self.git_files = list(self.pr.get_files())
-            return self.git_files
+        if self.git_files is None:
+            scope = (self.repo, self.pr_num, self.pr.base.ref, self.pr.head.sha)
+            # 'list' to handle pagination
+            self.git_files = get_request_cache().get_or_compute(_PR_FILES, lambda: list(self.pr.get_files()), scope)
+        return self.git_files
 
     def get_num_of_files(self):
         if hasattr(self.git_files, "totalCount"):
@@ -242,15 +276,16 @@ class GithubProvider(GitProvider):
             or renamed files in the merge request.
         """
         try:
-            try:
-                diff_files = context.get("diff_files", None)
-                if diff_files:
-                    return diff_files
-            except Exception:
-                pass
-
             if self.diff_files:
                 return self.diff_files
+            # the diff of an incremental review only covers the new commits, and is not shared with the other tools
+            shared = not self.incremental.is_incremental
+            if shared:
+                diff_files = get_request_cache().get(DIFF_FILES, self.pr.html_url)
+                if diff_files:
+                    # also used to locate the lines of the inline comments
+                    self.diff_files = diff_files
+                    return diff_files
 
             # filter files using [ignore] patterns
             files_original = self.get_files()
@@ -355,10 +390,8 @@ class GithubProvider(GitProvider):
                 get_logger().info(f"Filtered out files with invalid extensions: {invalid_files_names}")
 
             self.diff_files = diff_files
-            try:
-                context["diff_files"] = diff_files
-            except Exception:
-                pass
+            if shared:
+                get_request_cache().put(DIFF_FILES, diff_files, self.pr.html_url)
 
             return diff_files
 
@@ -480,18 +513,31 @@ class GithubProvider(GitProvider):
 
     def _publish_inline_comments_fallback_with_verification(self, comments: list[dict]):
         """
-        Check each inline comment separately against the GitHub API and discard of invalid comments,
-        then publish all the remaining valid comments in a single review.
+        Validate the placement of each inline comment locally against the PR hunks, verify only the ambiguous
+        comments against the GitHub API, then publish all the remaining valid comments in a single review.
         For invalid comments, also try removing the suggestion part and posting the comment just on the first line.
         """
-        verified_comments, invalid_comments = self._verify_code_comments(comments)
+        valid_comments, invalid_comments, ambiguous_comments = self._classify_inline_comments(comments)
+        get_logger().info(f"Inline comments placement: {len(valid_comments)} valid, {len(invalid_comments)} invalid, "
+                          f"{len(ambiguous_comments)} to verify against the GitHub API")
+        verified_comments, failed_comments = self._verify_code_comments(ambiguous_comments)
+        invalid_comments.extend(failed_comments)
 
         # publish as a group the verified comments
-        if verified_comments:
+        if valid_comments or verified_comments:
             try:
-                self.pr.create_review(commit=self.last_commit_id, comments=verified_comments)
-            except:
-                pass
+                self.pr.create_review(commit=self.last_commit_id, comments=valid_comments + verified_comments)
+            except Exception:
+                if valid_comments:
+                    # the local validation was wrong for at least one comment - verify those as well and retry
+                    confirmed_comments, failed_comments = self._verify_code_comments(valid_comments)
+                    invalid_comments.extend(failed_comments)
+                    if confirmed_comments or verified_comments:
+                        try:
+                            self.pr.create_review(commit=self.last_commit_id,
+                                                  comments=confirmed_comments + verified_comments)
+                        except:
+                            pass
 
         # try to publish one by one the invalid comments as a one-line code comment
         if invalid_comments and get_settings().github.try_fix_invalid_inline_comments:
@@ -504,6 +550,63 @@ class GithubProvider(GitProvider):
                 except:
                     get_logger().error(f"Failed to publish invalid comment as a single line comment: {comment}")
 
+    def _classify_inline_comments(self, comments: list[dict]) \
+            -> tuple[list[dict], list[tuple[dict, Exception]], list[dict]]:
+        """
+        Check the placement of each inline comment against the hunks of the PR patches, as returned by GitHub.
+        Return 3 lists: valid comments, invalid comments (with the reason) and ambiguous comments,
+        which cannot be decided locally and must be verified against the GitHub API.
+        """
+        try:
+            patches = {file.filename: file.patch for file in self.get_files()
+                       if hasattr(file, 'filename') and hasattr(file, 'patch')}
+        except Exception as e:
+            get_logger().warning(f"Failed to get PR patches for validating inline comments, error: {e}")
+            return [], [], list(comments)
+
+        valid_comments, invalid_comments, ambiguous_comments = [], [], []
+        for comment in comments:
+            path = comment.get('path')
+            if path not in patches:
+                if self.incremental.is_incremental:
+                    ambiguous_comments.append(comment)  # the incremental file set is not the full PR file list
+                else:
+                    invalid_comments.append((comment, ValueError(f"{path} is not part of the PR diff")))
+                continue
+            is_valid = self._is_inline_comment_inside_hunks(comment, patches[path])
+            if is_valid is None:
+                ambiguous_comments.append(comment)
+            elif is_valid:
+                valid_comments.append(comment)
+            else:
+                invalid_comments.append((comment, ValueError(f"Comment on {path} is outside the PR hunks")))
+        return valid_comments, invalid_comments, ambiguous_comments
+
+    @staticmethod
+    def _is_inline_comment_inside_hunks(comment: dict, patch: Optional[str]) -> Optional[bool]:
+        """Return whether the comment placement is valid for the given file patch, or None if it cannot be decided."""
+        if not patch:
+            return None  # binary or too large files have no patch
+        if 'position' in comment:
+            # 'position' counts the patch lines below the first hunk header
+            return 1 <= comment['position'] < len(patch.splitlines())
+        if 'line' not in comment:
+            return None
+        side = comment.get('side', 'RIGHT')
+        start_side = comment.get('start_side', side)
+        if side != start_side:
+            return None
+        line = comment['line']
+        start_line = comment.get('start_line', line)
+        if start_line > line:
+            return False
+        for old_range, new_range in get_hunk_line_ranges(patch):
+            hunk_range = new_range if side == 'RIGHT' else old_range
+            if line in hunk_range:
+                # multi-line comments must start and end in the same hunk
+                return start_line in hunk_range
+        return False
+
     def _verify_code_comment(self, comment: dict):
         is_verified = False
         e = None
@@ -526,7 +629,11 @@ class GithubProvider(GitProvider):
         return is_verified, e
 
     def _verify_code_comments(self, comments: list[dict]) -> tuple[list[dict], list[tuple[dict, Exception]]]:
-        """Very each comment against the GitHub API and return 2 lists: 1 of verified and 1 of invalid comments"""
+        """
+        Verify each comment against the GitHub API and return 2 lists: 1 of verified and 1 of invalid comments.
+        Comments are verified one at a time: each probe creates a pending review, and GitHub allows a single pending
+        review per user on a PR.
+        """
         verified_comments = []
         invalid_comments = []
         for comment in comments:
@@ -745,6 +852,9 @@ class GithubProvider(GitProvider):
     def get_issue_comments(self):
         return self.pr.get_issue_comments()
 
+    def get_repo_settings_cache_key(self) -> Optional[str]:
+        return f"{self.base_url_html}/{self.repo}" if self.repo else None
+
     def get_repo_settings(self):
         try:
             # contents = self.repo_obj.get_contents(".pr_agent.toml", ref=self.pr.head.sha).decoded_content
@@ -842,6 +952,7 @@ class GithubProvider(GitProvider):
     def _get_github_client(self):
         self.deployment_type = get_settings().get("GITHUB.DEPLOYMENT_TYPE", "user")
         self.auth = None
+        use_client_pool = get_settings().get("GITHUB.CLIENT_POOL", True)
         if self.deployment_type == 'app':
             try:
                 private_key = get_settings().github.private_key
@@ -850,6 +961,15 @@ class GithubProvider(GitProvider):
                 raise ValueError("GitHub app ID and private key are required when using GitHub app deployment") from e
             if not self.installation_id:
                 raise ValueError("GitHub app installation ID is required when using GitHub app deployment")
+            if use_client_pool:
+                refresh_margin = get_settings().get("GITHUB.INSTALLATION_TOKEN_REFRESH_MARGIN", 300)
+                github_client, self.auth = get_github_client_pool().get_client(
+                    key=('app', self.base_url, str(app_id), self.installation_id),
+                    auth_factory=lambda: PooledAppAuthentication(app_id=app_id, private_key=private_key,
+                                                                 installation_id=self.installation_id,
+                                                                 refresh_margin_seconds=refresh_margin),
+                    base_url=self.base_url)
+                return github_client
             auth = AppAuthentication(app_id=app_id, private_key=private_key,
                                      installation_id=self.installation_id)
             self.auth = auth
@@ -860,12 +980,29 @@ class GithubProvider(GitProvider):
                 raise ValueError(
                     "GitHub token is required when using user deployment. See: "
                     "https://github.com/Codium-ai/pr-agent#method-2-run-from-source") from e
+            if use_client_pool:
+                token_hash = hashlib.sha256(str(token).encode('utf-8')).hexdigest()
+                github_client, self.auth = get_github_client_pool().get_client(
+                    key=('user', self.base_url, token_hash),
+                    auth_factory=lambda: Auth.Token(token),
+                    base_url=self.base_url)
+                return github_client
             self.auth = Auth.Token(token)
         if self.auth:
-            return Github(auth=self.auth, base_url=self.base_url)
+            github_client = Github(auth=self.auth, base_url=self.base_url)
+            if get_settings().get("GITHUB.CONDITIONAL_REQUESTS", True):
+                install_conditional_requests(github_client)
+            return github_client
         else:
             raise ValueError("Could not authenticate to GitHub")
 
+    def get_conditional_request_stats(self) -> dict:
+        """
+        Returns statistics of the process-wide ETag cache, including how many requests were answered with
+        304 (Not Modified) and therefore did not count against the GitHub rate limit.
+        """
+        return get_conditional_request_cache().get_stats()
+
     def _get_repo(self):
         if hasattr(self, 'repo_obj') and \
                 hasattr(self.repo_obj, 'full_name') and \
@@ -951,8 +1088,7 @@ class GithubProvider(GitProvider):
         """
         max_tokens = get_settings().get("CONFIG.MAX_COMMITS_TOKENS", None)
         try:
-            commit_list = self.pr.get_commits()
-            commit_messages = [commit.commit.message for commit in commit_list]
+            commit_messages = [commit.commit.message for commit in self.pr_commits]
             commit_messages_str = "\n".join([f"{i + 1}. {message}" for i, message in enumerate(commit_messages)])
         except Exception:
             commit_messages_str = ""
@@ -14,6 +14,7 @@
 import difflib
 import hashlib
 import re
+from concurrent.futures import ThreadPoolExecutor
 from typing import Optional, Tuple
 from urllib.parse import urlparse
 
@@ -58,6 +59,7 @@ class GitLabProvider(GitProvider):
         self.diff_files = None
         self.git_files = None
         self.temp_comments = []
+        self._changes = None
         self.pr_url = merge_request_url
         self._set_merge_request(merge_request_url)
         self.RE_HUNK_HEADER = re.compile(
@@ -120,20 +122,36 @@ class GitLabProvider(GitProvider):
         self.id_project, self.id_mr = self._parse_merge_request_url(merge_request_url)
         self.mr = self._get_merge_request()
         try:
-            self.last_diff = self.mr.diffs.list(get_all=True)[-1]
+            self.mr_diffs = self.mr.diffs.list(get_all=True)
+            self.last_diff = self.mr_diffs[-1]
         except IndexError as e:
             get_logger().error(f"Could not get diff for merge request {self.id_mr}")
             raise DiffNotFoundError(f"Could not get diff for merge request {self.id_mr}") from e
 
 
+    def _get_changes(self) -> dict:
+        """The MR changes payload (all file diffs). Fetched once per provider, since it can be very large."""
+        if self._changes is None:
+            self._changes = self.mr.changes()
+        return self._changes
+
     def get_pr_file_content(self, file_path: str, branch: str) -> str:
         try:
-            return self.gl.projects.get(self.id_project).files.get(file_path, branch).decode()
+            # a lazy project avoids an extra API call per file, and the raw endpoint avoids base64-encoded payloads
+            return self.gl.projects.get(self.id_project, lazy=True).files.raw(file_path=file_path, ref=branch)
         except GitlabGetError:
             # In case of file creation the method returns GitlabGetError (404 file not found).
             # In this case we return an empty string for the diff.
             return ''
 
+    def _get_pr_files_contents(self, file_refs: list[tuple[str, str]]) -> list:
+        """Fetch the content of the given (file_path, ref) pairs concurrently, preserving their order."""
+        if not file_refs:
+            return []
+        max_workers = max(1, get_settings().get("CONFIG.GIT_PROVIDER_CONCURRENCY", 8))
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(file_refs))) as executor:
+            return list(executor.map(lambda file_ref: self.get_pr_file_content(*file_ref), file_refs))
+
     def get_diff_files(self) -> list[FilePatchInfo]:
         """
         Retrieves the list of files that have been modified, added, deleted, or renamed in a pull request in GitLab,
@@ -148,7 +166,7 @@ class GitLabProvider(GitProvider):
             return self.diff_files
 
         # filter files using [ignore] patterns
-        diffs_original = self.mr.changes()['changes']
+        diffs_original = self._get_changes()['changes']
         diffs = filter_ignored(diffs_original, 'gitlab')
         if diffs != diffs_original:
             try:
@@ -161,22 +179,30 @@ class GitLabProvider(GitProvider):
             except Exception as e:
                 pass
 
-        diff_files = []
         invalid_files_names = []
-        counter_valid = 0
+        valid_diffs = []
         for diff in diffs:
             if not is_valid_file(diff['new_path']):
                 invalid_files_names.append(diff['new_path'])
                 continue
+            valid_diffs.append(diff)
 
-            # allow only a limited number of files to be fully loaded. We can manage the rest with diffs only
-            counter_valid += 1
+        # allow only a limited number of files to be fully loaded. We can manage the rest with diffs only
+        file_refs = []
+        for counter_valid, diff in enumerate(valid_diffs, start=1):
             if counter_valid < MAX_FILES_ALLOWED_FULL or not diff['diff']:
-                original_file_content_str = self.get_pr_file_content(diff['old_path'], self.mr.diff_refs['base_sha'])
-                new_file_content_str = self.get_pr_file_content(diff['new_path'], self.mr.diff_refs['head_sha'])
+                file_refs.append((diff['old_path'], self.mr.diff_refs['base_sha']))
+                file_refs.append((diff['new_path'], self.mr.diff_refs['head_sha']))
+            elif counter_valid == MAX_FILES_ALLOWED_FULL:
+                get_logger().info(f"Too many files in PR, will avoid loading full content for rest of files")
+        contents = iter(self._get_pr_files_contents(file_refs))
+
+        diff_files = []
+        for counter_valid, diff in enumerate(valid_diffs, start=1):
+            if counter_valid < MAX_FILES_ALLOWED_FULL or not diff['diff']:
+                original_file_content_str = next(contents)
+                new_file_content_str = next(contents)
             else:
-                if counter_valid == MAX_FILES_ALLOWED_FULL:
-                    get_logger().info(f"Too many files in PR, will avoid loading full content for rest of files")
                 original_file_content_str = ''
                 new_file_content_str = ''
 
@@ -223,7 +249,7 @@ class GitLabProvider(GitProvider):
 
     def get_files(self) -> list:
         if not self.git_files:
-            self.git_files = [change['new_path'] for change in self.mr.changes()['changes']]
+            self.git_files = [change['new_path'] for change in self._get_changes()['changes']]
         return self.git_files
 
     def publish_description(self, pr_title: str, pr_body: str):
@@ -379,11 +405,11 @@ class GitLabProvider(GitProvider):
                     get_logger().exception(f"Failed to create comment in MR {self.id_mr}")
 
     def get_relevant_diff(self, relevant_file: str, relevant_line_in_file: str) -> Optional[dict]:
-        changes = self.mr.changes()  # Retrieve the changes for the merge request once
+        changes = self._get_changes()
         if not changes:
             get_logger().error('No changes found for the merge request.')
             return None
-        all_diffs = self.mr.diffs.list(get_all=True)
+        all_diffs = self.mr_diffs
         if not all_diffs:
             get_logger().error('No diffs found for the merge request.')
             return None
@@ -530,6 +556,9 @@ class GitLabProvider(GitProvider):
     def get_issue_comments(self):
         return self.mr.notes.list(get_all=True)[::-1]
 
+    def get_repo_settings_cache_key(self) -> Optional[str]:
+        return f"{self.gitlab_url}/{self.id_project}" if self.id_project else None
+
     def get_repo_settings(self):
         try:
             main_branch = self.gl.projects.get(self.id_project).default_branch
@@ -547,7 +576,8 @@ class GitLabProvider(GitProvider):
     def remove_reaction(self, issue_comment_id: int, reaction_id: int) -> bool:
         return True
 
-    def _parse_merge_request_url(self, merge_request_url: str) -> Tuple[str, int]:
+    @staticmethod
+    def _parse_merge_request_url(merge_request_url: str) -> Tuple[str, int]:
         parsed_url = urlparse(merge_request_url)
 
         path_parts = parsed_url.path.strip('/').split('/')
@@ -13,12 +13,14 @@
 
 from collections import Counter
 from pathlib import Path
-from typing import List
+from typing import List, Optional
 
 from git import Repo
 
+from pr_agent.algo.git_patch_processing import decode_if_bytes
 from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
 from pr_agent.config_loader import _find_repository_root, get_settings
+from pr_agent.git_providers.git_blob_reader import GitBlobReader
 from pr_agent.git_providers.git_provider import GitProvider
 from pr_agent.log import get_logger
 
@@ -33,6 +35,40 @@ class PullRequestMimic:
         self.diff_files = diff_files
 
 
+class LazyFilePatchInfo(FilePatchInfo):
+    """
+    A FilePatchInfo whose file contents are kept as raw blobs, and only decoded on first access.
+    Tools typically use the contents of a small part of the files of a large diff.
+    """
+
+    def __init__(self, base_blob: Optional[bytes], head_blob: Optional[bytes], *args, **kwargs):
+        self._base_blob = base_blob
+        self._head_blob = head_blob
+        super().__init__(None, None, *args, **kwargs)
+
+    @property
+    def base_file(self) -> str:
+        if self._base_file is None:
+            self._base_file = decode_if_bytes(self._base_blob or b"")
+            self._base_blob = None
+        return self._base_file
+
+    @base_file.setter
+    def base_file(self, value: str):
+        self._base_file = value
+
+    @property
+    def head_file(self) -> str:
+        if self._head_file is None:
+            self._head_file = decode_if_bytes(self._head_blob or b"")
+            self._head_blob = None
+        return self._head_file
+
+    @head_file.setter
+    def head_file(self, value: str):
+        self._head_file = value
+
+
 class LocalGitProvider(GitProvider):
     """
     This class implements the GitProvider interface for local git repositories.
@@ -81,16 +117,16 @@ class LocalGitProvider(GitProvider):
             create_patch=True,
             R=True
         )
+        # read all the blobs through a single 'git cat-file --batch' process. binary and too large files are read as empty
+        object_ids = [blob.hexsha for diff_item in diffs for blob in (diff_item.a_blob, diff_item.b_blob) if blob is not None]
+        max_blob_size = get_settings().get('local.max_file_size_bytes', 2 * 1024 * 1024)
+        with GitBlobReader(self.repo_path, max_blob_size=max_blob_size) as blob_reader:
+            blobs = blob_reader.read_many(object_ids)
+
         diff_files = []
         for diff_item in diffs:
-            if diff_item.a_blob is not None:
-                original_file_content_str = diff_item.a_blob.data_stream.read().decode('utf-8')
-            else:
-                original_file_content_str = ""  # empty file
-            if diff_item.b_blob is not None:
-                new_file_content_str = diff_item.b_blob.data_stream.read().decode('utf-8')
-            else:
-                new_file_content_str = ""  # empty file
+            original_file_blob = blobs.get(diff_item.a_blob.hexsha) if diff_item.a_blob is not None else None
+            new_file_blob = blobs.get(diff_item.b_blob.hexsha) if diff_item.b_blob is not None else None
             edit_type = EDIT_TYPE.MODIFIED
             if diff_item.new_file:
                 edit_type = EDIT_TYPE.ADDED
@@ -99,13 +135,13 @@ class LocalGitProvider(GitProvider):
             elif diff_item.renamed_file:
                 edit_type = EDIT_TYPE.RENAMED
             diff_files.append(
-                FilePatchInfo(original_file_content_str,
-                              new_file_content_str,
-                              diff_item.diff.decode('utf-8'),
-                              diff_item.b_path,
-                              edit_type=edit_type,
-                              old_filename=None if diff_item.a_path == diff_item.b_path else diff_item.a_path
-                              )
+                LazyFilePatchInfo(original_file_blob,
+                                  new_file_blob,
+                                  diff_item.diff.decode('utf-8', errors='replace'),
+                                  diff_item.b_path,
+                                  edit_type=edit_type,
+                                  old_filename=None if diff_item.a_path == diff_item.b_path else diff_item.a_path
+                                  )
             )
         self.diff_files = diff_files
         return diff_files
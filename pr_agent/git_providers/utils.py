@@ -12,50 +12,175 @@
 # limitations under the License.
 
 import copy
+import hashlib
 import os
-import tempfile
+import threading
+import time
+import tomllib
+from collections import OrderedDict
+from typing import Any, Optional
 
-from dynaconf import Dynaconf
-from starlette_context import context
+from dynaconf.utils.boxing import DynaBox
 
-from pr_agent.config_loader import get_settings
+from pr_agent.algo.request_cache import REPO_SETTINGS, get_request_cache
+from pr_agent.config_loader import SettingsOverlay, get_settings
 from pr_agent.git_providers import get_git_provider_with_context
 from pr_agent.log import get_logger
 
 
+class RepoSettingsCache(object):
+    """
+    Process-wide cache of the repo settings files ('.pr_agent.toml').
+    The raw file of a repo is reused for `ttl_seconds` after it was fetched, so that a burst of events on the same repo
+    fetches it once, and the parsed file is kept by content hash, so that it is parsed once per version of the file.
+    The base settings sections merged with a parsed file are kept too, to be shared between the per-request
+    SettingsOverlays as is: the base settings are assumed not to change once loaded.
+    """
+
+    def __init__(self, ttl_seconds: float, max_entries: int):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._files: OrderedDict[str, tuple[float, bytes]] = OrderedDict()  # repo key -> (fetch time, raw file)
+        self._parsed: OrderedDict[str, dict[str, dict[str, Any]]] = OrderedDict()  # content hash -> parsed file
+        self._merged: OrderedDict[tuple[str, int], dict[str, DynaBox]] = OrderedDict()  # (content hash, id(base)) -> sections
+        self._lock = threading.Lock()
+
+    def get_file(self, repo_key: Optional[str]) -> Optional[bytes]:
+        if not repo_key or self.ttl_seconds <= 0:
+            return None
+        with self._lock:
+            entry = self._files.get(repo_key)
+            if entry is None:
+                return None
+            if time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._files[repo_key]
+                return None
+            return entry[1]
+
+    def put_file(self, repo_key: Optional[str], contents: bytes):
+        if not repo_key or self.ttl_seconds <= 0:
+            return
+        with self._lock:
+            self._files[repo_key] = (time.monotonic(), contents)
+            self._files.move_to_end(repo_key)
+            while len(self._files) > self.max_entries:
+                self._files.popitem(last=False)
+
+    def parse(self, contents: bytes) -> dict[str, dict[str, Any]]:
+        """
+        Returns the sections of a settings file. The result is shared between callers, and must not be modified.
+        Raises on invalid files, which are not cached.
+        """
+        return self._get_or_create(self._parsed, hashlib.sha256(contents).hexdigest(),
+                                   lambda: parse_repo_settings(contents))
+
+    def merged_sections(self, contents: bytes, base) -> dict[str, DynaBox]:
+        """
+        Returns the sections of the `base` settings updated with the keys of a settings file. The result is shared
+        between callers, and must not be modified.
+        """
+        key = (hashlib.sha256(contents).hexdigest(), id(base))
+        return self._get_or_create(self._merged, key, lambda: merge_repo_settings(base, self.parse(contents)))
+
+    def _get_or_create(self, entries: OrderedDict, key, create):
+        with self._lock:
+            value = entries.get(key)
+            if value is not None:
+                entries.move_to_end(key)
+                return value
+        value = create()
+        with self._lock:
+            entries[key] = value
+            while len(entries) > self.max_entries:
+                entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._files.clear()
+            self._parsed.clear()
+            self._merged.clear()
+
+
+_repo_settings_cache: RepoSettingsCache | None = None
+_repo_settings_cache_lock = threading.Lock()
+
+
+def get_repo_settings_cache() -> RepoSettingsCache:
+    global _repo_settings_cache
+    if _repo_settings_cache is None:
+        with _repo_settings_cache_lock:
+            if _repo_settings_cache is None:
+                _repo_settings_cache = RepoSettingsCache(get_settings().get("CONFIG.REPO_SETTINGS_CACHE_TTL", 60),
+                                                         get_settings().get("CONFIG.REPO_SETTINGS_CACHE_SIZE", 1024))
+    return _repo_settings_cache
+
+
+def parse_repo_settings(contents: bytes) -> dict[str, dict[str, Any]]:
+    """
+    Parses a repo settings file in memory. Like the settings files, it only consists of sections (e.g. [pr_reviewer]).
+    """
+    sections = {}
+    for section, section_contents in tomllib.loads(contents.decode("utf-8")).items():
+        if not isinstance(section_contents, dict):
+            raise ValueError(f"'{section}' is not a settings section")
+        sections[section.upper()] = section_contents
+    return sections
+
+
+def merge_repo_settings(settings, sections: dict[str, dict[str, Any]]) -> dict[str, DynaBox]:
+    """
+    Returns copies of the given sections of the settings, with their keys replaced by the ones of a repo settings file.
+    """
+    merged = {}
+    for section, contents in sections.items():
+        # only this section is copied - not the whole settings tree
+        section_dict = copy.deepcopy(dict(settings.get(section, {})))
+        for key, value in contents.items():
+            section_dict[key] = copy.deepcopy(value)
+        merged[section] = DynaBox(section_dict)
+    return merged
+
+
+def _get_repo_settings(git_provider) -> bytes:
+    repo_settings_cache = get_repo_settings_cache()
+    repo_key = git_provider.get_repo_settings_cache_key()
+    repo_settings = repo_settings_cache.get_file(repo_key)
+    if repo_settings is None:
+        repo_settings = git_provider.get_repo_settings()
+        if isinstance(repo_settings, str):
+            repo_settings = repo_settings.encode("utf-8")
+        repo_settings_cache.put_file(repo_key, repo_settings)
+    return repo_settings
+
+
 def apply_repo_settings(pr_url):
     os.environ["AUTO_CAST_FOR_DYNACONF"] = "false"
     git_provider = get_git_provider_with_context(pr_url)
-    if get_settings().config.use_repo_settings_file:
-        repo_settings_file = None
+    if get_settings().get("CONFIG.USE_REPO_SETTINGS_FILE"):
         try:
-            try:
-                repo_settings = context.get("repo_settings", None)
-            except Exception:
-                repo_settings = None
-                pass
+            request_cache = get_request_cache()
+            repo_settings = request_cache.get(REPO_SETTINGS, pr_url)
             if repo_settings is None:  # None is different from "", which is a valid value
-                repo_settings = git_provider.get_repo_settings()
-                try:
-                    context["repo_settings"] = repo_settings
-                except Exception:
-                    pass
+                repo_settings = _get_repo_settings(git_provider)
+                request_cache.put(REPO_SETTINGS, repo_settings, pr_url)
 
             error_local = None
             if repo_settings:
-                repo_settings_file = None
                 category = 'local'
                 try:
-                    fd, repo_settings_file = tempfile.mkstemp(suffix='.toml')
-                    os.write(fd, repo_settings)
-                    new_settings = Dynaconf(settings_files=[repo_settings_file])
-                    for section, contents in new_settings.as_dict().items():
-                        section_dict = copy.deepcopy(get_settings().as_dict().get(section, {}))
-                        for key, value in contents.items():
-                            section_dict[key] = value
-                        get_settings().unset(section)
-                        get_settings().set(section, section_dict, merge=False)
-                    get_logger().info(f"Applying repo settings:\n{new_settings.as_dict()}")
+                    repo_settings_cache = get_repo_settings_cache()
+                    new_settings = repo_settings_cache.parse(repo_settings)
+                    settings = get_settings()
+                    sections = new_settings
+                    if isinstance(settings, SettingsOverlay):
+                        # the sections merged with the same file are shared between requests, and copied only if used
+                        merged_sections = repo_settings_cache.merged_sections(repo_settings, settings.base)
+                        sections = {section: new_settings[section] for section in settings.share_sections(merged_sections)}
+                    for section, section_dict in merge_repo_settings(settings, sections).items():
+                        settings.unset(section)
+                        settings.set(section, section_dict, merge=False)
+                    get_logger().info(f"Applying repo settings:\n{new_settings}")
                 except Exception as e:
                     get_logger().warning(f"Failed to apply repo {category} settings, error: {str(e)}")
                     error_local = {'error': str(e), 'settings': repo_settings, 'category': category}
@@ -64,15 +189,9 @@ def apply_repo_settings(pr_url):
                     handle_configurations_errors([error_local], git_provider)
         except Exception as e:
             get_logger().exception("Failed to apply repo settings", e)
-        finally:
-            if repo_settings_file:
-                try:
-                    os.remove(repo_settings_file)
-                except Exception as e:
-                    get_logger().error(f"Failed to remove temporary settings file {repo_settings_file}", e)
 
     # enable switching models with a short definition
-    if get_settings().config.model.lower() == 'claude-3-5-sonnet':
+    if get_settings().get("CONFIG.MODEL", "").lower() == 'claude-3-5-sonnet':
         set_claude_model()
 
 
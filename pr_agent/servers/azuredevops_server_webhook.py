@@ -16,29 +16,28 @@
 # ADO webhook documentation: https://learn.microsoft.com/en-us/azure/devops/service-hooks/services/webhooks?view=azure-devops
 
 import json
-import os
 import re
 import secrets
 from urllib.parse import unquote
 
-import uvicorn
-from fastapi import APIRouter, Depends, FastAPI, HTTPException, Request
+from fastapi import APIRouter, Depends, HTTPException, Request
 from fastapi.encoders import jsonable_encoder
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from starlette import status
-from starlette.background import BackgroundTasks
-from starlette.middleware import Middleware
 from starlette.requests import Request
 from starlette.responses import JSONResponse
-from starlette_context.middleware import RawContextMiddleware
+from starlette_context import context
 
 from pr_agent.agent.pr_agent import PRAgent, command2class
 from pr_agent.algo.utils import update_settings_from_args
-from pr_agent.config_loader import get_settings
+from pr_agent.config_loader import (SettingsOverlay, get_settings,
+                                    global_settings)
 from pr_agent.git_providers import get_git_provider_with_context
 from pr_agent.git_providers.azuredevops_provider import AzureDevopsProvider
 from pr_agent.git_providers.utils import apply_repo_settings
 from pr_agent.log import LoggingFormat, get_logger, setup_logger
+from pr_agent.servers.webhook_runtime import (create_app, get_task_registry,
+                                              run_app)
 
 setup_logger(fmt=LoggingFormat.JSON, level=get_settings().get("CONFIG.LOG_LEVEL", "DEBUG"))
 security = HTTPBasic(auto_error=False)
@@ -182,12 +181,13 @@ async def handle_request_azure(data, log_context):
     )
 
 @router.post("/", dependencies=[Depends(authorize)])
-async def handle_webhook(background_tasks: BackgroundTasks, request: Request):
+async def handle_webhook(request: Request):
     log_context = {"server_type": "azure_devops_server"}
     data = await request.json()
+    context["settings"] = SettingsOverlay(global_settings)
     # get_logger().info(json.dumps(data))
 
-    background_tasks.add_task(handle_request_azure, data, log_context)
+    get_task_registry().create_task(handle_request_azure(data, log_context))
 
     return JSONResponse(
         status_code=status.HTTP_202_ACCEPTED, content=jsonable_encoder({"message": "webhook triggered successfully"})
@@ -198,9 +198,7 @@ async def root():
     return {"status": "ok"}
 
 def start():
-    app = FastAPI(middleware=[Middleware(RawContextMiddleware)])
-    app.include_router(router)
-    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", "3000")))
+    run_app(create_app(router))
 
 if __name__ == "__main__":
     start()
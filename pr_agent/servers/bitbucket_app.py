@@ -12,7 +12,6 @@
 # limitations under the License.
 
 import base64
-import copy
 import hashlib
 import json
 import os
@@ -21,22 +20,21 @@ import time
 
 import jwt
 import requests
-import uvicorn
-from fastapi import APIRouter, FastAPI, Request, Response
-from starlette.background import BackgroundTasks
-from starlette.middleware import Middleware
+from fastapi import APIRouter, Request, Response
 from starlette.responses import JSONResponse
 from starlette_context import context
-from starlette_context.middleware import RawContextMiddleware
 
 from pr_agent.agent.pr_agent import PRAgent
 from pr_agent.algo.utils import update_settings_from_args
-from pr_agent.config_loader import get_settings, global_settings
+from pr_agent.config_loader import (SettingsOverlay, get_settings,
+                                    global_settings)
 from pr_agent.git_providers.utils import apply_repo_settings
 from pr_agent.identity_providers import get_identity_provider
 from pr_agent.identity_providers.identity_provider import Eligibility
 from pr_agent.log import LoggingFormat, get_logger, setup_logger
 from pr_agent.secret_providers import get_secret_provider
+from pr_agent.servers.webhook_runtime import (create_app, get_task_registry,
+                                              run_app)
 
 setup_logger(fmt=LoggingFormat.JSON, level=get_settings().get("CONFIG.LOG_LEVEL", "DEBUG"))
 router = APIRouter()
@@ -182,7 +180,7 @@ def should_process_pr_logic(data) -> bool:
 
 
 @router.post("/webhook")
-async def handle_github_webhooks(background_tasks: BackgroundTasks, request: Request):
+async def handle_github_webhooks(request: Request):
     app_name = get_settings().get("CONFIG.APP_NAME", "Unknown")
     log_context = {"server_type": "bitbucket_app", "app_name": app_name}
     get_logger().debug(request.headers)
@@ -219,7 +217,7 @@ async def handle_github_webhooks(background_tasks: BackgroundTasks, request: Req
             jwt.decode(input_jwt, shared_secret, audience=client_key, algorithms=["HS256"])
             bearer_token = await get_bearer_token(shared_secret, client_key)
             context['bitbucket_bearer_token'] = bearer_token
-            context["settings"] = copy.deepcopy(global_settings)
+            context["settings"] = SettingsOverlay(global_settings)
             event = data["event"]
             agent = PRAgent()
             if event == "pullrequest:created":
@@ -244,7 +242,7 @@ async def handle_github_webhooks(background_tasks: BackgroundTasks, request: Req
                         await agent.handle_request(pr_url, comment_body)
         except Exception as e:
             get_logger().error(f"Failed to handle webhook: {e}")
-    background_tasks.add_task(inner)
+    get_task_registry().create_task(inner())
     return "OK"
 
 @router.get("/webhook")
@@ -282,11 +280,7 @@ def start():
     get_settings().set("CONFIG.PUBLISH_OUTPUT_PROGRESS", False)
     get_settings().set("CONFIG.GIT_PROVIDER", "bitbucket")
     get_settings().set("PR_DESCRIPTION.PUBLISH_DESCRIPTION_AS_COMMENT", True)
-    middleware = [Middleware(RawContextMiddleware)]
-    app = FastAPI(middleware=middleware)
-    app.include_router(router)
-
-    uvicorn.run(app, host="0.0.0.0", port=int(os.getenv("PORT", "3000")))
+    run_app(create_app(router))
 
 
 if __name__ == '__main__':
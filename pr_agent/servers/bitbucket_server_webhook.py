@@ -13,19 +13,14 @@
 
 import ast
 import json
-import os
 from typing import List
 
-import uvicorn
-from fastapi import APIRouter, FastAPI
+from fastapi import APIRouter
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import RedirectResponse
 from starlette import status
-from starlette.background import BackgroundTasks
-from starlette.middleware import Middleware
 from starlette.requests import Request
 from starlette.responses import JSONResponse
-from starlette_context.middleware import RawContextMiddleware
 
 from pr_agent.agent.pr_agent import PRAgent
 from pr_agent.algo.utils import update_settings_from_args
@@ -33,14 +28,14 @@ from pr_agent.config_loader import get_settings
 from pr_agent.git_providers.utils import apply_repo_settings
 from pr_agent.log import LoggingFormat, get_logger, setup_logger
 from pr_agent.servers.utils import verify_signature
+from pr_agent.servers.webhook_runtime import (create_app, get_task_registry,
+                                              run_app)
 
 setup_logger(fmt=LoggingFormat.JSON, level=get_settings().get("CONFIG.LOG_LEVEL", "DEBUG"))
 router = APIRouter()
 
 
-def handle_request(
-    background_tasks: BackgroundTasks, url: str, body: str, log_context: dict
-):
+def handle_request(url: str, body: str, log_context: dict):
     log_context["action"] = body
     log_context["api_url"] = url
 
@@ -51,14 +46,14 @@ def handle_request(
         except Exception as e:
             get_logger().error(f"Failed to handle webhook: {e}")
 
-    background_tasks.add_task(inner)
+    get_task_registry().create_task(inner())
 
 @router.post("/")
 async def redirect_to_webhook():
     return RedirectResponse(url="/webhook")
 
 @router.post("/webhook")
-async def handle_webhook(background_tasks: BackgroundTasks, request: Request):
+async def handle_webhook(request: Request):
     log_context = {"server_type": "bitbucket_server"}
     data = await request.json()
     get_logger().info(json.dumps(data))
@@ -105,7 +100,7 @@ async def handle_webhook(background_tasks: BackgroundTasks, request: Request):
         except Exception as e:
             get_logger().error(f"Failed to handle webhook: {e}")
 
-    background_tasks.add_task(inner)
+    get_task_registry().create_task(inner())
 
     return JSONResponse(
         status_code=status.HTTP_200_OK, content=jsonable_encoder({"message": "success"})
@@ -168,9 +163,7 @@ async def root():
 
 
 def start():
-    app = FastAPI(middleware=[Middleware(RawContextMiddleware)])
-    app.include_router(router)
-    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", "3000")))
+    run_app(create_app(router))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,294 @@
+# Copyright (c) 2023 PR-Agent Authors
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable
+
+from pr_agent.log import get_logger
+
+# events older than this are forgotten by the backends
+_EVENT_TTL_SECONDS = 24 * 60 * 60
+_CLEANUP_INTERVAL_SECONDS = 60 * 60
+
+
+class CoalescerBackend(ABC):
+    """
+    Stores the latest event of each key (e.g. a PR), shared by all the processes that coalesce events.
+    Each event with a new value (e.g. a new head sha) of a key gets a new, increasing generation. At most one process
+    claims the run of a given generation.
+    """
+
+    @abstractmethod
+    def register(self, key: str, value: str) -> tuple[int, bool]:
+        """
+        Records `value` as the latest value of `key`. Returns its generation, and whether it is a new generation
+        (False for a duplicate of the latest event).
+        """
+        pass
+
+    @abstractmethod
+    def withdraw(self, key: str, generation: int):
+        """
+        Withdraws the new generation of an event that will not be run (e.g. rejected), unless a newer event of the key
+        was registered or the generation was claimed: the previous generation is the latest again, so that the events
+        it superseded can still run.
+        """
+        pass
+
+    @abstractmethod
+    def latest_generation(self, key: str) -> int:
+        pass
+
+    @abstractmethod
+    def claimed_generation(self, key: str) -> int:
+        """Returns the latest claimed generation of `key`, i.e. the latest event that started running."""
+        pass
+
+    @abstractmethod
+    def claim(self, key: str, generation: int) -> bool:
+        """
+        Claims the run of a generation: returns False if it is not the latest generation of the key anymore, or if it
+        was already claimed (e.g. by a duplicate delivery of the same event).
+        """
+        pass
+
+    @abstractmethod
+    def release(self, key: str, generation: int):
+        """Releases the claim of an interrupted run (e.g. by a shutdown), so that its event can be handled again."""
+        pass
+
+
+class MemoryCoalescerBackend(CoalescerBackend):
+    """Coalesces the events of a single process."""
+
+    def __init__(self):
+        self._events: dict[str, list] = {}  # key -> [generation, value, claimed generation, updated at]
+        self._lock = threading.Lock()
+        self._last_cleanup = time.monotonic()
+
+    def register(self, key: str, value: str) -> tuple[int, bool]:
+        with self._lock:
+            now = time.monotonic()
+            if now - self._last_cleanup > _CLEANUP_INTERVAL_SECONDS:
+                self._events = {k: event for k, event in self._events.items() if now - event[3] < _EVENT_TTL_SECONDS}
+                self._last_cleanup = now
+            event = self._events.setdefault(key, [0, None, 0, now])
+            new_generation = event[1] != value
+            if new_generation:
+                event[0] += 1
+                event[1] = value
+            event[3] = now
+            return event[0], new_generation
+
+    def withdraw(self, key: str, generation: int):
+        with self._lock:
+            event = self._events.get(key)
+            if event and event[0] == generation and event[2] < generation:
+                # the value of the previous generation is not kept: a duplicate of its event gets a new generation
+                event[0] -= 1
+                event[1] = None
+
+    def latest_generation(self, key: str) -> int:
+        with self._lock:
+            event = self._events.get(key)
+            return event[0] if event else 0
+
+    def claimed_generation(self, key: str) -> int:
+        with self._lock:
+            event = self._events.get(key)
+            return event[2] if event else 0
+
+    def claim(self, key: str, generation: int) -> bool:
+        with self._lock:
+            event = self._events.get(key)
+            if not event or event[0] != generation or event[2] >= generation:
+                return False
+            event[2] = generation
+            return True
+
+    def release(self, key: str, generation: int):
+        with self._lock:
+            event = self._events.get(key)
+            if event and event[2] == generation:
+                event[2] = generation - 1
+
+
+class SQLiteCoalescerBackend(CoalescerBackend):
+    """
+    Coalesces the events of all the processes of a host (e.g. the gunicorn workers) through a local SQLite file.
+    Another shared store (e.g. redis) can be plugged in by implementing CoalescerBackend.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._last_cleanup = 0.0
+        with self._connection() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS events (key TEXT PRIMARY KEY, generation INTEGER NOT NULL, "
+                               "value TEXT, claimed INTEGER NOT NULL DEFAULT 0, updated_at REAL NOT NULL)")
+
+    def _connection(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # autocommit mode: transactions are explicit, 'BEGIN IMMEDIATE' takes the write lock of the database upfront
+            connection = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self, func: Callable[[sqlite3.Connection], Any]) -> Any:
+        connection = self._connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            result = func(connection)
+            connection.execute("COMMIT")
+            return result
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def register(self, key: str, value: str) -> tuple[int, bool]:
+        now = time.time()
+
+        def register(connection: sqlite3.Connection) -> tuple[int, bool]:
+            if now - self._last_cleanup > _CLEANUP_INTERVAL_SECONDS:
+                connection.execute("DELETE FROM events WHERE updated_at < ?", (now - _EVENT_TTL_SECONDS,))
+                self._last_cleanup = now
+            row = connection.execute("SELECT generation, value FROM events WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                connection.execute("INSERT INTO events (key, generation, value, updated_at) VALUES (?, 1, ?, ?)",
+                                   (key, value, now))
+                return 1, True
+            new_generation = row[1] != value
+            generation = row[0] + 1 if new_generation else row[0]
+            connection.execute("UPDATE events SET generation = ?, value = ?, updated_at = ? WHERE key = ?",
+                               (generation, value, now, key))
+            return generation, new_generation
+
+        return self._transaction(register)
+
+    def withdraw(self, key: str, generation: int):
+        # the value of the previous generation is not kept: a duplicate of its event gets a new generation
+        self._connection().execute(
+            "UPDATE events SET generation = generation - 1, value = NULL WHERE key = ? AND generation = ? "
+            "AND claimed < ?", (key, generation, generation))
+
+    def latest_generation(self, key: str) -> int:
+        row = self._connection().execute("SELECT generation FROM events WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def claimed_generation(self, key: str) -> int:
+        row = self._connection().execute("SELECT claimed FROM events WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    def claim(self, key: str, generation: int) -> bool:
+        cursor = self._connection().execute(
+            "UPDATE events SET claimed = ? WHERE key = ? AND generation = ? AND claimed < ?",
+            (generation, key, generation, generation))
+        return cursor.rowcount == 1
+
+    def release(self, key: str, generation: int):
+        self._connection().execute("UPDATE events SET claimed = ? WHERE key = ? AND claimed = ?",
+                                   (generation - 1, key, generation))
+
+
+def create_coalescer_backend(backend: str, path: str = "") -> CoalescerBackend:
+    if backend == "memory":
+        return MemoryCoalescerBackend()
+    if backend == "sqlite":
+        return SQLiteCoalescerBackend(path or os.path.join(tempfile.gettempdir(), "pr_agent_events.sqlite3"))
+    raise ValueError(f"Unknown event coalescer backend: {backend}")
+
+
+@dataclass
+class CoalescedEvent:
+    key: str
+    value: str
+    generation: int
+    # False for a duplicate of the latest event (e.g. a redelivery), which supersedes nothing
+    new_generation: bool = True
+    registered_at: float = field(default_factory=time.monotonic)
+
+
+class EventCoalescer:
+    """
+    Coalesces bursts of events of the same key, e.g. the pushes to a PR, into a single run for the latest event:
+    - an event waits for `debounce_seconds`, and is dropped if a newer event of its key arrived in the meantime.
+    - the run of an event is cancelled when a newer event of its key starts running: right away for the events of this
+      process, within `poll_interval_seconds` for the events run by other processes sharing the backend.
+    Ten quick pushes to a PR thus produce a single run, for the last pushed sha.
+    Events should be registered when they are received, so that the ones waiting to be handled (e.g. in a task queue)
+    are superseded right away, and withdrawn if they are dropped without running (e.g. rejected or shed), so that they
+    do not supersede the events waiting to be handled.
+    """
+
+    def __init__(self, backend: CoalescerBackend, debounce_seconds: float, poll_interval_seconds: float = 5):
+        self.backend = backend
+        self.debounce_seconds = debounce_seconds
+        self.poll_interval_seconds = poll_interval_seconds
+        self._in_flight: dict[str, tuple[int, asyncio.Task]] = {}  # key -> (generation, run) of this process
+
+    async def register(self, key: str, value: str) -> CoalescedEvent:
+        generation, new_generation = await asyncio.to_thread(self.backend.register, key, value)
+        return CoalescedEvent(key, value, generation, new_generation)
+
+    async def withdraw(self, event: CoalescedEvent):
+        """Withdraws a registered event that will not be run, e.g. rejected by an overloaded scheduler."""
+        if event.new_generation:
+            await asyncio.to_thread(self.backend.withdraw, event.key, event.generation)
+
+    async def run_latest(self, event: CoalescedEvent, func: Callable[[], Awaitable[Any]]) -> bool:
+        """
+        Runs `func` for a registered event, unless it is superseded by a newer event of the same key.
+        Returns whether `func` ran to completion.
+        """
+        key, value, generation = event.key, event.value, event.generation
+        await asyncio.sleep(max(0.0, event.registered_at + self.debounce_seconds - time.monotonic()))
+        if not await asyncio.to_thread(self.backend.claim, key, generation):
+            get_logger().info(f"Skipping a superseded or already handled event of {key}, for {value}")
+            return False
+        in_flight = self._in_flight.get(key)
+        if in_flight and in_flight[0] < generation:
+            get_logger().info(f"Cancelling the run of a superseded event of {key}, for {value}")
+            in_flight[1].cancel()
+
+        run = asyncio.ensure_future(func())
+        self._in_flight[key] = (generation, run)
+        try:
+            while True:
+                done, _ = await asyncio.wait({run}, timeout=self.poll_interval_seconds)
+                if done:
+                    break
+                if await asyncio.to_thread(self.backend.claimed_generation, key) > generation:
+                    get_logger().info(f"Cancelling the run of a superseded event of {key}, for {value}")
+                    run.cancel()
+            await run
+            return True
+        except asyncio.CancelledError:
+            if await asyncio.to_thread(self.backend.claimed_generation, key) > generation:
+                return False  # the run was superseded
+            # this task itself was cancelled, e.g. by a shutdown: the event can be handled again, e.g. when resumed
+            await asyncio.to_thread(self.backend.release, key, generation)
+            raise
+        finally:
+            if self._in_flight.get(key, (None, None))[1] is run:
+                del self._in_flight[key]
+            if not run.done():
+                run.cancel()
@@ -11,20 +11,18 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import copy
 from enum import Enum
 from json import JSONDecodeError
 
-import uvicorn
-from fastapi import APIRouter, FastAPI, HTTPException
+from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
-from starlette.middleware import Middleware
 from starlette_context import context
-from starlette_context.middleware import RawContextMiddleware
 
 from pr_agent.agent.pr_agent import PRAgent
-from pr_agent.config_loader import get_settings, global_settings
+from pr_agent.config_loader import (SettingsOverlay, get_settings,
+                                    global_settings)
 from pr_agent.log import get_logger, setup_logger
+from pr_agent.servers.webhook_runtime import create_app, run_app
 
 setup_logger()
 router = APIRouter()
@@ -48,7 +46,7 @@ class Item(BaseModel):
 @router.post("/api/v1/gerrit/{action}")
 async def handle_gerrit_request(action: Action, item: Item):
     get_logger().debug("Received a Gerrit request")
-    context["settings"] = copy.deepcopy(global_settings)
+    context["settings"] = SettingsOverlay(global_settings)
 
     if action == Action.ask:
         if not item.msg:
@@ -79,11 +77,7 @@ async def root():
 def start():
     # to prevent adding help messages with the output
     get_settings().set("CONFIG.CLI_MODE", True)
-    middleware = [Middleware(RawContextMiddleware)]
-    app = FastAPI(middleware=middleware)
-    app.include_router(router)
-
-    uvicorn.run(app, host="0.0.0.0", port=3000)
+    run_app(create_app(router), port=3000)
 
 
 if __name__ == '__main__':
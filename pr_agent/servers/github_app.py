@@ -11,24 +11,20 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import asyncio.locks
-import copy
 import os
 import re
 import uuid
+from functools import partial
 from typing import Any, Dict, Tuple
 
-import uvicorn
-from fastapi import APIRouter, FastAPI, HTTPException, Request, Response
-from starlette.background import BackgroundTasks
-from starlette.middleware import Middleware
+from fastapi import APIRouter, HTTPException, Request, Response
 from starlette_context import context
-from starlette_context.middleware import RawContextMiddleware
 
 from pr_agent.agent.pr_agent import PRAgent
-from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
+from pr_agent.algo.request_cache import get_request_cache
 from pr_agent.algo.utils import update_settings_from_args
-from pr_agent.config_loader import get_settings, global_settings
+from pr_agent.config_loader import (SettingsOverlay, get_settings,
+                                    global_settings)
 from pr_agent.git_providers import (get_git_provider,
                                     get_git_provider_with_context)
 from pr_agent.git_providers.git_provider import IncrementalPR
@@ -36,8 +32,14 @@ from pr_agent.git_providers.utils import apply_repo_settings
 from pr_agent.identity_providers import get_identity_provider
 from pr_agent.identity_providers.identity_provider import Eligibility
 from pr_agent.log import LoggingFormat, get_logger, setup_logger
-from pr_agent.servers.utils import DefaultDictWithTimeout, verify_signature
-from pr_agent.tools.pr_rag_engine import PRRAGIndexManager, PRRAGEngine
+from pr_agent.servers.event_coalescer import (EventCoalescer,
+                                             create_coalescer_backend)
+from pr_agent.servers.task_scheduler import (SchedulerOverloaded,
+                                             TaskPriority,
+                                             WebhookTaskScheduler)
+from pr_agent.servers.utils import verify_signature
+from pr_agent.servers.webhook_runtime import (create_app, get_task_registry,
+                                              run_app)
 
 setup_logger(fmt=LoggingFormat.JSON, level=get_settings().get("CONFIG.LOG_LEVEL", "DEBUG"))
 base_path = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
@@ -49,27 +51,52 @@ else:
     build_number = "unknown"
 router = APIRouter()
 use_rag_engine = get_settings().get("KAITORAGENGINE.USE_RAG_ENGINE", False)
-ragIndexManager = PRRAGIndexManager(
-    base_url=get_settings().get("KAITORAGENGINE.RAG_ENGINE_URL", ""),
-    enabled_base_branches=get_settings().get("KAITORAGENGINE.ENABLED_BASE_BRANCHES", []),
-    ignore_directories=get_settings().get("KAITORAGENGINE.IGNORE_DIRECTORIES", []),
+_rag_index_manager = None
+
+
+def get_rag_index_manager():
+    # created on first use, so that the RAG engine (and tiktoken) is not imported when it is disabled
+    global _rag_index_manager
+    if _rag_index_manager is None:
+        from pr_agent.tools.pr_rag_index_manager import PRRAGIndexManager
+        _rag_index_manager = PRRAGIndexManager(
+            base_url=get_settings().get("KAITORAGENGINE.RAG_ENGINE_URL", ""),
+            enabled_base_branches=get_settings().get("KAITORAGENGINE.ENABLED_BASE_BRANCHES", []),
+            ignore_directories=get_settings().get("KAITORAGENGINE.IGNORE_DIRECTORIES", []),
+        )
+    return _rag_index_manager
+
+
+def create_ai_handler(api_url: str):
+    # litellm is only imported when the first tool runs
+    from pr_agent.algo.ai_handlers.litellm_ai_handler import LiteLLMAIHandler
+    pr_rag_engine = None
+    if use_rag_engine:
+        from pr_agent.tools.pr_rag_engine import PRRAGEngine
+        pr_rag_engine = PRRAGEngine(index_manager=get_rag_index_manager(), pr_url=api_url)
+    return LiteLLMAIHandler(pr_rag_engine=pr_rag_engine)
+
+task_registry = get_task_registry()
+# the tools run by webhook events are scheduled with bounded concurrency, commands of users first
+task_scheduler = WebhookTaskScheduler(
+    max_concurrent_tasks=get_settings().get("GITHUB_APP.MAX_CONCURRENT_TASKS", 16),
+    max_tasks_per_repo=get_settings().get("GITHUB_APP.MAX_CONCURRENT_TASKS_PER_REPO", 4),
+    max_tasks_per_installation=get_settings().get("GITHUB_APP.MAX_CONCURRENT_TASKS_PER_INSTALLATION", 8),
+    max_queued_tasks=get_settings().get("GITHUB_APP.MAX_QUEUED_TASKS", 500),
+    task_registry=task_registry,
 )
 
 @router.post("/api/v1/github_webhooks")
-async def handle_github_webhooks(background_tasks: BackgroundTasks, request: Request, response: Response):
+async def handle_github_webhooks(request: Request, response: Response):
     """
     Receives and processes incoming GitHub webhook requests.
-    Verifies the request signature, parses the request body, and passes it to the handle_request function for further
-    processing.
+    Verifies the request signature, parses the request body, and schedules the handle_request function for further
+    processing. Responds with 503 if too many events are already waiting to be processed.
     """
     get_logger().debug("Received a GitHub webhook")
 
     body = await get_body(request)
-
-    installation_id = body.get("installation", {}).get("id")
-    context["installation_id"] = installation_id
-    context["settings"] = copy.deepcopy(global_settings)
-    context["git_provider"] = {}
+    _set_request_context(body)
 
     # Get the repository URL from the payload
     repo_html_url = body.get("repository", {}).get("html_url")
@@ -86,10 +113,67 @@ async def handle_github_webhooks(background_tasks: BackgroundTasks, request: Req
             )
         )
 
-    background_tasks.add_task(handle_request, body, event=request.headers.get("X-GitHub-Event", None))
+    event = request.headers.get("X-GitHub-Event", None)
+    push_event = None
+    if event == "pull_request" and body.get("action") == "synchronize" and body.get("pull_request", {}).get("url"):
+        # registered on receipt, so that the older pushes to the PR waiting to be handled are known to be superseded.
+        # a push that is dropped without running (e.g. rejected, shed, or ignored by its repo settings) is withdrawn
+        push_event = await _push_trigger_coalescer.register(body["pull_request"]["url"], body.get("after"))
+        context["push_event"] = push_event
+    try:
+        await task_registry.submit("github_app.event", {"body": body, "event": event})
+    except SchedulerOverloaded as e:
+        get_logger().warning(f"Rejected webhook of {repo_html_url}: {e}")
+        if push_event:
+            await _push_trigger_coalescer.withdraw(push_event)
+        raise HTTPException(status_code=503, detail=str(e)) from e
     return {}
 
 
+def _set_request_context(body: Dict[str, Any]):
+    context["installation_id"] = body.get("installation", {}).get("id")
+    context["settings"] = SettingsOverlay(global_settings)
+
+
+async def handle_github_event(body: Dict[str, Any], event: str):
+    """The background task of a webhook event, resumed after a restart if it was interrupted by the shutdown."""
+    if context.get("settings") is None:  # a resumed event, which was not received by this process
+        _set_request_context(body)
+    try:
+        await handle_request(body, event)
+    finally:
+        push_event = context.get("push_event")
+        if push_event:
+            # a no-op if the push ran or was superseded. otherwise it was dropped, e.g. ignored by its repo settings
+            await _push_trigger_coalescer.withdraw(push_event)
+    entries, size_bytes = get_request_cache().request_size()
+    get_logger().debug(f"Request cache of the {event} event: {entries} values, {size_bytes / 1024:.0f} KB")
+
+
+def _schedule_github_event(run, payload: Dict[str, Any]):
+    body = payload["body"]
+    # comments are commands of users (e.g. '/review'), which are scheduled before automatic tools
+    priority = TaskPriority.COMMAND if body.get("action") == "created" and "comment" in body else TaskPriority.AUTO
+    push_event = context.get("push_event")
+
+    def on_shed():
+        run.discard()
+        if push_event:
+            task_registry.create_task(_push_trigger_coalescer.withdraw(push_event))
+
+    task_scheduler.submit(run, priority=priority, repo=body.get("repository", {}).get("full_name"),
+                          installation=body.get("installation", {}).get("id"), on_shed=on_shed)
+
+
+task_registry.register("github_app.event", handle_github_event, schedule=_schedule_github_event)
+
+
+@router.get("/metrics")
+async def metrics():
+    """Metrics of the background tasks (queue depth, running tasks and wait times), and of the request cache."""
+    return {**task_scheduler.metrics(), "runtime": task_registry.metrics(), "request_cache": get_request_cache().stats()}
+
+
 @router.post("/api/v1/marketplace_webhooks")
 async def handle_marketplace_webhooks(request: Request, response: Response):
     body = await get_body(request)
@@ -110,8 +194,13 @@ async def get_body(request):
     return body
 
 
-_duplicate_push_triggers = DefaultDictWithTimeout(ttl=get_settings().github_app.push_trigger_pending_tasks_ttl)
-_pending_task_duplicate_push_conditions = DefaultDictWithTimeout(asyncio.locks.Condition, ttl=get_settings().github_app.push_trigger_pending_tasks_ttl)
+# pushes to a PR are coalesced across the workers of the server: a burst of pushes is handled once, for its last commit
+_push_trigger_coalescer = EventCoalescer(
+    create_coalescer_backend(get_settings().get("GITHUB_APP.PUSH_TRIGGER_COALESCER_BACKEND", "sqlite"),
+                             get_settings().get("GITHUB_APP.PUSH_TRIGGER_COALESCER_PATH", "")),
+    debounce_seconds=get_settings().get("GITHUB_APP.PUSH_TRIGGER_DEBOUNCE_SECONDS", 10),
+    poll_interval_seconds=get_settings().get("GITHUB_APP.PUSH_TRIGGER_CANCEL_POLL_SECONDS", 5),
+)
 
 async def handle_comments_on_pr(body: Dict[str, Any],
                                 event: str,
@@ -155,9 +244,10 @@ async def handle_comments_on_pr(body: Dict[str, Any],
             if use_rag_engine:
                 try:
                     # we have to validate a pr index exists on comments in the event of rag restarts
-                    index_name = ragIndexManager._get_pr_head_index_name(provider)
-                    if not ragIndexManager._does_index_exist(index_name):
-                        await ragIndexManager.create_new_pr_index(api_url)
+                    rag_index_manager = get_rag_index_manager()
+                    index_name = rag_index_manager._get_pr_head_index_name(provider)
+                    if not rag_index_manager._does_index_exist(index_name):
+                        await rag_index_manager.create_new_pr_index(api_url)
                 except Exception as e:
                     get_logger().error(f"Failed to create new PR index for {api_url=}: {e}")
             await agent.handle_request(api_url, comment_body,
@@ -184,7 +274,7 @@ async def handle_new_pr_opened(body: Dict[str, Any],
         if get_identity_provider().verify_eligibility("github", sender_id, api_url) is not Eligibility.NOT_ELIGIBLE:
             if use_rag_engine:
                 try:
-                    await ragIndexManager.create_new_pr_index(api_url)
+                    await get_rag_index_manager().create_new_pr_index(api_url)
                 except Exception as e:
                     get_logger().error(f"Failed to create new PR index for {api_url=}: {e}")
             await _perform_auto_commands_github("pr_commands", agent, body, api_url, log_context)
@@ -202,62 +292,37 @@ async def handle_push_trigger_for_new_commits(body: Dict[str, Any],
     if not (pull_request and api_url):
         return {}
 
-    apply_repo_settings(api_url) # we need to apply the repo settings to get the correct settings for the PR. This is quite expensive - a call to the git provider is made for each PR event.
+    apply_repo_settings(api_url) # we need to apply the repo settings to get the correct settings for the PR. The repo settings file is cached for a short while (config.repo_settings_cache_ttl), so bursts of events on a PR fetch it once.
     if not get_settings().github_app.handle_push_trigger:
         return {}
 
     # TODO: do we still want to get the list of commits to filter bot/merge commits?
-    before_sha = body.get("before")
-    after_sha = body.get("after")
-    merge_commit_sha = pull_request.get("merge_commit_sha")
-    if before_sha == after_sha:
-        return {}
-    if get_settings().github_app.push_trigger_ignore_merge_commits and after_sha == merge_commit_sha:
+    if _is_ignored_push(body):
         return {}
+    after_sha = body.get("after")
 
-    # Prevent triggering multiple times for subsequent push triggers when one is enough:
-    # The first push will trigger the processing, and if there's a second push in the meanwhile it will wait.
-    # Any more events will be discarded, because they will all trigger the exact same processing on the PR.
-    # We let the second event wait instead of discarding it because while the first event was being processed,
-    # more commits may have been pushed that led to the subsequent events,
-    # so we keep just one waiting as a delegate to trigger the processing for the new commits when done waiting.
-    current_active_tasks = _duplicate_push_triggers.setdefault(api_url, 0)
-    max_active_tasks = 2 if get_settings().github_app.push_trigger_pending_tasks_backlog else 1
-    if current_active_tasks < max_active_tasks:
-        # first task can enter, and second tasks too if backlog is enabled
-        get_logger().info(
-            f"Continue processing push trigger for {api_url=} because there are {current_active_tasks} active tasks"
-        )
-        _duplicate_push_triggers[api_url] += 1
-    else:
-        get_logger().info(
-            f"Skipping push trigger for {api_url=} because another event already triggered the same processing"
-        )
-        return {}
-    async with _pending_task_duplicate_push_conditions[api_url]:
-        if current_active_tasks == 1:
-            # second task waits
-            get_logger().info(
-                f"Waiting to process push trigger for {api_url=} because the first task is still in progress"
-            )
-            await _pending_task_duplicate_push_conditions[api_url].wait()
-            get_logger().info(f"Finished waiting to process push trigger for {api_url=} - continue with flow")
-
-    try:
+    # Pushes in quick succession (e.g. fixups) are coalesced: the event waits for a debounce window and is dropped if
+    # a newer commit was pushed in the meantime, and the handling of an older commit is cancelled by a newer push.
+    async def perform_push_commands():
         if get_identity_provider().verify_eligibility("github", sender_id, api_url) is not Eligibility.NOT_ELIGIBLE:
             get_logger().info(f"Performing incremental review for {api_url=} because of {event=} and {action=}")
             if use_rag_engine:
                 try:
-                    await ragIndexManager.update_pr_index(api_url)
+                    await get_rag_index_manager().update_pr_index(api_url)
                 except Exception as e:
                     get_logger().error(f"Failed to update PR index for {api_url=}: {e}")
             await _perform_auto_commands_github("push_commands", agent, body, api_url, log_context)
 
-    finally:
-        # release the waiting task block
-        async with _pending_task_duplicate_push_conditions[api_url]:
-            _pending_task_duplicate_push_conditions[api_url].notify(1)
-            _duplicate_push_triggers[api_url] -= 1
+    push_event = context.get("push_event") or await _push_trigger_coalescer.register(api_url, after_sha)
+    await _push_trigger_coalescer.run_latest(push_event, perform_push_commands)
+
+
+def _is_ignored_push(body: Dict[str, Any]) -> bool:
+    after_sha = body.get("after")
+    if body.get("before") == after_sha:
+        return True
+    merge_commit_sha = body.get("pull_request", {}).get("merge_commit_sha")
+    return get_settings().github_app.push_trigger_ignore_merge_commits and after_sha == merge_commit_sha
 
 
 async def handle_closed_pr(body, event, action, log_context):
@@ -267,7 +332,7 @@ async def handle_closed_pr(body, event, action, log_context):
     if not is_merged:
         if use_rag_engine:
             try:
-                await ragIndexManager.delete_pr_index(api_url)
+                await get_rag_index_manager().delete_pr_index(api_url)
             except Exception as e:
                 get_logger().error(f"Failed to delete PR index for {api_url=}: {e}")
         return
@@ -278,9 +343,9 @@ async def handle_closed_pr(body, event, action, log_context):
     if use_rag_engine:
         try:
             # handle merging of head changes into base branch index
-            await ragIndexManager.update_base_branch_index(api_url)
+            await get_rag_index_manager().update_base_branch_index(api_url)
             # cleanup the index created for the head branch of the PR
-            await ragIndexManager.delete_pr_index(api_url)
+            await get_rag_index_manager().delete_pr_index(api_url)
         except Exception as e:
             get_logger().error(f"Failed to handle pr merged rag logic for {api_url=}: {e}")
 
@@ -419,7 +484,7 @@ async def handle_request(body: Dict[str, Any], event: str):
     if api_url is None or api_url == "":
         get_logger().debug(f"No API URL found in request body")
 
-    agent = PRAgent(ai_handler=lambda: LiteLLMAIHandler(pr_rag_engine=PRRAGEngine(index_manager=ragIndexManager, pr_url=api_url) if use_rag_engine else None))
+    agent = PRAgent(ai_handler=partial(create_ai_handler, api_url))
     log_context, sender, sender_id, sender_type = get_log_context(body, event, action, build_number)
 
     # logic to ignore PRs opened by bot, PRs with specific titles, labels, source branches, or target branches
@@ -543,13 +608,11 @@ if get_settings().github_app.override_deployment_type:
     # Override the deployment type to app
     get_settings().set("GITHUB.DEPLOYMENT_TYPE", "app")
 # get_settings().set("CONFIG.PUBLISH_OUTPUT_PROGRESS", False)
-middleware = [Middleware(RawContextMiddleware)]
-app = FastAPI(middleware=middleware)
-app.include_router(router)
+app = create_app(router)
 
 
 def start():
-    uvicorn.run(app, host="0.0.0.0", port=int(os.environ.get("PORT", "3000")))
+    run_app(app)
 
 
 if __name__ == '__main__':
@@ -12,19 +12,23 @@
 # limitations under the License.
 
 import asyncio
-import multiprocessing
-import time
+import json
+import threading
 import traceback
-from collections import deque
 from datetime import datetime, timezone
 
 import aiohttp
-import requests
+from starlette_context import request_cycle_context
 
 from pr_agent.agent.pr_agent import PRAgent
-from pr_agent.config_loader import get_settings
+from pr_agent.config_loader import (SettingsOverlay, get_settings,
+                                    global_settings)
 from pr_agent.git_providers import get_git_provider
+from pr_agent.git_providers.async_git_provider import gather_bounded
+from pr_agent.git_providers.github_conditional_requests import (
+    CachedResponse, ConditionalRequestCache, get_conditional_request_cache)
 from pr_agent.log import LoggingFormat, get_logger, setup_logger
+from pr_agent.servers.utils import ExpiringSet
 
 setup_logger(fmt=LoggingFormat.JSON, level=get_settings().get("CONFIG.LOG_LEVEL", "DEBUG"))
 NOTIFICATION_URL = "https://api.github.com/notifications"
@@ -39,6 +43,39 @@ async def mark_notification_as_read(headers, notification, session):
                 f"Failed to mark notification as read. Status code: {mark_read_response.status}")
 
 
+async def get_json_conditionally(session: aiohttp.ClientSession, url: str, headers: dict,
+                                 cache: ConditionalRequestCache = None):
+    """
+    GET a JSON resource as a conditional request (If-None-Match / If-Modified-Since) when a previous response is
+    cached, and serve the cached body when GitHub answers 304 - which does not count against the rate limit.
+    Returns (status, parsed body), the parsed body being None for errors.
+    """
+    if cache is None:
+        cache = get_conditional_request_cache()
+    key = (url, headers.get("Accept", ""))
+    cached = cache.get(key)
+    request_headers = dict(headers)
+    if cached:
+        if cached.etag:
+            request_headers["If-None-Match"] = cached.etag
+        if cached.last_modified:
+            request_headers["If-Modified-Since"] = cached.last_modified
+    async with session.get(url, headers=request_headers) as response:
+        if response.status == 304 and cached:
+            cache.record("not_modified")
+            return 200, json.loads(cached.content)
+        cache.record("modified" if cached else "uncached")
+        if response.status != 200:
+            return response.status, None
+        content = await response.read()
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+        if etag or last_modified:
+            cache.put(key, CachedResponse(etag=etag, last_modified=last_modified, headers=dict(response.headers),
+                                          content=content, encoding=response.charset))
+        return 200, json.loads(content)
+
+
 def now() -> str:
     """
     Get the current UTC time in ISO 8601 format.
@@ -50,28 +87,6 @@ def now() -> str:
     now_utc = now_utc.replace("+00:00", "Z")
     return now_utc
 
-async def async_handle_request(pr_url, rest_of_comment, comment_id, git_provider):
-    agent = PRAgent()
-    success = await agent.handle_request(
-        pr_url,
-        rest_of_comment,
-        notify=lambda: git_provider.add_eyes_reaction(comment_id)
-    )
-    return success
-
-def run_handle_request(pr_url, rest_of_comment, comment_id, git_provider):
-    return asyncio.run(async_handle_request(pr_url, rest_of_comment, comment_id, git_provider))
-
-
-def process_comment_sync(pr_url, rest_of_comment, comment_id):
-    try:
-        # Run the async handle_request in a separate function
-        git_provider = get_git_provider()(pr_url=pr_url)
-        success = run_handle_request(pr_url, rest_of_comment, comment_id, git_provider)
-    except Exception as e:
-        get_logger().error(f"Error processing comment: {e}", artifact={"traceback": traceback.format_exc()})
-
-
 async def process_comment(pr_url, rest_of_comment, comment_id):
     try:
         git_provider = get_git_provider()(pr_url=pr_url)
@@ -86,6 +101,67 @@ async def process_comment(pr_url, rest_of_comment, comment_id):
     except Exception as e:
         get_logger().error(f"Error processing comment: {e}", artifact={"traceback": traceback.format_exc()})
 
+class CommentWorkerPool:
+    """
+    A pool of long-lived workers processing the comments found by the polling loop, in the polling process: the
+    package, the settings and the clients are loaded once, instead of once per comment in a new process.
+    Each worker is a thread running its own event loop, so that the blocking calls of the tools only hold up their own
+    comment, and neither the polling loop nor the other workers.
+    Comments wait in a bounded queue: when it is full, submit() waits for a free slot (backpressure on the polling
+    loop) instead of dropping comments. Each comment is processed with its own copy-on-write settings, as in the
+    webhook servers, so that concurrent commands do not change each other's settings.
+    """
+
+    def __init__(self, num_workers: int, max_queued_tasks: int):
+        self.num_workers = num_workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queued_tasks)
+        self._workers: list[tuple[threading.Thread, asyncio.AbstractEventLoop, asyncio.Task]] = []
+
+    def start(self):
+        polling_loop = asyncio.get_running_loop()
+        for index in range(self.num_workers):
+            loop = asyncio.new_event_loop()
+            task = loop.create_task(self._worker(polling_loop))
+            thread = threading.Thread(target=self._run_worker, args=(loop, task), name=f"comment-worker-{index}",
+                                      daemon=True)
+            thread.start()
+            self._workers.append((thread, loop, task))
+
+    async def close(self):
+        for _, loop, task in self._workers:
+            loop.call_soon_threadsafe(task.cancel)
+        await asyncio.gather(*[asyncio.to_thread(thread.join) for thread, _, _ in self._workers])
+        self._workers = []
+
+    async def submit(self, pr_url, rest_of_comment, comment_id):
+        if self.queue.full():
+            get_logger().warning(f"The comment processing queue is full ({self.queue.qsize()} comments), "
+                                 f"waiting for a free slot")
+        await self.queue.put((pr_url, rest_of_comment, comment_id))
+
+    @staticmethod
+    def _run_worker(loop: asyncio.AbstractEventLoop, task: asyncio.Task):
+        asyncio.set_event_loop(loop)
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            loop.close()
+
+    async def _worker(self, polling_loop: asyncio.AbstractEventLoop):
+        # runs in the event loop of the worker thread, taking the comments from the queue of the polling loop
+        while True:
+            pr_url, rest_of_comment, comment_id = await asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(self.queue.get(), polling_loop))
+            try:
+                with request_cycle_context({"settings": SettingsOverlay(global_settings), "git_provider": {}}):
+                    await process_comment(pr_url, rest_of_comment, comment_id)
+            finally:
+                polling_loop.call_soon_threadsafe(self.queue.task_done)
+
+
 async def is_valid_notification(notification, headers, handled_ids, session, user_id):
     try:
         if 'reason' in notification and notification['reason'] == 'mention':
@@ -95,57 +171,56 @@ async def is_valid_notification(notification, headers, handled_ids, session, use
                 if not latest_comment or not isinstance(latest_comment, str):
                     get_logger().debug(f"no latest_comment")
                     return False, handled_ids
-                async with session.get(latest_comment, headers=headers) as comment_response:
-                    check_prev_comments = False
-                    user_tag = "@" + user_id
-                    if comment_response.status == 200:
-                        comment = await comment_response.json()
-                        if 'id' in comment:
-                            if comment['id'] in handled_ids:
-                                get_logger().debug(f"comment['id'] in handled_ids")
-                                return False, handled_ids
-                            else:
-                                handled_ids.add(comment['id'])
-                        if 'user' in comment and 'login' in comment['user']:
-                            if comment['user']['login'] == user_id:
-                                get_logger().debug(f"comment['user']['login'] == user_id")
-                                check_prev_comments = True
-                        comment_body = comment.get('body', '')
-                        if not comment_body:
-                            get_logger().debug(f"no comment_body")
+                comment_status, comment = await get_json_conditionally(session, latest_comment, headers)
+                check_prev_comments = False
+                user_tag = "@" + user_id
+                if comment_status == 200:
+                    if 'id' in comment:
+                        if comment['id'] in handled_ids:
+                            get_logger().debug(f"comment['id'] in handled_ids")
+                            return False, handled_ids
+                        else:
+                            handled_ids.add(comment['id'])
+                    if 'user' in comment and 'login' in comment['user']:
+                        if comment['user']['login'] == user_id:
+                            get_logger().debug(f"comment['user']['login'] == user_id")
+                            check_prev_comments = True
+                    comment_body = comment.get('body', '')
+                    if not comment_body:
+                        get_logger().debug(f"no comment_body")
+                        check_prev_comments = True
+                    else:
+                        if user_tag not in comment_body:
+                            get_logger().debug(f"user_tag not in comment_body")
                             check_prev_comments = True
                         else:
-                            if user_tag not in comment_body:
-                                get_logger().debug(f"user_tag not in comment_body")
-                                check_prev_comments = True
-                            else:
+                            get_logger().info(f"Polling, pr_url: {pr_url}",
+                                              artifact={"comment": comment_body})
+
+                    if not check_prev_comments:
+                        return True, handled_ids, comment, comment_body, pr_url, user_tag
+                    else: # we could not find the user tag in the latest comment. Check previous comments
+                        # get all comments in the PR
+                        requests_url = f"{pr_url}/comments".replace("pulls", "issues")
+                        _, comments = await get_json_conditionally(session, requests_url, headers)
+                        comments = (comments or [])[::-1]
+                        max_comment_to_scan = 4
+                        for comment in comments[:max_comment_to_scan]:
+                            if 'user' in comment and 'login' in comment['user']:
+                                if comment['user']['login'] == user_id:
+                                    continue
+                            comment_body = comment.get('body', '')
+                            if not comment_body:
+                                continue
+                            if user_tag in comment_body:
+                                get_logger().info("found user tag in previous comments")
                                 get_logger().info(f"Polling, pr_url: {pr_url}",
                                                   artifact={"comment": comment_body})
+                                return True, handled_ids, comment, comment_body, pr_url, user_tag
 
-                        if not check_prev_comments:
-                            return True, handled_ids, comment, comment_body, pr_url, user_tag
-                        else: # we could not find the user tag in the latest comment. Check previous comments
-                            # get all comments in the PR
-                            requests_url = f"{pr_url}/comments".replace("pulls", "issues")
-                            comments_response = requests.get(requests_url, headers=headers)
-                            comments = comments_response.json()[::-1]
-                            max_comment_to_scan = 4
-                            for comment in comments[:max_comment_to_scan]:
-                                if 'user' in comment and 'login' in comment['user']:
-                                    if comment['user']['login'] == user_id:
-                                        continue
-                                comment_body = comment.get('body', '')
-                                if not comment_body:
-                                    continue
-                                if user_tag in comment_body:
-                                    get_logger().info("found user tag in previous comments")
-                                    get_logger().info(f"Polling, pr_url: {pr_url}",
-                                                      artifact={"comment": comment_body})
-                                    return True, handled_ids, comment, comment_body, pr_url, user_tag
-
-                            get_logger().warning(f"Failed to fetch comments for PR: {pr_url}",
-                                                    artifact={"comments": comments})
-                            return False, handled_ids
+                        get_logger().warning(f"Failed to fetch comments for PR: {pr_url}",
+                                                artifact={"comments": comments})
+                        return False, handled_ids
 
         return False, handled_ids
     except Exception as e:
@@ -159,7 +234,9 @@ async def polling_loop():
     """
     Polls for notifications and handles them accordingly.
     """
-    handled_ids = set()
+    # notification and comment ids are remembered long enough to skip the repeated notifications of a comment
+    handled_ids = ExpiringSet(ttl=get_settings().get("GITHUB_POLLING.HANDLED_IDS_TTL", 24 * 60 * 60),
+                              max_size=get_settings().get("GITHUB_POLLING.MAX_HANDLED_IDS", 100000))
     since = [now()]
     last_modified = [None]
     git_provider = get_git_provider()()
@@ -179,76 +256,67 @@ async def polling_loop():
     if not token:
         raise ValueError("User token must be set to get notifications")
 
+    max_concurrent_requests = get_settings().get("GITHUB_POLLING.MAX_CONCURRENT_REQUESTS", 10)
+    worker_pool = CommentWorkerPool(num_workers=get_settings().get("GITHUB_POLLING.MAX_CONCURRENT_TASKS", 10),
+                                    max_queued_tasks=get_settings().get("GITHUB_POLLING.MAX_QUEUED_TASKS", 100))
+    worker_pool.start()
     async with aiohttp.ClientSession() as session:
-        while True:
-            try:
-                await asyncio.sleep(5)
-                headers = {
-                    "Accept": "application/vnd.github.v3+json",
-                    "Authorization": f"Bearer {token}"
-                }
-                params = {
-                    "participating": "true"
-                }
-                if since[0]:
-                    params["since"] = since[0]
-                if last_modified[0]:
-                    headers["If-Modified-Since"] = last_modified[0]
-
-                async with session.get(NOTIFICATION_URL, headers=headers, params=params) as response:
-                    if response.status == 200:
-                        if 'Last-Modified' in response.headers:
-                            last_modified[0] = response.headers['Last-Modified']
-                            since[0] = None
-                        notifications = await response.json()
-                        if not notifications:
-                            continue
-                        get_logger().info(f"Received {len(notifications)} notifications")
-                        task_queue = deque()
-                        for notification in notifications:
-                            if not notification:
+        try:
+            while True:
+                try:
+                    await asyncio.sleep(5)
+                    headers = {
+                        "Accept": "application/vnd.github.v3+json",
+                        "Authorization": f"Bearer {token}"
+                    }
+                    params = {
+                        "participating": "true"
+                    }
+                    if since[0]:
+                        params["since"] = since[0]
+                    if last_modified[0]:
+                        headers["If-Modified-Since"] = last_modified[0]
+
+                    async with session.get(NOTIFICATION_URL, headers=headers, params=params) as response:
+                        if response.status == 200:
+                            if 'Last-Modified' in response.headers:
+                                last_modified[0] = response.headers['Last-Modified']
+                                since[0] = None
+                            notifications = await response.json()
+                            if not notifications:
                                 continue
-                            # mark notification as read
-                            await mark_notification_as_read(headers, notification, session)
-
-                            handled_ids.add(notification['id'])
-                            output = await is_valid_notification(notification, headers, handled_ids, session, user_id)
-                            if output[0]:
-                                _, handled_ids, comment, comment_body, pr_url, user_tag = output
-                                rest_of_comment = comment_body.split(user_tag)[1].strip()
-                                comment_id = comment['id']
-
-                                # Add to the task queue
-                                get_logger().info(
-                                    f"Adding comment processing to task queue for PR, {pr_url}, comment_body: {comment_body}")
-                                task_queue.append((process_comment_sync, (pr_url, rest_of_comment, comment_id)))
-                                get_logger().info(f"Queued comment processing for PR: {pr_url}")
-                            else:
-                                get_logger().debug(f"Skipping comment processing for PR")
-
-                        max_allowed_parallel_tasks = 10
-                        if task_queue:
-                            processes = []
-                            for i, (func, args) in enumerate(task_queue):  # Create  parallel tasks
-                                p = multiprocessing.Process(target=func, args=args)
-                                processes.append(p)
-                                p.start()
-                                if i > max_allowed_parallel_tasks:
-                                    get_logger().error(
-                                        f"Dropping {len(task_queue) - max_allowed_parallel_tasks} tasks from polling session")
-                                    break
-                            task_queue.clear()
-
-                            # Dont wait for all processes to complete. Move on to the next iteration
-                            # for p in processes:
-                            #     p.join()
-
-                    elif response.status != 304:
-                        print(f"Failed to fetch notifications. Status code: {response.status}")
-
-            except Exception as e:
-                get_logger().error(f"Polling exception during processing of a notification: {e}",
-                                   artifact={"traceback": traceback.format_exc()})
+                            get_logger().info(f"Received {len(notifications)} notifications")
+                            notifications = [notification for notification in notifications if notification]
+                            # the notifications are marked as read, and then validated, concurrently
+                            await gather_bounded([mark_notification_as_read(headers, notification, session)
+                                                  for notification in notifications], max_concurrent_requests)
+                            for notification in notifications:
+                                handled_ids.add(notification['id'])
+                            outputs = await gather_bounded(
+                                [is_valid_notification(notification, headers, handled_ids, session, user_id)
+                                 for notification in notifications], max_concurrent_requests)
+                            for output in outputs:
+                                if output[0]:
+                                    _, handled_ids, comment, comment_body, pr_url, user_tag = output
+                                    rest_of_comment = comment_body.split(user_tag)[1].strip()
+                                    comment_id = comment['id']
+
+                                    # Add to the task queue
+                                    get_logger().info(
+                                        f"Adding comment processing to task queue for PR, {pr_url}, comment_body: {comment_body}")
+                                    await worker_pool.submit(pr_url, rest_of_comment, comment_id)
+                                    get_logger().info(f"Queued comment processing for PR: {pr_url}")
+                                else:
+                                    get_logger().debug(f"Skipping comment processing for PR")
+
+                        elif response.status != 304:
+                            print(f"Failed to fetch notifications. Status code: {response.status}")
+
+                except Exception as e:
+                    get_logger().error(f"Polling exception during processing of a notification: {e}",
+                                       artifact={"traceback": traceback.format_exc()})
+        finally:
+            await worker_pool.close()
 
 
 if __name__ == '__main__':
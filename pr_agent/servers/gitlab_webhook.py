@@ -11,26 +11,24 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import copy
 import json
 import re
 from datetime import datetime
 
-import uvicorn
-from fastapi import APIRouter, FastAPI, Request, status
+from fastapi import APIRouter, Request, status
 from fastapi.encoders import jsonable_encoder
 from fastapi.responses import JSONResponse
-from starlette.background import BackgroundTasks
-from starlette.middleware import Middleware
 from starlette_context import context
-from starlette_context.middleware import RawContextMiddleware
 
 from pr_agent.agent.pr_agent import PRAgent
 from pr_agent.algo.utils import update_settings_from_args
-from pr_agent.config_loader import get_settings, global_settings
+from pr_agent.config_loader import (SettingsOverlay, get_settings,
+                                    global_settings)
 from pr_agent.git_providers.utils import apply_repo_settings
 from pr_agent.log import LoggingFormat, get_logger, setup_logger
 from pr_agent.secret_providers import get_secret_provider
+from pr_agent.servers.webhook_runtime import (create_app, get_task_registry,
+                                              run_app)
 
 setup_logger(fmt=LoggingFormat.JSON, level=get_settings().get("CONFIG.LOG_LEVEL", "DEBUG"))
 router = APIRouter()
@@ -180,10 +178,10 @@ def should_process_pr_logic(data) -> bool:
 
 
 @router.post("/webhook")
-async def gitlab_webhook(background_tasks: BackgroundTasks, request: Request):
+async def gitlab_webhook(request: Request):
     start_time = datetime.now()
     request_json = await request.json()
-    context["settings"] = copy.deepcopy(global_settings)
+    context["settings"] = SettingsOverlay(global_settings)
 
     async def inner(data: dict):
         log_context = {"server_type": "gitlab_app"}
@@ -277,7 +275,7 @@ async def gitlab_webhook(background_tasks: BackgroundTasks, request: Request):
 
                 await handle_request(url, body, log_context, sender_id)
 
-    background_tasks.add_task(inner, request_json)
+    get_task_registry().create_task(inner(request_json))
     end_time = datetime.now()
     get_logger().info(f"Processing time: {end_time - start_time}", request=request_json)
     return JSONResponse(status_code=status.HTTP_200_OK, content=jsonable_encoder({"message": "success"}))
@@ -311,13 +309,11 @@ gitlab_url = get_settings().get("GITLAB.URL", None)
 if not gitlab_url:
     raise ValueError("GITLAB.URL is not set")
 get_settings().config.git_provider = "gitlab"
-middleware = [Middleware(RawContextMiddleware)]
-app = FastAPI(middleware=middleware)
-app.include_router(router)
+app = create_app(router)
 
 
 def start():
-    uvicorn.run(app, host="0.0.0.0", port=3000)
+    run_app(app, port=3000)
 
 
 if __name__ == '__main__':
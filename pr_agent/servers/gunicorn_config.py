@@ -78,6 +78,14 @@ backlog = 2048
 #       process is still communicating and is not tied to the length
 #       of time required to handle a single request.
 #
+#   graceful_timeout - After receiving a restart signal, workers have
+#       this much time to finish serving requests. Workers still alive
+#       after the timeout (starting from the receipt of the restart
+#       signal) are force killed.
+#
+#       The webhook servers drain their background tasks on shutdown for
+#       up to SERVER.SHUTDOWN_GRACE_PERIOD_SECONDS, which must be shorter.
+#
 #   keepalive - The number of seconds to wait for the next request
 #       on a Keep-Alive HTTP connection.
 #
@@ -89,8 +97,11 @@ if os.getenv('GUNICORN_WORKERS', None):
 else:
     cores = multiprocessing.cpu_count()
     workers = cores * 2 + 1
+# async workers, which run the background tasks of the webhooks in their event loop
+worker_class = 'uvicorn.workers.UvicornWorker'
 worker_connections = 1000
 timeout = 240
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', '150'))
 keepalive = 2
 
 #
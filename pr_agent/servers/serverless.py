@@ -11,16 +11,13 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from fastapi import FastAPI
 from mangum import Mangum
-from starlette.middleware import Middleware
-from starlette_context.middleware import RawContextMiddleware
 
 from pr_agent.servers.github_app import router
+from pr_agent.servers.webhook_runtime import create_app
 
-middleware = [Middleware(RawContextMiddleware)]
-app = FastAPI(middleware=middleware)
-app.include_router(router)
+# the event loop only runs while Mangum handles an invocation, so the background tasks of an event run within it
+app = create_app(router, run_tasks_inline=True)
 
 handler = Mangum(app, lifespan="off")
 
@@ -0,0 +1,203 @@
+# Copyright (c) 2023 PR-Agent Authors
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import contextvars
+import time
+from collections import Counter, deque
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Awaitable, Callable, Optional
+
+from pr_agent.log import get_logger
+from pr_agent.servers.webhook_runtime import TaskRegistry
+
+# number of recently started tasks the wait time statistics are computed on
+_WAIT_TIMES_WINDOW = 1000
+
+
+class TaskPriority(IntEnum):
+    """Lower values are scheduled first."""
+    COMMAND = 0  # commands written by users, e.g. a '/review' comment
+    AUTO = 1  # automatic tools, e.g. the review of a new PR or of new commits
+
+
+class SchedulerOverloaded(Exception):
+    """Raised when a task is rejected because the queue of the scheduler is full."""
+    pass
+
+
+@dataclass
+class _ScheduledTask:
+    func: Callable[..., Awaitable[Any]]
+    args: tuple
+    kwargs: dict
+    priority: TaskPriority
+    repo: Optional[str]
+    installation: Optional[Any]
+    on_shed: Optional[Callable[[], None]] = None
+    # the task runs in the context of the request that submitted it (e.g. its starlette_context settings)
+    context: contextvars.Context = field(default_factory=contextvars.copy_context)
+    submitted_at: float = field(default_factory=time.monotonic)
+
+
+def _decrement(counter: Counter, key):
+    counter[key] -= 1
+    if counter[key] <= 0:
+        del counter[key]
+
+
+class WebhookTaskScheduler:
+    """
+    Runs the background tasks of webhook events with a bounded concurrency, instead of starting all of them at once:
+    at most `max_concurrent_tasks` tasks run at a time, of which at most `max_tasks_per_repo` for the same repo and
+    `max_tasks_per_installation` for the same installation (or organization). Other tasks wait in a queue, by priority
+    and then in submission order. A queued task that only waits for the limit of its repo or installation does not
+    block the tasks of other repos.
+    At most `max_queued_tasks` tasks are queued: when the queue is full, a task sheds the most recent queued task of a
+    lower priority, or is rejected with SchedulerOverloaded if there is none.
+    Must be used from a single event loop. Limits of 0 (or less) disable the corresponding limit.
+    With a `task_registry`, the running tasks are drained on shutdown, and queued tasks are not started anymore once
+    it is draining.
+    """
+
+    def __init__(self, max_concurrent_tasks: int, max_tasks_per_repo: int = 0, max_tasks_per_installation: int = 0,
+                 max_queued_tasks: int = 0, task_registry: Optional[TaskRegistry] = None):
+        self.max_concurrent_tasks = max_concurrent_tasks
+        self.max_tasks_per_repo = max_tasks_per_repo
+        self.max_tasks_per_installation = max_tasks_per_installation
+        self.max_queued_tasks = max_queued_tasks
+        self.task_registry = task_registry
+        self._queues: dict[TaskPriority, deque[_ScheduledTask]] = {priority: deque() for priority in TaskPriority}
+        self._running: set[asyncio.Task] = set()  # references to the running tasks, so that they are not collected
+        self._running_count = 0
+        self._running_per_repo: Counter = Counter()
+        self._running_per_installation: Counter = Counter()
+        self._wait_times: deque[float] = deque(maxlen=_WAIT_TIMES_WINDOW)
+        self._started = 0
+        self._completed = 0
+        self._failed = 0
+        self._shed = 0
+        self._rejected = 0
+
+    @property
+    def queued(self) -> int:
+        return sum(len(queue) for queue in self._queues.values())
+
+    @property
+    def running(self) -> int:
+        return self._running_count
+
+    def submit(self, func: Callable[..., Awaitable[Any]], *args, priority: TaskPriority = TaskPriority.AUTO,
+               repo: Optional[str] = None, installation: Optional[Any] = None,
+               on_shed: Optional[Callable[[], None]] = None, **kwargs):
+        """
+        Schedules `func(*args, **kwargs)`, in the current context. Raises SchedulerOverloaded if the queue is full.
+        `on_shed` is called if the task is shed from the queue.
+        """
+        task = _ScheduledTask(func, args, kwargs, priority, repo, installation, on_shed)
+        # queued tasks only wait for the limits of their repo or installation if there is room for another task
+        if self._can_start(task):
+            self._start(task)
+            return
+        if 0 < self.max_queued_tasks <= self.queued and not self._shed_lower_priority_task(priority):
+            self._rejected += 1
+            raise SchedulerOverloaded(f"The queue of background tasks is full ({self.queued} tasks)")
+        self._queues[priority].append(task)
+
+    def _shed_lower_priority_task(self, priority: TaskPriority) -> bool:
+        for lower_priority in sorted((p for p in TaskPriority if p > priority), reverse=True):
+            if self._queues[lower_priority]:
+                shed_task = self._queues[lower_priority].pop()
+                self._shed += 1
+                get_logger().warning(f"Shedding a queued {shed_task.priority.name} task of {shed_task.repo=}, "
+                                     f"to make room for a {priority.name} task")
+                if shed_task.on_shed:
+                    shed_task.on_shed()
+                return True
+        return False
+
+    def _can_start(self, task: _ScheduledTask) -> bool:
+        if 0 < self.max_concurrent_tasks <= self.running:
+            return False
+        if task.repo is not None and 0 < self.max_tasks_per_repo <= self._running_per_repo[task.repo]:
+            return False
+        if (task.installation is not None and
+                0 < self.max_tasks_per_installation <= self._running_per_installation[task.installation]):
+            return False
+        return True
+
+    def _start(self, task: _ScheduledTask):
+        self._wait_times.append(time.monotonic() - task.submitted_at)
+        self._started += 1
+        self._running_count += 1
+        self._running_per_repo[task.repo] += 1
+        self._running_per_installation[task.installation] += 1
+        running_task = asyncio.get_running_loop().create_task(self._run(task), context=task.context)
+        self._running.add(running_task)
+        running_task.add_done_callback(self._running.discard)
+        if self.task_registry:
+            self.task_registry.track(running_task)
+
+    async def _run(self, task: _ScheduledTask):
+        try:
+            await task.func(*task.args, **task.kwargs)
+            self._completed += 1
+        except Exception as e:
+            self._failed += 1
+            get_logger().error(f"Failed to run a background task of {task.repo=}", artifact={"error": e})
+        finally:
+            self._running_count -= 1
+            _decrement(self._running_per_repo, task.repo)
+            _decrement(self._running_per_installation, task.installation)
+            self._schedule_queued_tasks()
+
+    def _schedule_queued_tasks(self):
+        if self.task_registry and self.task_registry.draining:
+            return
+        for priority in TaskPriority:
+            queue = self._queues[priority]
+            for task in list(queue):
+                if 0 < self.max_concurrent_tasks <= self.running:
+                    return
+                if self._can_start(task):
+                    queue.remove(task)
+                    self._start(task)
+
+    def metrics(self) -> dict:
+        now = time.monotonic()
+        wait_times = sorted(self._wait_times)
+        queued_tasks = [task for queue in self._queues.values() for task in queue]
+        return {
+            "running": self.running,
+            "queued": self.queued,
+            "queued_per_priority": {priority.name.lower(): len(queue) for priority, queue in self._queues.items()},
+            "oldest_queued_task_wait_seconds": max((now - task.submitted_at for task in queued_tasks), default=0.0),
+            "wait_seconds": {
+                "avg": sum(wait_times) / len(wait_times) if wait_times else 0.0,
+                "p50": wait_times[len(wait_times) // 2] if wait_times else 0.0,
+                "p95": wait_times[int(len(wait_times) * 0.95)] if wait_times else 0.0,
+                "max": wait_times[-1] if wait_times else 0.0,
+            },
+            "started": self._started,
+            "completed": self._completed,
+            "failed": self._failed,
+            "shed": self._shed,
+            "rejected": self._rejected,
+            "limits": {
+                "max_concurrent_tasks": self.max_concurrent_tasks,
+                "max_tasks_per_repo": self.max_tasks_per_repo,
+                "max_tasks_per_installation": self.max_tasks_per_installation,
+                "max_queued_tasks": self.max_queued_tasks,
+            },
+        }
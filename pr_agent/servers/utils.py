@@ -14,8 +14,8 @@
 import hashlib
 import hmac
 import time
-from collections import defaultdict
-from typing import Any, Callable
+from collections import OrderedDict, defaultdict
+from typing import Any, Callable, Hashable, Mapping, Optional
 
 from fastapi import HTTPException
 
@@ -43,8 +43,48 @@ class RateLimitExceeded(Exception):
     pass
 
 
+class ExpiringSet:
+    """
+    A set whose items expire `ttl` seconds after they were (last) added, and holding at most `max_size` items: the
+    oldest ones are evicted first. The items are kept in expiry order, so eviction is amortized O(1) per item.
+    """
+
+    def __init__(self, ttl: float, max_size: Optional[int] = None):
+        self.ttl = ttl
+        self.max_size = max_size
+        self._items: OrderedDict[Hashable, float] = OrderedDict()  # item -> expiry time, in expiry order
+
+    def _evict_expired(self, now: float):
+        while self._items:
+            item, expiry = next(iter(self._items.items()))
+            if expiry > now:
+                break
+            self._items.popitem(last=False)
+
+    def add(self, item: Hashable):
+        now = time.monotonic()
+        self._evict_expired(now)
+        self._items[item] = now + self.ttl
+        self._items.move_to_end(item)
+        if self.max_size is not None:
+            while len(self._items) > self.max_size:
+                self._items.popitem(last=False)
+
+    def __contains__(self, item: Hashable) -> bool:
+        expiry = self._items.get(item)
+        return expiry is not None and expiry > time.monotonic()
+
+    def __len__(self) -> int:
+        self._evict_expired(time.monotonic())
+        return len(self._items)
+
+
 class DefaultDictWithTimeout(defaultdict):
-    """A defaultdict with a time-to-live (TTL)."""
+    """
+    A defaultdict with a time-to-live (TTL), holding at most `max_size` keys: the least recently used ones are evicted
+    first. The keys are kept in the order of their last use, which is their expiry order, so eviction is amortized O(1)
+    per key. All the methods that read or write a key (e.g. get, setdefault, update) go through the TTL and max_size.
+    """
 
     def __init__(
         self,
@@ -52,6 +92,7 @@ class DefaultDictWithTimeout(defaultdict):
         ttl: int = None,
         refresh_interval: int = 60,
         update_key_time_on_get: bool = True,
+        max_size: Optional[int] = None,
         *args,
         **kwargs,
     ):
@@ -59,41 +100,128 @@ class DefaultDictWithTimeout(defaultdict):
         Args:
             default_factory: The default factory to use for keys that are not in the dictionary.
             ttl: The time-to-live (TTL) in seconds.
-            refresh_interval: How often to refresh the dict and delete items older than the TTL.
+            refresh_interval: How often to refresh the dict and delete items older than the TTL. An expired key is
+                never returned, even before it is deleted.
             update_key_time_on_get: Whether to update the access time of a key also on get (or only when set).
+            max_size: The maximum number of keys, or None for no limit.
         """
         super().__init__(default_factory, *args, **kwargs)
-        self.__key_times = dict()
         self.__ttl = ttl
         self.__refresh_interval = refresh_interval
         self.__update_key_time_on_get = update_key_time_on_get
-        self.__last_refresh = self.__time() - self.__refresh_interval
+        self.__max_size = max_size
+        now = self.__time()
+        self.__key_times: OrderedDict[Hashable, float] = OrderedDict((key, now) for key in self)  # in last use order
+        self.__last_refresh = now - self.__refresh_interval
+        self.__evict_oversize()
 
     @staticmethod
     def __time():
         return time.monotonic()
 
-    def __refresh(self):
-        if self.__ttl is None:
+    def __refresh(self, request_time: float):
+        if self.__ttl is None or request_time - self.__last_refresh < self.__refresh_interval:
             return
-        request_time = self.__time()
-        if request_time - self.__last_refresh > self.__refresh_interval:
-            return
-        to_delete = [key for key, key_time in self.__key_times.items() if request_time - key_time > self.__ttl]
-        for key in to_delete:
-            del self[key]
+        while self.__key_times:
+            key, key_time = next(iter(self.__key_times.items()))
+            if request_time - key_time <= self.__ttl:
+                break
+            self.__evict(key)
         self.__last_refresh = request_time
 
+    def __evict(self, key):
+        self.__key_times.pop(key, None)
+        super().pop(key, None)
+
+    def __evict_oversize(self):
+        if self.__max_size is not None:
+            while len(self.__key_times) > self.__max_size:
+                self.__evict(next(iter(self.__key_times)))
+
+    def __is_expired(self, key, request_time: float) -> bool:
+        key_time = self.__key_times.get(key)
+        return self.__ttl is not None and key_time is not None and request_time - key_time > self.__ttl
+
+    def __touch(self, key, request_time: float):
+        self.__key_times[key] = request_time
+        self.__key_times.move_to_end(key)
+
     def __getitem__(self, __key):
-        if self.__update_key_time_on_get:
-            self.__key_times[__key] = self.__time()
-        self.__refresh()
-        return super().__getitem__(__key)
+        request_time = self.__time()
+        self.__refresh(request_time)
+        if self.__is_expired(__key, request_time):
+            self.__evict(__key)
+        elif self.__update_key_time_on_get and __key in self.__key_times:
+            self.__touch(__key, request_time)
+        return super().__getitem__(__key)  # a missing key is set by __missing__, through __setitem__
 
     def __setitem__(self, __key, __value):
-        self.__key_times[__key] = self.__time()
-        return super().__setitem__(__key, __value)
+        request_time = self.__time()
+        self.__refresh(request_time)
+        super().__setitem__(__key, __value)
+        self.__touch(__key, request_time)
+        self.__evict_oversize()
 
     def __delitem__(self, __key):
-        del self.__key_times[__key]
+        self.__key_times.pop(__key, None)
         return super().__delitem__(__key)
+
+    def __contains__(self, __key) -> bool:
+        return super().__contains__(__key) and not self.__is_expired(__key, self.__time())
+
+    def get(self, __key, __default=None):
+        request_time = self.__time()
+        self.__refresh(request_time)
+        if self.__is_expired(__key, request_time):
+            self.__evict(__key)
+            return __default
+        if not super().__contains__(__key):
+            return __default
+        if self.__update_key_time_on_get:
+            self.__touch(__key, request_time)
+        return super().__getitem__(__key)
+
+    def setdefault(self, __key, __default=None):
+        if __key in self:
+            return self[__key]
+        self[__key] = __default
+        return __default
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def pop(self, __key, *default):
+        self.__key_times.pop(__key, None)
+        return super().pop(__key, *default)
+
+    def popitem(self):
+        key, value = super().popitem()
+        self.__key_times.pop(key, None)
+        return key, value
+
+    def clear(self):
+        self.__key_times.clear()
+        super().clear()
+
+    def copy(self) -> "DefaultDictWithTimeout":
+        """A shallow copy, with the same settings and the same key times."""
+        copied = type(self)(self.default_factory, self.__ttl, self.__refresh_interval, self.__update_key_time_on_get,
+                            self.__max_size)
+        dict.update(copied, self)
+        copied.__key_times = OrderedDict(self.__key_times)
+        copied.__last_refresh = self.__last_refresh
+        return copied
+
+    __copy__ = copy
+
+    def __or__(self, other):
+        if not isinstance(other, Mapping):
+            return NotImplemented
+        merged = self.copy()
+        merged.update(other)
+        return merged
+
+    def __ior__(self, other):
+        self.update(other)
+        return self
@@ -0,0 +1,295 @@
+# Copyright (c) 2023 PR-Agent Authors
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Runtime shared by the webhook servers: the FastAPI app, the registry of their background tasks, and the draining of
+these tasks on shutdown.
+
+On SIGTERM (e.g. a rolling restart), uvicorn stops accepting requests and the app waits for the running background
+tasks for up to SERVER.SHUTDOWN_GRACE_PERIOD_SECONDS. The tasks still running after that are cancelled. Resumable
+tasks that did not finish, whether running or still queued, are checkpointed: the next process that starts resumes
+them, and replays their steps that completed before the shutdown (e.g. the AI calls) from their checkpoint. The tools
+that completed are not run again, so that their results are not published twice.
+
+Serverless functions (e.g. with Mangum) run the event loop only while a request is handled, so their app waits for the
+background tasks before completing each request instead (see create_app).
+"""
+
+import asyncio
+import os
+import socket
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import asynccontextmanager
+from dataclasses import dataclass
+from typing import Any, Awaitable, Callable, Optional
+
+import uvicorn
+from fastapi import APIRouter, FastAPI
+from starlette.middleware import Middleware
+from starlette_context import request_cycle_context
+from starlette_context.middleware import RawContextMiddleware
+
+from pr_agent.algo.checkpoints import (CheckpointedTask, CheckpointStore,
+                                       set_current_checkpoint)
+from pr_agent.config_loader import get_settings
+from pr_agent.log import get_logger
+
+# schedules the run of a resumable task, e.g. in a WebhookTaskScheduler: called with the run and the task payload
+Schedule = Callable[["ResumableRun", dict], None]
+
+
+@dataclass
+class _ResumableHandler:
+    func: Callable[..., Awaitable[Any]]
+    schedule: Optional[Schedule]
+
+
+class ResumableRun:
+    """The run of a resumable task: awaiting it runs the task, `discard` drops it if it is never run (e.g. shed)."""
+
+    def __init__(self, registry: "TaskRegistry", task: CheckpointedTask, func: Callable[..., Awaitable[Any]]):
+        self.registry = registry
+        self.task = task
+        self.func = func
+
+    async def __call__(self):
+        await self.registry._run(self)
+
+    def discard(self):
+        self.registry._delete_checkpoint(self.task)
+
+
+class TaskRegistry:
+    """
+    Tracks the background tasks of a webhook server, so that they can be drained on shutdown.
+    Resumable tasks are registered by name, with a function of their (JSON serializable) payload. Their payload is
+    checkpointed from the moment they are submitted until they finish, so that they can be resumed by another process
+    if this one is shut down in the meantime. Must be used from a single event loop.
+    """
+
+    def __init__(self, checkpoint_store: Optional[CheckpointStore] = None, max_checkpoint_age_seconds: float = 3600):
+        self.checkpoint_store = checkpoint_store
+        self.max_checkpoint_age_seconds = max_checkpoint_age_seconds
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.draining = False
+        self._handlers: dict[str, _ResumableHandler] = {}
+        self._tasks: set[asyncio.Task] = set()
+        self._completed = 0
+        self._cancelled = 0
+        self._checkpointed = 0
+        self._resumed = 0
+
+    def register(self, name: str, func: Callable[..., Awaitable[Any]], schedule: Optional[Schedule] = None):
+        """
+        Registers a resumable task: `func(**payload)` runs it. `schedule` runs it in the background, by default right
+        away. The task must not rely on the context of the request that submitted it, as it has none when resumed.
+        """
+        self._handlers[name] = _ResumableHandler(func, schedule)
+
+    async def submit(self, name: str, payload: dict) -> Optional[str]:
+        """
+        Schedules the resumable task `name`, and returns the id of its checkpoint (None if checkpoints are disabled).
+        Errors of its scheduling (e.g. SchedulerOverloaded) are raised.
+        While draining, the task is only checkpointed, to be resumed by the next process.
+        """
+        handler = self._handlers[name]
+        task = CheckpointedTask("", name, payload)
+        if self.checkpoint_store:
+            task = await asyncio.to_thread(self.checkpoint_store.create, name, payload, self.owner, self.draining)
+            if self.draining:
+                self._checkpointed += 1
+                get_logger().info(f"Checkpointed a {name} task received while shutting down")
+                return task.id
+        run = ResumableRun(self, task, handler.func)
+        try:
+            if handler.schedule:
+                handler.schedule(run, payload)
+            else:
+                self.create_task(run())
+        except Exception:
+            run.discard()
+            raise
+        return task.id or None
+
+    def create_task(self, coro: Awaitable[Any]) -> asyncio.Task:
+        """Runs `coro` in a background task of the current context, drained on shutdown."""
+        return self.track(asyncio.get_running_loop().create_task(coro))
+
+    def track(self, task: asyncio.Task) -> asyncio.Task:
+        """Drains `task` on shutdown, e.g. a task started by a scheduler."""
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run(self, run: ResumableRun):
+        store, task = self.checkpoint_store, run.task
+        if store and task.id:
+            set_current_checkpoint(store, task.id)
+        try:
+            await run.func(**task.payload)
+            self._completed += 1
+        except asyncio.CancelledError:
+            if self.draining:
+                raise  # the checkpoint is kept, to resume the task after the restart
+            await asyncio.to_thread(self._delete_checkpoint, task)
+            raise
+        except BaseException:
+            await asyncio.to_thread(self._delete_checkpoint, task)
+            raise
+        await asyncio.to_thread(self._delete_checkpoint, task)
+
+    async def join(self):
+        """Waits until no background task is running, including the tasks started meanwhile (e.g. queued tasks)."""
+        while self._tasks:
+            await asyncio.wait(set(self._tasks))
+
+    def _delete_checkpoint(self, task: CheckpointedTask):
+        if self.checkpoint_store and task.id:
+            try:
+                self.checkpoint_store.delete(task.id)
+            except Exception as e:
+                get_logger().warning(f"Failed to delete the checkpoint of a {task.name} task: {e}")
+
+    async def drain(self, grace_period_seconds: float) -> int:
+        """
+        Stops scheduling new tasks, and waits up to `grace_period_seconds` for the running tasks. The tasks still
+        running are then cancelled, and the unfinished resumable tasks are checkpointed for the next process.
+        Returns the number of cancelled tasks.
+        """
+        self.draining = True
+        start = time.monotonic()
+        running = set(self._tasks)
+        get_logger().info(f"Draining {len(running)} background tasks, for up to {grace_period_seconds} seconds")
+        if running:
+            _, running = await asyncio.wait(running, timeout=grace_period_seconds)
+        for task in running:
+            task.cancel()
+        if running:
+            await asyncio.wait(running, timeout=5)
+        self._cancelled += len(running)
+        if self.checkpoint_store:
+            checkpointed = await asyncio.to_thread(self.checkpoint_store.interrupt, self.owner)
+            self._checkpointed += checkpointed
+            if checkpointed:
+                get_logger().info(f"Checkpointed {checkpointed} unfinished tasks, to be resumed after the restart")
+        get_logger().info(f"Drained the background tasks in {time.monotonic() - start:.1f} seconds, "
+                          f"cancelled {len(running)} tasks")
+        return len(running)
+
+    async def resume_interrupted(self) -> int:
+        """Resumes the tasks interrupted by the shutdown of a previous process, and returns their number."""
+        if not self.checkpoint_store:
+            return 0
+        tasks = await asyncio.to_thread(self.checkpoint_store.claim_interrupted, self.owner,
+                                        self.max_checkpoint_age_seconds)
+        for task in tasks:
+            handler = self._handlers.get(task.name)
+            if handler is None:
+                get_logger().warning(f"Dropping an interrupted task of unknown type {task.name}")
+                self._delete_checkpoint(task)
+                continue
+            get_logger().info(f"Resuming an interrupted {task.name} task")
+            run = ResumableRun(self, task, handler.func)
+            try:
+                # a resumed task does not run in the context of a request
+                with request_cycle_context({}):
+                    if handler.schedule:
+                        handler.schedule(run, task.payload)
+                    else:
+                        self.create_task(run())
+                self._resumed += 1
+            except Exception as e:
+                get_logger().error(f"Failed to resume an interrupted {task.name} task: {e}")
+                run.discard()
+        return len(tasks)
+
+    def metrics(self) -> dict:
+        return {
+            "running": len(self._tasks),
+            "draining": self.draining,
+            "completed": self._completed,
+            "cancelled": self._cancelled,
+            "checkpointed": self._checkpointed,
+            "resumed": self._resumed,
+        }
+
+
+_task_registry = None
+_task_registry_lock = threading.Lock()
+
+
+def get_task_registry() -> TaskRegistry:
+    global _task_registry
+    if _task_registry is None:
+        with _task_registry_lock:
+            if _task_registry is None:
+                checkpoint_store = None
+                if get_settings().get("SERVER.CHECKPOINTS_ENABLED", True):
+                    path = get_settings().get("SERVER.CHECKPOINTS_PATH", "") or \
+                        os.path.join(tempfile.gettempdir(), "pr_agent_checkpoints.sqlite3")
+                    checkpoint_store = CheckpointStore(path)
+                _task_registry = TaskRegistry(
+                    checkpoint_store,
+                    max_checkpoint_age_seconds=get_settings().get("SERVER.MAX_CHECKPOINT_AGE_SECONDS", 3600),
+                )
+    return _task_registry
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    registry = get_task_registry()
+    try:
+        await registry.resume_interrupted()
+    except Exception as e:
+        get_logger().error(f"Failed to resume the interrupted tasks: {e}")
+    yield
+    await registry.drain(get_settings().get("SERVER.SHUTDOWN_GRACE_PERIOD_SECONDS", 120))
+    # imported on shutdown only, as aiohttp is not needed by the servers that do not use the async git providers
+    from pr_agent.git_providers.async_git_provider import \
+        close_async_http_session
+    await close_async_http_session()
+
+
+class _RunTasksInlineMiddleware:
+    """Completes each request only once the background tasks are done, e.g. the tasks that the request submitted."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        await self.app(scope, receive, send)
+        if scope["type"] == "http":
+            await get_task_registry().join()
+
+
+def create_app(*routers: APIRouter, run_tasks_inline: bool = False) -> FastAPI:
+    """
+    Creates the app of a webhook server, which drains its background tasks on shutdown.
+    With run_tasks_inline, e.g. for a serverless function, whose event loop only runs until a request is handled, each
+    request waits for the background tasks before completing: a task left pending would never finish.
+    """
+    middleware = [Middleware(RawContextMiddleware)]
+    if run_tasks_inline:
+        middleware.append(Middleware(_RunTasksInlineMiddleware))
+    app = FastAPI(middleware=middleware, lifespan=_lifespan)
+    for router in routers:
+        app.include_router(router)
+    return app
+
+
+def run_app(app: FastAPI, port: Optional[int] = None):
+    uvicorn.run(app, host="0.0.0.0", port=port or int(os.environ.get("PORT", "3000")),
+                timeout_graceful_shutdown=get_settings().get("SERVER.SHUTDOWN_GRACE_PERIOD_SECONDS", 120))
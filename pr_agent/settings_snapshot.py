@@ -0,0 +1,80 @@
+# Copyright (c) 2023 PR-Agent Authors
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Precompiled snapshot of the default settings files.
+
+Loading the ~20 default TOML files is a large part of the start-up time of PR-Agent: besides parsing them, dynaconf
+looks up a hooks module next to each file, and inspects the call stack to do so. The snapshot is a single JSON file
+holding the merged default settings, generated at build time with:
+
+    python -m pr_agent.settings_snapshot
+
+It is only used while the settings files it was generated from are unchanged, and never holds secrets or environment
+variables: the secrets files and the environment are still loaded on top of it at runtime.
+"""
+
+import hashlib
+import json
+import os
+from importlib.metadata import version
+from typing import Optional
+
+SNAPSHOT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "settings", ".settings_snapshot.json")
+
+
+def _digest_path(snapshot_path: str) -> str:
+    return snapshot_path + ".sha256"
+
+
+def settings_files_digest(settings_files: list[str]) -> str:
+    """Digest of the contents of the settings files, in order, and of the dynaconf version that merges them."""
+    digest = hashlib.sha256(f"dynaconf=={version('dynaconf')}".encode())
+    for settings_file in settings_files:
+        digest.update(os.path.basename(settings_file).encode())
+        try:
+            with open(settings_file, "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+        except FileNotFoundError:
+            digest.update(b"<missing>")
+    return digest.hexdigest()
+
+
+def build_settings_snapshot(settings_files: list[str], snapshot_path: str = SNAPSHOT_PATH) -> str:
+    """Merges the settings files like PR-Agent does, and writes the result to `snapshot_path`."""
+    from dynaconf import Dynaconf
+
+    # no loaders: the environment variables of the build are not part of the snapshot
+    settings = Dynaconf(envvar_prefix=False, merge_enabled=True, settings_files=settings_files, loaders=[])
+    with open(snapshot_path, "w") as f:
+        json.dump(settings.as_dict(), f)
+    with open(_digest_path(snapshot_path), "w") as f:
+        f.write(settings_files_digest(settings_files))
+    return snapshot_path
+
+
+def get_settings_snapshot(settings_files: list[str], snapshot_path: str = SNAPSHOT_PATH) -> Optional[str]:
+    """Returns the path of the snapshot of the settings files, or None if there is no up-to-date snapshot."""
+    try:
+        with open(_digest_path(snapshot_path)) as f:
+            digest = f.read().strip()
+    except FileNotFoundError:
+        return None
+    if not os.path.isfile(snapshot_path) or digest != settings_files_digest(settings_files):
+        return None
+    return snapshot_path
+
+
+if __name__ == "__main__":
+    from pr_agent.config_loader import DEFAULT_SETTINGS_FILES
+    print(f"Settings snapshot written to {build_settings_snapshot(DEFAULT_SETTINGS_FILES)}")
@@ -12,9 +12,14 @@
 # limitations under the License.
 
 import copy
+import hashlib
+import json
 import math
 import os
+import posixpath
 import re
+import threading
+from collections import OrderedDict
 from functools import partial
 from tempfile import TemporaryDirectory
 
@@ -138,14 +143,8 @@ def map_documentation_files_to_contents(base_path: str, doc_files: list[str], ma
             try:
                 with open(file, 'r', encoding='utf-8') as f:
                     content = f.read()
-                    # Skip files with no text content
-                    if not re.search(r'[a-zA-Z]', content):
-                        continue
-                    if len(content) > max_allowed_file_len:
-                        get_logger().warning(f"File {file} length: {len(content)} exceeds limit: {max_allowed_file_len}, so it will be trimmed.")
-                        content = content[:max_allowed_file_len]
                     file_path = str(file).replace(str(base_path), '')
-                    returned_dict[file_path] = content.strip()
+                    _add_documentation_file_contents(returned_dict, file_path, content, max_allowed_file_len)
             except Exception as e:
                 get_logger().warning(f"Error while reading the file {file}: {e}")
                 continue
@@ -156,6 +155,28 @@ def map_documentation_files_to_contents(base_path: str, doc_files: list[str], ma
         get_logger().exception(f"Unexpected exception thrown. Returning empty dict.")
         return {}
 
+# Same as map_documentation_files_to_contents, for documentation files already read from the repo: file path relative to the repo root -> raw contents
+def map_documentation_blobs_to_contents(doc_files_to_blobs: dict[str, bytes], max_allowed_file_len=5000) -> dict[str, str]:
+    returned_dict = {}
+    for file, blob in doc_files_to_blobs.items():
+        try:
+            _add_documentation_file_contents(returned_dict, f"/{file}", blob.decode('utf-8'), max_allowed_file_len)
+        except Exception as e:
+            get_logger().warning(f"Error while reading the file {file}: {e}")
+            continue
+    if not returned_dict:
+        get_logger().error("Couldn't find any usable documentation files. Returning empty dict.")
+    return returned_dict
+
+def _add_documentation_file_contents(returned_dict: dict[str, str], file_path: str, content: str, max_allowed_file_len: int):
+    # Skip files with no text content
+    if not re.search(r'[a-zA-Z]', content):
+        return
+    if len(content) > max_allowed_file_len:
+        get_logger().warning(f"File {file_path} length: {len(content)} exceeds limit: {max_allowed_file_len}, so it will be trimmed.")
+        content = content[:max_allowed_file_len]
+    returned_dict[file_path] = content.strip()
+
 # Goes over files' contents, generating payload for prompt while decorating them with a header to mark where each file begins,
 # as to help the LLM to give a better answer.
 def aggregate_documentation_files_for_prompt_contents(file_path_to_contents: dict[str, str], return_just_headings=False) -> str:
@@ -296,6 +317,79 @@ class PredictionPreparator:
             raise e
 
 
+# The preprocessed documentation of a repo at a given version: file contents, the aggregated prompt, the headings prompt
+# (used for ranking when the full documentation is too long) and the token counts of the prompts built from it.
+# Everything is computed at most once, so that further questions on the same docs version skip all preprocessing.
+class DocsCorpus(object):
+    def __init__(self, docs_filepath_to_contents: dict[str, str]):
+        self.docs_filepath_to_contents = docs_filepath_to_contents
+        self.docs_prompt = aggregate_documentation_files_for_prompt_contents(docs_filepath_to_contents)
+        self._headings_prompt = None
+        self._token_counts: dict[tuple[str, str], int] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def headings_prompt(self) -> str:
+        with self._lock:
+            if self._headings_prompt is None:
+                self._headings_prompt = aggregate_documentation_files_for_prompt_contents(self.docs_filepath_to_contents,
+                                                                                          return_just_headings=True)
+            return self._headings_prompt
+
+    # Accurate token counts may require an API call (e.g. for Claude models), so they are memoized per model and text.
+    def count_tokens(self, token_handler: TokenHandler, text: str) -> int:
+        key = (get_settings().config.model, hashlib.sha256(text.encode()).hexdigest())
+        with self._lock:
+            token_count = self._token_counts.get(key)
+        if token_count is None:
+            token_count = token_handler.count_tokens(text, force_accurate=True)
+            with self._lock:
+                self._token_counts[key] = token_count
+        return token_count
+
+
+# Process-wide LRU cache of documentation corpora, keyed by (repo url, docs path, docs version).
+class DocsCorpusCache(object):
+    def __init__(self, max_entries: int):
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple, DocsCorpus] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: tuple) -> DocsCorpus | None:
+        with self._lock:
+            corpus = self._entries.get(key)
+            if corpus is not None:
+                self._entries.move_to_end(key)
+            return corpus
+
+    def put(self, key: tuple, corpus: DocsCorpus):
+        with self._lock:
+            # only the latest version of the docs of a given repo and path is kept
+            for stale_key in [k for k in self._entries if k[:2] == key[:2] and k != key]:
+                del self._entries[stale_key]
+            self._entries[key] = corpus
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_docs_corpus_cache: DocsCorpusCache | None = None
+_docs_corpus_cache_lock = threading.Lock()
+
+
+def get_docs_corpus_cache() -> DocsCorpusCache:
+    global _docs_corpus_cache
+    if _docs_corpus_cache is None:
+        with _docs_corpus_cache_lock:
+            if _docs_corpus_cache is None:
+                _docs_corpus_cache = DocsCorpusCache(get_settings().get('PR_HELP_DOCS.DOCS_CORPUS_CACHE_SIZE', 16))
+    return _docs_corpus_cache
+
+
 class PRHelpDocs(object):
     def __init__(self, ctx_url, ai_handler:partial[BaseAiHandler,] = LiteLLMAIHandler, args: tuple[str]=None, return_as_string: bool=False):
         try:
@@ -326,6 +420,7 @@ class PRHelpDocs(object):
                 get_logger().debug(f"deduced repo url: {self.repo_url}")
                 self.repo_desired_branch = None #Inferred from the repo provider.
 
+            self.docs_corpus: DocsCorpus | None = None
             self.ai_handler = ai_handler()
             self.vars = {
                 "docs_url": self.repo_url,
@@ -346,11 +441,12 @@ class PRHelpDocs(object):
             return None
 
         try:
-            # Clone the repository and gather relevant documentation files.
-            docs_filepath_to_contents = self._gen_filenames_to_contents_map_from_repo()
+            # Gather relevant documentation files from the repository (or reuse them, if the docs did not change since a previous question).
+            self.docs_corpus = self._get_docs_corpus()
+            docs_filepath_to_contents = self.docs_corpus.docs_filepath_to_contents
 
             #Generate prompt for the AI model. This will be the full text of all the documentation files combined.
-            docs_prompt = aggregate_documentation_files_for_prompt_contents(docs_filepath_to_contents)
+            docs_prompt = self.docs_corpus.docs_prompt
             if not docs_filepath_to_contents or not docs_prompt:
                 get_logger().warning(f"Could not find any usable documentation. Returning with no result...")
                 return None
@@ -432,11 +528,63 @@ class PRHelpDocs(object):
             get_logger().exception(f"Unexpected exception thrown. Returning empty list.")
             return []
 
+    # docs_path relative to the repo root, without leading or trailing '/'. '.' is the repo root itself.
+    def _normalized_docs_path(self) -> str:
+        docs_path = self.docs_path.strip('/')
+        return posixpath.normpath(docs_path) if docs_path else '.'
+
+    def _is_doc_file(self, file_path: str) -> bool:
+        # file_path is relative to the repo root. Mirrors the selection done on a cloned repo: root README files,
+        # plus the files under docs_path with a supported extension (without README files at the root of docs_path, if it is the repo root).
+        dotless_extensions = [ext.lower().lstrip('.') for ext in self.supported_doc_exts]
+        dir_name, file_name = posixpath.split(file_path.lower())
+        if not dir_name and self.include_root_readme_file and file_name.startswith("readme."):
+            return True
+        docs_path = self._normalized_docs_path()
+        if docs_path != '.' and not file_path.startswith(docs_path + '/'):
+            return False
+        if docs_path == '.' and not dir_name and file_name in [f"readme.{ext}" for ext in dotless_extensions]:
+            return False
+        return any(file_name.endswith(f'.{ext}') for ext in dotless_extensions)
+
+    def _get_docs_corpus(self) -> DocsCorpus:
+        # The documentation files are listed from the cached mirror of the repo. Their blob ids identify the version of the docs,
+        # so the corpus built for a previous question is reused as long as the documentation did not change.
+        doc_files = self.git_provider.list_repo_files(self.repo_url, [self.docs_path], self._is_doc_file)
+        if doc_files is None:
+            return DocsCorpus(self._gen_filenames_to_contents_map_from_repo())
+        if not doc_files:
+            get_logger().warning(f"No documentation files found matching file extensions: "
+                                 f"{self.supported_doc_exts} under repo: {self.repo_url} "
+                                 f"path: {self.docs_path}. Returning empty dict.")
+            return DocsCorpus({})
+        docs_version = hashlib.sha256(json.dumps(list(doc_files.items())).encode()).hexdigest()
+        cache_key = (self.repo_url, self.docs_path, docs_version)
+        docs_corpus = get_docs_corpus_cache().get(cache_key)
+        if docs_corpus is not None:
+            get_logger().debug(f"Reusing the documentation of repo: {self.repo_url} path: {self.docs_path}")
+            return docs_corpus
+
+        get_logger().info(f'For context {self.ctx_url} and repo: {self.repo_url}'
+                          f' will be using the following documentation files: ',
+                          artifacts={'doc_files': list(doc_files.keys())})
+        doc_files_to_blobs = self.git_provider.read_repo_files(self.repo_url, doc_files)
+        if doc_files_to_blobs is None:
+            return DocsCorpus(self._gen_filenames_to_contents_map_from_repo())
+        docs_corpus = DocsCorpus(map_documentation_blobs_to_contents(doc_files_to_blobs))
+        if docs_corpus.docs_filepath_to_contents:
+            get_docs_corpus_cache().put(cache_key, docs_corpus)
+        return docs_corpus
+
     def _gen_filenames_to_contents_map_from_repo(self) -> dict[str, str]:
         try:
+            docs_path = self._normalized_docs_path()
             with TemporaryDirectory() as tmp_dir:
                 get_logger().debug(f"About to clone repository: {self.repo_url} to temporary directory: {tmp_dir}...")
-                returned_cloned_repo_root = self.git_provider.clone(self.repo_url, tmp_dir, remove_dest_folder=False)
+                # a sparse checkout of the repo root would only contain the files at the root
+                returned_cloned_repo_root = self.git_provider.clone(
+                    self.repo_url, tmp_dir, remove_dest_folder=False,
+                    sparse_paths=None if docs_path == '.' else [docs_path])
                 if not returned_cloned_repo_root:
                     raise Exception(f"Failed to clone {self.repo_url} to {tmp_dir}")
 
@@ -449,10 +597,10 @@ class PRHelpDocs(object):
                             for file in files:
                                 if file.lower().startswith("readme."):
                                     doc_files.append(os.path.join(root, file))
-                abs_docs_path = os.path.join(returned_cloned_repo_root.path, self.docs_path)
+                abs_docs_path = os.path.normpath(os.path.join(returned_cloned_repo_root.path, docs_path))
                 if os.path.exists(abs_docs_path):
                     doc_files.extend(self._find_all_document_files_matching_exts(abs_docs_path,
-                                                                                 ignore_readme=(self.docs_path=='.')))
+                                                                                 ignore_readme=(docs_path=='.')))
                     if not doc_files:
                         get_logger().warning(f"No documentation files found matching file extensions: "
                                              f"{self.supported_doc_exts} under repo: {self.repo_url} "
@@ -477,7 +625,10 @@ class PRHelpDocs(object):
                     return True
                 docs_input = docs_input[:max_allowed_txt_input]
             # Then, count the tokens in the prompt. If the count exceeds the limit, trim the text.
-            token_count = self.token_handler.count_tokens(docs_input, force_accurate=True)
+            if self.docs_corpus:
+                token_count = self.docs_corpus.count_tokens(self.token_handler, docs_input)
+            else:
+                token_count = self.token_handler.count_tokens(docs_input, force_accurate=True)
             get_logger().debug(f"Estimated token count of documentation to send to model: {token_count}")
             model = get_settings().config.model
             if model in MAX_TOKENS:
@@ -508,9 +659,12 @@ class PRHelpDocs(object):
     async def _rank_docs_and_return_them_as_prompt(self, docs_filepath_to_contents: dict[str, str], max_allowed_txt_input: int) -> str:
         try:
             #Return just file name and their headings (if exist):
-            docs_prompt_to_send_to_model = (
-                aggregate_documentation_files_for_prompt_contents(docs_filepath_to_contents,
-                                                                  return_just_headings=True))
+            if self.docs_corpus and self.docs_corpus.docs_filepath_to_contents is docs_filepath_to_contents:
+                docs_prompt_to_send_to_model = self.docs_corpus.headings_prompt
+            else:
+                docs_prompt_to_send_to_model = (
+                    aggregate_documentation_files_for_prompt_contents(docs_filepath_to_contents,
+                                                                      return_just_headings=True))
             # Verify list of headings does not exceed limits - trim it if it does.
             docs_prompt_to_send_to_model = self._trim_docs_input(docs_prompt_to_send_to_model, max_allowed_txt_input,
                                                                  only_return_if_trim_needed=False)
@@ -57,11 +57,14 @@ class PRReviewer:
             ai_handler (BaseAiHandler): The AI handler to be used for the review. Defaults to None.
             args (list, optional): List of arguments passed to the PRReviewer class. Defaults to None.
         """
-        self.git_provider = get_git_provider_with_context(pr_url)
         self.args = args
         self.incremental = self.parse_incremental(args)  # -i command
         if self.incremental and self.incremental.is_incremental:
+            # an incremental review changes the files of its provider, which is not shared with the other tools
+            self.git_provider = get_git_provider()(pr_url)
             self.git_provider.get_incremental_commits(self.incremental)
+        else:
+            self.git_provider = get_git_provider_with_context(pr_url)
 
         self.main_language = get_main_pr_language(
             self.git_provider.get_languages(), self.git_provider.get_files()
@@ -0,0 +1,72 @@
+"""
+Benchmark the cold import time of the entry points of PR-Agent, with `python -X importtime` in fresh interpreters.
+Reports the best total import time of each entry point out of several runs, the modules with the largest own import
+time, and whether modules that should only be imported on first use (e.g. litellm) were imported.
+Exits with a non-zero status if an entry point exceeds `--max-ms`, or imports a deferred module, so that it can be used
+as a regression check.
+Build the settings snapshot first (`python -m pr_agent.settings_snapshot`) to measure the import time of a deployment.
+
+Usage:
+    python tests/benchmarks/benchmark_import_time.py [--runs 5] [--top 10] [--max-ms 0]
+"""
+import argparse
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+
+ENTRY_POINTS = ["pr_agent.servers.serverless", "pr_agent.servers.github_app", "pr_agent.cli"]
+# modules that are expensive to import, and are only needed when a tool runs
+DEFERRED_MODULES = ["litellm", "openai", "tiktoken", "pr_agent.tools.pr_reviewer", "pr_agent.tools.pr_rag_engine"]
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _import_times(module: str) -> dict[str, tuple[int, int]]:
+    """Returns the (own, cumulative) import time in microseconds of each module imported by `module`."""
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT)
+    # run outside the repository, whose pyproject.toml would otherwise be loaded as the settings of a reviewed project
+    with tempfile.TemporaryDirectory() as cwd:
+        result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], cwd=cwd, env=env,
+                                capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, cumulative, name = line[len("import time:"):].split("|")
+        if own.strip().isdigit():
+            times[name.strip()] = (int(own), int(cumulative))
+    return times
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    parser.add_argument("--max-ms", type=float, default=0, help="fail if an entry point takes longer (0: no limit)")
+    args = parser.parse_args()
+
+    failed = False
+    for entry_point in ENTRY_POINTS:
+        if entry_point.endswith("serverless") and importlib.util.find_spec("mangum") is None:
+            print(f"{entry_point}: skipped, mangum is not installed\n")
+            continue
+        runs = [_import_times(entry_point) for _ in range(args.runs)]
+        best = min(runs, key=lambda times: times[entry_point][1])
+        total_ms = best[entry_point][1] / 1000
+        print(f"{entry_point}: {total_ms:.0f} ms (best of {args.runs}), {len(best)} modules")
+        for name, (own, _) in sorted(best.items(), key=lambda item: item[1][0], reverse=True)[:args.top]:
+            print(f"{own / 1000:>10.1f} ms  {name}")
+        deferred = [name for name in DEFERRED_MODULES if name in best]
+        if deferred:
+            print(f"imports deferred modules: {', '.join(deferred)}")
+            failed = True
+        if args.max_ms and total_ms > args.max_ms:
+            print(f"exceeds the limit of {args.max_ms:.0f} ms")
+            failed = True
+        print()
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
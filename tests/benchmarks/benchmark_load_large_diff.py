@@ -0,0 +1,60 @@
+"""
+Benchmark the patch generation backends of load_large_diff: difflib vs 'git diff --no-index'.
+
+Usage:
+    python tests/benchmarks/benchmark_load_large_diff.py [--sizes 1000 10000 100000] [--edit-ratio 0.2]
+"""
+import argparse
+import difflib
+import random
+import time
+
+from pr_agent.algo.utils import _git_diff_no_index
+
+
+def _make_versions(num_lines: int, edit_ratio: float, seed: int = 0) -> tuple[str, str]:
+    rng = random.Random(seed)
+    original = [f"    value_{i} = compute({rng.randint(0, 10 ** 6)})\n" for i in range(num_lines)]
+    new = []
+    for line in original:
+        r = rng.random()
+        if r < edit_ratio / 3:
+            continue  # deleted line
+        elif r < 2 * edit_ratio / 3:
+            new.append(line.replace("compute", "recompute"))  # modified line
+        elif r < edit_ratio:
+            new.append(line)
+            new.append(f"    extra = compute({rng.randint(0, 10 ** 6)})\n")  # added line
+        else:
+            new.append(line)
+    return "".join(original), "".join(new)
+
+
+def _time(func, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--edit-ratio", type=float, default=0.2)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'lines':>8} {'difflib [s]':>12} {'git [s]':>10} {'speedup':>8}")
+    for size in args.sizes:
+        original, new = _make_versions(size, args.edit_ratio)
+        original_lines = original.splitlines(keepends=True)
+        new_lines = new.splitlines(keepends=True)
+        difflib_time = _time(lambda: "".join(difflib.unified_diff(original_lines, new_lines)), args.repeat)
+        git_time = _time(lambda: _git_diff_no_index(original, new, timeout=600), args.repeat)
+        print(f"{size:>8} {difflib_time:>12.3f} {git_time:>10.3f} {difflib_time / git_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
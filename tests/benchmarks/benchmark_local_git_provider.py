@@ -0,0 +1,80 @@
+"""
+Benchmark reading the file contents of a local diff: one GitPython stream per blob vs a single 'git cat-file --batch'.
+
+Usage:
+    python tests/benchmarks/benchmark_local_git_provider.py [--files 1000] [--lines 200]
+"""
+import argparse
+import os
+import subprocess
+import tempfile
+import time
+
+from git import Repo
+
+from pr_agent.git_providers.git_blob_reader import GitBlobReader
+
+
+def _git(*args, cwd):
+    subprocess.run(["git", "-c", "user.email=bench@bench", "-c", "user.name=bench", *args],
+                   cwd=cwd, check=True, capture_output=True)
+
+
+def _make_repo(path: str, num_files: int, num_lines: int):
+    _git("init", "-q", "-b", "main", cwd=path)
+    for i in range(num_files):
+        with open(os.path.join(path, f"file_{i}.py"), "w") as f:
+            f.writelines(f"value_{j} = {i * j}\n" for j in range(num_lines))
+    _git("add", ".", cwd=path)
+    _git("commit", "-q", "-m", "initial", cwd=path)
+    _git("checkout", "-q", "-b", "feature", cwd=path)
+    for i in range(num_files):
+        with open(os.path.join(path, f"file_{i}.py"), "a") as f:
+            f.write(f"extra = {i}\n")
+    _git("add", ".", cwd=path)
+    _git("commit", "-q", "-m", "feature", cwd=path)
+
+
+def _read_with_gitpython(diffs) -> int:
+    total = 0
+    for diff_item in diffs:
+        for blob in (diff_item.a_blob, diff_item.b_blob):
+            if blob is not None:
+                total += len(blob.data_stream.read().decode('utf-8'))
+    return total
+
+
+def _read_with_blob_reader(repo_path: str, diffs) -> int:
+    object_ids = [blob.hexsha for diff_item in diffs for blob in (diff_item.a_blob, diff_item.b_blob) if blob is not None]
+    with GitBlobReader(repo_path) as blob_reader:
+        blobs = blob_reader.read_many(object_ids)
+    return sum(len(blob.decode('utf-8')) for blob in blobs.values() if blob is not None)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=1000)
+    parser.add_argument("--lines", type=int, default=200)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as repo_path:
+        _make_repo(repo_path, args.files, args.lines)
+        repo = Repo(repo_path)
+        diffs = repo.merge_base(repo.head, "main")[0].diff(repo.head.commit, create_patch=True, R=True)
+
+        start = time.perf_counter()
+        gitpython_total = _read_with_gitpython(diffs)
+        gitpython_time = time.perf_counter() - start
+
+        start = time.perf_counter()
+        blob_reader_total = _read_with_blob_reader(repo_path, diffs)
+        blob_reader_time = time.perf_counter() - start
+        repo.close()
+
+    assert gitpython_total == blob_reader_total
+    print(f"{'files':>6} {'gitpython [s]':>14} {'cat-file --batch [s]':>21} {'speedup':>8}")
+    print(f"{len(diffs):>6} {gitpython_time:>14.3f} {blob_reader_time:>21.3f} {gitpython_time / blob_reader_time:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark applying the repo settings file ('.pr_agent.toml') for a burst of events on the same repo:
+without caching (the file is fetched and parsed for every event) vs with the process-wide repo settings cache.
+Fetching the file from the git provider is simulated with a fixed latency.
+
+Usage:
+    python tests/benchmarks/benchmark_repo_settings.py [--events 200] [--fetch-latency-ms 50]
+"""
+import argparse
+import time
+from unittest.mock import MagicMock, patch
+
+from pr_agent.algo.request_cache import request_scope
+from pr_agent.config_loader import SettingsOverlay, global_settings
+from pr_agent.git_providers import utils
+from pr_agent.git_providers.utils import RepoSettingsCache, apply_repo_settings
+from pr_agent.log import setup_logger
+
+REPO_SETTINGS = b"""
+[config]
+ignore_pr_labels = ["wip", "do-not-review"]
+
+[pr_reviewer]
+num_max_findings = 5
+require_security_review = true
+extra_instructions = "Focus on error handling and on the public API."
+
+[pr_description]
+generate_ai_title = true
+enable_pr_diagram = false
+
+[pr_code_suggestions]
+suggestions_score_threshold = 7
+focus_only_on_problems = true
+"""
+
+
+def _microseconds_per_event(cache: RepoSettingsCache, num_events: int, fetch_latency: float) -> float:
+    def get_repo_settings():
+        time.sleep(fetch_latency)
+        return REPO_SETTINGS
+
+    git_provider = MagicMock()
+    git_provider.get_repo_settings_cache_key.return_value = "https://github.com/owner/repo"
+    git_provider.get_repo_settings.side_effect = get_repo_settings
+    elapsed = 0.0
+    with patch.object(utils, "get_git_provider_with_context", return_value=git_provider), \
+            patch.object(utils, "get_repo_settings_cache", return_value=cache):
+        for _ in range(num_events):
+            settings = SettingsOverlay(global_settings)  # a fresh per-request settings object, as in the webhooks
+            with patch.object(utils, "get_settings", return_value=settings), request_scope():
+                start = time.perf_counter()
+                apply_repo_settings("https://github.com/owner/repo/pull/1")
+                elapsed += time.perf_counter() - start
+    return elapsed / num_events * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--events", type=int, default=200)
+    parser.add_argument("--fetch-latency-ms", type=float, default=50)
+    args = parser.parse_args()
+
+    setup_logger(level="WARNING")
+    fetch_latency = args.fetch_latency_ms / 1000
+    results = {}
+    for name, cache in [("uncached", RepoSettingsCache(ttl_seconds=0, max_entries=0)),
+                        ("cached", RepoSettingsCache(ttl_seconds=60, max_entries=1024))]:
+        _microseconds_per_event(cache, 5, fetch_latency)  # warm up
+        results[name] = _microseconds_per_event(cache, args.events, fetch_latency)
+    print(f"{'cache':>10} {'us/event':>10}")
+    for name, microseconds in results.items():
+        print(f"{name:>10} {microseconds:>10.0f}")
+    print(f"speedup: {results['uncached'] / results['cached']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark DefaultDictWithTimeout with a large number of keys (e.g. the PRs seen by a long-lived webhook worker):
+the previous implementation, which scanned every key on each refresh, vs the current one, which keeps the keys in
+expiry order. Time is simulated: each operation advances the clock by `--step-ms`, and touches a new key, so that
+about ttl / step keys are live at any time.
+Reports the throughput, the slowest operation (a refresh of the previous implementation scans all the live keys),
+and the number of keys left.
+
+Usage:
+    python tests/benchmarks/benchmark_ttl_dict.py [--keys 100000] [--ttl 60] [--step-ms 1] [--refresh-interval 1]
+"""
+import argparse
+import gc
+import time
+from collections import defaultdict
+from unittest.mock import patch
+
+from pr_agent.servers.utils import DefaultDictWithTimeout
+
+
+class ScanningDefaultDictWithTimeout(defaultdict):
+    """The previous implementation, with its refresh condition fixed: each refresh scans every key."""
+
+    def __init__(self, default_factory=None, ttl=None, refresh_interval=60, update_key_time_on_get=True):
+        super().__init__(default_factory)
+        self.__key_times = dict()
+        self.__ttl = ttl
+        self.__refresh_interval = refresh_interval
+        self.__update_key_time_on_get = update_key_time_on_get
+        self.__last_refresh = time.monotonic() - self.__refresh_interval
+
+    def __refresh(self):
+        if self.__ttl is None:
+            return
+        request_time = time.monotonic()
+        if request_time - self.__last_refresh < self.__refresh_interval:
+            return
+        to_delete = [key for key, key_time in self.__key_times.items() if request_time - key_time > self.__ttl]
+        for key in to_delete:
+            del self[key]
+        self.__last_refresh = request_time
+
+    def __getitem__(self, __key):
+        if self.__update_key_time_on_get:
+            self.__key_times[__key] = time.monotonic()
+        self.__refresh()
+        return super().__getitem__(__key)
+
+    def __setitem__(self, __key, __value):
+        self.__key_times[__key] = time.monotonic()
+        return super().__setitem__(__key, __value)
+
+    def __delitem__(self, __key):
+        del self.__key_times[__key]
+        return super().__delitem__(__key)
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def _run(ttl_dict, num_keys: int, step: float, clock: _Clock) -> tuple[float, float]:
+    """Touches `num_keys` new keys, and returns the operations per second and the slowest operation in ms."""
+    slowest = 0.0
+    gc.collect()
+    gc.disable()  # so that the slowest operation is not a garbage collection
+    try:
+        start = time.perf_counter()
+        for i in range(num_keys):
+            clock.now += step
+            op_start = time.perf_counter()
+            ttl_dict[f"https://github.com/owner/repo/pull/{i}"].append(i)
+            slowest = max(slowest, time.perf_counter() - op_start)
+        elapsed = time.perf_counter() - start
+    finally:
+        gc.enable()
+    return num_keys / elapsed, slowest * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keys", type=int, default=100_000)
+    parser.add_argument("--ttl", type=float, default=60)
+    parser.add_argument("--step-ms", type=float, default=1)
+    parser.add_argument("--refresh-interval", type=float, default=1)
+    args = parser.parse_args()
+
+    step = args.step_ms / 1000
+    implementations = {
+        "scanning": lambda: ScanningDefaultDictWithTimeout(list, ttl=args.ttl, refresh_interval=args.refresh_interval),
+        "ordered": lambda: DefaultDictWithTimeout(list, ttl=args.ttl, refresh_interval=args.refresh_interval),
+        "ordered, refresh on each op": lambda: DefaultDictWithTimeout(list, ttl=args.ttl, refresh_interval=0),
+        "ordered, max_size 10k": lambda: DefaultDictWithTimeout(list, ttl=args.ttl,
+                                                                refresh_interval=args.refresh_interval,
+                                                                max_size=10_000),
+    }
+    print(f"{args.keys} keys, ttl {args.ttl:.0f}s, one key every {args.step_ms} ms, "
+          f"refresh every {args.refresh_interval}s")
+    print(f"{'implementation':>28} {'ops/s':>10} {'slowest op (ms)':>16} {'keys left':>10}")
+    for name, create in implementations.items():
+        clock = _Clock()
+        with patch("time.monotonic", clock):
+            ttl_dict = create()
+            ops_per_second, slowest_ms = _run(ttl_dict, args.keys, step, clock)
+        print(f"{name:>28} {ops_per_second:>10.0f} {slowest_ms:>16.2f} {len(ttl_dict):>10}")
+
+
+if __name__ == "__main__":
+    main()
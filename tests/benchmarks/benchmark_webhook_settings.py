@@ -0,0 +1,63 @@
+"""
+Benchmark the GitHub webhook endpoint with per-request settings: a copy-on-write overlay vs a deep copy of the settings.
+The request handling itself (the background task) is stubbed out - this measures the per-webhook overhead only.
+
+Usage:
+    python tests/benchmarks/benchmark_webhook_settings.py [--requests 500]
+"""
+import argparse
+import copy
+import time
+
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.middleware import Middleware
+from starlette_context.middleware import RawContextMiddleware
+
+from pr_agent.config_loader import SettingsOverlay, global_settings
+from pr_agent.log import setup_logger
+from pr_agent.servers import github_app
+
+REPO_URL = "https://github.com/owner/repo"
+
+
+async def _handle_request(body, event):
+    pass
+
+
+def _requests_per_second(client: TestClient, num_requests: int) -> float:
+    body = {"repository": {"html_url": REPO_URL}, "installation": {"id": 1}, "action": "opened"}
+    headers = {"X-GitHub-Event": "pull_request"}
+    start = time.perf_counter()
+    for _ in range(num_requests):
+        response = client.post("/api/v1/github_webhooks", json=body, headers=headers)
+        assert response.status_code == 200, response.text
+    return num_requests / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=500)
+    args = parser.parse_args()
+
+    setup_logger(level="WARNING")
+    global_settings.set("ALLOWED_REPOS", [REPO_URL])
+    global_settings.set("GITHUB.WEBHOOK_SECRET", "")
+    github_app.handle_request = _handle_request
+    app = FastAPI(middleware=[Middleware(RawContextMiddleware)])
+    app.include_router(github_app.router)
+    client = TestClient(app)
+
+    results = {}
+    for name, make_settings in [("deepcopy", copy.deepcopy), ("overlay", SettingsOverlay)]:
+        github_app.SettingsOverlay = make_settings
+        _requests_per_second(client, 10)  # warm up
+        results[name] = _requests_per_second(client, args.requests)
+    print(f"{'settings':>10} {'requests/s':>11}")
+    for name, requests_per_second in results.items():
+        print(f"{name:>10} {requests_per_second:>11.0f}")
+    print(f"speedup: {results['overlay'] / results['deepcopy']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
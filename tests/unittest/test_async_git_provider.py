@@ -0,0 +1,228 @@
+import asyncio
+import json
+import threading
+from unittest.mock import MagicMock, patch
+
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+from github import Auth
+from starlette_context import context, request_cycle_context
+
+from pr_agent.algo.types import EDIT_TYPE
+from pr_agent.config_loader import get_settings
+from pr_agent.git_providers import async_git_provider, async_github_provider
+from pr_agent.git_providers.async_git_provider import (ThreadedGitProvider,
+                                                       close_async_http_session,
+                                                       gather_bounded,
+                                                       get_async_http_session,
+                                                       run_in_thread)
+from pr_agent.git_providers.async_github_provider import AsyncGithubProvider
+from pr_agent.git_providers.async_gitlab_provider import AsyncGitLabProvider
+
+
+class _FakeApi:
+    """
+    A git server answering from canned responses, keyed by method and raw path (with the query string). A response is
+    a JSON value, bytes, or a (json, headers) tuple. The requests are recorded, with their JSON body and auth header.
+    """
+
+    def __init__(self):
+        self.responses = {}
+        self.requests = []
+        app = web.Application()
+        app.router.add_route("*", "/{tail:.*}", self._handle)
+        self.server = TestServer(app)
+
+    @property
+    def url(self) -> str:
+        return str(self.server.make_url("")).rstrip("/")
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        body = await request.json() if request.can_read_body else None
+        self.requests.append((request.method, request.raw_path, body, request.headers.get("Authorization")))
+        response = self.responses.get((request.method, request.raw_path))
+        if response is None:
+            return web.Response(status=404, text="not found")
+        if isinstance(response, bytes):
+            return web.Response(body=response)
+        payload, headers = response if isinstance(response, tuple) else (response, {})
+        return web.Response(text=json.dumps(payload), headers=headers, content_type="application/json")
+
+
+def _run_with_api(test):
+    """Runs `test(api)` against a fake git server, on a fresh event loop."""
+
+    async def run():
+        api = _FakeApi()
+        await api.server.start_server()
+        try:
+            return await test(api)
+        finally:
+            await close_async_http_session()
+            await api.server.close()
+
+    return asyncio.run(run())
+
+
+class TestThreadedGitProvider:
+    def test_calls_run_off_the_event_loop(self):
+        loop_thread = threading.get_ident()
+        sync_provider = MagicMock()
+        sync_provider.get_files.side_effect = lambda: threading.get_ident()
+
+        async def run():
+            return await ThreadedGitProvider(sync_provider).get_files()
+
+        assert asyncio.run(run()) != loop_thread
+
+    def test_unknown_methods_are_awaitable(self):
+        sync_provider = MagicMock()
+        sync_provider.get_repo_settings.return_value = b"[config]"
+        sync_provider.pr_url = "https://github.com/owner/repo/pull/1"
+        provider = ThreadedGitProvider(sync_provider)
+
+        async def run():
+            return await provider.get_repo_settings()
+
+        assert asyncio.run(run()) == b"[config]"
+        assert provider.pr_url == "https://github.com/owner/repo/pull/1"
+
+    def test_request_context_is_visible_in_thread(self):
+        async def run():
+            with request_cycle_context({"installation_id": 42}):
+                return await run_in_thread(lambda: context.get("installation_id"))
+
+        assert asyncio.run(run()) == 42
+
+
+class TestGatherBounded:
+    def test_limits_concurrency_and_preserves_order(self):
+        in_flight = 0
+        max_in_flight = 0
+
+        async def task(i):
+            nonlocal in_flight, max_in_flight
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.01)
+            in_flight -= 1
+            return i
+
+        results = asyncio.run(gather_bounded([task(i) for i in range(10)], limit=3))
+        assert results == list(range(10))
+        assert max_in_flight == 3
+
+
+class TestAsyncHttpSession:
+    def test_sessions_of_closed_loops_are_dropped(self):
+        async def get_session():
+            return get_async_http_session()
+
+        first = asyncio.run(get_session())
+        second = asyncio.run(get_session())
+        assert first is not second and first.closed
+        assert list(async_git_provider._http_sessions.values()) == [second]
+        asyncio.run(close_async_http_session())
+
+    def test_session_is_closed_on_shutdown(self):
+        async def run():
+            session = get_async_http_session()
+            await close_async_http_session()
+            return session
+
+        assert asyncio.run(run()).closed
+
+
+class TestAsyncGithubProvider:
+    @staticmethod
+    def _provider(api: _FakeApi) -> AsyncGithubProvider:
+        github_provider = MagicMock(base_url=api.url, auth=Auth.Token("token"))
+        github_provider._parse_pr_url.return_value = ("owner/repo", 1)
+        with patch.object(async_github_provider, "GithubProvider", return_value=github_provider):
+            return AsyncGithubProvider("https://github.com/owner/repo/pull/1")
+
+    def test_diff_files_are_built_from_paginated_files_and_contents(self):
+        async def test(api):
+            repo = "/repos/owner/repo"
+            api.responses.update({
+                ("GET", f"{repo}/pulls/1"): {"title": "Fix", "body": None, "head": {"sha": "head", "ref": "feature"},
+                                             "base": {"sha": "base"}, "labels": [{"name": "bug"}]},
+                ("GET", f"{repo}/pulls/1/files?per_page=100"): (
+                    [{"filename": "src/a.py", "status": "modified", "patch": "@@ -1 +1 @@\n-a\n+b",
+                      "additions": 1, "deletions": 1}],
+                    {"Link": f'<{api.url}{repo}/pulls/1/files?per_page=100&page=2>; rel="next"'}),
+                ("GET", f"{repo}/pulls/1/files?per_page=100&page=2"): [
+                    {"filename": "src/b.py", "status": "added", "patch": "@@ -0,0 +1 @@\n+c",
+                     "additions": 1, "deletions": 0}],
+                ("GET", f"{repo}/compare/base...head"): {"merge_base_commit": {"sha": "merge_base"}},
+                ("GET", f"{repo}/contents/src/a.py?ref=head"): b"b\n",
+                ("GET", f"{repo}/contents/src/a.py?ref=merge_base"): b"a\n",
+                ("GET", f"{repo}/contents/src/b.py?ref=head"): b"c\n",
+            })
+            provider = self._provider(api)
+            return await provider.get_diff_files(), await provider.get_title(), await provider.get_pr_branch(), \
+                await provider.get_pr_description_full(), await provider.get_pr_labels(), api.requests
+
+        diff_files, title, branch, description, labels, requests = _run_with_api(test)
+        assert [(f.filename, f.edit_type, f.head_file, f.base_file) for f in diff_files] == [
+            ("src/a.py", EDIT_TYPE.MODIFIED, "b\n", "a\n"),
+            # the base version of an added file does not exist
+            ("src/b.py", EDIT_TYPE.ADDED, "c\n", ""),
+        ]
+        assert (title, branch, description, labels) == ("Fix", "feature", "", ["bug"])
+        # the PR is fetched once, with the token of the provider
+        assert [request[1] for request in requests].count("/repos/owner/repo/pulls/1") == 1
+        assert {request[3] for request in requests} == {"token token"}
+
+    def test_publish_and_errors(self):
+        async def test(api):
+            api.responses[("POST", "/repos/owner/repo/issues/1/comments")] = {"id": 7}
+            provider = self._provider(api)
+            comment = await provider.publish_comment("x" * 70000)
+            try:
+                await provider.get_title()
+            except async_git_provider.AsyncGitProviderError as e:
+                return comment, api.requests[0][2], e.status
+
+        comment, body, status = _run_with_api(test)
+        assert comment == {"id": 7, "is_temporary": False}
+        assert len(body["body"]) == 65003 and body["body"].endswith("...")
+        assert status == 404
+
+
+class TestAsyncGitLabProvider:
+    @staticmethod
+    def _provider(api: _FakeApi) -> AsyncGitLabProvider:
+        settings = get_settings()
+        with patch.dict(settings.gitlab, {"url": api.url, "personal_access_token": "token"}):
+            return AsyncGitLabProvider("https://gitlab.com/group/project/-/merge_requests/1")
+
+    def test_diff_files_are_built_from_changes_and_contents(self):
+        async def test(api):
+            mr = "/api/v4/projects/group%2Fproject/merge_requests/1"
+            api.responses.update({
+                ("GET", mr): {"title": "Fix", "description": "desc", "source_branch": "feature", "labels": ["bug"],
+                              "diff_refs": {"base_sha": "base", "head_sha": "head"}},
+                ("GET", f"{mr}/changes"): {"changes": [
+                    {"old_path": "src/old.py", "new_path": "src/a.py", "diff": "@@ -1 +1 @@\n-a\n+b\n",
+                     "new_file": False, "deleted_file": False, "renamed_file": True}]},
+                ("GET", "/api/v4/projects/group%2Fproject/repository/files/src%2Fold.py/raw?ref=base"): b"a\n",
+                ("GET", "/api/v4/projects/group%2Fproject/repository/files/src%2Fa.py/raw?ref=head"): b"b\n",
+                ("GET", f"{mr}/notes?per_page=100"): [{"id": 2}, {"id": 1}],
+            })
+            provider = self._provider(api)
+            return await provider.get_diff_files(), await provider.get_files(), \
+                await provider.get_issue_comments(), api.requests
+
+        diff_files, files, comments, requests = _run_with_api(test)
+        [diff_file] = diff_files
+        assert (diff_file.filename, diff_file.old_filename, diff_file.edit_type) == \
+            ("src/a.py", "src/old.py", EDIT_TYPE.RENAMED)
+        assert (diff_file.base_file, diff_file.head_file) == ("a\n", "b\n")
+        assert (diff_file.num_plus_lines, diff_file.num_minus_lines) == (1, 1)
+        assert files == ["src/a.py"]
+        assert comments == [{"id": 1}, {"id": 2}]
+        # the changes of the MR are fetched once
+        changes_path = "/api/v4/projects/group%2Fproject/merge_requests/1/changes"
+        assert [request[1] for request in requests].count(changes_path) == 1
+        assert {request[3] for request in requests} == {"Bearer token"}
@@ -0,0 +1,98 @@
+import io
+import zipfile
+from unittest.mock import MagicMock, patch
+
+from azure.devops.v7_0.git.models import GitItem
+
+from pr_agent.algo.types import EDIT_TYPE
+from pr_agent.git_providers import azuredevops_provider
+from pr_agent.git_providers.azuredevops_provider import (AzureDevopsProvider,
+                                                         _git_blob_id)
+
+
+def _change(path, change_type):
+    return MagicMock(additional_properties={"item": {"path": path}, "changeType": change_type})
+
+
+def _zip(*contents):
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w") as archive:
+        for i, content in enumerate(contents):
+            archive.writestr(f"blob_{i}", content)
+    return buffer.getvalue()
+
+
+class TestAzureDevopsProviderDiffFiles:
+    def _provider(self, client):
+        provider = AzureDevopsProvider.__new__(AzureDevopsProvider)
+        provider.azure_devops_client = client
+        provider.diff_files = None
+        provider.workspace_slug = "project"
+        provider.repo_slug = "repo"
+        provider.pr_num = 1
+        provider.pr = MagicMock()
+        provider.pr.last_merge_target_commit.commit_id = "base"
+        provider.pr.last_merge_source_commit.commit_id = "head"
+        return provider
+
+    def test_contents_are_fetched_in_batches(self):
+        files = {("a.py", "base"): b"a = 1\n", ("a.py", "head"): b"a = 2\n", ("b.py", "head"): b"b = 1\n",
+                 ("c.py", "base"): b"c = 1\n"}
+        client = MagicMock()
+        client.get_pull_request_iterations.return_value = [MagicMock(id=1)]
+        client.get_pull_request_iteration_changes.return_value.change_entries = [
+            _change("a.py", "edit"), _change("b.py", "add"), _change("c.py", "delete")]
+        client.get_items_batch.side_effect = lambda request_data, **kwargs: [
+            [GitItem(path=d.path, object_id=_git_blob_id(files[(d.path, d.version)]), git_object_type="blob")]
+            for d in request_data.item_descriptors]
+        # the batch is missing the blob of b.py - it is fetched as a single item instead
+        client.get_blobs_zip.return_value = iter([_zip(files[("a.py", "base")], files[("a.py", "head")],
+                                                       files[("c.py", "base")], b"unexpected entry")])
+        client.get_item.return_value.content = "b = 1\n"
+
+        diff_files = {file.filename: file for file in self._provider(client).get_diff_files()}
+
+        assert client.get_items_batch.call_count == 1
+        assert client.get_blobs_zip.call_count == 1
+        client.get_item.assert_called_once()
+        assert client.get_item.call_args.kwargs["path"] == "b.py"
+        assert diff_files["a.py"].base_file == "a = 1\n"
+        assert diff_files["a.py"].head_file == "a = 2\n"
+        assert "+a = 2" in diff_files["a.py"].patch
+        assert diff_files["b.py"].edit_type == EDIT_TYPE.ADDED
+        assert diff_files["b.py"].head_file == "b = 1\n"
+        assert diff_files["c.py"].edit_type == EDIT_TYPE.DELETED
+        assert diff_files["c.py"].base_file == "c = 1\n"
+        assert diff_files["c.py"].head_file == ""
+
+    def test_falls_back_to_concurrent_item_requests(self):
+        client = MagicMock()
+        client.get_pull_request_iterations.return_value = [MagicMock(id=1)]
+        client.get_pull_request_iteration_changes.return_value.change_entries = [
+            _change(f"file_{i}.py", "add") for i in range(20)]
+        client.get_items_batch.side_effect = Exception("not supported")
+        client.get_item.side_effect = lambda path, **kwargs: MagicMock(content=f"# {path}\n")
+
+        diff_files = self._provider(client).get_diff_files()
+
+        assert len(diff_files) == 20
+        assert client.get_item.call_count == 20
+        client.get_blobs_zip.assert_not_called()
+        assert all(file.head_file == f"# {file.filename}\n" for file in diff_files)
+
+
+class TestAzureDevopsClientReuse:
+    def test_connection_is_reused_until_the_token_changes(self):
+        settings = MagicMock()
+        settings.azure_devops.get.side_effect = lambda key, default=None: {"org": "https://dev.azure.com/org",
+                                                                            "pat": "token"}.get(key, default)
+        with patch.object(azuredevops_provider, "get_settings", return_value=settings), \
+                patch.object(azuredevops_provider, "Connection") as connection, \
+                patch.dict(azuredevops_provider._azure_devops_clients, clear=True):
+            first = AzureDevopsProvider._get_azure_devops_client()
+            assert AzureDevopsProvider._get_azure_devops_client() is first
+            assert connection.call_count == 1
+            settings.azure_devops.get.side_effect = lambda key, default=None: {"org": "https://dev.azure.com/org",
+                                                                                "pat": "rotated"}.get(key, default)
+            AzureDevopsProvider._get_azure_devops_client()
+            assert connection.call_count == 2
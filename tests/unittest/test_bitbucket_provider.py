@@ -11,13 +11,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from unittest.mock import MagicMock
+from unittest.mock import MagicMock, patch
 
 from atlassian.bitbucket import Bitbucket
 
 from pr_agent.algo.types import EDIT_TYPE, FilePatchInfo
 from pr_agent.git_providers import BitbucketServerProvider
-from pr_agent.git_providers.bitbucket_provider import BitbucketProvider
+from pr_agent.git_providers.bitbucket_provider import (BitbucketProvider,
+                                                       _decode_patch,
+                                                       _strip_patch_header,
+                                                       _split_diff_per_file)
 
 
 class TestBitbucketProvider:
@@ -28,6 +31,85 @@ class TestBitbucketProvider:
         assert repo_slug == "MY_TEST_REPO"
         assert pr_number == 321
 
+    def test_split_diff_per_file_across_chunk_boundaries(self):
+        diff = (b"diff --git a/a.py b/a.py\n--- a/a.py\n+++ b/a.py\n@@ -1 +1 @@\n-x\n+y\n"
+                b"diff --git a/b.py b/b.py\n--- a/b.py\n+++ b/b.py\n@@ -1 +1 @@\n-diff --git\n+z")
+        # split into tiny chunks, so that lines (and the 'diff --git' marker itself) span several chunks
+        chunks = [diff[i:i + 5] for i in range(0, len(diff), 5)]
+        patches = list(_split_diff_per_file(chunks))
+        assert len(patches) == 2
+        assert patches[0].startswith(b"diff --git a/a.py") and patches[0].endswith(b"+y\n")
+        assert patches[1].startswith(b"diff --git a/b.py") and patches[1].endswith(b"+z")
+        assert b"".join(patches) == diff
+
+    def test_decode_patch_falls_back_per_file(self):
+        assert _decode_patch("caf\u00e9".encode("utf-8")) == "caf\u00e9"
+        assert _decode_patch("caf\u00e9".encode("latin-1")) == "caf\u00e9"
+
+    def test_pr_diff_is_streamed_with_a_timeout(self):
+        diff = b"diff --git a/a.py b/a.py\n@@ -1 +1 @@\n-x\n+y\ndiff --git a/b.py b/b.py\n@@ -1 +1 @@\n-caf\xe9\n"
+        response = MagicMock()
+        response.__enter__.return_value = response
+        response.iter_content.return_value = iter([diff[:30], diff[30:]])
+        provider = BitbucketProvider.__new__(BitbucketProvider)
+        provider.pr = MagicMock(url="https://api.bitbucket.org/2.0/repositories/ws/repo/pullrequests/1")
+        provider.headers = {}
+        with patch("pr_agent.git_providers.bitbucket_provider.requests.get", return_value=response) as get:
+            patches = provider._iter_pr_file_patches()
+            get.assert_not_called()  # nothing is downloaded until the patches are consumed
+            assert next(patches).startswith("diff --git a/a.py")
+            assert list(patches) == ["diff --git a/b.py b/b.py\n@@ -1 +1 @@\n-caf\u00e9\n"]
+        assert get.call_args.kwargs["stream"] and get.call_args.kwargs["timeout"] == 60
+
+    def test_diff_files_are_built_as_the_patches_arrive(self):
+        def diffstat_entry(path):
+            entry = MagicMock(data={"status": "modified", "lines_added": 1, "lines_removed": 1})
+            entry.new.path = path
+            return entry
+
+        diffstat = [diffstat_entry("a.py"), diffstat_entry("ignored.py"), diffstat_entry("b.py")]
+        events = []
+
+        def patches():
+            for entry in diffstat:
+                path = entry.new.path
+                events.append(f"received {path}")
+                yield f"diff --git a/{path} b/{path}\nindex 1..2\n--- a/{path}\n+++ b/{path}\n@@ -1 +1 @@\n-x\n+y"
+            events.append("stream closed")
+
+        def strip_patch_header(patch, diff):
+            events.append(f"built {diff.new.path}")
+            return _strip_patch_header(patch, diff)
+
+        provider = BitbucketProvider.__new__(BitbucketProvider)
+        provider.diff_files = None
+        provider.pr = MagicMock()
+        provider.pr.diffstat.return_value = diffstat
+        provider._iter_pr_file_patches = patches
+        provider._get_pr_file_content = MagicMock(side_effect=lambda url: events.append("fetched") or "content")
+        module = "pr_agent.git_providers.bitbucket_provider"
+        with patch(f"{module}.filter_ignored", side_effect=lambda diffs, _: [d for d in diffs if d is not diffstat[1]]), \
+                patch(f"{module}._strip_patch_header", side_effect=strip_patch_header):
+            diff_files = provider.get_diff_files()
+
+        # each patch is turned into its file entry before the next one is received, the ignored one is dropped,
+        # and the full files are fetched only once the diff stream is closed
+        assert events[:6] == ["received a.py", "built a.py", "received ignored.py",
+                              "received b.py", "built b.py", "stream closed"]
+        assert set(events[6:]) == {"fetched"}
+        assert [f.filename for f in diff_files] == ["a.py", "b.py"]
+        assert diff_files[0].patch == "@@ -1 +1 @@\n-x\n+y"
+        assert diff_files[0].head_file == "content" and diff_files[0].edit_type == EDIT_TYPE.MODIFIED
+
+    def test_diff_files_are_dropped_when_the_patches_do_not_match_the_diffstat(self):
+        provider = BitbucketProvider.__new__(BitbucketProvider)
+        provider.diff_files = None
+        provider.pr = MagicMock()
+        provider.pr.diffstat.return_value = [MagicMock(data={"status": "modified"})]
+        provider._iter_pr_file_patches = lambda: iter(["diff --git a/a.py b/a.py", "diff --git a/b.py b/b.py"])
+        with patch("pr_agent.git_providers.bitbucket_provider.filter_ignored", side_effect=lambda diffs, _: diffs):
+            assert provider.get_diff_files() == []
+
 
 class TestBitbucketServerProvider:
     def test_parse_pr_url(self):
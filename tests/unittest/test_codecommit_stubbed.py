@@ -0,0 +1,141 @@
+from unittest.mock import MagicMock, patch
+
+import boto3
+import pytest
+from botocore.stub import Stubber
+
+from pr_agent.algo.types import EDIT_TYPE
+from pr_agent.config_loader import get_settings
+from pr_agent.git_providers import codecommit_client
+from pr_agent.git_providers.codecommit_client import (CodeCommitBlobCache,
+                                                      CodeCommitClient)
+from pr_agent.git_providers.codecommit_provider import CodeCommitProvider
+
+BLOBS = {
+    "1" * 40: b"a = 1\n",
+    "2" * 40: b"a = 2\n",
+    "3" * 40: b"b = 1\n",
+    "4" * 40: b"c = 1\n",
+}
+
+
+def _difference(before_path, before_id, after_path, after_id, change_type):
+    difference = {"changeType": change_type}
+    if before_path:
+        difference["beforeBlob"] = {"path": before_path, "blobId": before_id, "mode": "100644"}
+    if after_path:
+        difference["afterBlob"] = {"path": after_path, "blobId": after_id, "mode": "100644"}
+    return difference
+
+
+@pytest.fixture
+def stubbed_client():
+    boto_client = boto3.client("codecommit", region_name="us-east-1",
+                               aws_access_key_id="test", aws_secret_access_key="test")
+    with Stubber(boto_client) as stubber, \
+            patch.object(codecommit_client, "_blob_cache", CodeCommitBlobCache(1024 * 1024)):
+        client = CodeCommitClient()
+        client.boto_client = boto_client
+        yield client, stubber
+        stubber.assert_no_pending_responses()
+
+
+def _add_differences(stubber):
+    stubber.add_response(
+        "get_differences",
+        {"differences": [_difference("a.py", "1" * 40, "a.py", "2" * 40, "M"),
+                         _difference("image.png", "5" * 40, "image.png", "6" * 40, "M")],
+         "NextToken": "page-2"},
+        {"repositoryName": "repo", "beforeCommitSpecifier": "base", "afterCommitSpecifier": "head"},
+    )
+    stubber.add_response(
+        "get_differences",
+        {"differences": [_difference(None, None, "b.py", "3" * 40, "A"),
+                         _difference("c.py", "4" * 40, None, None, "D")]},
+        {"repositoryName": "repo", "beforeCommitSpecifier": "base", "afterCommitSpecifier": "head",
+         "NextToken": "page-2"},
+    )
+
+
+def _add_blob(stubber, blob_id):
+    stubber.add_response("get_blob", {"content": BLOBS[blob_id]}, {"repositoryName": "repo", "blobId": blob_id})
+
+
+class TestCodeCommitStubbed:
+    def test_iter_differences_streams_pages(self, stubbed_client):
+        client, stubber = stubbed_client
+        _add_differences(stubber)
+        differences = client.iter_differences("repo", "base", "head")
+        first = next(differences)
+        assert first.after_blob_path == "a.py"
+        # only the first page has been requested so far
+        assert len(stubber._queue) == 1
+        assert [d.after_blob_path or d.before_blob_path for d in differences] == ["image.png", "b.py", "c.py"]
+
+    def test_get_blob_is_cached(self, stubbed_client):
+        client, stubber = stubbed_client
+        _add_blob(stubber, "1" * 40)
+        assert client.get_blob("repo", "1" * 40) == b"a = 1\n"
+        # a second read does not call CodeCommit again - the stubber would fail on an unexpected request
+        assert client.get_blob("repo", "1" * 40) == b"a = 1\n"
+
+    def test_get_diff_files(self, stubbed_client):
+        client, stubber = stubbed_client
+        _add_differences(stubber)
+        # the stubber answers requests in order: the differences are listed first, and a single worker downloads blobs
+        for blob_id in ["1" * 40, "2" * 40]:
+            _add_blob(stubber, blob_id)
+        stubber.add_client_error("get_blob", "AccessDeniedException",
+                                 expected_params={"repositoryName": "repo", "blobId": "3" * 40})
+
+        provider = CodeCommitProvider()
+        provider.codecommit_client = client
+        provider.repo_name = "repo"
+        provider.pr = MagicMock(destination_commit="base", source_commit="head")
+        assert len(provider.get_files()) == 4
+        # without the permission to read blobs, the file is read instead
+        client.get_file = MagicMock(return_value=b"b = 1\n")
+        max_concurrent_requests = get_settings().get("CODECOMMIT.MAX_CONCURRENT_REQUESTS")
+        get_settings().set("CODECOMMIT.MAX_CONCURRENT_REQUESTS", 1)
+        try:
+            diff_files = provider.get_diff_files()
+        finally:
+            get_settings().set("CODECOMMIT.MAX_CONCURRENT_REQUESTS", max_concurrent_requests)
+
+        # image.png has a bad extension, and deleted files are skipped - none of their blobs are downloaded
+        assert [file.filename for file in diff_files] == ["a.py", "b.py"]
+        assert diff_files[0].base_file == "a = 1\n"
+        assert diff_files[0].head_file == "a = 2\n"
+        assert diff_files[0].edit_type == EDIT_TYPE.MODIFIED
+        assert diff_files[1].base_file == ""
+        assert diff_files[1].head_file == "b = 1\n"
+        client.get_file.assert_called_once_with("repo", "b.py", "head")
+
+    def test_blob_cache_evicts_least_recently_used(self):
+        cache = CodeCommitBlobCache(max_size_bytes=10)
+        cache.put("repo", "a", b"12345")
+        cache.put("repo", "b", b"12345")
+        assert cache.get("repo", "a") == b"12345"
+        cache.put("repo", "c", b"12345")
+        assert cache.get("repo", "b") is None
+        assert cache.get("repo", "a") == b"12345"
+        assert cache.size_bytes == 10
+
+    def test_get_diff_files_streams_and_downloads_each_blob_once(self):
+        client = MagicMock()
+        client.iter_differences.return_value = iter([
+            MagicMock(before_blob_path=f"file_{i}.py", before_blob_id="1" * 40, after_blob_path=f"file_{i}.py",
+                      after_blob_id="2" * 40, change_type="M")
+            for i in range(10)])
+        client.get_blob.side_effect = lambda repo_name, blob_id: BLOBS[blob_id]
+
+        provider = CodeCommitProvider()
+        provider.codecommit_client = client
+        provider.repo_name = "repo"
+        provider.pr = MagicMock(destination_commit="base", source_commit="head")
+        diff_files = provider.get_diff_files()
+
+        assert len(diff_files) == 10
+        assert all(file.base_file == "a = 1\n" and file.head_file == "a = 2\n" for file in diff_files)
+        assert client.get_blob.call_count == 2
+        assert len(provider.git_files) == 10
@@ -0,0 +1,109 @@
+from unittest.mock import patch
+
+from pr_agent.servers.utils import DefaultDictWithTimeout
+
+
+def _at(now):
+    return patch("pr_agent.servers.utils.time.monotonic", return_value=now)
+
+
+class TestDefaultDictWithTimeout:
+    def test_keys_expire_after_the_ttl(self):
+        with _at(100):
+            pushes = DefaultDictWithTimeout(list, ttl=10, refresh_interval=0)
+            pushes["a"].append(1)
+        with _at(105):
+            pushes["b"].append(2)
+            assert pushes["a"] == [1]
+        with _at(116):
+            # "a" was last used at 105
+            assert "a" not in pushes and pushes["b"] == []
+            assert len(pushes) == 1
+
+    def test_expired_keys_are_deleted_every_refresh_interval(self):
+        with _at(100):
+            pushes = DefaultDictWithTimeout(list, ttl=10, refresh_interval=60)
+            for i in range(100):
+                pushes[i].append(i)
+        with _at(150):
+            pushes["new"].append(0)
+            assert len(pushes) == 101
+        with _at(161):
+            pushes["new"].append(1)
+            assert len(pushes) == 1
+        with _at(200):
+            pushes["newer"].append(0)
+            # the refresh ran at 161, "new" is expired but not deleted yet
+            assert len(pushes) == 2 and "new" not in pushes
+            assert pushes["new"] == []
+
+    def test_keys_are_not_refreshed_on_get_if_disabled(self):
+        with _at(100):
+            seen = DefaultDictWithTimeout(bool, ttl=10, refresh_interval=0, update_key_time_on_get=False)
+            seen["a"] = True
+        with _at(108):
+            assert seen["a"]
+        with _at(111):
+            assert not seen["a"]
+
+    def test_least_recently_used_keys_are_evicted_above_the_max_size(self):
+        with _at(100):
+            pushes = DefaultDictWithTimeout(list, ttl=10, max_size=2)
+            pushes["a"].append(1)
+            pushes["b"].append(2)
+            pushes["a"].append(3)
+            pushes["c"].append(4)
+        assert dict(pushes) == {"a": [1, 3], "c": [4]}
+        pushes.pop("a")
+        del pushes["c"]
+        pushes["d"] = [5]
+        assert dict(pushes) == {"d": [5]}
+
+    def test_get_and_setdefault_honor_the_ttl(self):
+        with _at(100):
+            seen = DefaultDictWithTimeout(bool, ttl=10, refresh_interval=60)
+            assert seen.setdefault("a", True) is True
+            assert seen.setdefault("a", False) is True
+            assert seen.get("missing") is None and "missing" not in seen
+        with _at(105):
+            assert seen.get("a") is True  # also refreshes the key
+        with _at(114):
+            assert seen.get("a", False) is True
+        with _at(125):
+            # expired, although not deleted by a refresh yet
+            assert seen.get("a", False) is False
+            assert seen.setdefault("a", False) is False
+        with _at(130):
+            assert seen.get("a") is False
+
+    def test_update_popitem_and_init_data_honor_the_max_size(self):
+        with _at(100):
+            pushes = DefaultDictWithTimeout(list, 10, 0, True, 2, {"a": [1], "b": [2], "c": [3]})
+            assert dict(pushes) == {"b": [2], "c": [3]}
+            pushes.update({"d": [4]}, e=[5])
+            assert dict(pushes) == {"d": [4], "e": [5]}
+            pushes |= {"f": [6]}
+            assert dict(pushes) == {"e": [5], "f": [6]}
+            assert pushes.popitem() == ("f", [6])
+            pushes.update(g=[7], h=[8])
+            assert dict(pushes) == {"g": [7], "h": [8]}
+        with _at(111):
+            # the popped key was forgotten, the others expired
+            pushes["i"].append(9)
+            assert dict(pushes) == {"i": [9]}
+
+    def test_copy_keeps_the_settings_and_key_times(self):
+        with _at(100):
+            pushes = DefaultDictWithTimeout(list, ttl=10, refresh_interval=0, max_size=2)
+            pushes["a"].append(1)
+        with _at(105):
+            pushes["b"].append(2)
+            copied = pushes.copy()
+            merged = pushes | {"c": [3]}
+            assert dict(merged) == {"b": [2], "c": [3]}
+        with _at(112):
+            assert "a" not in copied and copied["b"] == [2]
+            copied["c"].append(3)
+            copied["d"].append(4)
+            assert dict(copied) == {"c": [3], "d": [4]}
+        assert dict(pushes) == {"a": [1], "b": [2]}
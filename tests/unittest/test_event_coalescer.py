@@ -0,0 +1,220 @@
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import HTTPException
+from starlette_context import context, request_cycle_context
+
+from pr_agent.servers import github_app
+from pr_agent.servers.event_coalescer import (EventCoalescer,
+                                              MemoryCoalescerBackend,
+                                              SQLiteCoalescerBackend)
+from pr_agent.servers.task_scheduler import TaskPriority, WebhookTaskScheduler
+from pr_agent.servers.webhook_runtime import TaskRegistry
+
+PR_URL = "https://api.github.com/repos/owner/repo/pulls/1"
+REPO_URL = "https://github.com/owner/repo"
+
+
+class TestEventCoalescer:
+    def test_quick_pushes_produce_a_single_run_for_the_last_sha(self):
+        async def run():
+            coalescer = EventCoalescer(MemoryCoalescerBackend(), debounce_seconds=0.05)
+            handled = []
+
+            async def handle(sha):
+                handled.append(sha)
+
+            runs = []
+            for i in range(10):
+                event = await coalescer.register(PR_URL, f"sha{i}")
+                runs.append(coalescer.run_latest(event, lambda sha=f"sha{i}": handle(sha)))
+            return await asyncio.gather(*runs), handled
+
+        results, handled = asyncio.run(run())
+        assert handled == ["sha9"]
+        assert results == [False] * 9 + [True]
+
+    def test_newer_push_cancels_the_run_of_an_older_one(self):
+        async def run():
+            coalescer = EventCoalescer(MemoryCoalescerBackend(), debounce_seconds=0)
+            started = asyncio.Event()
+            cancelled = []
+
+            async def slow_review():
+                started.set()
+                try:
+                    await asyncio.sleep(10)
+                except asyncio.CancelledError:
+                    cancelled.append(True)
+                    raise
+
+            async def fast_review():
+                pass
+
+            first = asyncio.create_task(coalescer.run_latest(await coalescer.register(PR_URL, "sha1"), slow_review))
+            await started.wait()
+            second = await coalescer.run_latest(await coalescer.register(PR_URL, "sha2"), fast_review)
+            return await first, second, cancelled
+
+        assert asyncio.run(run()) == (False, True, [True])
+
+    def test_sqlite_backend_is_shared_between_processes(self, tmp_path):
+        path = str(tmp_path / "events.sqlite3")
+        worker1, worker2 = SQLiteCoalescerBackend(path), SQLiteCoalescerBackend(path)
+        first, new_generation = worker1.register(PR_URL, "sha1")
+        assert new_generation
+        # a duplicate delivery of the same push gets the same generation, and is claimed once
+        assert worker2.register(PR_URL, "sha1") == (first, False)
+        assert worker2.claim(PR_URL, first)
+        assert not worker1.claim(PR_URL, first)
+        second, _ = worker2.register(PR_URL, "sha2")
+        assert second > first and worker1.latest_generation(PR_URL) == second
+        assert not worker1.claim(PR_URL, first)
+        assert worker1.claim(PR_URL, second)
+        assert worker2.claimed_generation(PR_URL) == second
+
+    @pytest.mark.parametrize("backend", ["memory", "sqlite"])
+    def test_withdrawn_push_does_not_supersede_older_ones(self, tmp_path, backend):
+        if backend == "memory":
+            backend = MemoryCoalescerBackend()
+        else:
+            backend = SQLiteCoalescerBackend(str(tmp_path / "events.sqlite3"))
+        first, _ = backend.register(PR_URL, "sha1")
+        second, _ = backend.register(PR_URL, "sha2")
+        backend.withdraw(PR_URL, second)
+        assert backend.latest_generation(PR_URL) == first
+        assert backend.claim(PR_URL, first)
+        # a claimed generation, or one superseded in the meantime, is not withdrawn
+        backend.withdraw(PR_URL, first)
+        assert backend.latest_generation(PR_URL) == first
+        third, _ = backend.register(PR_URL, "sha3")
+        fourth, _ = backend.register(PR_URL, "sha4")
+        backend.withdraw(PR_URL, third)
+        assert backend.latest_generation(PR_URL) == fourth
+
+    def test_run_is_cancelled_by_a_push_received_by_another_process(self, tmp_path):
+        path = str(tmp_path / "events.sqlite3")
+
+        async def run():
+            coalescer = EventCoalescer(SQLiteCoalescerBackend(path), debounce_seconds=0, poll_interval_seconds=0.02)
+            other_worker = SQLiteCoalescerBackend(path)
+
+            async def review():
+                # a push that was only registered by the other process does not cancel the run
+                other_worker.register(PR_URL, "sha2")
+                await asyncio.sleep(0.1)
+                other_worker.claim(PR_URL, other_worker.register(PR_URL, "sha3")[0])
+                await asyncio.sleep(10)
+
+            return await asyncio.wait_for(coalescer.run_latest(await coalescer.register(PR_URL, "sha1"), review), 5)
+
+        assert asyncio.run(run()) is False
+
+    def test_interrupted_run_can_be_resumed(self):
+        async def run():
+            backend = MemoryCoalescerBackend()
+            coalescer = EventCoalescer(backend, debounce_seconds=0)
+            started = asyncio.Event()
+            handled = []
+
+            async def review():
+                started.set()
+                await asyncio.sleep(10)
+
+            async def resumed_review():
+                handled.append("sha1")
+
+            # e.g. a shutdown cancels the run of the push
+            interrupted = asyncio.create_task(coalescer.run_latest(await coalescer.register(PR_URL, "sha1"), review))
+            await started.wait()
+            interrupted.cancel()
+            await asyncio.gather(interrupted, return_exceptions=True)
+            # the same push, resumed after the restart
+            resumed = await coalescer.run_latest(await coalescer.register(PR_URL, "sha1"), resumed_review)
+            return interrupted.cancelled(), resumed, handled
+
+        assert asyncio.run(run()) == (True, True, ["sha1"])
+
+
+class TestGithubAppPushCoalescing:
+    """Checks that a push dropped by the scheduler of the GitHub app does not cancel or supersede older pushes."""
+
+    @staticmethod
+    def _push_body(sha):
+        return {"action": "synchronize", "before": "sha0", "after": sha, "pull_request": {"url": PR_URL},
+                "repository": {"html_url": REPO_URL, "full_name": "owner/repo"}, "installation": {"id": 1}}
+
+    async def _receive_push(self, sha):
+        request = MagicMock(headers={"X-GitHub-Event": "pull_request"})
+        get_body = AsyncMock(return_value=self._push_body(sha))
+        with request_cycle_context({}), patch.object(github_app, "get_body", get_body):
+            return await github_app.handle_github_webhooks(request, MagicMock())
+
+    def _run(self, scenario):
+        coalescer = EventCoalescer(MemoryCoalescerBackend(), debounce_seconds=0)
+        registry = TaskRegistry()
+        handled = []
+
+        async def handle_event(body, event):
+            handled.append(body["after"])
+
+        registry.register("github_app.event", handle_event, schedule=github_app._schedule_github_event)
+
+        def set_request_context(body):
+            context["settings"] = {"allowed_repos": [REPO_URL]}
+
+        async def run():
+            scheduler = WebhookTaskScheduler(max_concurrent_tasks=1, max_queued_tasks=1, task_registry=registry)
+            release = asyncio.Event()
+            started = asyncio.Event()
+
+            async def review():
+                started.set()
+                await release.wait()
+
+            # the review of an older push is in flight, and the scheduler is busy
+            in_flight = asyncio.create_task(coalescer.run_latest(await coalescer.register(PR_URL, "sha1"), review))
+            await started.wait()
+            scheduler.submit(release.wait)
+            with patch.object(github_app, "task_scheduler", scheduler):
+                await scenario(scheduler, release)
+                latest_generation = coalescer.backend.latest_generation(PR_URL)
+                release.set()
+                await registry.join()
+            return await in_flight, latest_generation
+
+        with patch.object(github_app, "_push_trigger_coalescer", coalescer), \
+                patch.object(github_app, "task_registry", registry), \
+                patch.object(github_app, "_set_request_context", set_request_context):
+            completed, latest_generation = asyncio.run(run())
+        return completed, latest_generation, handled
+
+    def test_rejected_push_is_withdrawn(self):
+        async def scenario(scheduler, release):
+            scheduler.submit(release.wait, priority=TaskPriority.COMMAND)  # fills the queue
+            with pytest.raises(HTTPException) as e:
+                await self._receive_push("sha2")
+            assert e.value.status_code == 503
+
+        completed, latest_generation, handled = self._run(scenario)
+        # the review of the older push was not cancelled, and its push is still the latest
+        assert completed is True
+        assert latest_generation == 1
+        assert handled == []
+
+    def test_shed_push_is_withdrawn(self):
+        async def scenario(scheduler, release):
+            await self._receive_push("sha2")
+            assert scheduler.queued == 1
+            # a command of a user sheds the queued push
+            scheduler.submit(release.wait, priority=TaskPriority.COMMAND)
+            for _ in range(100):
+                if github_app._push_trigger_coalescer.backend.latest_generation(PR_URL) == 1:
+                    break
+                await asyncio.sleep(0.01)
+
+        completed, latest_generation, handled = self._run(scenario)
+        assert completed is True
+        assert latest_generation == 1
+        assert handled == []
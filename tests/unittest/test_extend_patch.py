@@ -11,12 +11,16 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import difflib
+import subprocess
+from unittest.mock import patch
+
 import pytest
 
 from pr_agent.algo.git_patch_processing import extend_patch
 from pr_agent.algo.pr_processing import pr_generate_extended_diff
 from pr_agent.algo.token_handler import TokenHandler
-from pr_agent.algo.utils import load_large_diff
+from pr_agent.algo.utils import _get_git_executable, load_large_diff
 from pr_agent.config_loader import get_settings
 
 get_settings(use_context=False).set("CONFIG.CLI_MODE", True)
@@ -207,3 +211,33 @@ class TestLoadLargeDiff:
         assert load_large_diff("test.py", None, None) == ""
         assert (load_large_diff("test.py", "content\n", "") ==
                 '--- \n+++ \n@@ -1 +1 @@\n-\n+content\n')
+
+    def _large_file_versions(self):
+        original = "".join(f"line {i}\n" for i in range(2000))
+        new = original.replace("line 10\n", "line ten\n").replace("line 1500\n", "")
+        return original, new
+
+    @pytest.mark.skipif(_get_git_executable() is None, reason="git is not installed")
+    def test_large_file_uses_git_diff(self):
+        original, new = self._large_file_versions()
+        patch_str = load_large_diff("test.py", new, original)
+        assert patch_str.startswith("--- \n+++ \n@@ -8,7 +8,7 @@")
+        assert "-line 10\n+line ten\n" in patch_str
+        assert "-line 1500\n" in patch_str
+        assert [line for line in patch_str.splitlines() if line[:1] in "+-" and line not in ("--- ", "+++ ")] == \
+               [line for line in difflib_patch_lines(original, new)]
+
+    def test_large_file_diff_timeout_returns_no_patch(self):
+        original, new = self._large_file_versions()
+        with patch("pr_agent.algo.utils._get_git_executable", return_value="git"), \
+                patch("pr_agent.algo.utils.subprocess.run", side_effect=subprocess.TimeoutExpired("git", 10)), \
+                patch("pr_agent.algo.utils.get_logger") as mock_logger:
+            patch_str = load_large_diff("test.py", new, original)
+        assert patch_str == ""
+        mock_logger.return_value.warning.assert_called_once()
+
+
+def difflib_patch_lines(original, new):
+    return [line.rstrip("\n") for line in difflib.unified_diff(original.splitlines(keepends=True),
+                                                                  new.splitlines(keepends=True))
+            if line[:1] in "+-" and not line.startswith(("---", "+++"))]
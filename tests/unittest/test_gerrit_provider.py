@@ -0,0 +1,96 @@
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from pr_agent.algo.types import EDIT_TYPE
+from pr_agent.git_providers.gerrit_provider import (GerritWorkspacePool,
+                                                    load_diff_files)
+from pr_agent.git_providers.git_mirror_cache import GitMirrorCache
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+
+
+def _git(*args, cwd):
+    return subprocess.run(["git", "-c", "user.email=test@test", "-c", "user.name=test", *args],
+                          cwd=cwd, check=True, capture_output=True).stdout.decode().strip()
+
+
+@pytest.fixture
+def gerrit_repo(tmp_path):
+    """A project with two changes, pushed to refs/changes/ like gerrit does."""
+    repo = tmp_path / "project"
+    repo.mkdir()
+    _git("init", "-q", "-b", "main", cwd=repo)
+    (repo / "a.py").write_text("a = 1\n")
+    (repo / "old_name.py").write_text("x = 1\ny = 2\nz = 3\n")
+    (repo / "removed.py").write_text("removed\n")
+    _git("add", ".", cwd=repo)
+    _git("commit", "-q", "-m", "initial", cwd=repo)
+
+    (repo / "a.py").write_text("a = 2\n")
+    (repo / "new name.py").write_text("x = 1\ny = 2\nz = 3\n")
+    (repo / "old_name.py").unlink()
+    (repo / "removed.py").unlink()
+    (repo / "image.bin").write_bytes(b"\x89PNG\0\0")
+    _git("add", "-A", ".", cwd=repo)
+    _git("commit", "-q", "-m", "change 1", cwd=repo)
+    _git("update-ref", "refs/changes/01/1/1", "HEAD", cwd=repo)
+
+    _git("checkout", "-q", "main~1", cwd=repo)
+    (repo / "b.py").write_text("b = 1\n")
+    _git("add", ".", cwd=repo)
+    _git("commit", "-q", "-m", "change 2", cwd=repo)
+    _git("update-ref", "refs/changes/02/2/1", "HEAD", cwd=repo)
+    _git("checkout", "-q", "main", cwd=repo)
+    return repo
+
+
+class TestGerritProvider:
+    def test_load_diff_files(self, gerrit_repo):
+        _git("checkout", "-q", "refs/changes/01/1/1", cwd=gerrit_repo)
+        diff_files = {file.filename: file for file in load_diff_files(gerrit_repo)}
+        assert set(diff_files) == {"a.py", "new name.py", "removed.py", "image.bin"}
+
+        assert diff_files["a.py"].edit_type == EDIT_TYPE.MODIFIED
+        assert diff_files["a.py"].base_file == "a = 1\n"
+        assert diff_files["a.py"].head_file == "a = 2\n"
+        assert diff_files["a.py"].patch.startswith("@@ -1 +1 @@\n-a = 1\n+a = 2")
+
+        renamed = diff_files["new name.py"]
+        assert renamed.edit_type == EDIT_TYPE.RENAMED
+        assert renamed.old_filename == "old_name.py"
+        assert renamed.head_file == "x = 1\ny = 2\nz = 3\n"
+        assert renamed.patch == ""
+
+        assert diff_files["removed.py"].edit_type == EDIT_TYPE.DELETED
+        assert diff_files["removed.py"].base_file == "removed\n"
+        assert diff_files["removed.py"].head_file == ""
+        assert diff_files["image.bin"].edit_type == EDIT_TYPE.ADDED
+        assert diff_files["image.bin"].head_file == ""
+
+    def test_workspaces_are_reused_and_cleaned_up(self, tmp_path, gerrit_repo):
+        pool = GerritWorkspacePool(GitMirrorCache(str(tmp_path / "cache"), 10 ** 9),
+                                   max_idle_per_project=1, idle_ttl_seconds=3600)
+        url = gerrit_repo.as_uri()
+
+        first = pool.acquire(url, "refs/changes/01/1/1")
+        assert (first / "new name.py").exists()
+        second = pool.acquire(url, "refs/changes/02/2/1")  # the first workspace is in use
+        assert second != first
+        (first / "untracked.txt").write_text("left over")
+        pool.release(url, "refs/changes/02/2/1", second)
+        pool.release(url, "refs/changes/01/1/1", first)
+        # only the most recently released workspace is kept
+        assert not second.exists()
+
+        reused = pool.acquire(url, "refs/changes/02/2/1")
+        assert reused == first
+        assert sorted(os.listdir(reused)) == [".git", "a.py", "b.py", "old_name.py", "removed.py"]
+        assert [file.filename for file in load_diff_files(reused)] == ["b.py"]
+
+        pool.release(url, "refs/changes/02/2/1", reused)
+        pool.idle_ttl_seconds = 0
+        pool.cleanup()
+        assert not reused.exists()
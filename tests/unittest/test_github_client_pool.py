@@ -0,0 +1,51 @@
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock
+
+from github import Auth
+
+from pr_agent.git_providers.github_client_pool import (GithubClientPool,
+                                                       PooledAppAuthentication)
+
+
+class TestGithubClientPool:
+    def test_same_key_reuses_client_and_auth(self):
+        pool = GithubClientPool()
+        factory = MagicMock(side_effect=lambda: Auth.Token("token"))
+        client1, auth1 = pool.get_client(("user", "https://api.github.com", "a"), factory, "https://api.github.com")
+        client2, auth2 = pool.get_client(("user", "https://api.github.com", "a"), factory, "https://api.github.com")
+        assert client1 is client2
+        assert auth1 is auth2
+        assert factory.call_count == 1
+        assert pool.get_stats() == {"clients": 1, "hits": 1, "misses": 1}
+
+    def test_clients_share_http_adapter(self):
+        pool = GithubClientPool()
+        client1, _ = pool.get_client(("app", "https://api.github.com", "1", 1), lambda: Auth.Token("a"),
+                                     "https://api.github.com")
+        client2, _ = pool.get_client(("app", "https://api.github.com", "1", 2), lambda: Auth.Token("b"),
+                                     "https://api.github.com")
+        adapter1 = client1._Github__requester._Requester__createConnection().session.get_adapter("https://api.github.com")
+        adapter2 = client2._Github__requester._Requester__createConnection().session.get_adapter("https://api.github.com")
+        assert adapter1 is adapter2
+
+    def test_pool_evicts_least_recently_used(self):
+        pool = GithubClientPool(max_clients=2)
+        for key in ("a", "b", "a", "c"):
+            pool.get_client((key,), lambda: Auth.Token("token"), "https://api.github.com")
+        assert len(pool) == 2
+        assert ("b",) not in pool._clients
+
+
+class TestPooledAppAuthentication:
+    def _auth_with_expiry(self, expires_in: timedelta, margin: int) -> PooledAppAuthentication:
+        auth = PooledAppAuthentication(app_id=1, private_key="key", installation_id=1, refresh_margin_seconds=margin)
+        authorization = MagicMock()
+        authorization.expires_at = (datetime.now(timezone.utc) + expires_in).replace(tzinfo=None)
+        auth._AppInstallationAuth__installation_authorization = authorization
+        return auth
+
+    def test_token_within_refresh_margin_is_expired(self):
+        assert self._auth_with_expiry(timedelta(minutes=4), margin=300)._is_expired
+
+    def test_token_outside_refresh_margin_is_reused(self):
+        assert not self._auth_with_expiry(timedelta(minutes=30), margin=300)._is_expired
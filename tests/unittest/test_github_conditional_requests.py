@@ -0,0 +1,85 @@
+from unittest.mock import patch
+
+import requests
+
+from pr_agent.git_providers.github_conditional_requests import (
+    ConditionalRequestAdapter, ConditionalRequestCache)
+
+
+def _response(request, status, body=b"", headers=None):
+    response = requests.Response()
+    response.status_code = status
+    response._content = body
+    response.headers = requests.structures.CaseInsensitiveDict(headers or {})
+    response.encoding = "utf-8"
+    response.request = request
+    response.url = request.url
+    return response
+
+
+def _prepare(url="https://api.github.com/repos/o/r/pulls/1/files", method="GET"):
+    return requests.Request(method, url, headers={"Accept": "application/json"}).prepare()
+
+
+class TestConditionalRequestAdapter:
+    def test_serves_cached_body_on_304(self):
+        cache = ConditionalRequestCache()
+        adapter = ConditionalRequestAdapter(cache)
+        sent_headers = []
+
+        def fake_send(request, **kwargs):
+            sent_headers.append(dict(request.headers))
+            if "If-None-Match" in request.headers:
+                return _response(request, 304, headers={"ETag": '"abc"', "X-RateLimit-Remaining": "4999"})
+            return _response(request, 200, b'[{"filename": "a.py"}]',
+                             headers={"ETag": '"abc"', "X-RateLimit-Remaining": "5000"})
+
+        with patch("requests.adapters.HTTPAdapter.send", side_effect=fake_send):
+            first = adapter.send(_prepare())
+            second = adapter.send(_prepare())
+
+        assert first.status_code == 200
+        assert second.status_code == 200
+        assert second.text == '[{"filename": "a.py"}]'
+        assert second.headers["X-RateLimit-Remaining"] == "4999"
+        assert "If-None-Match" not in sent_headers[0]
+        assert sent_headers[1]["If-None-Match"] == '"abc"'
+        stats = cache.get_stats()
+        assert stats["saved_requests"] == 1
+        assert stats["uncached_requests"] == 1
+
+    def test_modified_response_replaces_cache_entry(self):
+        cache = ConditionalRequestCache()
+        adapter = ConditionalRequestAdapter(cache)
+        responses = iter([(b"old", '"v1"'), (b"new", '"v2"')])
+
+        def fake_send(request, **kwargs):
+            body, etag = next(responses)
+            return _response(request, 200, body, headers={"ETag": etag})
+
+        with patch("requests.adapters.HTTPAdapter.send", side_effect=fake_send):
+            adapter.send(_prepare())
+            adapter.send(_prepare())
+
+        entry = cache.get((_prepare().url, "application/json"))
+        assert entry.content == b"new"
+        assert entry.etag == '"v2"'
+        assert cache.get_stats()["conditional_requests"] == 1
+
+    def test_non_get_requests_are_not_cached(self):
+        cache = ConditionalRequestCache()
+        adapter = ConditionalRequestAdapter(cache)
+        with patch("requests.adapters.HTTPAdapter.send",
+                   side_effect=lambda request, **kwargs: _response(request, 200, b"{}", headers={"ETag": '"x"'})):
+            adapter.send(_prepare(method="POST"))
+        assert len(cache) == 0
+
+    def test_cache_is_bounded(self):
+        cache = ConditionalRequestCache(max_entries=2)
+        adapter = ConditionalRequestAdapter(cache)
+        with patch("requests.adapters.HTTPAdapter.send",
+                   side_effect=lambda request, **kwargs: _response(request, 200, b"{}", headers={"ETag": '"x"'})):
+            for i in range(3):
+                adapter.send(_prepare(url=f"https://api.github.com/repos/o/r/pulls/{i}"))
+        assert len(cache) == 2
+        assert cache.get(("https://api.github.com/repos/o/r/pulls/0", "application/json")) is None
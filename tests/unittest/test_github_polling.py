@@ -0,0 +1,173 @@
+import asyncio
+import json
+import threading
+from unittest.mock import patch
+
+from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.github_conditional_requests import \
+    ConditionalRequestCache
+from pr_agent.servers import github_polling
+from pr_agent.servers.github_polling import (CommentWorkerPool,
+                                             is_valid_notification)
+from pr_agent.servers.utils import ExpiringSet
+
+
+class TestExpiringSet:
+    def test_items_expire(self):
+        with patch("pr_agent.servers.utils.time.monotonic", return_value=100):
+            ids = ExpiringSet(ttl=10)
+            ids.add(1)
+        with patch("pr_agent.servers.utils.time.monotonic", return_value=105):
+            ids.add(2)
+            assert 1 in ids and 2 in ids
+        with patch("pr_agent.servers.utils.time.monotonic", return_value=111):
+            assert 1 not in ids and 2 in ids
+            assert len(ids) == 1
+
+    def test_oldest_items_are_evicted_beyond_max_size(self):
+        ids = ExpiringSet(ttl=60, max_size=2)
+        for item in [1, 2, 1, 3]:
+            ids.add(item)
+        assert 1 in ids and 3 in ids and 2 not in ids
+
+
+class TestCommentWorkerPool:
+    def test_backpressure_and_per_comment_settings(self):
+        async def run():
+            release = threading.Event()
+            processed = []
+
+            async def process_comment(pr_url, rest_of_comment, comment_id):
+                get_settings().set("CONFIG.MODEL", f"model-{comment_id}")
+                release.wait()
+                processed.append((comment_id, get_settings().get("CONFIG.MODEL")))
+
+            with patch.object(github_polling, "process_comment", process_comment):
+                pool = CommentWorkerPool(num_workers=2, max_queued_tasks=1)
+                pool.start()
+                for comment_id in range(3):
+                    await pool.submit("https://github.com/owner/repo/pull/1", "/review", comment_id)
+                # two comments are being processed and one is queued: a fourth one waits for a free slot
+                fourth = asyncio.create_task(pool.submit("https://github.com/owner/repo/pull/1", "/review", 3))
+                await asyncio.sleep(0.05)
+                assert not fourth.done()
+                release.set()
+                await fourth
+                await pool.queue.join()
+                await pool.close()
+            return processed
+
+        model = get_settings().get("CONFIG.MODEL")
+        processed = asyncio.run(run())
+        assert sorted(processed) == [(i, f"model-{i}") for i in range(4)]
+        assert get_settings().get("CONFIG.MODEL") == model
+
+    def test_blocking_comment_does_not_stall_polling_or_other_workers(self):
+        async def run():
+            release = threading.Event()
+            processed = []
+
+            async def process_comment(pr_url, rest_of_comment, comment_id):
+                if comment_id == 0:
+                    release.wait()  # a blocking call of a tool
+                processed.append((comment_id, threading.current_thread().name))
+
+            with patch.object(github_polling, "process_comment", process_comment):
+                pool = CommentWorkerPool(num_workers=2, max_queued_tasks=2)
+                pool.start()
+                for comment_id in range(3):
+                    await pool.submit("https://github.com/owner/repo/pull/1", "/review", comment_id)
+                # the polling loop keeps running, and the other worker processes the other comments meanwhile
+                for _ in range(100):
+                    if len(processed) == 2:
+                        break
+                    await asyncio.sleep(0.01)
+                assert sorted(comment_id for comment_id, _ in processed) == [1, 2]
+                release.set()
+                await pool.queue.join()
+                await pool.close()
+            return processed
+
+        processed = asyncio.run(run())
+        assert len(processed) == 3
+        assert all(thread_name.startswith("comment-worker-") for _, thread_name in processed)
+
+    def test_close_cancels_idle_and_busy_workers(self):
+        async def run():
+            started = threading.Event()
+
+            async def process_comment(pr_url, rest_of_comment, comment_id):
+                started.set()
+                await asyncio.sleep(60)
+
+            with patch.object(github_polling, "process_comment", process_comment):
+                pool = CommentWorkerPool(num_workers=2, max_queued_tasks=1)
+                pool.start()
+                await pool.submit("https://github.com/owner/repo/pull/1", "/review", 0)
+                await asyncio.to_thread(started.wait, 5)
+                await asyncio.wait_for(pool.close(), 5)
+            return threading.enumerate()
+
+        threads = asyncio.run(run())
+        assert not [thread for thread in threads if thread.name.startswith("comment-worker-")]
+
+
+class _FakeResponse:
+    def __init__(self, status, body=None, headers=None):
+        self.status = status
+        self.body = body
+        self.headers = headers or {}
+        self.charset = "utf-8"
+
+    async def read(self):
+        return json.dumps(self.body).encode()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        pass
+
+
+class _FakeSession:
+    """Serves the comments of a PR, with an ETag on the comment listing."""
+
+    def __init__(self, latest_comment, comments):
+        self.latest_comment = latest_comment
+        self.comments = comments
+        self.requests = []
+
+    def get(self, url, headers=None):
+        self.requests.append((url, headers))
+        if url.endswith("/comments"):
+            if headers.get("If-None-Match") == '"v1"':
+                return _FakeResponse(304)
+            return _FakeResponse(200, self.comments, {"ETag": '"v1"'})
+        return _FakeResponse(200, self.latest_comment)
+
+
+class TestIsValidNotification:
+    @staticmethod
+    def _notification(comment_id):
+        return {"id": f"n{comment_id}", "reason": "mention",
+                "subject": {"type": "PullRequest", "url": "https://api.github.com/repos/o/r/pulls/1",
+                            "latest_comment_url": f"https://api.github.com/repos/o/r/issues/comments/{comment_id}"}}
+
+    def test_comment_listing_is_revalidated_with_its_etag(self):
+        comments = [{"id": 1, "user": {"login": "user"}, "body": "@bot /review"}]
+        cache = ConditionalRequestCache()
+
+        async def run(comment_id):
+            # the latest comment is the bot's answer, so the previous comments are scanned for the mention
+            session = _FakeSession({"id": comment_id, "user": {"login": "bot"}, "body": "answer"}, comments)
+            with patch.object(github_polling, "get_conditional_request_cache", return_value=cache):
+                output = await is_valid_notification(self._notification(comment_id), {}, ExpiringSet(ttl=60),
+                                                      session, "bot")
+            return output, session.requests
+
+        (valid, *_, comment, body, pr_url, user_tag), _ = asyncio.run(run(10))
+        assert valid and comment["id"] == 1 and body == "@bot /review"
+        (valid, *_), requests = asyncio.run(run(11))
+        assert valid
+        assert requests[-1][1]["If-None-Match"] == '"v1"'
+        assert cache.get_stats()["saved_requests"] == 1
@@ -0,0 +1,98 @@
+from unittest.mock import MagicMock, patch
+
+from pr_agent.git_providers.github_provider import GithubProvider
+
+
+class TestGithubProvider:
+    """Unit-tests for GithubProvider with the PyGithub client and PR object mocked out."""
+
+    def _provider(self, commits=None):
+        pr = MagicMock()
+        pr.head.sha = "abc123"
+        pr.html_url = "https://github.com/owner/repo/pull/1"
+        pr.get_commits.return_value = commits or []
+        repo = MagicMock()
+        repo.url = "https://api.github.com/repos/owner/repo"
+        repo.html_url = "https://github.com/owner/repo"
+        with patch.object(GithubProvider, '_get_github_client', return_value=MagicMock()), \
+                patch.object(GithubProvider, '_get_repo', return_value=repo), \
+                patch.object(GithubProvider, '_get_pr', return_value=pr):
+            provider = GithubProvider('https://github.com/owner/repo/pull/1')
+        provider.repo_obj = repo
+        provider._get_repo = MagicMock(return_value=repo)
+        return provider, pr
+
+    # ---------------- lazy commits ----------------
+    def test_constructor_does_not_list_commits(self):
+        provider, pr = self._provider()
+        pr.get_commits.assert_not_called()
+
+    def test_last_commit_id_uses_head_sha(self):
+        provider, pr = self._provider()
+        assert provider.last_commit_id.sha == "abc123"
+        assert provider.last_commit_id.html_url == "https://github.com/owner/repo/commit/abc123"
+        pr.get_commits.assert_not_called()
+
+    def test_commit_messages_fetch_commits_once(self):
+        commit1, commit2 = MagicMock(), MagicMock()
+        commit1.commit.message = "first"
+        commit2.commit.message = "second"
+        provider, pr = self._provider(commits=[commit1, commit2])
+        assert provider.get_commit_messages() == "1. first\n2. second"
+        assert len(provider.pr_commits) == 2
+        pr.get_commits.assert_called_once()
+
+    # ---------------- inline comments fallback ----------------
+    def _provider_with_patch(self, patch):
+        provider, pr = self._provider()
+        file = MagicMock()
+        file.filename = "a.py"
+        file.patch = patch
+        provider.get_files = MagicMock(return_value=[file])
+        return provider, pr
+
+    def test_classify_inline_comments(self):
+        patch_str = "@@ -1,3 +1,4 @@\n a\n+b\n c\n d\n@@ -20,2 +21,2 @@\n-x\n+y\n z"
+        provider, _ = self._provider_with_patch(patch_str)
+        inside = {"path": "a.py", "line": 2, "side": "RIGHT", "body": "ok"}
+        multi_line = {"path": "a.py", "line": 4, "start_line": 1, "start_side": "RIGHT", "body": "ok"}
+        across_hunks = {"path": "a.py", "line": 21, "start_line": 3, "start_side": "RIGHT", "body": "bad"}
+        outside = {"path": "a.py", "line": 10, "side": "RIGHT", "body": "bad"}
+        other_file = {"path": "b.py", "line": 1, "side": "RIGHT", "body": "bad"}
+        mixed_sides = {"path": "a.py", "line": 2, "side": "RIGHT", "start_line": 20, "start_side": "LEFT", "body": "?"}
+        valid, invalid, ambiguous = provider._classify_inline_comments(
+            [inside, multi_line, across_hunks, outside, other_file, mixed_sides])
+        assert valid == [inside, multi_line]
+        assert [comment for comment, _ in invalid] == [across_hunks, outside, other_file]
+        assert ambiguous == [mixed_sides]
+
+    def test_fallback_verifies_only_ambiguous_comments(self):
+        provider, pr = self._provider_with_patch("@@ -1,2 +1,2 @@\n-a\n+b\n c")
+        valid = {"path": "a.py", "line": 1, "side": "RIGHT", "body": "ok"}
+        ambiguous = {"path": "a.py", "position": 1, "line": 1, "body": "?"}
+        provider._is_inline_comment_inside_hunks = MagicMock(side_effect=[True, None])
+        provider._verify_code_comment = MagicMock(return_value=(True, None))
+        with patch("pr_agent.git_providers.github_provider.time.sleep"):
+            provider._publish_inline_comments_fallback_with_verification([valid, ambiguous])
+        provider._verify_code_comment.assert_called_once_with(ambiguous)
+        pr.create_review.assert_called_once()
+        assert pr.create_review.call_args.kwargs["comments"] == [valid, ambiguous]
+
+    def test_comments_are_verified_one_at_a_time(self):
+        provider, _ = self._provider_with_patch("@@ -1,2 +1,2 @@\n-a\n+b\n c")
+        comments = [{"path": "a.py", "position": i, "body": str(i)} for i in range(3)]
+        calls = []
+        error = ValueError("Unprocessable Entity")
+
+        # each probe creates a pending review, of which GitHub allows one per user on a PR
+        def verify(comment):
+            calls.append(("verify", comment["body"]))
+            return (False, error) if comment["body"] == "1" else (True, None)
+
+        provider._verify_code_comment = MagicMock(side_effect=verify)
+        with patch("pr_agent.git_providers.github_provider.time.sleep",
+                   side_effect=lambda seconds: calls.append(("sleep", seconds))):
+            verified, invalid = provider._verify_code_comments(comments)
+        assert calls == [("sleep", 1), ("verify", "0"), ("sleep", 1), ("verify", "1"), ("sleep", 1), ("verify", "2")]
+        assert verified == [comments[0], comments[2]]
+        assert invalid == [(comments[1], error)]
@@ -0,0 +1,50 @@
+from unittest.mock import MagicMock, patch
+
+from pr_agent.algo.types import EDIT_TYPE
+from pr_agent.git_providers.gitlab_provider import GitLabProvider
+
+
+class TestGitLabProvider:
+    """Unit-tests for GitLabProvider with the python-gitlab client mocked out."""
+
+    def _provider(self, changes):
+        with patch('pr_agent.git_providers.gitlab_provider.gitlab.Gitlab') as mock_gitlab, \
+                patch('pr_agent.git_providers.gitlab_provider.get_settings') as mock_get_settings:
+            settings = MagicMock()
+            settings.get.side_effect = lambda k, d=None: {
+                'GITLAB.URL': 'https://gitlab.example.com',
+                'GITLAB.PERSONAL_ACCESS_TOKEN': 'test-token',
+            }.get(k, d)
+            mock_get_settings.return_value = settings
+            mr = MagicMock()
+            mr.changes.return_value = {'changes': changes}
+            mr.diff_refs = {'base_sha': 'base', 'head_sha': 'head'}
+            mock_gitlab.return_value.projects.get.return_value.mergerequests.get.return_value = mr
+            provider = GitLabProvider('https://gitlab.example.com/group/repo/-/merge_requests/1')
+        files = provider.gl.projects.get.return_value.files
+        files.raw.side_effect = lambda file_path, ref: f"{file_path}@{ref}\n".encode()
+        return provider, mr, files
+
+    @staticmethod
+    def _change(path, diff='', new_file=False):
+        return {'old_path': path, 'new_path': path, 'diff': diff, 'new_file': new_file,
+                'deleted_file': False, 'renamed_file': False}
+
+    def test_changes_are_fetched_once(self):
+        provider, mr, _ = self._provider([self._change('a.py', '@@ -1 +1 @@\n-a\n+b')])
+        provider.get_files()
+        provider.get_diff_files()
+        mr.changes.assert_called_once()
+
+    def test_diff_files_contents_keep_order(self):
+        changes = [self._change(f'f{i}.py', '@@ -1 +1 @@\n-a\n+b') for i in range(5)]
+        changes.append(self._change('new.py', '', new_file=True))
+        provider, _, files = self._provider(changes)
+        diff_files = provider.get_diff_files()
+        assert [f.filename for f in diff_files] == [f'f{i}.py' for i in range(5)] + ['new.py']
+        for diff_file in diff_files:
+            assert diff_file.base_file == f"{diff_file.filename}@base\n"
+            assert diff_file.head_file == f"{diff_file.filename}@head\n"
+        assert diff_files[-1].edit_type == EDIT_TYPE.ADDED
+        assert diff_files[-1].patch  # generated from the file contents
+        assert files.raw.call_count == 12
@@ -0,0 +1,51 @@
+import json
+import os
+import subprocess
+import sys
+
+from dynaconf import Dynaconf
+
+from pr_agent.agent.pr_agent import command2class, commands
+from pr_agent.config_loader import DEFAULT_SETTINGS_FILES
+from pr_agent.settings_snapshot import (build_settings_snapshot,
+                                        get_settings_snapshot)
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class TestLazyImports:
+    def test_webhook_server_does_not_import_the_tools(self, tmp_path):
+        code = ("import sys, pr_agent.servers.github_app; "
+                "print([m for m in ['litellm', 'tiktoken', 'pr_agent.tools.pr_reviewer'] if m in sys.modules])")
+        result = subprocess.run([sys.executable, "-c", code], cwd=tmp_path, env=dict(os.environ, PYTHONPATH=REPO_ROOT),
+                                capture_output=True, text=True, check=True)
+        assert result.stdout.strip().splitlines()[-1] == "[]"
+
+    def test_commands_are_imported_on_first_use(self):
+        from pr_agent.tools.pr_reviewer import PRReviewer
+        assert "review" in commands and "unknown" not in command2class
+        assert command2class["review"] is PRReviewer and command2class["auto_review"] is PRReviewer
+
+    def test_provider_classes_are_still_exported(self):
+        from pr_agent.git_providers import GithubProvider
+        from pr_agent.git_providers.github_provider import \
+            GithubProvider as provider_class
+        assert GithubProvider is provider_class
+
+
+class TestSettingsSnapshot:
+    def test_snapshot_matches_the_settings_files(self, tmp_path):
+        snapshot = build_settings_snapshot(DEFAULT_SETTINGS_FILES, str(tmp_path / "snapshot.json"))
+        assert get_settings_snapshot(DEFAULT_SETTINGS_FILES, snapshot) == snapshot
+        from_files = Dynaconf(envvar_prefix=False, merge_enabled=True, settings_files=DEFAULT_SETTINGS_FILES, loaders=[])
+        from_snapshot = Dynaconf(envvar_prefix=False, merge_enabled=True, settings_files=[snapshot], loaders=[])
+        assert from_snapshot.as_dict() == from_files.as_dict()
+
+    def test_snapshot_of_modified_files_is_not_used(self, tmp_path):
+        settings_file = tmp_path / "configuration.toml"
+        settings_file.write_text("[config]\nmodel = 'gpt-4o'\n")
+        snapshot = build_settings_snapshot([str(settings_file)], str(tmp_path / "snapshot.json"))
+        assert json.loads((tmp_path / "snapshot.json").read_text())["CONFIG"]["model"] == "gpt-4o"
+        settings_file.write_text("[config]\nmodel = 'o3'\n")
+        assert get_settings_snapshot([str(settings_file)], snapshot) is None
+        assert get_settings_snapshot([str(settings_file)], str(tmp_path / "missing.json")) is None
@@ -0,0 +1,71 @@
+import shutil
+import subprocess
+
+import pytest
+
+from pr_agent.algo.types import EDIT_TYPE
+from pr_agent.config_loader import get_settings
+from pr_agent.git_providers.git_blob_reader import GitBlobReader
+from pr_agent.git_providers.local_git_provider import LocalGitProvider
+
+pytestmark = pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+
+
+def _git(*args, cwd):
+    return subprocess.run(["git", "-c", "user.email=test@test", "-c", "user.name=test", *args],
+                          cwd=cwd, check=True, capture_output=True).stdout.decode().strip()
+
+
+@pytest.fixture
+def local_repo(tmp_path, monkeypatch):
+    repo = tmp_path / "repo"
+    repo.mkdir()
+    _git("init", "-q", "-b", "main", cwd=repo)
+    (repo / "a.py").write_text("print('a')\n")
+    (repo / "removed.py").write_text("x = 1\n")
+    _git("add", ".", cwd=repo)
+    _git("commit", "-q", "-m", "initial", cwd=repo)
+    _git("checkout", "-q", "-b", "feature", cwd=repo)
+    (repo / "a.py").write_text("print('a')\nprint('b')\n")
+    (repo / "removed.py").unlink()
+    (repo / "image.bin").write_bytes(b"\x89PNG\0\0binary")
+    (repo / "big.txt").write_text("line\n" * 1000)
+    _git("add", "-A", ".", cwd=repo)
+    _git("commit", "-q", "-m", "feature", cwd=repo)
+    monkeypatch.chdir(repo)
+    # LocalGitProvider disables inline code comments globally
+    inline_code_comments = get_settings().get("PR_REVIEWER.INLINE_CODE_COMMENTS", None)
+    yield repo
+    get_settings().set("PR_REVIEWER.INLINE_CODE_COMMENTS", inline_code_comments)
+
+
+class TestLocalGitProvider:
+    def test_blob_reader_skips_binary_and_large_blobs(self, local_repo):
+        text_id = _git("rev-parse", "HEAD:a.py", cwd=local_repo)
+        binary_id = _git("rev-parse", "HEAD:image.bin", cwd=local_repo)
+        big_id = _git("rev-parse", "HEAD:big.txt", cwd=local_repo)
+        with GitBlobReader(local_repo, max_blob_size=1000) as reader:
+            blobs = reader.read_many([text_id, binary_id, big_id, text_id, "0" * 40])
+        assert blobs == {text_id: b"print('a')\nprint('b')\n", binary_id: None, big_id: None, "0" * 40: None}
+
+    def test_get_diff_files(self, local_repo):
+        get_settings().set("LOCAL.MAX_FILE_SIZE_BYTES", 1000)
+        try:
+            provider = LocalGitProvider("main")
+        finally:
+            get_settings().set("LOCAL.MAX_FILE_SIZE_BYTES", 2 * 1024 * 1024)
+        # deleted files have no filename, only an old_filename
+        diff_files = {file.filename or file.old_filename: file for file in provider.diff_files}
+
+        modified = diff_files["a.py"]
+        assert modified.edit_type == EDIT_TYPE.MODIFIED
+        assert modified.base_file == "print('a')\n"
+        assert modified.head_file == "print('a')\nprint('b')\n"
+        assert "+print('b')" in modified.patch
+
+        assert diff_files["removed.py"].edit_type == EDIT_TYPE.DELETED
+        assert diff_files["removed.py"].base_file == "x = 1\n"
+        assert diff_files["removed.py"].head_file == ""
+        assert diff_files["image.bin"].head_file == ""
+        assert diff_files["big.txt"].head_file == ""
+        assert diff_files["big.txt"].edit_type == EDIT_TYPE.ADDED
@@ -0,0 +1,102 @@
+import shutil
+import subprocess
+from unittest.mock import MagicMock
+
+import pytest
+
+from pr_agent.git_providers.git_mirror_cache import GitMirrorCache
+from pr_agent.git_providers.git_provider import GitProvider
+from pr_agent.tools.pr_help_docs import (DocsCorpus, PRHelpDocs,
+                                         get_docs_corpus_cache)
+
+
+def _help_docs(git_provider, docs_path="docs", include_root_readme_file=True):
+    help_docs = PRHelpDocs.__new__(PRHelpDocs)
+    help_docs.git_provider = git_provider
+    help_docs.ctx_url = "https://github.com/owner/repo/issues/1"
+    help_docs.repo_url = "https://github.com/owner/repo.git"
+    help_docs.docs_path = docs_path
+    help_docs.include_root_readme_file = include_root_readme_file
+    help_docs.supported_doc_exts = [".md", ".mdx", ".rst"]
+    return help_docs
+
+
+class TestPRHelpDocsCorpus:
+    """Checks that the documentation corpus is reused across questions, as long as the docs did not change."""
+
+    @pytest.fixture(autouse=True)
+    def clear_cache(self):
+        get_docs_corpus_cache().clear()
+        yield
+        get_docs_corpus_cache().clear()
+
+    def test_is_doc_file(self):
+        help_docs = _help_docs(MagicMock())
+        assert help_docs._is_doc_file("README.md")
+        assert help_docs._is_doc_file("docs/guide/intro.rst")
+        assert not help_docs._is_doc_file("docs/image.png")
+        assert not help_docs._is_doc_file("src/notes.md")
+        help_docs.docs_path = "."
+        help_docs.include_root_readme_file = False
+        assert not help_docs._is_doc_file("README.md")
+        assert help_docs._is_doc_file("src/notes.md")
+
+    def test_corpus_is_reused_until_docs_change(self):
+        git_provider = MagicMock()
+        git_provider.list_repo_files.return_value = {"README.md": "1", "docs/a.md": "2"}
+        git_provider.read_repo_files.return_value = {"README.md": b"# Readme", "docs/a.md": b"# A\ntext"}
+
+        first = _help_docs(git_provider)._get_docs_corpus()
+        assert first.docs_filepath_to_contents == {"/README.md": "# Readme", "/docs/a.md": "# A\ntext"}
+        assert _help_docs(git_provider)._get_docs_corpus() is first
+        git_provider.read_repo_files.assert_called_once()
+
+        git_provider.list_repo_files.return_value = {"README.md": "1", "docs/a.md": "3"}
+        assert _help_docs(git_provider)._get_docs_corpus() is not first
+        assert git_provider.read_repo_files.call_count == 2
+
+    def test_corpus_memoizes_token_counts_and_headings(self):
+        corpus = DocsCorpus({"/docs/a.md": "# A\ntext", "/docs/b.md": "# B\nmore text"})
+        token_handler = MagicMock()
+        token_handler.count_tokens.return_value = 42
+        assert corpus.count_tokens(token_handler, corpus.docs_prompt) == 42
+        assert corpus.count_tokens(token_handler, corpus.docs_prompt) == 42
+        token_handler.count_tokens.assert_called_once_with(corpus.docs_prompt, force_accurate=True)
+        assert "# A" in corpus.headings_prompt and "==index==" in corpus.headings_prompt
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+class TestPRHelpDocsClone:
+    """Checks the documentation files gathered from a clone of the repo, e.g. when the git mirror cache is disabled."""
+
+    @pytest.fixture
+    def git_provider(self, tmp_path):
+        repo = tmp_path / "source"
+        (repo / "docs" / "guide").mkdir(parents=True)
+        (repo / "README.md").write_text("# Readme")
+        (repo / "docs" / "a.md").write_text("# A")
+        (repo / "docs" / "guide" / "b.md").write_text("# B")
+        for args in (["init", "-q", "-b", "main"], ["add", "."], ["commit", "-q", "-m", "initial"]):
+            subprocess.run(["git", "-c", "user.email=test@test", "-c", "user.name=test", *args], cwd=repo,
+                           check=True, capture_output=True)
+        cache = GitMirrorCache(str(tmp_path / "cache"), 10 ** 9)
+
+        def clone(repo_url, dest_folder, remove_dest_folder=True, sparse_paths=None):
+            cache.checkout(repo.as_uri(), repo.as_uri(), dest_folder, sparse_paths=sparse_paths)
+            return GitProvider.ScopedClonedRepo(dest_folder)
+
+        git_provider = MagicMock()
+        git_provider.clone.side_effect = clone
+        return git_provider
+
+    def test_repo_root_docs_path_checks_out_subdirectories(self, git_provider):
+        help_docs = _help_docs(git_provider, ".", include_root_readme_file=False)
+        contents = help_docs._gen_filenames_to_contents_map_from_repo()
+        assert sorted(contents) == ["/docs/a.md", "/docs/guide/b.md"]
+        assert git_provider.clone.call_args.kwargs["sparse_paths"] is None
+
+    def test_docs_path_is_normalized(self, git_provider):
+        help_docs = _help_docs(git_provider, "/docs/", include_root_readme_file=False)
+        contents = help_docs._gen_filenames_to_contents_map_from_repo()
+        assert sorted(contents) == ["/docs/a.md", "/docs/guide/b.md"]
+        assert git_provider.clone.call_args.kwargs["sparse_paths"] == ["docs"]
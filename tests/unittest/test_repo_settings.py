@@ -0,0 +1,92 @@
+from unittest.mock import MagicMock, patch
+
+import pytest
+
+from pr_agent.algo.request_cache import request_scope
+from pr_agent.config_loader import SettingsOverlay, global_settings
+from pr_agent.git_providers import utils
+from pr_agent.git_providers.utils import (RepoSettingsCache,
+                                          apply_repo_settings,
+                                          parse_repo_settings)
+
+REPO_SETTINGS = b"""
+[pr_reviewer]
+num_max_findings = 7
+extra_instructions = "be nice"
+
+[pr_description]
+enable_pr_diagram = false
+"""
+
+
+class TestRepoSettings:
+    @pytest.fixture
+    def settings(self):
+        settings = SettingsOverlay(global_settings)
+        cache = RepoSettingsCache(ttl_seconds=60, max_entries=16)
+        with patch.object(utils, "get_settings", return_value=settings), \
+                patch.object(utils, "get_repo_settings_cache", return_value=cache), request_scope():
+            yield settings
+
+    @staticmethod
+    def _git_provider(repo_settings=REPO_SETTINGS):
+        git_provider = MagicMock()
+        git_provider.get_repo_settings_cache_key.return_value = "https://github.com/owner/repo"
+        git_provider.get_repo_settings.return_value = repo_settings
+        return git_provider
+
+    def test_parse_repo_settings(self):
+        assert parse_repo_settings(REPO_SETTINGS) == {
+            "PR_REVIEWER": {"num_max_findings": 7, "extra_instructions": "be nice"},
+            "PR_DESCRIPTION": {"enable_pr_diagram": False},
+        }
+        with pytest.raises(ValueError):
+            parse_repo_settings(b"model = 'gpt-4'\n")
+
+    def test_repo_settings_are_fetched_and_parsed_once(self, settings):
+        git_provider = self._git_provider()
+        with patch.object(utils, "get_git_provider_with_context", return_value=git_provider), \
+                patch.object(utils, "parse_repo_settings", wraps=parse_repo_settings) as parse:
+            apply_repo_settings("https://github.com/owner/repo/pull/1")
+            apply_repo_settings("https://github.com/owner/repo/pull/2")
+        git_provider.get_repo_settings.assert_called_once()
+        parse.assert_called_once()
+        assert settings.get("PR_REVIEWER.NUM_MAX_FINDINGS") == 7
+        assert settings.get("PR_REVIEWER.EXTRA_INSTRUCTIONS") == "be nice"
+        assert settings.get("PR_DESCRIPTION.ENABLE_PR_DIAGRAM") is False
+        # the other keys of the section are kept
+        assert settings.get("PR_REVIEWER.REQUIRE_TESTS_REVIEW") == global_settings.get("PR_REVIEWER.REQUIRE_TESTS_REVIEW")
+        assert global_settings.get("PR_REVIEWER.EXTRA_INSTRUCTIONS") != "be nice"
+
+    def test_repo_settings_file_expires(self, settings):
+        git_provider = self._git_provider()
+        utils.get_repo_settings_cache().ttl_seconds = 0
+        with patch.object(utils, "get_git_provider_with_context", return_value=git_provider):
+            apply_repo_settings("https://github.com/owner/repo/pull/1")
+            git_provider.get_repo_settings.return_value = b"[pr_reviewer]\nnum_max_findings = 2\n"
+            with request_scope():  # a later event
+                apply_repo_settings("https://github.com/owner/repo/pull/1")
+        assert git_provider.get_repo_settings.call_count == 2
+        assert settings.get("PR_REVIEWER.NUM_MAX_FINDINGS") == 2
+
+    def test_invalid_repo_settings_are_reported(self, settings):
+        git_provider = self._git_provider(b"[pr_reviewer\n")
+        with patch.object(utils, "get_git_provider_with_context", return_value=git_provider), \
+                patch.object(utils, "handle_configurations_errors") as handle_errors:
+            apply_repo_settings("https://github.com/owner/repo/pull/1")
+        handle_errors.assert_called_once()
+        error = handle_errors.call_args.args[0][0]
+        assert error["settings"] == b"[pr_reviewer\n" and error["category"] == "local"
+
+    def test_merged_sections_are_shared_between_requests(self, settings):
+        git_provider = self._git_provider()
+        other_settings = SettingsOverlay(global_settings)
+        with patch.object(utils, "get_git_provider_with_context", return_value=git_provider):
+            apply_repo_settings("https://github.com/owner/repo/pull/1")
+            with patch.object(utils, "get_settings", return_value=other_settings):
+                apply_repo_settings("https://github.com/owner/repo/pull/2")
+        # modifying the settings of a request copies the shared section first
+        settings.pr_reviewer.num_max_findings = 1
+        assert settings.get("PR_REVIEWER.NUM_MAX_FINDINGS") == 1
+        assert other_settings.get("PR_REVIEWER.NUM_MAX_FINDINGS") == 7
+        assert other_settings.pr_reviewer.extra_instructions == "be nice"
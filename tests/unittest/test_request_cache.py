@@ -0,0 +1,69 @@
+import asyncio
+from unittest.mock import MagicMock, patch
+
+from starlette_context import request_cycle_context
+
+from pr_agent import git_providers
+from pr_agent.algo.request_cache import (CacheKey, CacheLifetime,
+                                         RequestCache, request_scope)
+from pr_agent.config_loader import get_settings
+
+REQUEST_KEY = CacheKey("files", CacheLifetime.REQUEST)
+PR_HEAD_KEY = CacheKey("files_at_head", CacheLifetime.PR_HEAD, sizeof=len)
+
+
+class TestRequestCache:
+    def test_request_values_are_shared_within_a_request_only(self):
+        cache = RequestCache(max_size_bytes=1024)
+        with request_scope():
+            cache.put(REQUEST_KEY, ["a.py"], "pr/1")
+            assert cache.get(REQUEST_KEY, "pr/1") == ["a.py"]
+            assert cache.get(REQUEST_KEY, "pr/2") is None
+            assert cache.request_size()[0] == 1 and cache.request_size()[1] > 0
+        with request_scope():
+            assert cache.get(REQUEST_KEY, "pr/1") is None
+        assert cache.stats()["keys"]["files"] == {"lifetime": "request", "hits": 1, "misses": 2, "puts": 1}
+
+    def test_webhook_events_have_their_own_request_values(self):
+        cache = RequestCache(max_size_bytes=1024)
+
+        async def handle_event(pr_url):
+            with request_cycle_context({}):
+                cache.put(REQUEST_KEY, [pr_url], "pr")
+                await asyncio.sleep(0.01)
+                # the values are shared with the threads running the blocking calls of the event
+                return await asyncio.to_thread(cache.get, REQUEST_KEY, "pr")
+
+        async def run():
+            return await asyncio.gather(handle_event("pr/1"), handle_event("pr/2"))
+
+        assert asyncio.run(run()) == [["pr/1"], ["pr/2"]]
+
+    def test_pr_head_values_are_evicted_by_size(self):
+        cache = RequestCache(max_size_bytes=10)
+        with request_scope():
+            cache.put(PR_HEAD_KEY, "x" * 6, ("pr/1", "sha1"))
+        with request_scope():
+            # shared across requests
+            assert cache.get(PR_HEAD_KEY, ("pr/1", "sha1")) == "x" * 6
+            assert cache.get(PR_HEAD_KEY, ("pr/1", "sha2")) is None
+            cache.put(PR_HEAD_KEY, "y" * 6, ("pr/1", "sha2"))
+            cache.put(PR_HEAD_KEY, "z" * 20, ("pr/2", "sha1"))  # larger than the cache, not cached
+        assert cache.get(PR_HEAD_KEY, ("pr/1", "sha1")) is None
+        assert cache.get(PR_HEAD_KEY, ("pr/1", "sha2")) == "y" * 6
+        assert cache.get(PR_HEAD_KEY, ("pr/2", "sha1")) is None
+        assert cache.stats()["process"] == {"entries": 1, "size_bytes": 6, "max_size_bytes": 10, "evictions": 1}
+
+    def test_git_provider_is_shared_by_the_tools_of_a_request(self):
+        provider_class = MagicMock(side_effect=lambda pr_url: MagicMock(pr_url=pr_url))
+        provider_id = get_settings().config.git_provider
+        with patch.object(git_providers, "_GIT_PROVIDERS", {provider_id: provider_class}), \
+                patch.object(git_providers, "get_request_cache", return_value=RequestCache(1024)):
+            with request_scope():
+                first = git_providers.get_git_provider_with_context("https://github.com/owner/repo/pull/1")
+                assert git_providers.get_git_provider_with_context("https://github.com/owner/repo/pull/1") is first
+                other = git_providers.get_git_provider_with_context("https://github.com/owner/repo/pull/2")
+                assert other is not first
+            with request_scope():
+                assert git_providers.get_git_provider_with_context("https://github.com/owner/repo/pull/1") is not first
+        assert provider_class.call_count == 3
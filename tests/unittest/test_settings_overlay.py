@@ -0,0 +1,73 @@
+import copy
+
+import pytest
+from dynaconf import Dynaconf
+
+from pr_agent.config_loader import SettingsOverlay
+
+
+@pytest.fixture
+def base(tmp_path):
+    settings_file = tmp_path / "settings.toml"
+    settings_file.write_text("""
+[config]
+model = "gpt-4"
+fallback_models = ["gpt-3"]
+verbosity_level = 0
+
+[pr_reviewer]
+num_max_findings = 3
+extra_instructions = ""
+""")
+    settings = Dynaconf(envvar_prefix="PR_AGENT_TEST_OVERLAY", merge_enabled=True, settings_files=[str(settings_file)])
+    settings.get("config.model")  # loads the settings, before they are copied
+    return settings
+
+
+class TestSettingsOverlay:
+    def test_writes_do_not_reach_the_base_settings(self, base):
+        overlay = SettingsOverlay(base)
+        overlay.set("config.model", "gpt-5")
+        overlay.set("PR_REVIEWER.NUM_MAX_FINDINGS", 5)
+        overlay.config.verbosity_level = 2
+
+        assert overlay.get("config.model") == "gpt-5"
+        assert overlay.config.model == "gpt-5"
+        assert overlay["pr_reviewer.num_max_findings"] == 5
+        assert overlay.get("config.verbosity_level") == 2
+        assert base.get("config.model") == "gpt-4"
+        assert base.get("pr_reviewer.num_max_findings") == 3
+        assert base.get("config.verbosity_level") == 0
+        assert SettingsOverlay(base).get("config.model") == "gpt-4"
+
+    def test_reading_immutable_values_copies_nothing(self, base):
+        overlay = SettingsOverlay(base)
+        assert overlay.get("config.model") == "gpt-4"
+        assert overlay.get("CONFIG.MISSING", "default") == "default"
+        assert overlay._sections == {}
+        overlay.get("config.fallback_models")
+        assert list(overlay._sections) == ["CONFIG"]
+
+    def test_set_has_the_semantics_of_dynaconf(self, base):
+        overlay = SettingsOverlay(base)
+        reference = copy.deepcopy(base)
+        for settings in (overlay, reference):
+            settings.set("config.fallback_models", ["a"])
+            settings.set("CONFIG", {"fallback_models": ["b"], "new_key": 1})
+            settings.set("pr_reviewer", {"extra_instructions": "be nice"}, merge=False)
+            settings.set("new_section.nested.key", "value")
+        for key in ["config.fallback_models", "config.new_key", "config.model", "pr_reviewer.extra_instructions",
+                    "pr_reviewer.num_max_findings", "new_section.nested.key"]:
+            assert overlay.get(key) == reference.get(key), key
+        assert overlay.as_dict()["CONFIG"] == reference.as_dict()["CONFIG"]
+
+    def test_unset_and_missing_keys(self, base):
+        overlay = SettingsOverlay(base)
+        overlay.unset("pr_reviewer")
+        assert overlay.get("pr_reviewer.num_max_findings") is None
+        assert "PR_REVIEWER" not in overlay.as_dict()
+        assert base.get("pr_reviewer.num_max_findings") == 3
+        with pytest.raises(KeyError):
+            overlay["config.missing"]
+        with pytest.raises(AttributeError):
+            overlay.missing_section
@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+from starlette_context import context, request_cycle_context
+
+from pr_agent.servers.task_scheduler import (SchedulerOverloaded,
+                                             TaskPriority,
+                                             WebhookTaskScheduler)
+
+
+class TestWebhookTaskScheduler:
+    @staticmethod
+    async def _settle():
+        for _ in range(5):
+            await asyncio.sleep(0)
+
+    def test_concurrency_limits(self):
+        async def run():
+            scheduler = WebhookTaskScheduler(max_concurrent_tasks=3, max_tasks_per_repo=2)
+            release = asyncio.Event()
+            started = []
+
+            async def task(name):
+                started.append(name)
+                await release.wait()
+
+            for name, repo in [("a1", "a"), ("a2", "a"), ("a3", "a"), ("b1", "b"), ("c1", "c")]:
+                scheduler.submit(task, name, repo=repo)
+            await self._settle()
+            # a3 waits for the limit of its repo, but does not block the tasks of the other repos
+            assert started == ["a1", "a2", "b1"]
+            assert scheduler.metrics()["queued"] == 2
+            release.set()
+            await self._settle()
+            assert sorted(started) == ["a1", "a2", "a3", "b1", "c1"]
+            await self._settle()
+            metrics = scheduler.metrics()
+            assert metrics["running"] == 0 and metrics["queued"] == 0 and metrics["completed"] == 5
+
+        asyncio.run(run())
+
+    def test_commands_are_scheduled_first_and_shed_automatic_tasks(self):
+        async def run():
+            scheduler = WebhookTaskScheduler(max_concurrent_tasks=1, max_queued_tasks=2)
+            release = asyncio.Event()
+            started = []
+
+            async def task(name):
+                started.append(name)
+                await release.wait()
+
+            scheduler.submit(task, "running")
+            scheduler.submit(task, "auto1")
+            scheduler.submit(task, "auto2")
+            with pytest.raises(SchedulerOverloaded):
+                scheduler.submit(task, "auto3")
+            # the most recent automatic task is shed to make room for the command
+            scheduler.submit(task, "command", priority=TaskPriority.COMMAND)
+            release.set()
+            for _ in range(4):
+                await self._settle()
+            assert started == ["running", "command", "auto1"]
+            metrics = scheduler.metrics()
+            assert metrics["shed"] == 1 and metrics["rejected"] == 1
+
+        asyncio.run(run())
+
+    def test_tasks_run_in_the_context_of_their_request(self):
+        async def run():
+            scheduler = WebhookTaskScheduler(max_concurrent_tasks=1)
+            release = asyncio.Event()
+            installation_ids = []
+
+            async def task():
+                installation_ids.append(context.get("installation_id"))
+                await release.wait()
+
+            for installation_id in [1, 2]:
+                with request_cycle_context({"installation_id": installation_id}):
+                    scheduler.submit(task, installation=installation_id)
+            release.set()
+            await self._settle()
+            await self._settle()
+            assert installation_ids == [1, 2]
+
+        asyncio.run(run())
+
+    def test_failed_tasks_free_their_slot(self):
+        async def run():
+            scheduler = WebhookTaskScheduler(max_concurrent_tasks=1, max_tasks_per_installation=1)
+
+            async def failing_task():
+                raise ValueError("failed")
+
+            scheduler.submit(failing_task, installation=1)
+            scheduler.submit(failing_task, installation=1)
+            await self._settle()
+            await self._settle()
+            metrics = scheduler.metrics()
+            assert metrics["failed"] == 2 and metrics["running"] == 0 and metrics["queued"] == 0
+
+        asyncio.run(run())
@@ -0,0 +1,215 @@
+import asyncio
+import sqlite3
+from unittest.mock import patch
+
+from fastapi import APIRouter
+
+from pr_agent.agent.pr_agent import PRAgent
+from pr_agent.algo.checkpoints import CheckpointStore, checkpointed
+from pr_agent.servers.task_scheduler import TaskPriority, WebhookTaskScheduler
+from pr_agent.servers.webhook_runtime import TaskRegistry, create_app
+
+
+def _checkpoint_count(path) -> int:
+    with sqlite3.connect(path) as connection:
+        return connection.execute("SELECT COUNT(*) FROM tasks").fetchone()[0]
+
+
+class TestTaskRegistry:
+    def test_finished_tasks_are_drained_and_forgotten(self, tmp_path):
+        path = str(tmp_path / "checkpoints.sqlite3")
+
+        async def run():
+            registry = TaskRegistry(CheckpointStore(path))
+            finished = []
+
+            async def review(pr_url):
+                await asyncio.sleep(0.01)
+                finished.append(pr_url)
+
+            registry.register("review", review)
+            await registry.submit("review", {"pr_url": "https://github.com/owner/repo/pull/1"})
+            cancelled = await registry.drain(grace_period_seconds=5)
+            return cancelled, finished
+
+        assert asyncio.run(run()) == (0, ["https://github.com/owner/repo/pull/1"])
+        assert _checkpoint_count(path) == 0
+
+    def test_interrupted_task_is_resumed_from_its_checkpoint(self, tmp_path):
+        path = str(tmp_path / "checkpoints.sqlite3")
+        ai_calls = []
+
+        async def ai_call(prompt):
+            ai_calls.append(prompt)
+            return f"answer to {prompt}"
+
+        def make_review(results, block):
+            async def review(pr_url):
+                first = await checkpointed("ai", [pr_url, 1], lambda: ai_call("first"))
+                if block:
+                    await asyncio.Event().wait()  # interrupted by the shutdown
+                second = await checkpointed("ai", [pr_url, 2], lambda: ai_call("second"))
+                results.append((first, second))
+            return review
+
+        async def shut_down():
+            registry = TaskRegistry(CheckpointStore(path))
+            registry.register("review", make_review([], block=True))
+            await registry.submit("review", {"pr_url": "https://github.com/owner/repo/pull/1"})
+            await asyncio.sleep(0.05)
+            return await registry.drain(grace_period_seconds=0.05)
+
+        async def restart():
+            registry = TaskRegistry(CheckpointStore(path))
+            results = []
+            registry.register("review", make_review(results, block=False))
+            resumed = await registry.resume_interrupted()
+            await registry.drain(grace_period_seconds=5)
+            return resumed, results
+
+        assert asyncio.run(shut_down()) == 1
+        assert _checkpoint_count(path) == 1
+        resumed, results = asyncio.run(restart())
+        assert resumed == 1
+        assert results == [("answer to first", "answer to second")]
+        # the AI call that completed before the shutdown is not made again
+        assert ai_calls == ["first", "second"]
+        assert _checkpoint_count(path) == 0
+
+    def test_queued_tasks_are_checkpointed_while_draining(self, tmp_path):
+        path = str(tmp_path / "checkpoints.sqlite3")
+
+        async def run():
+            registry = TaskRegistry(CheckpointStore(path))
+            scheduler = WebhookTaskScheduler(max_concurrent_tasks=1, task_registry=registry)
+            started = []
+
+            async def review(pr_url):
+                started.append(pr_url)
+                await asyncio.sleep(0.05)
+
+            registry.register("review", review, schedule=lambda run, payload: scheduler.submit(run))
+            for i in range(3):
+                await registry.submit("review", {"pr_url": f"https://github.com/owner/repo/pull/{i}"})
+            await asyncio.sleep(0)
+            cancelled = await registry.drain(grace_period_seconds=5)
+            await asyncio.sleep(0.1)
+            return cancelled, started, registry.metrics()
+
+        cancelled, started, metrics = asyncio.run(run())
+        # the running task finishes, the queued ones are left to the next process
+        assert cancelled == 0 and started == ["https://github.com/owner/repo/pull/0"]
+        assert metrics["checkpointed"] == 2
+        assert len(CheckpointStore(path).claim_interrupted("next-process", max_age_seconds=60)) == 2
+
+    def test_shed_tasks_are_not_resumed(self, tmp_path):
+        path = str(tmp_path / "checkpoints.sqlite3")
+
+        async def run():
+            registry = TaskRegistry(CheckpointStore(path))
+            scheduler = WebhookTaskScheduler(max_concurrent_tasks=1, max_queued_tasks=1, task_registry=registry)
+
+            async def review(pr_url):
+                await asyncio.sleep(10)
+
+            registry.register("review", review,
+                              schedule=lambda run, payload: scheduler.submit(run, on_shed=run.discard))
+            await registry.submit("review", {"pr_url": "running"})
+            await registry.submit("review", {"pr_url": "queued"})
+            scheduler.submit(review, "command", priority=TaskPriority.COMMAND)  # sheds the queued task
+            return await registry.drain(grace_period_seconds=0)
+
+        assert asyncio.run(run()) == 1
+        tasks = CheckpointStore(path).claim_interrupted("next-process", max_age_seconds=60)
+        assert [task.payload["pr_url"] for task in tasks] == ["running"]
+
+
+    def test_resumed_task_does_not_repeat_completed_tools(self, tmp_path):
+        path = str(tmp_path / "checkpoints.sqlite3")
+        published = []
+
+        def make_tool(name, block):
+            class Tool:
+                def __init__(self, pr_url, ai_handler=None, args=None):
+                    pass
+
+                async def run(self):
+                    if block:
+                        await asyncio.Event().wait()  # interrupted by the shutdown
+                    published.append(name)
+
+            return Tool
+
+        def make_handler(block):
+            tools = {"describe": make_tool("describe", False), "review": make_tool("review", block)}
+
+            async def handle_event(pr_url):
+                with patch("pr_agent.agent.pr_agent.command2class", tools):
+                    await PRAgent().handle_request(pr_url, "/describe")
+                    await PRAgent().handle_request(pr_url, "/review")
+            return handle_event
+
+        async def shut_down():
+            registry = TaskRegistry(CheckpointStore(path))
+            registry.register("event", make_handler(block=True))
+            await registry.submit("event", {"pr_url": "https://github.com/owner/repo/pull/1"})
+            await asyncio.sleep(0.05)
+            return await registry.drain(grace_period_seconds=0.05)
+
+        async def restart():
+            registry = TaskRegistry(CheckpointStore(path))
+            registry.register("event", make_handler(block=False))
+            resumed = await registry.resume_interrupted()
+            await registry.drain(grace_period_seconds=5)
+            return resumed
+
+        with patch("pr_agent.agent.pr_agent.apply_repo_settings"):
+            assert asyncio.run(shut_down()) == 1
+            assert published == ["describe"]
+            assert asyncio.run(restart()) == 1
+        # the description published before the shutdown is not published again
+        assert published == ["describe", "review"]
+        assert _checkpoint_count(path) == 0
+
+class TestServerlessApp:
+    def test_background_tasks_run_within_the_invocation(self, tmp_path):
+        registry = TaskRegistry(CheckpointStore(str(tmp_path / "checkpoints.sqlite3")))
+        scheduler = WebhookTaskScheduler(max_concurrent_tasks=1, task_registry=registry)
+        finished = []
+
+        async def review(pr_url):
+            await asyncio.sleep(0.01)
+            finished.append(pr_url)
+
+        registry.register("review", review, schedule=lambda run, payload: scheduler.submit(run))
+        router = APIRouter()
+
+        @router.post("/api/v1/github_webhooks")
+        async def webhook():
+            # the second task is queued until the first one is done
+            await registry.submit("review", {"pr_url": "https://github.com/owner/repo/pull/1"})
+            await registry.submit("review", {"pr_url": "https://github.com/owner/repo/pull/2"})
+            return {}
+
+        app = create_app(router, run_tasks_inline=True)
+        scope = {"type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "POST",
+                 "scheme": "https", "path": "/api/v1/github_webhooks", "raw_path": b"/api/v1/github_webhooks",
+                 "root_path": "", "query_string": b"", "headers": [], "client": ("127.0.0.1", 0),
+                 "server": ("testserver", 443)}
+        messages = []
+
+        async def receive():
+            return {"type": "http.request", "body": b"", "more_body": False}
+
+        async def send(message):
+            messages.append(message)
+
+        # as Mangum does, the event loop only runs until the app has handled the request
+        loop = asyncio.new_event_loop()
+        try:
+            with patch("pr_agent.servers.webhook_runtime._task_registry", registry):
+                loop.run_until_complete(app(scope, receive, send))
+        finally:
+            loop.close()
+        assert messages[0]["status"] == 200
+        assert finished == ["https://github.com/owner/repo/pull/1", "https://github.com/owner/repo/pull/2"]